@@ -0,0 +1,397 @@
+"""This is a script to benchmark the build and the preview server."""
+# SYSTEM: Python 3.11.1
+#
+# これは、ビルドとプレビューサーバの性能を測定するスクリプトです。
+#
+# このスクリプトは、以下の内容を実行します。
+# * 指定したページ数(10, 100, 1000など)のdocsフォルダを生成
+# * build.pyの各手順(コンテナ削除、clone、イメージ作成、コンテナ実行、描画)の時間を測定
+# * 変更なし・1ページ変更の再ビルド時間を測定
+# * プレビューサーバに負荷をかけ、p50/p99レイテンシと1秒あたりのリクエスト数を測定
+# * 結果をJSONで出力し、基準値より指定した割合以上遅くなった場合は失敗
+
+import io
+import sys
+import os
+import json
+import math
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import contextlib
+import urllib.parse
+
+import build
+import build_cache
+import native_engine
+
+__version__ = "0.0.1"
+RESULT_VERSION = 1
+parser = argparse.ArgumentParser(
+    description="Benchmark the build and the preview server"
+)
+parser.add_argument("-v", "--version", action="version",
+                    version="%(prog)s ver." + __version__)
+parser.add_argument("--pages", type=str, default="10,100,1000",
+                    help="Comma separated page counts of the synthetic docs trees")
+parser.add_argument("--engine", type=str, default="native", choices=["docker", "native"],
+                    help="Engine of build.py")
+parser.add_argument("--repeat", type=int, default=3,
+                    help="Number of runs of each phase (the median is reported)")
+parser.add_argument("--work_dir", type=str, default="",
+                    help="Directory of the synthetic trees (default: temporary directory)")
+parser.add_argument("--jobs", type=int, default=0,
+                    help="Number of render processes of the native engine (0: CPU cores)")
+# options : Load
+parser.add_argument("--requests", type=int, default=2000,
+                    help="Number of requests of the load test (0: no load test)")
+parser.add_argument("--concurrency", type=int, default=16,
+                    help="Number of concurrent connections of the load test")
+parser.add_argument("--target_url", type=str, default="",
+                    help="Load test a running server instead of server.py --serve_only")
+# options : Results
+parser.add_argument("--output", type=str, default="",
+                    help="JSON file to write the results to")
+parser.add_argument("--baseline", type=str, default="",
+                    help="JSON results to compare with")
+parser.add_argument("--threshold", type=float, default=10.0,
+                    help="Fail when a metric is more than this percent worse than the baseline")
+parser.add_argument("--min_seconds", type=float, default=0.02,
+                    help="Do not compare phases shorter than this (timer noise)")
+
+
+def generate_docs(dest: str, pages: int):
+    """Generate a docs tree with the given number of pages."""
+    if os.path.exists(dest):
+        shutil.rmtree(dest)
+    os.makedirs(os.path.join(dest, "assets", "css"))
+    with open(os.path.join(dest, "_config.yml"), "w", encoding="utf-8") as f:
+        f.write("title: ベンチマーク\ndescription: >-\n 合成したドキュメントです。\n"
+                "theme: minima\n")
+    with open(os.path.join(dest, "assets", "css", "style.scss"), "w", encoding="utf-8") as f:
+        f.write("---\n---\n$color: #424242;\n.page-content {\n  h2 { color: $color; }\n"
+                "  table { th { font-weight: bold; } }\n}\n")
+    sections = []
+    for index in range(pages):
+        section = "section_%03d" % (index // 10)
+        if section not in sections:
+            sections.append(section)
+            os.makedirs(os.path.join(dest, section))
+        with open(os.path.join(dest, section, "page_%04d.md" % index), "w",
+                  encoding="utf-8") as f:
+            f.write(synthetic_page(index))
+    for section in sections:
+        names = sorted(os.listdir(os.path.join(dest, section)))
+        with open(os.path.join(dest, section, "00_overview.md"), "w", encoding="utf-8") as f:
+            f.write("### " + section + "\n\n")
+            for name in names:
+                f.write('@import "./' + name + '"\n')
+    with open(os.path.join(dest, "index.md"), "w", encoding="utf-8") as f:
+        f.write("---\nlayout: home\n---\n\n[TOC]\n\n")
+        for section in sections:
+            f.write('@import "./' + section + '/00_overview.md"\n')
+            f.write('<div style="page-break-before:always"></div>\n')
+
+
+def synthetic_page(index: int):
+    """Get the Markdown of a synthetic page."""
+    lines = ["#### ページ %d" % index, "",
+             "人型ロボットの**共通インターフェイス**について説明します。"
+             "詳細は[概要](../index.md)を参照してください。", ""]
+    for part in range(3):
+        lines += ["##### 項目 %d-%d" % (index, part), "",
+                  "| 名前 | 型 | 説明 |", "| --- | --- | --- |"]
+        lines += ["| joint_%d | float | 関節%dの角度 `rad` |" % (row, row) for row in range(6)]
+        lines += ["", "- モーター", "  - 電流", "  - 温度", "- センサー", "",
+                  "```json", '{"id": %d, "value": [0, 1, 2]}' % part, "```", ""]
+    return "\n".join(lines) + "\n"
+
+
+def percentile(values: list, percent: float):
+    """Get a percentile of the values (nearest rank)."""
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    rank = max(math.ceil(percent / 100.0 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def free_port():
+    """Get a free TCP port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def read_response(reader: asyncio.StreamReader):
+    """Read a response. Returns (status, keep-alive)."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep != "":
+            headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif status not in (204, 304):
+        await reader.read()
+        return status, False
+    return status, headers.get("connection", "").lower() != "close"
+
+
+async def load_test(base_url: str, paths: list, requests: int, concurrency: int):
+    """Send GET requests over keep-alive connections and measure the latency."""
+    url = urllib.parse.urlsplit(base_url)
+    host = url.hostname or "127.0.0.1"
+    port = url.port or 80
+    prefix = url.path.rstrip("/")
+    latencies = []
+    errors = [0]
+    counter = iter(range(requests))
+
+    async def worker():
+        reader = writer = None
+        for index in counter:
+            path = prefix + "/" + paths[index % len(paths)]
+            request = ("GET " + urllib.parse.quote(path) + " HTTP/1.1\r\nHost: " + host
+                       + "\r\nAccept-Encoding: gzip\r\n\r\n").encode("latin-1")
+            start = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                writer.write(request)
+                status, keep_alive = await read_response(reader)
+                if status >= 400:
+                    errors[0] += 1
+                if keep_alive is False:
+                    writer.close()
+                    writer = None
+            except (OSError, ValueError, asyncio.IncompleteReadError,
+                    asyncio.LimitOverrunError):
+                errors[0] += 1
+                if writer is not None:
+                    writer.close()
+                writer = None
+                continue
+            latencies.append(time.perf_counter() - start)
+        if writer is not None:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors[0],
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "requests_per_second": len(latencies) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def flatten(results: dict):
+    """Get the comparable metrics. Returns {name: (value, kind)}."""
+    metrics = {}
+    for tree, result in results.items():
+        for phase, seconds in result.get("phases", {}).items():
+            metrics[tree + "/" + phase] = (seconds, "phase")
+        server = result.get("server", {})
+        for name in ("p50_ms", "p99_ms"):
+            if name in server:
+                metrics[tree + "/server/" + name] = (server[name], "latency")
+        if "requests_per_second" in server:
+            metrics[tree + "/server/requests_per_second"] = (
+                server["requests_per_second"], "throughput")
+    return metrics
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_seconds: float = 0.02):
+    """Get the metrics that are more than threshold percent worse than the baseline."""
+    regressions = []
+    current = flatten(results)
+    for name, (base_value, kind) in flatten(baseline).items():
+        if name not in current:
+            continue
+        value = current[name][0]
+        if kind == "throughput":
+            if base_value > 0 and value < base_value * (1.0 - threshold / 100.0):
+                regressions.append((name, base_value, value))
+            continue
+        if kind == "phase" and max(base_value, value) < min_seconds:
+            continue
+        if value > base_value * (1.0 + threshold / 100.0):
+            regressions.append((name, base_value, value))
+    return regressions
+
+
+class Benchmark:
+    """Benchmark the build and the preview server."""
+    _work_dir = "."
+    _engine = "native"
+    _repeat = 3
+    _jobs = 0
+    _results = {}
+
+    def __init__(self, ap):
+        """Initialize the class."""
+        self._engine = ap.engine
+        self._repeat = max(ap.repeat, 1)
+        self._jobs = ap.jobs
+        self._results = {}
+        work_dir = ap.work_dir
+        temporary = None
+        if work_dir == "":
+            temporary = tempfile.TemporaryDirectory(prefix="github_pages_bench_")
+            work_dir = temporary.name
+        self._work_dir = os.path.abspath(work_dir)
+        try:
+            for pages in [int(value) for value in ap.pages.split(",") if value.strip() != ""]:
+                self.run_tree(pages, ap.requests, ap.concurrency, ap.target_url)
+        finally:
+            if temporary is not None:
+                temporary.cleanup()
+
+    @property
+    def results(self):
+        """Get the results."""
+        return self._results
+
+    def run_build(self, src: str, site: str, no_cache: bool):
+        """Run build.py once. Returns the timings of its phases."""
+        argv = ["--engine", self._engine, "--src", src, "--volume_site", site,
+                "--jobs", str(self._jobs)]
+        if no_cache is True:
+            argv.append("--no_cache")
+        log = io.StringIO()
+        start = time.monotonic()
+        with contextlib.redirect_stdout(log):
+            setup = build.SetupGithubPages(build.parser.parse_args(argv))
+        timings = dict(setup.timings)
+        timings["total"] = time.monotonic() - start
+        if setup.ret != 0:
+            print(log.getvalue())
+            raise RuntimeError("build.py failed (" + str(setup.ret) + ")")
+        return timings
+
+    def measure(self, name: str, runs: list, func):
+        """Run func repeatedly and keep the median of each phase under name."""
+        samples = {}
+        for _i in range(self._repeat):
+            for phase, seconds in func().items():
+                samples.setdefault(phase, []).append(seconds)
+        for phase, values in samples.items():
+            runs[name + "." + phase] = statistics.median(values)
+
+    def run_tree(self, pages: int, requests: int, concurrency: int, target_url: str):
+        """Benchmark a synthetic tree."""
+        name = "pages_" + str(pages)
+        print("[## Benchmark: " + name + "]")
+        src = os.path.join(self._work_dir, name, "docs")
+        site = os.path.join(self._work_dir, name, "_site")
+        generate_docs(src, pages)
+        phases = {}
+        # Full build, build without changes and build after one page was changed.
+        self.measure("full", phases, lambda: self.run_build(src, site, True))
+        self.measure("noop", phases, lambda: self.run_build(src, site, False))
+        leaf = os.path.join(src, "section_000", "page_0000.md")
+
+        def touch_and_build():
+            with open(leaf, "a", encoding="utf-8") as f:
+                f.write("\n追記しました。\n")
+            return self.run_build(src, site, False)
+        self.measure("incremental", phases, touch_and_build)
+        for phase, seconds in sorted(phases.items()):
+            print("  --> %-32s %9.1f ms" % (phase, seconds * 1000))
+        result = {"pages": pages, "phases": phases}
+        if requests > 0:
+            result["server"] = self.run_server(site, requests, concurrency, target_url)
+            print("  --> server: p50 %.2f ms, p99 %.2f ms, %.0f req/s, errors %d" % (
+                result["server"]["p50_ms"], result["server"]["p99_ms"],
+                result["server"]["requests_per_second"], result["server"]["errors"]))
+        self._results[name] = result
+
+    def run_server(self, site: str, requests: int, concurrency: int, target_url: str):
+        """Load test the preview server."""
+        paths = [native_engine.output_path(rel) for rel in build_cache.list_files(site)
+                 if rel.endswith((".html", ".css"))]
+        if target_url != "":
+            return asyncio.run(load_test(target_url, paths, requests, concurrency))
+        port = free_port()
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(__file__), "server.py"),
+             "--serve_only", "--output_dir", site, "--port", str(port)],
+            stdout=subprocess.DEVNULL)
+        try:
+            if self.wait_port(port, 10.0) is False:
+                raise RuntimeError("server.py did not start")
+            return asyncio.run(load_test("http://127.0.0.1:" + str(port), paths,
+                                         requests, concurrency))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    def wait_port(self, port: int, timeout: float):
+        """Wait until a port accepts connections."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(("127.0.0.1", port), 0.2):
+                    return True
+            except OSError:
+                time.sleep(0.05)
+        return False
+
+
+def main(ap):
+    """Run the benchmark and compare the results with the baseline."""
+    bench = Benchmark(ap)
+    data = {
+        "version": RESULT_VERSION,
+        "engine": ap.engine,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": bench.results,
+    }
+    if ap.output != "":
+        with open(ap.output, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        print("  --> Save results: " + ap.output)
+    ret = 0
+    if ap.baseline != "":
+        print("[## Compare with the baseline]")
+        with open(ap.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(bench.results, baseline.get("results", {}), ap.threshold,
+                              ap.min_seconds)
+        for name, base_value, value in regressions:
+            print("  [ERROR] %s: %.4g -> %.4g (> %g%%)" % (name, base_value, value,
+                                                          ap.threshold))
+        if len(regressions) > 0:
+            ret = 1
+        else:
+            print("  --> No regression (threshold " + str(ap.threshold) + "%)")
+    return ret
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    try:
+        sys.exit(main(args))
+    except Exception as e:
+        print("[ERROR] " + str(e))
+        sys.exit(1)
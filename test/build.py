@@ -5,14 +5,41 @@
 #
 # このスクリプトは、以下の内容を実行します。
 # * .buildフォルダにjekyll-build-pagesをダウンロード
+#   (ミラーキャッシュに浅く取得し、取得済みの場合やオフラインの場合はキャッシュからコピー)
 # * jekyll-build-pagesのDockerイメージを作成
 # * jekyll-build-pagesのDockerコンテナを作成
+# * 前回のビルドから変更がない場合は、ビルドをスキップ
+# * --engine native の場合は、Dockerを使わずにビルド
+# * 依存関係のない手順(git cloneとイメージの確認など)は並列に実行
+# * DockerはEngine API(Unixソケット)で操作し、使えない場合はdockerコマンドを使用
+#   (コンテナとイメージの一覧は最初に1回だけ取得し、以降の確認はメモリの状態から回答)
+# * --image_cache の場合は、Dockerfile, Gemfile, entrypoint.sh, Rubyのバージョンの
+#   ハッシュをイメージのタグにし、同じタグのイメージがあれば再利用
+#   (ない場合はレイヤーキャッシュを使用してビルド)
+# * --daemon の場合は、Jekyll(またはネイティブエンジン)を読み込んだまま常駐する
+#   ワーカーにビルドを依頼(ワーカーがなければ起動)
+# * ビルド後に_siteのマニフェストと内容を記録(deploy.pyで変更分だけを配置)
+# * 各手順と外部コマンドの時間・終了コード・出力のバイト数を表示し、--trace でトレース
+#   (JSON Lines / Chromeのトレース)、--metrics でPrometheusのテキスト形式に出力
+# * --print_bundle の場合は、ビルド後に仕様書を印刷用の1つのHTMLファイルに出力(print_bundle.py)
 
 import sys
 import os
 import argparse
-import shutil
-import subprocess
+import asyncio
+
+import build_cache
+import build_daemon
+import deploy
+import docker_api
+import docker_state
+import log_follower
+import native_engine
+import orchestrator
+import print_bundle
+import repo_cache
+import site_artifacts
+import tracing
 
 __version__ = "0.0.1"
 parser = argparse.ArgumentParser(
@@ -49,9 +76,47 @@ parser.add_argument("--volume_site", type=str, default="_site",
 parser.add_argument("--ruby_version", type=str, default="3.3.2",
                     help="Ruby version")
 parser.add_argument("--clone_again", action='store_true',
-                    help="Execute a git clone again")
+                    help="Fetch jekyll-build-pages again")
+parser.add_argument("--cache_dir", type=str, default="",
+                    help="Mirror cache directory (default: $XDG_CACHE_HOME/github_pages)")
+parser.add_argument("--offline", action='store_true',
+                    help="Do not fetch, use the mirror cache or --archive")
+parser.add_argument("--archive", type=str, default="",
+                    help="Tarball of jekyll-build-pages to use instead of git")
 parser.add_argument("--remake_image", action='store_true',
                     help="Remake Docker image")
+parser.add_argument("--no_cache", action='store_true',
+                    help="Ignore the build manifest and build everything")
+parser.add_argument("--image_cache", action='store_true',
+                    help="Tag the image with a hash of its inputs and build with the layer cache")
+parser.add_argument("--engine", type=str, default="docker", choices=["docker", "native"],
+                    help="Build with Jekyll in Docker or with the built-in renderer")
+parser.add_argument("--docker_client", type=str, default="auto",
+                    choices=["auto", "api", "cli"],
+                    help="Control Docker through the Engine API socket or the docker command")
+parser.add_argument("--docker_socket", type=str, default="",
+                    help="Docker Engine API socket (default: DOCKER_HOST or /var/run/docker.sock)")
+parser.add_argument("--docker_events", action='store_true',
+                    help="Keep the Docker state up to date with the daemon's event stream")
+parser.add_argument("--jobs", type=int, default=0,
+                    help="Number of render processes of the native engine (0: CPU cores)")
+parser.add_argument("--plantuml", type=str, default="",
+                    help="PlantUML command of the native engine (default: PLANTUML or plantuml)")
+parser.add_argument("--daemon", action='store_true',
+                    help="Build on a resident worker (started on the first build)")
+parser.add_argument("--daemon_port", type=int, default=build_daemon.DEFAULT_PORT,
+                    help="Port of the resident worker")
+parser.add_argument("--stop_daemon", action='store_true',
+                    help="Stop the resident worker")
+parser.add_argument("--print_bundle", type=str, default="",
+                    help="Also write the single-file print bundle of docs/index.md to this file")
+parser.add_argument("--trace", type=str, default="",
+                    help="Write the spans of the phases and commands to this file")
+parser.add_argument("--trace_format", type=str, default="auto",
+                    choices=["auto", "jsonl", "chrome"],
+                    help="Format of --trace (auto: jsonl for *.jsonl, else chrome)")
+parser.add_argument("--metrics", type=str, default="",
+                    help="Write the phase metrics in the Prometheus text format to this file")
 
 
 class SetupGithubPages:
@@ -63,6 +128,16 @@ class SetupGithubPages:
     _dockerfile_path = "Dockerfile"
     _gemfile_path = "test/Gemfile"
     _remake_image = False
+    _manifest_path = "_site.manifest.json"
+    _manifest = None
+    _pages_to_rebuild = []
+    _full_build = True
+    _image_exists = None
+    _image_hash = ""
+    _plantuml = ""
+    _docker = None
+    _timings = {}
+    _ret = 0
 
     def __init__(self, ap):
         """Initialize the class."""
@@ -79,111 +154,326 @@ class SetupGithubPages:
         self._dockerfile_path = os.path.abspath(
             os.path.join(self._download_dir, ap.dockerfile_name))
         self._remake_image = ap.remake_image
+        self._plantuml = ap.plantuml
         if ap.clone_again is True:
             self._remake_image = True
-        # =========================================================
-        # If there are any containers using the image, delete them.
-        ret = self.remove_container(ap.image_name, ap.image_version)
+        self._manifest_path = build_cache.manifest_path(self._volume_site)
+        # The existence checks of the steps are answered from one snapshot of the daemon.
+        self._docker = docker_state.DockerState(
+            docker_api.create_client(ap.docker_client, ap.docker_socket, self._root_dir),
+            ap.docker_events)
+        self._timings = {}
+        tracing.start("build")
+        try:
+            with tracing.span("build", engine=ap.engine) as span:
+                self.run(ap)
+                if self._ret == 0 and ap.print_bundle != "" and ap.stop_daemon is False:
+                    with tracing.span("print_bundle") as bundle_span:
+                        self._ret = print_bundle.make_bundle(
+                            self._src, "index.md", self._volume_site,
+                            os.path.join(self._root_dir, ap.print_bundle), self._plantuml)
+                        bundle_span.status = self._ret
+                span.status = self._ret
+        finally:
+            tracing.finish(ap.trace, ap.trace_format, ap.metrics)
 
+    def run(self, ap):
+        """Run the phases of the setup."""
+        if ap.stop_daemon is True:
+            with tracing.span("stop_daemon") as span:
+                self._ret = asyncio.run(self.stop_build_daemon(ap.daemon_port))
+                span.status = self._ret
+            return
         # =========================================================
-        # If there is an image with the same name, delete it.
-        if self._remake_image is True:
-            if ret == 0:
-                ret = self.remove_image(ap.image_name, ap.image_version)
+        # If nothing has changed since the previous build, reuse _site.
+        use_cache = not (ap.no_cache or self._remake_image)
+        with tracing.span("check_manifest") as span:
+            skip = self.check_build_manifest(ap.branch, ap.engine, use_cache)
+            span.status = 0
+        self._timings["check_manifest"] = span.seconds
+        if skip is True:
+            return
 
         # =========================================================
-        if ret == 0:
-            ret = self.download_jekyll_build_pages(
-                self._download_dir, ap.url, ap.branch, ap.clone_again)
+        # Build on the resident worker.
+        if ap.daemon is True:
+            with tracing.span("daemon_build") as span:
+                self._ret = asyncio.run(self.build_on_daemon(ap))
+                span.status = self._ret
+            self._timings["daemon_build"] = span.seconds
+            return
 
         # =========================================================
-        if ret == 0:
-            ret = self.build_docker_image(self._root_dir, self._download_dir,
-                                          self._dockerfile_path,
-                                          ap.image_name, ap.image_version,
-                                          ap.ruby_version)
+        # Build without Docker.
+        if ap.engine == "native":
+            with tracing.span("native_build") as span:
+                ret = self.build_native(self._src, self._volume_site, ap.jobs)
+                span.status = ret
+            self._timings["native_build"] = span.seconds
+            if ret == 0:
+                with tracing.span("save_manifest") as span:
+                    ret = self.save_build_manifest()
+                    span.status = ret
+            self._ret = ret
+            return
 
         # =========================================================
-        if ret == 0:
-            ret = self.create_docker_container(ap.image_name, ap.image_version, ap.container_name,
-                                               self._src, self._volume_site, self._gemfile_path)
+        # Run the Docker steps. Steps that do not depend on each other
+        # (e.g. the git clone and the image check) run concurrently.
+        graph = orchestrator.TaskGraph()
+        self.add_image_steps(graph, ap)
+        graph.add("create_container",
+                  lambda: self.create_docker_container(ap.image_name, ap.image_version,
+                                                       ap.container_name, self._src,
+                                                       self._volume_site, self._gemfile_path),
+                  ["remove_container", "build_image"])
+        graph.add("wait_container",
+                  lambda: self.wait_docker_container(ap.container_name),
+                  ["create_container"])
+        graph.add("save_manifest", self.save_build_manifest_async, ["wait_container"])
+        with tracing.span("docker_steps", client=self._docker.name) as span:
+            ret = asyncio.run(self.run_graph(graph))
+            span.status = ret
+        self._timings.update(graph.timings)
+        self._ret = ret
 
         # =========================================================
         # self.print_container_list()
         # self.print_docker_logs(ap.container_name)
         # =========================================================
 
-    def download_jekyll_build_pages(self, download_dir: str,
-                                    url: str, branch: str,
-                                    clone_again: bool):
-        """Download jekyll-build-pages."""
-        print("[## Download jekyll-build-pages]")
-        ret = 0
-        _flag_download = True
-        # Delete the existing directory
-        if os.path.exists(download_dir):
-            if clone_again is True:
-                print("  --> Remove directory: " + download_dir)
-                shutil.rmtree(download_dir)
-                _flag_download = True
+    @property
+    def timings(self):
+        """Get the wall time of each phase (seconds)."""
+        return self._timings
+
+    @property
+    def ret(self):
+        """Get the exit status of the setup."""
+        return self._ret
+
+    def add_image_steps(self, graph: orchestrator.TaskGraph, ap):
+        """Add the steps that remove the old containers and prepare the image."""
+        # If there are any containers using the image, delete them.
+        graph.add("remove_container",
+                  lambda: self.remove_container(ap.image_name, ap.image_version))
+        graph.add("download",
+                  lambda: self.download_jekyll_build_pages(
+                      self._download_dir, ap.url, ap.branch, ap.clone_again,
+                      ap.cache_dir, ap.offline, ap.archive))
+        if ap.image_cache is True:
+            self.add_cached_image_steps(graph, ap)
+        else:
+            image_depends = []
+            if self._remake_image is True:
+                # If there is an image with the same name, delete it.
+                graph.add("remove_image",
+                          lambda: self.remove_image(ap.image_name, ap.image_version),
+                          ["remove_container"])
+                image_depends = ["remove_image"]
+            graph.add("check_image",
+                      lambda: self.check_docker_image(ap.image_name, ap.image_version),
+                      image_depends)
+            graph.add("build_image",
+                      lambda: self.build_docker_image(self._root_dir, self._download_dir,
+                                                      self._dockerfile_path,
+                                                      ap.image_name, ap.image_version,
+                                                      ap.ruby_version),
+                      ["check_image", "download"])
+
+    def add_cached_image_steps(self, graph: orchestrator.TaskGraph, ap):
+        """Add the steps that reuse or build the image tagged with its input hash."""
+        graph.add("image_hash",
+                  lambda: self.hash_image_inputs(self._download_dir, self._dockerfile_path,
+                                                 ap.ruby_version),
+                  ["download"])
+        image_depends = ["image_hash"]
+        if self._remake_image is True:
+            # Untag the hashed image so that it is built again.
+            graph.add("remove_image",
+                      lambda: self.remove_image(ap.image_name, self._image_hash),
+                      ["remove_container", "image_hash"])
+            image_depends = ["remove_image"]
+        graph.add("check_image",
+                  lambda: self.check_docker_image(ap.image_name, self._image_hash),
+                  image_depends)
+        graph.add("build_hashed_image",
+                  lambda: self.build_docker_image(self._root_dir, self._download_dir,
+                                                  self._dockerfile_path,
+                                                  ap.image_name, self._image_hash,
+                                                  ap.ruby_version, self._remake_image),
+                  ["check_image"])
+        # The container and the other steps use image_name:image_version.
+        graph.add("build_image",
+                  lambda: self.tag_docker_image(ap.image_name, self._image_hash,
+                                                ap.image_version),
+                  ["build_hashed_image"])
+
+    async def build_on_daemon(self, ap):
+        """Submit the build to the resident worker, starting it if needed."""
+        print("[## Build on the resident worker]")
+        host = build_daemon.DEFAULT_HOST
+        expected = "native" if ap.engine == "native" else "jekyll"
+        worker = await build_daemon.ping(host, ap.daemon_port)
+        if worker != "" and worker != expected:
+            print("  [ERROR] Another worker (" + worker + ") is running on port "
+                  + str(ap.daemon_port))
+            return 1
+        if worker == "":
+            if ap.engine == "native":
+                build_daemon.start_native_worker(
+                    host, ap.daemon_port, self._src, self._volume_site,
+                    os.path.join(self._download_dir, "build_daemon.log"))
             else:
-                print("  --> exists directory: " + download_dir)
-                _flag_download = False
-
-        if _flag_download is True:
-            # Clone the repository
-            flag_autocrlf = "false"
-            ret, result = self.get_process(
-                ['git', 'config', '--global', 'core.autocrlf'])
-            if ret == 0:
-                flag_autocrlf = result
-                print("  --> git config core.autocrlf " + flag_autocrlf)
+                graph = orchestrator.TaskGraph()
+                self.add_image_steps(graph, ap)
+                graph.add("create_worker",
+                          lambda: self.create_worker_container(ap.image_name,
+                                                               ap.image_version,
+                                                               ap.container_name + "_worker",
+                                                               ap.daemon_port),
+                          ["remove_container", "build_image"])
+                ret = await self.run_graph(graph)
+                self._timings.update(graph.timings)
+                if ret != 0:
+                    return ret
+            if await build_daemon.wait_ready(host, ap.daemon_port) == "":
+                print("  [ERROR] The worker did not start on port " + str(ap.daemon_port))
+                return 1
+            print("  --> Start the " + expected + " worker: " + host + ":"
+                  + str(ap.daemon_port))
+        if ap.engine == "native":
+            ret, result = await build_daemon.submit_build(
+                host, ap.daemon_port, self._src, self._volume_site,
+                None if self._full_build is True else self._pages_to_rebuild,
+                options={"jobs": ap.jobs, "plantuml": self._plantuml})
+        else:
+            # The paths in the container (see create_worker_container).
+            ret, result = await build_daemon.submit_build(
+                host, ap.daemon_port, "/root/src", "/root/_site",
+                incremental=not self._full_build)
+        if ret != 0:
+            print("  [ERROR] " + result)
+            return ret
+        build_daemon.print_result(result)
+        ret = int(result.get("status", 1))
+        if ret == 0:
+            ret = self.save_build_manifest()
+        return ret
 
-            ret, result = self.get_process(
-                ['git', 'config', '--global', 'core.autocrlf', "input"])
-            if ret == 0:
-                print("  --> git config core.autocrlf input")
-            if ret == 0:
-                # Clone the repository
-                ret, result = self.get_process(['git', 'clone', '--quiet', '--no-progress', url,
-                                                '--branch', branch, download_dir])
-                if ret == 0:
-                    print("  --> Get clone " + url + "(" + branch + ")")
-                else:
-                    print("  [ERROR] " + result)
-            ret, result = self.get_process(
-                ['git', 'config', '--global', 'core.autocrlf', flag_autocrlf])
-            ret, result = self.get_process(
-                ['git', 'config', '--global', 'core.autocrlf'])
-            if ret == 0:
-                print("  --> git config core.autocrlf " + result)
+    async def stop_build_daemon(self, port: int):
+        """Stop the resident worker."""
+        print("[## Stop the resident worker]")
+        if await build_daemon.ping(build_daemon.DEFAULT_HOST, port) == "":
+            print("  --> Not running: " + str(port))
+            return 0
+        ret = await build_daemon.stop(build_daemon.DEFAULT_HOST, port)
+        if ret == 0:
+            print("  --> Stop: " + str(port))
+        else:
+            print("  [ERROR] Don't stop the worker")
+        return ret
+
+    async def run_graph(self, graph: orchestrator.TaskGraph):
+        """Run the task graph and close the Docker connection."""
+        try:
+            return await graph.run()
+        finally:
+            self._docker.print_stats()
+            await self._docker.close()
+
+    def check_build_manifest(self, branch: str, engine: str, use_cache: bool):
+        """Check whether the previous build results can be reused."""
+        print("[## Check the build manifest]")
+        self._manifest = build_cache.BuildManifest.create(
+            self._src,
+            {"_config.yml": os.path.join(self._src, "_config.yml"),
+             "Gemfile": self._gemfile_path},
+            {"branch": branch, "engine": engine})
+        previous = None
+        if use_cache is True:
+            previous = build_cache.BuildManifest.load(self._manifest_path)
+        if os.path.isdir(self._volume_site) and self._manifest.matches(previous):
+            print("  --> Up to date, skip the build: " + self._volume_site)
+            return True
+
+        self._pages_to_rebuild = self._manifest.pages_to_rebuild(previous)
+        self._full_build = self._manifest.inputs_changed(previous)
+        if self._full_build is True:
+            print("  --> Build all pages")
+        else:
+            print("  --> Changed pages: " + str(len(self._pages_to_rebuild)))
+            for page in self._pages_to_rebuild:
+                print("        " + page)
+        return False
+
+    def save_build_manifest(self):
+        """Save the build manifest."""
+        print("[## Save the build manifest]")
+        ret = 0
+        try:
+            self._manifest.save(self._manifest_path)
+            print("  --> Save manifest: " + self._manifest_path)
+        except OSError as e:
+            print("  [ERROR] " + str(e))
+            ret = 1
+        if ret == 0:
+            ret = self.record_site_artifacts()
         return ret
 
-    def remove_container(self, image_name: str, image_version: str):
+    def record_site_artifacts(self):
+        """Record the build results for deploy.py."""
+        store = site_artifacts.ArtifactStore(site_artifacts.store_dir(self._volume_site))
+        try:
+            return deploy.record_build(store, self._volume_site)
+        except OSError as e:
+            print("  [ERROR] " + str(e))
+            return 1
+
+    def build_native(self, src: str, volume_site: str, jobs: int):
+        """Build the site with the built-in renderer."""
+        engine = native_engine.NativeEngine(src, volume_site, jobs, self._plantuml)
+        if self._full_build is True:
+            return engine.build()
+        return engine.build(self._pages_to_rebuild)
+
+    async def save_build_manifest_async(self):
+        """Save the build manifest from the task graph."""
+        return self.save_build_manifest()
+
+    async def download_jekyll_build_pages(self, download_dir: str,
+                                          url: str, branch: str,
+                                          clone_again: bool, cache_dir: str = "",
+                                          offline: bool = False, archive: str = ""):
+        """Download jekyll-build-pages."""
+        print("[## Download jekyll-build-pages]")
+        if archive != "":
+            archive = os.path.abspath(os.path.join(self._root_dir, archive))
+        cache = repo_cache.RepoCache(cache_dir)
+        return await cache.checkout(url, branch, download_dir, clone_again, offline, archive)
+
+    async def remove_container(self, image_name: str, image_version: str):
         """Remove Docker container."""
         print("[## Remove a container]")
         # ================================
         # If there are any containers using the image, delete them.
-        ret, result = self.get_process(['docker', 'ps', '-a', '--format', '"{{.Names}}"',
-                                        '--filter', 'ancestor=' + image_name + ':' + image_version])
+        ret, containers = await self._docker.list_containers(
+            True, ancestor=image_name + ':' + image_version)
         if ret == 0:
-            for container_name in result.splitlines():
-                if container_name == "":
-                    continue
-                ret2, _result2 = self.get_process(
-                    ['docker', 'rm', '-f', container_name])
+            names = [item["Name"] for item in containers]
+            results = await asyncio.gather(
+                *[self._docker.remove_container(name) for name in names])
+            for container_name, ret2 in zip(names, results):
                 print(
                     "  --> Remove container: " + container_name + "(" + str(ret2) + ")")
         return ret
 
-    def remove_image(self, image_name: str, image_version: str):
+    async def remove_image(self, image_name: str, image_version: str):
         """Remove Docker image."""
         print("[## Remove a docker image]")
-        ret, result = self.get_process(
-            ['docker', 'images', '-q', image_name + ':' + image_version])
-        if result != "":
-            ret, _result2 = self.get_process(
-                ['docker', 'rmi', image_name + ':' + image_version])
+        ret, image_id = await self._docker.image_id(image_name + ':' + image_version)
+        if ret == 0 and image_id != "":
+            ret, _result2 = await self._docker.remove_image(image_name + ':' + image_version)
             if ret == 0:
                 print(
                     "  --> Remove image: " + image_name + ':' + image_version)
@@ -191,55 +481,77 @@ class SetupGithubPages:
                 print("  [ERROR] Don't remove a Docker image")
         return ret
 
-    def build_docker_image(self, root_dir: str, download_dir: str, dockerfile_path: str,
-                           image_name: str, image_version: str, ruby_version: str):
+    async def check_docker_image(self, image_name: str, image_version: str):
+        """Check whether the Docker image exists."""
+        ret, image_id = await self._docker.image_id(image_name + ':' + image_version)
+        if ret == 0:
+            self._image_exists = image_id != ""
+        return ret
+
+    async def hash_image_inputs(self, download_dir: str, dockerfile_path: str,
+                                ruby_version: str):
+        """Get the image tag from the hash of the image inputs."""
+        print("[## Hash the image inputs]")
+        self._image_hash = build_cache.content_tag(
+            {"Dockerfile": dockerfile_path,
+             "Gemfile": os.path.join(download_dir, "Gemfile"),
+             "entrypoint.sh": os.path.join(download_dir, "entrypoint.sh")},
+            {"RUBY_VERSION": ruby_version})
+        print("  --> Image inputs hash: " + self._image_hash)
+        return 0
+
+    async def build_docker_image(self, root_dir: str, download_dir: str, dockerfile_path: str,
+                                 image_name: str, image_version: str, ruby_version: str,
+                                 nocache: bool = True):
         """Build Docker Image."""
         print("[## Create a Docker image]")
-        ret, result = self.get_process(
-            ['docker', 'images', '-q', image_name + ':' + image_version])
-        if result == "":
-            os.chdir(download_dir)
-            ret = os.system('docker build'
-                            + ' --no-cache'
-                            + ' --build-arg RUBY_VERSION=' + ruby_version
-                            + ' -t ' + image_name + ':' + image_version
-                            + ' -f' + dockerfile_path
-                            + " " + download_dir)
-            os.chdir(root_dir)
+        ret = 0
+        if self._image_exists is None:
+            ret = await self.check_docker_image(image_name, image_version)
+        if self._image_exists is False:
+            ret, _result = await self._docker.build_image(
+                download_dir, dockerfile_path, image_name + ':' + image_version,
+                {"RUBY_VERSION": ruby_version}, nocache=nocache)
             if ret == 0:
+                self._image_exists = True
                 print("  --> Create image: "
                       + image_name + ':' + image_version + "(" + str(ret) + ")")
-        else:
+        elif ret == 0:
             print("  --> Already exists image: "
                   + image_name + ':' + image_version)
 
         return ret
 
-    def create_docker_container(self, image_name: str, image_version: str,
-                                container_name: str,
-                                src: str, volume_site: str, gemfile_path: str):
+    async def tag_docker_image(self, image_name: str, image_hash: str, image_version: str):
+        """Tag the hashed image with the image version."""
+        ret, result = await self._docker.tag_image(image_name + ':' + image_hash,
+                                                   image_name, image_version)
+        if ret == 0:
+            print("  --> Tag image: " + image_name + ':' + image_hash
+                  + " -> " + image_name + ':' + image_version)
+        else:
+            print("  [ERROR] Don't tag a Docker image: " + result)
+        return ret
+
+    async def create_docker_container(self, image_name: str, image_version: str,
+                                      container_name: str,
+                                      src: str, volume_site: str, gemfile_path: str):
         """Create Docker Container."""
         ret = 0
         print("[## Create Docker Container]")
-        ret, _result = self.get_process(
-            ['docker', 'run', '-dit',
-             '--name', container_name,
-             '--hostname', container_name,
-             '--rm',
-             '-v', gemfile_path + ":/root/src/Gemfile",
-             '-v', src + ":/root/src",
-             '-v', volume_site + ":/root/_site",
-             '-e', "GITHUB_WORKSPACE=/root",
-             '-e', "INPUT_SOURCE=src",
-             '-e', "INPUT_DESTINATION=_site",
-             '-e', "INPUT_FUTURE=true",
-             '-e', "INPUT_VERBOSE=true",
-             '-e', "INPUT_TOKEN=",
-             '-e', "INPUT_BUILD_REVISION=",
-             '--workdir', "/",
-             image_name + ":" + image_version,
-             "/bin/bash"
-             ])
+        ret, _result = await self._docker.run_container(
+            image_name + ":" + image_version, container_name, ["/bin/bash"],
+            binds=[gemfile_path + ":/root/src/Gemfile",
+                   src + ":/root/src",
+                   volume_site + ":/root/_site"],
+            env=["GITHUB_WORKSPACE=/root",
+                 "INPUT_SOURCE=src",
+                 "INPUT_DESTINATION=_site",
+                 "INPUT_FUTURE=true",
+                 "INPUT_VERBOSE=true",
+                 "INPUT_TOKEN=",
+                 "INPUT_BUILD_REVISION="],
+            workdir="/")
         if ret == 0:
             print("  --> Create Docker container: " + container_name)
             print("        src:         " + src)
@@ -248,57 +560,69 @@ class SetupGithubPages:
             print("  [ERROR] Don't create a Docker container")
         return ret
 
-    def print_docker_logs(self, container_name: str):
-        """Print Docker Logs."""
+    async def create_worker_container(self, image_name: str, image_version: str,
+                                      container_name: str, port: int):
+        """Create the Docker container of the resident build worker."""
+        print("[## Create the build worker container]")
+        worker_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   "src", "jekyll", "build_worker.rb")
+        ret, _result = await self._docker.run_container(
+            image_name + ":" + image_version, container_name, [],
+            binds=[self._gemfile_path + ":/root/src/Gemfile",
+                   self._src + ":/root/src",
+                   self._volume_site + ":/root/_site",
+                   worker_path + ":/root/worker/build_worker.rb"],
+            env=["JEKYLL_ENV=production",
+                 "BUILD_WORKER_PORT=" + str(build_daemon.DEFAULT_PORT),
+                 "BUILD_WORKER_TOKEN=" + build_daemon.load_token(port, create=True)],
+            workdir="/root",
+            ports={port: build_daemon.DEFAULT_PORT},
+            host_ip=build_daemon.DEFAULT_HOST,
+            auto_remove=True,
+            entrypoint=["ruby", "/root/worker/build_worker.rb"])
+        if ret == 0:
+            print("  --> Create Docker container: " + container_name)
+        else:
+            print("  [ERROR] Don't create a Docker container")
+        return ret
+
+    async def wait_docker_container(self, container_name: str):
+        """Wait for the build in the Docker container to finish and remove the container."""
+        print("[## Wait for the build]")
+        ret, result = await self._docker.wait_container(container_name)
+        if ret == 0:
+            ret = result
+            print("  --> Finish build: " + container_name + "(" + str(ret) + ")")
+            # The container is not created with --rm: a fast build could be removed
+            # before the wait, which fails with "No such container".
+            if await self._docker.remove_container(container_name) != 0:
+                print("  [WARNING] Don't remove the Docker container: " + container_name)
+        else:
+            print("  [ERROR] Don't wait for a Docker container")
+        return ret
+
+    async def print_docker_logs(self, container_name: str, lines: int = 200):
+        """Print the new lines of the Docker logs."""
         print("[## docker logs]")
-        ret = os.system('docker logs ' + container_name)
+        follower = log_follower.LogFollower(self._docker, container_name, lines=lines)
+        ret, message = await follower.read()
+        for text in follower.lines:
+            print(text)
+        if ret != 0:
+            print("  [ERROR] " + message)
         return ret
 
-    def print_container_list(self):
+    async def print_container_list(self):
         """Print Docker Container"""
         print("[## Container list] ")
-        ret, result = self.get_process(
-            ['docker', 'ps', '-a', '--format', '"{{.Names}} : {{.Status}}"'])
+        ret, containers = await self._docker.list_containers(True)
         if ret == 0:
             print("--------------------------------------------------")
-            print(result)
+            for item in containers:
+                print(item["Name"] + " : " + item["Status"])
             print("--------------------------------------------------")
         return ret
 
-    def process_run(self, cmd: str, work_dir: str = ""):
-        """Run the process."""
-        try:
-            if work_dir == "":
-                work_dir = self._root_dir
-            proc = subprocess.run(
-                cmd, check=True, shell=True, cwd=work_dir, stdout=subprocess.PIPE)
-            stdout = proc.stdout
-            str_type = type(stdout)
-            if str_type is bytes:
-                stdout = stdout.decode('utf-8').replace('"', '')
-            else:
-                stdout = str(stdout).replace('"', '')
-            return proc.returncode, stdout
-        except Exception as e:
-            return 1, str(e)
-
-    def get_process(self, cmd: str, work_dir: str = ""):
-        """Get the process."""
-        try:
-            if work_dir == "":
-                work_dir = self._root_dir
-            proc = subprocess.run(
-                cmd, check=True, shell=True, cwd=work_dir, stdout=subprocess.PIPE)
-            stdout = proc.stdout
-            str_type = type(stdout)
-            if str_type is bytes:
-                stdout = stdout.decode('utf-8').replace('"', '')
-            else:
-                stdout = str(stdout).replace('"', '')
-            return proc.returncode, stdout
-        except Exception as e:
-            return 1, str(e)
-
 
 if __name__ == "__main__":
     args = parser.parse_args()
@@ -0,0 +1,166 @@
+"""This is a module to cache the build results of the docs tree."""
+# SYSTEM: Python 3.11.1
+#
+# これは、docsフォルダのビルド結果をキャッシュするためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * ソースフォルダ配下の全ファイルのSHA-256ハッシュを計算
+# * _config.yml, Gemfile, ブランチ名をビルド条件として記録
+# * 前回のマニフェストと比較し、再ビルドが必要なページを抽出
+#   (@importと画像の参照はimport_resolver.pyのグラフで解決し、docsの外のファイルもハッシュを記録)
+# * Dockerイメージの入力ファイルのハッシュからイメージのタグを作成
+
+import os
+import json
+import hashlib
+
+import import_resolver
+
+MANIFEST_VERSION = 2
+PAGE_EXTENSIONS = (".md", ".markdown", ".html")
+
+
+def hash_file(path: str):
+    """Get the SHA-256 hash of a file."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hash_text(text: str):
+    """Get the SHA-256 hash of a string."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_inputs(input_files: dict, input_values: dict):
+    """Get the hashes of the build input files and values."""
+    inputs = {}
+    for name, path in input_files.items():
+        if os.path.isfile(path):
+            inputs[name] = hash_file(path)
+        else:
+            inputs[name] = ""
+    for name, value in input_values.items():
+        inputs[name] = hash_text(str(value))
+    return inputs
+
+
+def content_tag(input_files: dict, input_values: dict, length: int = 16):
+    """Get an image tag derived from the hashes of the build inputs."""
+    inputs = hash_inputs(input_files, input_values)
+    return hash_text(json.dumps(inputs, sort_keys=True))[:length]
+
+
+def manifest_path(volume_site: str):
+    """Get the manifest path stored next to the build results."""
+    volume_site = os.path.abspath(volume_site)
+    return os.path.join(os.path.dirname(volume_site),
+                        os.path.basename(volume_site) + ".manifest.json")
+
+
+def list_files(src: str):
+    """List all files under the source directory as relative paths."""
+    files = []
+    for dir_path, dir_names, file_names in os.walk(src):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            path = os.path.join(dir_path, file_name)
+            files.append(os.path.relpath(path, src).replace(os.sep, "/"))
+    return files
+
+
+class BuildManifest:
+    """Build manifest of the source tree."""
+    _files = {}
+    _inputs = {}
+    _resolver = None
+
+    def __init__(self, files: dict, inputs: dict, resolver=None):
+        """Initialize the class. resolver is the import graph of the current tree."""
+        self._files = files
+        self._inputs = inputs
+        self._resolver = resolver
+
+    @classmethod
+    def create(cls, src: str, input_files: dict, input_values: dict):
+        """Create a manifest from the current source tree.
+
+        The files outside the source that the pages import or show are recorded as "../...".
+        """
+        files = {}
+        for rel_path in list_files(src):
+            files[rel_path] = hash_file(os.path.join(src, rel_path))
+        resolver = import_resolver.ImportResolver(src)
+        for rel_path in resolver.scan([rel_path for rel_path in files
+                                       if rel_path.endswith(PAGE_EXTENSIONS)]):
+            files[rel_path] = hash_file(os.path.join(src, rel_path))
+        inputs = hash_inputs(input_files, input_values)
+        return cls(files, inputs, resolver)
+
+    @classmethod
+    def load(cls, path: str):
+        """Load a manifest. Returns None if there is no valid manifest."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                return None
+            return cls(data["files"], data["inputs"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, path: str):
+        """Save the manifest."""
+        data = {
+            "version": MANIFEST_VERSION,
+            "inputs": self._inputs,
+            "files": self._files,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    @property
+    def files(self):
+        """Get the file hashes."""
+        return self._files
+
+    @property
+    def inputs(self):
+        """Get the build inputs."""
+        return self._inputs
+
+    def inputs_changed(self, previous):
+        """Check whether the build inputs have changed."""
+        if previous is None:
+            return True
+        return self._inputs != previous.inputs
+
+    def changed_files(self, previous):
+        """Get the files that were added, modified or removed."""
+        if previous is None:
+            return sorted(self._files.keys())
+        changed = set()
+        for rel_path, digest in self._files.items():
+            if previous.files.get(rel_path) != digest:
+                changed.add(rel_path)
+        for rel_path in previous.files.keys():
+            if rel_path not in self._files:
+                changed.add(rel_path)
+        return sorted(changed)
+
+    def pages_to_rebuild(self, previous):
+        """Get the changed pages and the pages that depend on them."""
+        if self.inputs_changed(previous):
+            return sorted(rel_path for rel_path in self._files
+                          if rel_path.startswith("../") is False)
+        return self._resolver.dependents(self.changed_files(previous))
+
+    def matches(self, previous):
+        """Check whether nothing has changed since the previous build."""
+        if previous is None:
+            return False
+        return self._inputs == previous.inputs and self._files == previous.files
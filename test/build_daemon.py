@@ -0,0 +1,263 @@
+"""This is a module to run builds on a resident build worker."""
+# SYSTEM: Python 3.11.1
+#
+# これは、常駐するビルドワーカーにビルドを依頼するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * ワーカーとは、TCPで1行のJSON(ping, build, stop)をやり取り
+# * ping以外のコマンドには、本人だけが読めるファイルに保存したトークンを付ける
+#   (~/.cache/github_pages/build_daemon_<ポート>.token, ワーカーは127.0.0.1でのみ待ち受け)
+# * ワーカーは起動時に指定されたsrc/dstのビルドだけを受け付ける
+# * Docker版のワーカーは、Jekyllを読み込んだまま常駐するコンテナ(src/jekyll/build_worker.rb)
+# * ネイティブ版のワーカーは、このスクリプトを常駐プロセスとして実行(テストにも使用)
+# * ビルドの結果として、終了コード・ビルド時間・ページごとの変換時間を受け取る
+#
+# 単体で実行した場合は、ネイティブ版のワーカーとして常駐します。
+#   build_daemon.py --port 4010 --src ../docs --dst ../_site
+
+import io
+import sys
+import os
+import json
+import hmac
+import time
+import secrets
+import asyncio
+import argparse
+import subprocess
+import contextlib
+
+import native_engine
+import repo_cache
+
+__version__ = "0.0.1"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 4010
+CONNECT_TIMEOUT = 2.0
+BUILD_TIMEOUT = 600.0
+START_TIMEOUT = 120.0
+SLOWEST_PAGES = 5
+parser = argparse.ArgumentParser(
+    description="Resident build worker of the native engine"
+)
+parser.add_argument("-v", "--version", action="version",
+                    version="%(prog)s ver." + __version__)
+parser.add_argument("--host", type=str, default=DEFAULT_HOST, help="Address to listen on")
+parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+parser.add_argument("--src", type=str,
+                    default=os.path.abspath(os.path.join(os.path.dirname(__file__), "../docs")),
+                    help="The only source directory the worker builds")
+parser.add_argument("--dst", type=str,
+                    default=os.path.abspath(os.path.join(os.path.dirname(__file__), "../_site")),
+                    help="The only output directory the worker writes")
+
+
+def token_path(port: int):
+    """Get the token file of the worker on a port."""
+    return os.path.join(repo_cache.default_cache_dir(), "build_daemon_" + str(port) + ".token")
+
+
+def load_token(port: int, create: bool = False):
+    """Read the token of the worker on a port. Returns "" if there is none.
+
+    create makes a new token that only the user can read.
+    """
+    path = token_path(port)
+    if create is True:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(secrets.token_hex(32))
+        except FileExistsError:
+            os.chmod(path, 0o600)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+async def request(host: str, port: int, message: dict, timeout: float = BUILD_TIMEOUT):
+    """Send a command to a worker. Returns (ret, response or error message)."""
+    message = dict(message, token=load_token(port))
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port),
+                                                CONNECT_TIMEOUT)
+    except (OSError, asyncio.TimeoutError) as e:
+        return 1, str(e) or "Connection timeout"
+    try:
+        writer.write((json.dumps(message) + "\n").encode("utf-8"))
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        return 0, json.loads(line.decode("utf-8"))
+    except (OSError, ValueError, asyncio.TimeoutError) as e:
+        return 1, str(e) or "Timeout"
+    finally:
+        writer.close()
+
+
+async def ping(host: str, port: int):
+    """Check whether a worker is running. Returns the worker name or ""."""
+    ret, result = await request(host, port, {"command": "ping"}, CONNECT_TIMEOUT)
+    if ret != 0 or isinstance(result, dict) is False:
+        return ""
+    return str(result.get("worker", ""))
+
+
+async def wait_ready(host: str, port: int, timeout: float = START_TIMEOUT):
+    """Wait for a worker to accept commands. Returns the worker name or ""."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        worker = await ping(host, port)
+        if worker != "":
+            return worker
+        await asyncio.sleep(0.2)
+    return ""
+
+
+async def submit_build(host: str, port: int, src: str, dst: str, pages: list = None,
+                       incremental: bool = False, options: dict = None):
+    """Submit a build. Returns (ret, response or error message)."""
+    message = {"command": "build", "src": src, "dst": dst, "pages": pages,
+               "incremental": incremental}
+    message.update(options or {})
+    return await request(host, port, message)
+
+
+async def stop(host: str, port: int):
+    """Stop a worker."""
+    ret, _result = await request(host, port, {"command": "stop"}, CONNECT_TIMEOUT)
+    return ret
+
+
+def print_result(result: dict):
+    """Print the result of a build."""
+    log = str(result.get("log", ""))
+    if log != "":
+        print(log.rstrip("\n"))
+    pages = sorted(result.get("pages") or [], key=lambda item: -item[1])
+    print("  --> Build on the worker: " + str(len(pages)) + " pages in "
+          + str(round(float(result.get("seconds", 0)) * 1000)) + " ms")
+    for path, seconds in pages[:SLOWEST_PAGES]:
+        print("        " + str(round(seconds * 1000, 1)) + " ms : " + path)
+
+
+def start_native_worker(host: str, port: int, src: str, dst: str, log_path: str = ""):
+    """Start the native worker of a site in the background."""
+    if log_path != "":
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    log = open(log_path, "ab") if log_path != "" else subprocess.DEVNULL
+    try:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                          "--host", host, "--port", str(port), "--src", src, "--dst", dst],
+                         cwd=os.path.dirname(os.path.abspath(__file__)),
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                         start_new_session=True)
+    finally:
+        if log_path != "":
+            log.close()
+
+
+class NativeBuildWorker:
+    """Resident worker that keeps native engines (and their caches) loaded."""
+    _token = ""
+    _src = "docs"
+    _dst = "_site"
+    _engines = {}
+    _lock = None
+    _stopped = None
+
+    def __init__(self, token: str, src: str, dst: str):
+        """Initialize the class. Only the builds of src into dst are accepted."""
+        self._token = token
+        self._src = os.path.abspath(src)
+        self._dst = os.path.abspath(dst)
+        self._engines = {}
+        self._lock = None
+        self._stopped = None
+
+    def engine(self, message: dict):
+        """Get the engine of a build, creating it when the site changed."""
+        src = os.path.abspath(message["src"])
+        config_path = os.path.join(src, "_config.yml")
+        mtime = os.path.getmtime(config_path) if os.path.isfile(config_path) else 0
+        key = json.dumps([src, os.path.abspath(message["dst"]), message.get("jobs", 0),
+                          message.get("plantuml", ""), mtime])
+        if key not in self._engines:
+            self._engines[key] = native_engine.NativeEngine(
+                src, message["dst"], int(message.get("jobs", 0)),
+                str(message.get("plantuml", "")))
+        return self._engines[key]
+
+    def build(self, message: dict):
+        """Run a build and collect its output."""
+        log = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(log):
+            try:
+                engine = self.engine(message)
+                ret = engine.build(message.get("pages"))
+                pages = sorted(engine.page_timings.items())
+            except (OSError, ValueError, KeyError) as e:
+                print("  [ERROR] " + str(e))
+                ret, pages = 1, []
+        return {"status": ret, "seconds": time.perf_counter() - start,
+                "pages": pages, "log": log.getvalue()}
+
+    def check(self, message: dict):
+        """Check the token and the site of a command. Returns "" if it is accepted."""
+        if hmac.compare_digest(str(message.get("token", "")).encode("utf-8"),
+                               self._token.encode("utf-8")) is False:
+            return "Invalid token"
+        if message.get("command") == "build" and (
+                os.path.abspath(str(message.get("src", ""))) != self._src
+                or os.path.abspath(str(message.get("dst", ""))) != self._dst):
+            return "The worker builds only " + self._src + " into " + self._dst
+        return ""
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handle a command."""
+        try:
+            message = json.loads((await reader.readline()).decode("utf-8") or "{}")
+            command = message.get("command")
+            error = self.check(message) if command != "ping" else ""
+            if error != "":
+                response = {"status": 1, "log": "  [ERROR] " + error + "\n"}
+            elif command == "ping":
+                response = {"status": 0, "worker": "native", "version": __version__}
+            elif command == "build":
+                async with self._lock:
+                    response = await asyncio.to_thread(self.build, message)
+            elif command == "stop":
+                response = {"status": 0}
+                self._stopped.set()
+            else:
+                response = {"status": 1, "log": "Unknown command\n"}
+            writer.write((json.dumps(response) + "\n").encode("utf-8"))
+            await writer.drain()
+        except (OSError, ValueError) as e:
+            print("  [ERROR] " + str(e))
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        """Accept commands until a stop command is received."""
+        self._lock = asyncio.Lock()
+        self._stopped = asyncio.Event()
+        server = await asyncio.start_server(self.handle, host, port)
+        print("[## Build worker] " + host + ":" + str(port), flush=True)
+        print("  --> " + self._src + " -> " + self._dst, flush=True)
+        async with server:
+            await self._stopped.wait()
+        return 0
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    try:
+        worker = NativeBuildWorker(load_token(args.port, create=True), args.src, args.dst)
+        sys.exit(asyncio.run(worker.serve(args.host, args.port)))
+    except Exception as e:
+        print("[ERROR] " + str(e))
+        sys.exit(1)
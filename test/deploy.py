@@ -0,0 +1,156 @@
+"""This is a script to deploy only the changes of the build results."""
+# SYSTEM: Python 3.11.1
+#
+# これは、ビルド結果(_site)の変更されたファイルだけを配置するスクリプトです。
+#
+# このスクリプトは、以下の内容を実行します。
+# * build.pyがビルドごとに記録したマニフェストと内容(_site.cache/artifacts)を使う
+# * --target の場合は、配置先のフォルダに変更されたファイルだけをコピーし、削除されたファイルを削除
+#   (配置先のマニフェストは<配置先>.deploy.jsonに保存)
+# * --bundle の場合は、--base のマニフェストからの変更だけを1つのファイル(tar.zst / tar.gz)に出力
+# * --apply の場合は、出力したファイルを配置先のフォルダに反映
+# * --build で以前のビルドを指定して戻すことも可能(--list でビルドの一覧を表示)
+
+import sys
+import os
+import time
+import argparse
+import datetime
+
+import site_artifacts
+
+__version__ = "0.0.1"
+parser = argparse.ArgumentParser(
+    description="Deploy only the changes of the build results"
+)
+parser.add_argument("-v", "--version", action="version",
+                    version="%(prog)s ver." + __version__)
+parser.add_argument("--root_dir", type=str,
+                    default=os.path.abspath(os.path.join(
+                        os.path.dirname(__file__), "./..")),
+                    help="Root directory")
+parser.add_argument("--volume_site", type=str, default="_site",
+                    help="Directory of the built site")
+parser.add_argument("--store", type=str, default="",
+                    help="Artifact store (default: <volume_site>.cache/artifacts)")
+parser.add_argument("--build", type=str, default="",
+                    help="Build ID (or its prefix) to deploy (default: the latest)")
+parser.add_argument("--list", action='store_true', help="List the recorded builds")
+parser.add_argument("--record", action='store_true',
+                    help="Record the current site as a build (build.py does this after a build)")
+parser.add_argument("--target", type=str, default="",
+                    help="Folder to deploy to (or to apply the bundle to)")
+parser.add_argument("--bundle", type=str, default="",
+                    help="Write the changes to this file instead of a folder")
+parser.add_argument("--base", type=str, default="",
+                    help="Manifest of the deployed site (<target>.deploy.json) for --bundle")
+parser.add_argument("--compression", type=str, default="",
+                    choices=["", "zstd", "gzip", "none"],
+                    help="Compression of the bundle (default: zstd if available, else gzip)")
+parser.add_argument("--apply", type=str, default="", help="Apply a bundle to --target")
+parser.add_argument("--force", action='store_true',
+                    help="Apply a bundle even if the target is not its base")
+
+
+def size_text(size: int):
+    """Format a size in bytes."""
+    if size < 1024 * 1024:
+        return str(round(size / 1024, 1)) + " KiB"
+    return str(round(size / 1024 / 1024, 1)) + " MiB"
+
+
+def list_builds(store: site_artifacts.ArtifactStore):
+    """Print the recorded builds."""
+    print("[## Builds] " + store.root)
+    for build in store.builds():
+        stamp = datetime.datetime.fromtimestamp(build["time"]).strftime("%Y-%m-%d %H:%M:%S")
+        print("  --> " + build["id"] + " : " + stamp + ", " + str(build["files"])
+              + " files, " + size_text(build["bytes"]))
+    return 0
+
+
+def record_build(store: site_artifacts.ArtifactStore, site: str):
+    """Record the site in the store."""
+    print("[## Record the build results]")
+    if os.path.isdir(site) is False:
+        print("  [ERROR] Not found: " + site)
+        return 1
+    start = time.perf_counter()
+    manifest, added, added_bytes = store.add_build(site)
+    print("  --> Build " + manifest["id"] + ": " + str(len(manifest["files"])) + " files, "
+          + str(added) + " new contents (" + size_text(added_bytes) + ") in "
+          + str(round((time.perf_counter() - start) * 1000)) + " ms")
+    return 0
+
+
+def deploy(ap, store: site_artifacts.ArtifactStore):
+    """Deploy a build to a folder or to a bundle."""
+    print("[## Deploy]")
+    manifest = store.load(ap.build)
+    if manifest is None:
+        print("  [ERROR] Build not found: " + (ap.build or "(latest)")
+              + " (build the site or run --record)")
+        return 1
+    start = time.perf_counter()
+    if ap.bundle != "":
+        base = {}
+        if ap.base != "":
+            data = site_artifacts.load_manifest(ap.base)
+            if data is None:
+                print("  [ERROR] Not a manifest: " + ap.base)
+                return 1
+            base = data["files"]
+        changed, removed, size = store.write_bundle(ap.bundle, manifest, base,
+                                                    ap.compression)
+        print("  --> Bundle: " + ap.bundle + " (" + size_text(os.path.getsize(ap.bundle))
+              + ")")
+    else:
+        path = site_artifacts.deploy_manifest_path(ap.target)
+        data = site_artifacts.load_manifest(path)
+        changed, removed, size = store.sync(manifest, ap.target,
+                                            data["files"] if data is not None else None)
+        site_artifacts.save_manifest(path, {"id": manifest["id"], "files": manifest["files"]})
+        print("  --> Target: " + os.path.abspath(ap.target) + " (" + manifest["id"] + ")")
+    for rel_path in changed:
+        print("        + " + rel_path)
+    for rel_path in removed:
+        print("        - " + rel_path)
+    print("  --> " + str(len(changed)) + " changed (" + size_text(size) + "), "
+          + str(len(removed)) + " removed, "
+          + str(len(manifest["files"]) - len(changed)) + " unchanged in "
+          + str(round((time.perf_counter() - start) * 1000)) + " ms")
+    return 0
+
+
+def main(ap):
+    """Run the command."""
+    site = os.path.abspath(os.path.join(ap.root_dir, ap.volume_site))
+    store = site_artifacts.ArtifactStore(ap.store or site_artifacts.store_dir(site))
+    if ap.apply != "":
+        print("[## Apply the bundle]")
+        if ap.target == "":
+            print("  [ERROR] --target is required")
+            return 1
+        ret, message = site_artifacts.apply_bundle(ap.apply, ap.target, ap.force)
+        print(("  --> " if ret == 0 else "  [ERROR] ") + message)
+        return ret
+    if ap.list is True:
+        return list_builds(store)
+    ret = 0
+    if ap.record is True:
+        ret = record_build(store, site)
+    if ret == 0 and (ap.target != "" or ap.bundle != ""):
+        if ap.compression == "zstd" and site_artifacts.zstandard is None:
+            print("  [ERROR] zstandard is not installed (pip install zstandard)")
+            return 1
+        ret = deploy(ap, store)
+    return ret
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    try:
+        sys.exit(main(args))
+    except Exception as e:
+        print("[ERROR] " + str(e))
+        sys.exit(1)
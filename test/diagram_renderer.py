@@ -0,0 +1,222 @@
+"""This is a module to render the PlantUML diagrams of the docs tree with a cache."""
+# SYSTEM: Python 3.11.1
+#
+# これは、docsフォルダのPlantUMLの図をキャッシュを使ってSVGに変換するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * ページ内の```puml(```plantuml)のコードブロックを集める
+# * 図のソースのハッシュをキーにして、SVGを_site.cache/plantumlにキャッシュ
+# * キャッシュにない図だけを、常駐させたPlantUMLプロセス(-pipe)で並列に変換
+# * コードブロックを画像(/assets/diagrams/<ハッシュ>.svg)に置き換える
+
+import os
+import re
+import shlex
+import shutil
+import asyncio
+
+import build_cache
+
+DIAGRAM_LANGUAGES = ("puml", "plantuml", "uml")
+DIAGRAM_FENCE = re.compile(
+    r'^[ ]{0,3}(`{3,}|~{3,})[ \t]*(' + "|".join(DIAGRAM_LANGUAGES) + r')\b[ \t]*(\{[^}\n]*\})?'
+    r'[^\n]*\n(.*?)^[ ]{0,3}\1[ \t]*$', re.MULTILINE | re.DOTALL)
+DEFAULT_COMMAND = "plantuml"
+DELIMITER = "___DIAGRAM_RENDERER_END___"
+DIAGRAM_DIR = "assets/diagrams"
+MAX_PROCESSES = 4
+RENDER_TIMEOUT = 60
+KEY_LENGTH = 24
+
+
+def find_diagrams(text: str):
+    """Find the diagram code blocks. Returns [(match, source, attrs)]."""
+    return [(match, match.group(4), match.group(3) or "")
+            for match in DIAGRAM_FENCE.finditer(text)]
+
+
+def wrap_source(source: str):
+    """Add @startuml/@enduml if the source does not have them."""
+    source = source.strip("\n")
+    if re.match(r'^\s*@start\w+', source) is None:
+        source = "@startuml\n" + source + "\n@enduml"
+    return source + "\n"
+
+
+def diagram_key(source: str):
+    """Get the cache key of a diagram."""
+    return build_cache.hash_text("svg\n" + wrap_source(source))[:KEY_LENGTH]
+
+
+def diagram_path(key: str):
+    """Get the site path of a rendered diagram."""
+    return DIAGRAM_DIR + "/" + key + ".svg"
+
+
+def replace_diagrams(text: str, rendered: set, baseurl: str = ""):
+    """Replace the rendered diagram code blocks with images."""
+    def replace(match):
+        key = diagram_key(match.group(4))
+        if key not in rendered:
+            return match.group(0)
+        return "![](" + baseurl + "/" + diagram_path(key) + ")" + (match.group(3) or "")
+    return DIAGRAM_FENCE.sub(replace, text)
+
+
+class PlantUmlProcess:
+    """Long-lived PlantUML process reading diagrams from stdin."""
+    _command = []
+    _process = None
+
+    def __init__(self, command: list):
+        """Initialize the class."""
+        self._command = command
+        self._process = None
+
+    async def start(self):
+        """Start the process."""
+        self._process = await asyncio.create_subprocess_exec(
+            *self._command, "-pipe", "-tsvg", "-charset", "UTF-8",
+            "-pipedelimitor", DELIMITER,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL)
+
+    async def render(self, source: str):
+        """Render one diagram. Returns the SVG text."""
+        self._process.stdin.write(wrap_source(source).encode("utf-8"))
+        await self._process.stdin.drain()
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self._process.stdout.readline(), RENDER_TIMEOUT)
+            if line == b"":
+                raise OSError("The renderer exited unexpectedly")
+            text = line.decode("utf-8", errors="replace")
+            if text.strip() == DELIMITER:
+                break
+            lines.append(text)
+        svg = "".join(lines).strip()
+        if svg.find("<svg") < 0:
+            raise ValueError(svg.splitlines()[0] if svg != "" else "No output")
+        return svg + "\n"
+
+    async def close(self):
+        """Stop the process."""
+        if self._process is None:
+            return
+        if self._process.returncode is None:
+            self._process.stdin.close()
+            try:
+                await asyncio.wait_for(self._process.wait(), 5)
+            except asyncio.TimeoutError:
+                self._process.kill()
+                await self._process.wait()
+        self._process = None
+
+
+class DiagramRenderer:
+    """Render diagrams through a cache keyed by the diagram source."""
+    _cache_dir = ""
+    _command = []
+    _jobs = 1
+    _errors = []
+    _stats = {}
+
+    def __init__(self, cache_dir: str, command: str = "", jobs: int = 0):
+        """Initialize the class. jobs=0 uses up to MAX_PROCESSES processes."""
+        self._cache_dir = os.path.abspath(cache_dir)
+        self._command = shlex.split(command or os.environ.get("PLANTUML", DEFAULT_COMMAND))
+        self._jobs = jobs if jobs > 0 else min(MAX_PROCESSES, os.cpu_count() or 1)
+        self._errors = []
+        self._stats = {"rendered": 0, "cached": 0}
+
+    @property
+    def errors(self):
+        """Get the (key, message) list of the failed diagrams."""
+        return self._errors
+
+    @property
+    def stats(self):
+        """Get the number of rendered and cached diagrams."""
+        return self._stats
+
+    def cache_path(self, key: str):
+        """Get the cache path of a diagram."""
+        return os.path.join(self._cache_dir, key + ".svg")
+
+    def available(self):
+        """Check whether the renderer command exists."""
+        return len(self._command) > 0 and shutil.which(self._command[0]) is not None
+
+    def render_all(self, sources: list):
+        """Render the diagrams that are not cached. Returns the set of available keys."""
+        self._errors = []
+        self._stats = {"rendered": 0, "cached": 0}
+        pending = {}
+        rendered = set()
+        for source in sources:
+            key = diagram_key(source)
+            if key in rendered or key in pending:
+                continue
+            if os.path.isfile(self.cache_path(key)):
+                rendered.add(key)
+                self._stats["cached"] += 1
+            else:
+                pending[key] = source
+        if len(pending) > 0:
+            if self.available() is False:
+                self._errors.append(("", "Renderer not found: " + " ".join(self._command)))
+            else:
+                rendered.update(asyncio.run(self.render_pending(pending)))
+        return rendered
+
+    async def render_pending(self, pending: dict):
+        """Render the diagrams concurrently on long-lived processes."""
+        os.makedirs(self._cache_dir, exist_ok=True)
+        queue = asyncio.Queue()
+        for key, source in pending.items():
+            queue.put_nowait((key, source))
+        rendered = set()
+
+        async def worker():
+            process = PlantUmlProcess(self._command)
+            await process.start()
+            try:
+                while queue.empty() is False:
+                    key, source = queue.get_nowait()
+                    try:
+                        svg = await process.render(source)
+                    except (OSError, ValueError, asyncio.TimeoutError) as e:
+                        self._errors.append((key, str(e) or type(e).__name__))
+                        # The process may be out of sync, so restart it.
+                        await process.close()
+                        await process.start()
+                        continue
+                    path = self.cache_path(key)
+                    # The cache may be shared by several builds (preview_farm.py).
+                    tmp_path = path + "." + str(os.getpid()) + ".tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.write(svg)
+                    os.replace(tmp_path, path)
+                    rendered.add(key)
+                    self._stats["rendered"] += 1
+            finally:
+                await process.close()
+
+        jobs = min(self._jobs, len(pending))
+        print("  --> Render diagrams: " + str(len(pending)) + " with "
+              + str(jobs) + " processes")
+        results = await asyncio.gather(*[worker() for _ in range(jobs)],
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self._errors.append(("", str(result)))
+        return rendered
+
+    def copy_to(self, keys: set, dst: str):
+        """Copy rendered diagrams into the site."""
+        for key in sorted(keys):
+            dst_path = os.path.join(dst, diagram_path(key))
+            if os.path.isfile(dst_path):
+                continue
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            shutil.copyfile(self.cache_path(key), dst_path)
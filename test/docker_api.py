@@ -0,0 +1,792 @@
+"""This is a module to control Docker through the Engine API or the CLI."""
+# SYSTEM: Python 3.11.1
+#
+# これは、Dockerを操作するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * Docker Engine APIにUnixソケット(/var/run/docker.sock)で接続
+#   * 1本のコネクションをKeep-Aliveで使い回す
+#   * デーモンに閉じられたコネクションは、応答を1バイトも受信していない場合だけ再送
+#   * 結果はJSONをそのまま返す(--formatの文字列を解析しない)
+#   * 各リクエストはtracing.pyのスパンとして記録(HTTPステータスと応答のバイト数)
+# * コンテナのログは全体を読み込まず、タイムスタンプ付きの行として逐次受け取る
+# * コンテナとイメージのイベント(docker events)を逐次受け取る(docker_state.py)
+# * ソケットが使えない環境(Windowsなど)では、dockerコマンドで同じ操作を実行
+
+import io
+import os
+import re
+import json
+import asyncio
+import tarfile
+import urllib.parse
+
+import tracing
+import orchestrator
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+
+
+def default_socket_path():
+    """Get the Docker socket path from DOCKER_HOST."""
+    host = os.environ.get("DOCKER_HOST", "")
+    if host.startswith("unix://"):
+        return host[len("unix://"):]
+    return DEFAULT_SOCKET
+
+
+def create_client(mode: str = "auto", socket_path: str = "", cwd: str = None):
+    """Create a Docker client. mode is auto, api or cli."""
+    if socket_path == "":
+        socket_path = default_socket_path()
+    if mode == "api" or (mode == "auto" and hasattr(asyncio, "open_unix_connection")
+                         and os.path.exists(socket_path)):
+        return DockerApiClient(socket_path)
+    return DockerCliClient(cwd)
+
+
+def format_ports(ports: list):
+    """Format the port list of a container like docker ps."""
+    items = []
+    for port in ports or []:
+        text = str(port.get("PrivatePort", "")) + "/" + port.get("Type", "tcp")
+        if port.get("PublicPort") is not None:
+            text = (port.get("IP", "") + ":" + str(port["PublicPort"]) + "->" + text)
+        items.append(text)
+    return ", ".join(items)
+
+
+def parse_json_line(text: str):
+    """Parse a JSON object of a line (events, docker ps). Returns None if it is not one."""
+    try:
+        item = json.loads(text)
+    except ValueError:
+        return None
+    return item if isinstance(item, dict) else None
+
+
+def parse_size(text: str):
+    """Convert a size like docker stats (12.5MiB, 1.2GB) to bytes. Returns 0 if unknown."""
+    match = re.match(r'^\s*([\d.]+)\s*([KMGT]?i?B)?', text, re.IGNORECASE)
+    if match is None:
+        return 0
+    unit = (match.group(2) or "B").upper()
+    power = " KMGT".index(unit[0]) if len(unit) > 1 else 0
+    base = 1024 if unit.endswith("IB") else 1000
+    return int(float(match.group(1)) * base ** power)
+
+
+def demux_logs(data: bytes):
+    """Convert a multiplexed log stream of a non-TTY container to plain bytes."""
+    if len(data) < 8 or data[0] not in (0, 1, 2) or data[1:4] != b"\0\0\0":
+        return data
+    out = []
+    pos = 0
+    while pos + 8 <= len(data):
+        size = int.from_bytes(data[pos + 4:pos + 8], "big")
+        out.append(data[pos + 8:pos + 8 + size])
+        pos += 8 + size
+    return b"".join(out)
+
+
+class LogStream:
+    """Split a log stream (plain or multiplexed) into lines as it arrives."""
+    _on_line = None
+    _multiplexed = None
+    _raw = b""
+    _pending = b""
+
+    def __init__(self, on_line):
+        """Initialize the class."""
+        self._on_line = on_line
+        self._multiplexed = None
+        self._raw = b""
+        self._pending = b""
+
+    def feed(self, data: bytes):
+        """Add received bytes and call on_line for each complete line."""
+        if self._multiplexed is None:
+            self._raw += data
+            if len(self._raw) < 8:
+                return
+            data = self._raw
+            self._raw = b""
+            self._multiplexed = data[0] in (0, 1, 2) and data[1:4] == b"\0\0\0"
+        if self._multiplexed is True:
+            self._raw += data
+            data = b""
+            while len(self._raw) >= 8:
+                size = int.from_bytes(self._raw[4:8], "big")
+                if len(self._raw) < 8 + size:
+                    break
+                data += self._raw[8:8 + size]
+                self._raw = self._raw[8 + size:]
+        *lines, self._pending = (self._pending + data).split(b"\n")
+        for line in lines:
+            self._on_line(line.rstrip(b"\r").decode("utf-8", errors="replace"))
+
+    def close(self):
+        """Pass the last line without a line break."""
+        data = self._raw if self._multiplexed is not True else b""
+        self._raw = b""
+        self._multiplexed = False
+        self.feed(data)
+        if self._pending != b"":
+            self._on_line(self._pending.rstrip(b"\r").decode("utf-8", errors="replace"))
+            self._pending = b""
+
+
+class DockerApiClient:
+    """Docker Engine API client over a Unix socket."""
+    _socket_path = DEFAULT_SOCKET
+    _reader = None
+    _writer = None
+    _lock = None
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET):
+        """Initialize the class."""
+        self._socket_path = socket_path
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    @property
+    def name(self):
+        """Get the client name."""
+        return "api(" + self._socket_path + ")"
+
+    async def close(self):
+        """Close the connection."""
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        self._reader = None
+        self._writer = None
+
+    # =========================================================
+    # HTTP
+    async def request(self, method: str, path: str, query: dict = None,
+                      body=None, content_type: str = "application/json",
+                      on_line=None, on_chunk=None):
+        """Send a request. Returns (status, body bytes (b"" with on_chunk))."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if query:
+            path += "?" + urllib.parse.urlencode(
+                {k: v for k, v in query.items() if v is not None})
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        with tracing.span(method + " " + path.split("?")[0], tracing.DOCKER,
+                          path=path) as span:
+            async with self._lock:
+                for attempt in range(2):
+                    reused = self._writer is not None
+                    if self._writer is None:
+                        self._reader, self._writer = await asyncio.open_unix_connection(
+                            self._socket_path)
+                    try:
+                        self._send(method, path, body, content_type)
+                        await self._writer.drain()
+                        status_line = await self._reader.readuntil(b"\r\n")
+                    except (ConnectionError, asyncio.IncompleteReadError) as e:
+                        await self.close()
+                        # A kept-alive connection may have been closed by the daemon
+                        # before the request. Once any of the response has arrived, the
+                        # request may have run (e.g. POST /containers/create), so it is
+                        # not sent again.
+                        partial = getattr(e, "partial", b"")
+                        if reused is False or attempt == 1 or partial != b"":
+                            raise
+                        continue
+                    try:
+                        status, data = await self._read_response(status_line, on_line,
+                                                                 on_chunk)
+                    except (ConnectionError, asyncio.IncompleteReadError):
+                        await self.close()
+                        raise
+                    span.status = status
+                    span.add_output(len(data))
+                    return status, data
+        raise ConnectionError("Docker API request failed: " + path)
+
+    def _send(self, method: str, path: str, body: bytes, content_type: str):
+        head = method + " " + path + " HTTP/1.1\r\nHost: docker\r\n"
+        if body is not None:
+            head += "Content-Type: " + content_type + "\r\n"
+            head += "Content-Length: " + str(len(body)) + "\r\n"
+        self._writer.write((head + "\r\n").encode("latin-1"))
+        if body is not None:
+            self._writer.write(body)
+
+    async def _read_response(self, status_line: bytes, on_line, on_chunk=None):
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self._reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            key, _sep, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        chunks = []
+        pending = b""
+        async for chunk in self._body(headers, status):
+            if on_chunk is not None and status == 200:
+                # Streamed bodies (e.g. followed logs) are not kept in memory.
+                if tracing.current() is not None:
+                    tracing.current().add_output(len(chunk))
+                on_chunk(chunk)
+                continue
+            chunks.append(chunk)
+            if on_line is not None:
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    on_line(line)
+        if on_line is not None and pending != b"":
+            on_line(pending)
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, b"".join(chunks)
+
+    async def _body(self, headers: dict, status: int = 200):
+        if status in (204, 304) or status < 200:
+            # No body even without Content-Length (e.g. POST /containers/<name>/stop).
+            return
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self._reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    await self._reader.readuntil(b"\r\n")
+                    return
+                data = await self._reader.readexactly(size)
+                await self._reader.readexactly(2)
+                yield data
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            if length > 0:
+                yield await self._reader.readexactly(length)
+        else:
+            yield await self._reader.read()
+            await self.close()
+
+    async def call(self, method: str, path: str, query: dict = None, body=None,
+                   ok=(200, 201, 204, 304)):
+        """Send a request. Returns (0, JSON result) or (1, error message)."""
+        try:
+            status, data = await self.request(method, path, query, body)
+        except (OSError, EOFError, ValueError) as e:
+            return 1, str(e)
+        result = None
+        if data != b"":
+            try:
+                result = json.loads(data)
+            except ValueError:
+                result = data.decode("utf-8", errors="replace")
+        if status not in ok:
+            if isinstance(result, dict):
+                result = result.get("message", str(result))
+            return 1, str(result)
+        return 0, result
+
+    # =========================================================
+    # Containers
+    async def list_containers(self, all: bool = True, ancestor: str = None,
+                              name: str = None):
+        """List containers. Returns (ret, [{Name, Image, State, Status, Ports}])."""
+        filters = {}
+        if ancestor is not None:
+            filters["ancestor"] = [ancestor]
+        if name is not None:
+            filters["name"] = [name]
+        ret, result = await self.call("GET", "/containers/json",
+                                      {"all": "1" if all else "0",
+                                       "filters": json.dumps(filters)})
+        if ret != 0:
+            return ret, result
+        containers = []
+        for item in result:
+            containers.append({
+                "Id": item.get("Id", ""),
+                "Name": (item.get("Names") or ["/"])[0].lstrip("/"),
+                "Image": item.get("Image", ""),
+                "ImageID": item.get("ImageID", ""),
+                "State": item.get("State", ""),
+                "Status": item.get("Status", ""),
+                "Ports": format_ports(item.get("Ports")),
+            })
+        return 0, containers
+
+    async def remove_container(self, name: str, force: bool = True):
+        """Remove a container."""
+        ret, _result = await self.call("DELETE", "/containers/" + urllib.parse.quote(name),
+                                       {"force": "1" if force else "0"})
+        return ret
+
+    async def run_container(self, image: str, name: str, cmd: list, binds: list = (),
+                            env: list = (), workdir: str = "", ports: dict = None,
+                            auto_remove: bool = False, entrypoint: list = None,
+                            host_ip: str = ""):
+        """Create and start a detached container with a TTY (docker run -dit).
+
+        ports ({host: container}) are published on host_ip, or on all interfaces if it is "".
+        """
+        config = {
+            "Image": image,
+            "Hostname": name,
+            "Cmd": list(cmd),
+            "Env": list(env),
+            "WorkingDir": workdir,
+            "Tty": True,
+            "OpenStdin": True,
+            "HostConfig": {"Binds": list(binds), "AutoRemove": auto_remove},
+        }
+        if entrypoint is not None:
+            config["Entrypoint"] = list(entrypoint)
+        if ports:
+            config["ExposedPorts"] = {str(p) + "/tcp": {} for p in ports.values()}
+            config["HostConfig"]["PortBindings"] = {
+                str(c) + "/tcp": [{"HostIp": host_ip, "HostPort": str(h)}]
+                for h, c in ports.items()}
+        ret, result = await self.call("POST", "/containers/create", {"name": name}, config)
+        if ret != 0:
+            return ret, result
+        container_id = result["Id"]
+        ret, result = await self.call("POST", "/containers/" + container_id + "/start")
+        return ret, container_id if ret == 0 else result
+
+    async def start_container(self, name: str):
+        """Start a container."""
+        ret, _result = await self.call("POST", "/containers/" + urllib.parse.quote(name)
+                                       + "/start")
+        return ret
+
+    async def stop_container(self, name: str):
+        """Stop a container."""
+        ret, _result = await self.call("POST", "/containers/" + urllib.parse.quote(name)
+                                       + "/stop")
+        return ret
+
+    async def wait_container(self, name: str):
+        """Wait for a container to exit. Returns (ret, exit code)."""
+        ret, result = await self.call("POST", "/containers/" + urllib.parse.quote(name)
+                                      + "/wait")
+        if ret != 0:
+            return ret, result
+        if isinstance(result, dict) is False:
+            return 1, "Unexpected wait response"
+        return 0, int(result.get("StatusCode", 1))
+
+    async def started_at(self, name: str):
+        """Get the start time of a running container. Returns (ret, RFC 3339 time or "")."""
+        ret, result = await self.call("GET", "/containers/" + urllib.parse.quote(name)
+                                      + "/json", ok=(200, 404))
+        if ret != 0:
+            return ret, result
+        state = (result.get("State") if isinstance(result, dict) else None) or {}
+        return 0, str(state.get("StartedAt", "")) if state.get("Running") is True else ""
+
+    async def memory_usage(self, name: str):
+        """Get the memory usage of a running container. Returns (ret, bytes)."""
+        ret, result = await self.call("GET", "/containers/" + urllib.parse.quote(name)
+                                      + "/stats", {"stream": "0", "one-shot": "1"})
+        if ret != 0:
+            return ret, result
+        memory = (result or {}).get("memory_stats") or {}
+        # Page cache is counted in usage, but it is freed under memory pressure.
+        cache = (memory.get("stats") or {}).get("inactive_file", 0)
+        return 0, max(0, int(memory.get("usage", 0)) - int(cache))
+
+    async def logs(self, name: str):
+        """Get the logs of a container. Returns (ret, text)."""
+        try:
+            status, data = await self.request(
+                "GET", "/containers/" + urllib.parse.quote(name) + "/logs",
+                {"stdout": "1", "stderr": "1"})
+        except (OSError, EOFError, ValueError) as e:
+            return 1, str(e)
+        text = demux_logs(data).decode("utf-8", errors="replace")
+        return (0 if status == 200 else 1), text
+
+    async def stream_logs(self, name: str, on_line, since: str = "", follow: bool = False):
+        """Pass the timestamped log lines to on_line. Returns (ret, message)."""
+        # A followed stream does not end, so it uses its own connection.
+        client = DockerApiClient(self._socket_path)
+        stream = LogStream(on_line)
+        try:
+            status, data = await client.request(
+                "GET", "/containers/" + urllib.parse.quote(name) + "/logs",
+                {"stdout": "1", "stderr": "1", "timestamps": "1",
+                 "since": since or None, "follow": "1" if follow is True else None},
+                on_chunk=stream.feed)
+        except (OSError, EOFError, ValueError) as e:
+            return 1, str(e)
+        finally:
+            await client.close()
+        stream.close()
+        if status != 200:
+            return 1, "Can't read the logs of " + name + " (" + str(status) + "): " \
+                + data.decode("utf-8", errors="replace").strip()
+        return 0, ""
+
+    # =========================================================
+    # Images
+    async def image_id(self, ref: str):
+        """Get the image ID. Returns (ret, "" if not found)."""
+        ret, result = await self.call("GET", "/images/" + urllib.parse.quote(ref) + "/json",
+                                      ok=(200, 404))
+        if ret != 0:
+            return ret, result
+        if isinstance(result, dict) and "Id" in result:
+            return 0, result["Id"]
+        return 0, ""
+
+    async def list_images(self):
+        """List the images. Returns (ret, [{Id, Tags}])."""
+        ret, result = await self.call("GET", "/images/json")
+        if ret != 0:
+            return ret, result
+        images = []
+        for item in result:
+            images.append({
+                "Id": item.get("Id", ""),
+                "Tags": [tag for tag in item.get("RepoTags") or [] if tag != "<none>:<none>"],
+            })
+        return 0, images
+
+    async def remove_image(self, ref: str, force: bool = False):
+        """Remove an image. Returns (ret, message)."""
+        ret, result = await self.call("DELETE", "/images/" + urllib.parse.quote(ref),
+                                      {"force": "1" if force else "0"})
+        if ret != 0:
+            return ret, result
+        return 0, "\n".join(
+            k + ": " + v for item in result or [] for k, v in item.items())
+
+    async def tag_image(self, ref: str, repo: str, tag: str):
+        """Add a tag to an image. Returns (ret, message)."""
+        ret, result = await self.call("POST", "/images/" + urllib.parse.quote(ref) + "/tag",
+                                      {"repo": repo, "tag": tag}, ok=(200, 201))
+        if ret != 0:
+            return ret, result
+        return 0, ""
+
+    async def build_image(self, context_dir: str, dockerfile: str, tag: str,
+                          buildargs: dict = None, nocache: bool = False):
+        """Build an image and stream the output. Returns (ret, image ID or errors)."""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            tar.add(context_dir, arcname=".", filter=lambda info: None if (
+                info.name == "./.git" or info.name.startswith("./.git/")) else info)
+            dockerfile = os.path.abspath(dockerfile)
+            if os.path.dirname(dockerfile) != os.path.abspath(context_dir):
+                tar.add(dockerfile, arcname=".dockerfile")
+                dockerfile_name = ".dockerfile"
+            else:
+                dockerfile_name = os.path.basename(dockerfile)
+        errors = []
+        image_ids = []
+
+        def on_line(line: bytes):
+            try:
+                message = json.loads(line)
+            except ValueError:
+                return
+            if isinstance((message.get("aux") or {}).get("ID"), str):
+                image_ids.append(message["aux"]["ID"])
+            if "stream" in message:
+                text = message["stream"].rstrip("\n")
+                if text != "":
+                    print("    | " + text, flush=True)
+            if "error" in message:
+                errors.append(message["error"])
+                print("    | [ERROR] " + message["error"], flush=True)
+
+        query = {"t": tag, "dockerfile": dockerfile_name, "rm": "1",
+                 "buildargs": json.dumps(buildargs or {})}
+        if nocache is True:
+            query["nocache"] = "1"
+        try:
+            status, _data = await self.request("POST", "/build", query, buffer.getvalue(),
+                                               "application/x-tar", on_line)
+        except (OSError, EOFError, ValueError) as e:
+            return 1, str(e)
+        if status != 200 or len(errors) > 0:
+            return 1, "\n".join(errors)
+        return 0, image_ids[-1] if len(image_ids) > 0 else ""
+
+    # =========================================================
+    # Events
+    async def stream_events(self, on_event, since: str = ""):
+        """Pass the container and image events to on_event until cancelled."""
+        # The event stream does not end, so it uses its own connection.
+        client = DockerApiClient(self._socket_path)
+        stream = LogStream(lambda text: self._dispatch_event(text, on_event))
+        try:
+            status, data = await client.request(
+                "GET", "/events",
+                {"since": since or None,
+                 "filters": json.dumps({"type": ["container", "image"]})},
+                on_chunk=stream.feed)
+        except (OSError, EOFError, ValueError) as e:
+            return 1, str(e)
+        finally:
+            await client.close()
+        if status != 200:
+            return 1, "Can't read the events (" + str(status) + "): " \
+                + data.decode("utf-8", errors="replace").strip()
+        return 0, ""
+
+    @staticmethod
+    def _dispatch_event(text: str, on_event):
+        event = parse_json_line(text)
+        if event is not None:
+            on_event(event)
+
+
+class DockerCliClient:
+    """Docker client through the docker command."""
+    _cwd = None
+
+    def __init__(self, cwd: str = None):
+        """Initialize the class."""
+        self._cwd = cwd
+
+    @property
+    def name(self):
+        """Get the client name."""
+        return "cli"
+
+    async def close(self):
+        """Nothing to close."""
+
+    async def run(self, args: list, cwd: str = None, stream: bool = False):
+        """Run a docker command."""
+        return await orchestrator.run_process(["docker"] + args, cwd or self._cwd, stream)
+
+    async def list_containers(self, all: bool = True, ancestor: str = None,
+                              name: str = None):
+        """List containers. Returns (ret, [{Name, Image, State, Status, Ports}])."""
+        args = ["ps", "--no-trunc", "--format", "{{json .}}"]
+        if all is True:
+            args.append("-a")
+        if ancestor is not None:
+            args += ["--filter", "ancestor=" + ancestor]
+        if name is not None:
+            args += ["--filter", "name=" + name]
+        ret, items = await self.run_json(args)
+        if ret != 0:
+            return ret, items
+        containers = []
+        for item in items:
+            containers.append({
+                "Id": item.get("ID", ""),
+                "Name": item.get("Names", "").split(",")[0],
+                "Image": item.get("Image", ""),
+                "ImageID": "",
+                "State": item.get("State", ""),
+                "Status": item.get("Status", ""),
+                "Ports": item.get("Ports", ""),
+            })
+        return 0, containers
+
+    async def run_json(self, args: list):
+        """Run a docker command that prints a JSON object per line. Returns (ret, [dict])."""
+        # run_process removes double quotes, so read the raw output here.
+        with tracing.span("docker " + args[0], tracing.PROCESS,
+                          command=" ".join(["docker"] + args)) as span:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    "docker", *args, cwd=self._cwd, stdout=asyncio.subprocess.PIPE)
+                stdout, _stderr = await proc.communicate()
+            except OSError as e:
+                span.status = 1
+                return 1, str(e)
+            span.status = proc.returncode
+            span.add_output(len(stdout))
+        if proc.returncode != 0:
+            return proc.returncode, ""
+        items = []
+        for line in stdout.decode("utf-8", errors="replace").splitlines():
+            if line.strip() == "":
+                continue
+            item = parse_json_line(line)
+            if item is None:
+                return 1, "Unexpected docker " + args[0] + " output: " + line
+            items.append(item)
+        return 0, items
+
+    async def remove_container(self, name: str, force: bool = True):
+        """Remove a container."""
+        ret, _result = await self.run(["rm", "-f", name] if force else ["rm", name])
+        return ret
+
+    async def run_container(self, image: str, name: str, cmd: list, binds: list = (),
+                            env: list = (), workdir: str = "", ports: dict = None,
+                            auto_remove: bool = False, entrypoint: list = None,
+                            host_ip: str = ""):
+        """Create and start a detached container with a TTY (docker run -dit).
+
+        ports ({host: container}) are published on host_ip, or on all interfaces if it is "".
+        """
+        args = ["run", "-dit", "--name", name, "--hostname", name]
+        if auto_remove is True:
+            args.append("--rm")
+        for host_port, container_port in (ports or {}).items():
+            args += ["--publish", (host_ip + ":" if host_ip != "" else "")
+                     + str(host_port) + ":" + str(container_port)]
+        for bind in binds:
+            args += ["-v", bind]
+        for item in env:
+            args += ["-e", item]
+        if workdir != "":
+            args += ["--workdir", workdir]
+        if entrypoint is not None:
+            args += ["--entrypoint", entrypoint[0]]
+            cmd = list(entrypoint[1:]) + list(cmd)
+        return await self.run(args + [image] + list(cmd))
+
+    async def start_container(self, name: str):
+        """Start a container."""
+        ret, _result = await self.run(["start", name])
+        return ret
+
+    async def stop_container(self, name: str):
+        """Stop a container."""
+        ret, _result = await self.run(["stop", name])
+        return ret
+
+    async def wait_container(self, name: str):
+        """Wait for a container to exit. Returns (ret, exit code)."""
+        ret, result = await self.run(["wait", name])
+        if ret != 0:
+            return ret, result
+        if result.strip().isdigit() is False:
+            return 1, result
+        return 0, int(result.strip())
+
+    async def started_at(self, name: str):
+        """Get the start time of a running container. Returns (ret, RFC 3339 time or "")."""
+        ret, result = await self.run(["inspect", "--type", "container", "--format",
+                                      "{{.State.Running}} {{.State.StartedAt}}", name])
+        if ret != 0:
+            return ret, result
+        running, _space, started = result.strip().partition(" ")
+        return 0, started if running == "true" else ""
+
+    async def memory_usage(self, name: str):
+        """Get the memory usage of a running container. Returns (ret, bytes)."""
+        ret, result = await self.run(["stats", "--no-stream", "--format", "{{.MemUsage}}",
+                                      name])
+        if ret != 0:
+            return ret, result
+        return 0, parse_size(result.split("/")[0])
+
+    async def logs(self, name: str):
+        """Get the logs of a container. Returns (ret, text)."""
+        return await self.run(["logs", name])
+
+    async def stream_logs(self, name: str, on_line, since: str = "", follow: bool = False):
+        """Pass the timestamped log lines to on_line. Returns (ret, message)."""
+        args = ["logs", "--timestamps"]
+        if since != "":
+            args += ["--since", since]
+        if follow is True:
+            args.append("--follow")
+        args.append(name)
+        with tracing.span("docker logs", tracing.PROCESS,
+                          command=" ".join(["docker"] + args)) as span:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    "docker", *args, cwd=self._cwd, stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT, limit=1024 * 1024)
+            except OSError as e:
+                span.status = 1
+                return 1, str(e)
+            try:
+                while True:
+                    line = await proc.stdout.readline()
+                    if line == b"":
+                        break
+                    span.add_output(len(line))
+                    on_line(line.rstrip(b"\r\n").decode("utf-8", errors="replace"))
+                ret = await proc.wait()
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+            span.status = ret
+        return ret, "" if ret == 0 else "docker logs exited with " + str(ret)
+
+    async def image_id(self, ref: str):
+        """Get the image ID. Returns (ret, "" if not found)."""
+        ret, result = await self.run(["images", "-q", ref])
+        return ret, result.strip()
+
+    async def list_images(self):
+        """List the images. Returns (ret, [{Id, Tags}])."""
+        ret, items = await self.run_json(["images", "--no-trunc", "--format", "{{json .}}"])
+        if ret != 0:
+            return ret, items
+        images = {}
+        # docker images prints a line per tag.
+        for item in items:
+            image = images.setdefault(item.get("ID", ""), {"Id": item.get("ID", ""),
+                                                            "Tags": []})
+            if item.get("Repository", "<none>") != "<none>" \
+                    and item.get("Tag", "<none>") != "<none>":
+                image["Tags"].append(item["Repository"] + ":" + item["Tag"])
+        return 0, list(images.values())
+
+    async def remove_image(self, ref: str, force: bool = False):
+        """Remove an image. Returns (ret, message)."""
+        return await self.run(["rmi"] + (["--force"] if force is True else []) + [ref])
+
+    async def tag_image(self, ref: str, repo: str, tag: str):
+        """Add a tag to an image. Returns (ret, message)."""
+        return await self.run(["tag", ref, repo + ":" + tag])
+
+    async def build_image(self, context_dir: str, dockerfile: str, tag: str,
+                          buildargs: dict = None, nocache: bool = False):
+        """Build an image from a context directory and stream the output."""
+        args = ["build"]
+        if nocache is True:
+            args.append("--no-cache")
+        for key, value in (buildargs or {}).items():
+            args += ["--build-arg", key + "=" + value]
+        args += ["-t", tag, "-f", dockerfile, context_dir]
+        return await self.run(args, context_dir, stream=True)
+
+    async def stream_events(self, on_event, since: str = ""):
+        """Pass the container and image events to on_event until cancelled."""
+        args = ["events", "--format", "{{json .}}", "--filter", "type=container",
+                "--filter", "type=image"]
+        if since != "":
+            args += ["--since", since]
+        with tracing.span("docker events", tracing.PROCESS,
+                          command=" ".join(["docker"] + args)) as span:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    "docker", *args, cwd=self._cwd, stdout=asyncio.subprocess.PIPE,
+                    limit=1024 * 1024)
+            except OSError as e:
+                span.status = 1
+                return 1, str(e)
+            try:
+                while True:
+                    line = await proc.stdout.readline()
+                    if line == b"":
+                        break
+                    span.add_output(len(line))
+                    event = parse_json_line(line.decode("utf-8", errors="replace"))
+                    if event is not None:
+                        on_event(event)
+                ret = await proc.wait()
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+            span.status = ret
+        return ret, "" if ret == 0 else "docker events exited with " + str(ret)
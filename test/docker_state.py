@@ -0,0 +1,372 @@
+"""This is a module to answer the Docker queries of a run from one snapshot."""
+# SYSTEM: Python 3.11.1
+#
+# これは、Dockerのコンテナとイメージの状態をメモリに保持するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * コンテナとイメージの一覧は、それぞれ最初の問い合わせのときに1回だけ取得
+# * コンテナとイメージの有無の確認(docker ps, docker images)はメモリの状態から回答
+# * スクリプトが行った操作(作成・起動・停止・削除・タグ付け・ビルド)の結果をメモリの状態に反映
+#   (確認してから操作するまでの間に、他の手順の結果を見落とさない)
+# * events=True(--docker_events)の場合は、Dockerのイベントで他のプロセスの操作も反映
+# * ログ、wait、statsなどの操作はそのままDockerに送る
+
+import re
+import time
+import asyncio
+
+RUNNING = "running"
+EXITED = "exited"
+CREATED = "created"
+PAUSED = "paused"
+CONTAINER_FIELDS = ("Id", "Name", "Image", "ImageID", "State", "Status", "Ports")
+
+
+def image_ref(ref: str):
+    """Normalize an image reference (name -> name:latest)."""
+    if "@" in ref or ":" in ref.rsplit("/", 1)[-1]:
+        return ref
+    return ref + ":latest"
+
+
+def short_id(image_id: str):
+    """Get an image ID without the algorithm (sha256:)."""
+    return image_id.split(":")[-1]
+
+
+def name_matches(pattern: str, name: str):
+    """Match a container name like the name filter of docker ps (a regular expression)."""
+    try:
+        return re.search(pattern, name) is not None
+    except re.error:
+        return pattern in name
+
+
+class DockerState:
+    """Docker client that answers the existence checks from a snapshot of the daemon."""
+    _docker = None
+    _use_events = False
+    _containers = None
+    _images = None
+    _lock = None
+    _events = None
+    _stats = {}
+
+    def __init__(self, docker, events: bool = False):
+        """Initialize the class. docker is a client of docker_api.py."""
+        self._docker = docker
+        self._use_events = events
+        self._containers = None
+        self._images = None
+        self._lock = None
+        self._events = None
+        self._stats = {"snapshots": 0, "answered": 0, "events": 0}
+
+    @property
+    def name(self):
+        """Get the client name."""
+        return self._docker.name
+
+    @property
+    def stats(self):
+        """Get the numbers of lists read, queries answered from memory and applied events."""
+        return self._stats
+
+    def print_stats(self):
+        """Print how many queries were answered without asking the daemon."""
+        if self._stats["snapshots"] == 0:
+            return
+        print("  --> Docker state: " + str(self._stats["snapshots"]) + " lists read, "
+              + str(self._stats["answered"]) + " queries answered from memory"
+              + (", " + str(self._stats["events"]) + " events" if self._use_events else ""))
+
+    async def close(self):
+        """Stop following the events and close the client."""
+        if self._events is not None:
+            if self._events.done():
+                ret, message = self._events.result()
+                if ret != 0:
+                    print("  [WARNING] Docker events: " + message)
+            self._events.cancel()
+            try:
+                await self._events
+            except asyncio.CancelledError:
+                pass
+            self._events = None
+        await self._docker.close()
+
+    # =========================================================
+    # Snapshot
+    async def snapshot(self, containers: bool = True, images: bool = False):
+        """Read the containers and/or the images on their first query. Returns (ret, message)."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Concurrent steps wait for the same snapshot.
+        async with self._lock:
+            since = str(int(time.time()) - 1)
+            if containers is True and self._containers is None:
+                ret, items = await self._docker.list_containers(True)
+                if ret != 0:
+                    return ret, items
+                self._containers = {}
+                for item in items:
+                    entry = {field: item.get(field, "") for field in CONTAINER_FIELDS}
+                    entry["AutoRemove"] = False
+                    self._containers[item["Name"]] = entry
+                self._stats["snapshots"] += 1
+            if images is True and self._images is None:
+                ret, items = await self._docker.list_images()
+                if ret != 0:
+                    return ret, items
+                self._images = {}
+                for image in items:
+                    self._images[image["Id"]] = [image_ref(tag) for tag in image["Tags"]]
+                self._stats["snapshots"] += 1
+            if self._use_events is True and self._events is None:
+                # Replaying the last second is harmless, the events are applied idempotently.
+                self._events = asyncio.ensure_future(
+                    self._docker.stream_events(self.apply_event, since))
+        return 0, ""
+
+    def find_image(self, ref: str):
+        """Get the ID of an image tag or ID prefix ("" if not found or not read yet)."""
+        if self._images is None or ref == "":
+            return ""
+        ref = image_ref(ref)
+        for image_id, tags in self._images.items():
+            if ref in tags:
+                return image_id
+        prefix = short_id(ref.split(":")[0] if ref.endswith(":latest") else ref)
+        if re.fullmatch(r'[0-9a-f]{12,64}', prefix):
+            for image_id in self._images:
+                if short_id(image_id).startswith(prefix):
+                    return image_id
+        return ""
+
+    def uses_image(self, container: dict, ref: str, image_id: str):
+        """Check whether a container was created from an image (the ancestor filter)."""
+        if image_ref(container["Image"]) == image_ref(ref):
+            return True
+        if image_id == "":
+            return False
+        if container["ImageID"] != "":
+            return container["ImageID"] == image_id
+        # docker ps shows the short ID when the tag was moved to another image.
+        return len(container["Image"]) >= 12 and \
+            short_id(image_id).startswith(short_id(container["Image"]))
+
+    # =========================================================
+    # Queries
+    async def list_containers(self, all: bool = True, ancestor: str = None,
+                              name: str = None):
+        """List containers. Returns (ret, [{Name, Image, State, Status, Ports}])."""
+        ret, message = await self.snapshot(True, ancestor is not None)
+        if ret != 0:
+            return ret, message
+        self._stats["answered"] += 1
+        image_id = self.find_image(ancestor) if ancestor is not None else ""
+        containers = []
+        for item in self._containers.values():
+            if all is False and item["State"] != RUNNING:
+                continue
+            if name is not None and name_matches(name, item["Name"]) is False:
+                continue
+            if ancestor is not None and self.uses_image(item, ancestor, image_id) is False:
+                continue
+            containers.append({field: item[field] for field in CONTAINER_FIELDS})
+        return 0, containers
+
+    async def image_id(self, ref: str):
+        """Get the image ID. Returns (ret, "" if not found)."""
+        ret, message = await self.snapshot(False, True)
+        if ret != 0:
+            return ret, message
+        self._stats["answered"] += 1
+        return 0, self.find_image(ref)
+
+    async def list_images(self):
+        """List the images. Returns (ret, [{Id, Tags}])."""
+        ret, message = await self.snapshot(False, True)
+        if ret != 0:
+            return ret, message
+        self._stats["answered"] += 1
+        return 0, [{"Id": image_id, "Tags": list(tags)}
+                   for image_id, tags in self._images.items()]
+
+    # =========================================================
+    # Changes made by this run
+    def set_container(self, name: str, state: str, status: str):
+        """Change the state of a known container."""
+        if self._containers is not None and name in self._containers:
+            self._containers[name]["State"] = state
+            self._containers[name]["Status"] = status
+
+    def forget_container(self, name: str):
+        """Remove a container (by name or ID) from the state."""
+        if self._containers is None:
+            return
+        for key, item in list(self._containers.items()):
+            if key == name or (len(name) >= 12 and item["Id"].startswith(name)):
+                del self._containers[key]
+
+    def set_tag(self, ref: str, image_id: str):
+        """Move a tag to an image."""
+        ref = image_ref(ref)
+        for tags in self._images.values():
+            if ref in tags:
+                tags.remove(ref)
+        if image_id != "":
+            self._images.setdefault(image_id, []).append(ref)
+
+    async def remove_container(self, name: str, force: bool = True):
+        """Remove a container."""
+        ret = await self._docker.remove_container(name, force)
+        if ret == 0:
+            self.forget_container(name)
+        return ret
+
+    async def run_container(self, image: str, name: str, cmd: list, binds: list = (),
+                            env: list = (), workdir: str = "", ports: dict = None,
+                            auto_remove: bool = False, entrypoint: list = None,
+                            host_ip: str = ""):
+        """Create and start a detached container with a TTY (docker run -dit).
+
+        ports ({host: container}) are published on host_ip, or on all interfaces if it is "".
+        """
+        ret, result = await self._docker.run_container(
+            image, name, cmd, binds=binds, env=env, workdir=workdir, ports=ports,
+            auto_remove=auto_remove, entrypoint=entrypoint, host_ip=host_ip)
+        if ret == 0 and self._containers is not None:
+            self._containers[name] = {
+                "Id": str(result or "").strip(), "Name": name, "Image": image,
+                "ImageID": self.find_image(image), "State": RUNNING, "Status": "Up",
+                "Ports": ", ".join((host_ip or "0.0.0.0") + ":" + str(host) + "->"
+                                   + str(container) + "/tcp"
+                                   for host, container in (ports or {}).items()),
+                "AutoRemove": auto_remove}
+        return ret, result
+
+    async def start_container(self, name: str):
+        """Start a container."""
+        ret = await self._docker.start_container(name)
+        if ret == 0:
+            self.set_container(name, RUNNING, "Up")
+        return ret
+
+    async def stop_container(self, name: str):
+        """Stop a container."""
+        ret = await self._docker.stop_container(name)
+        if ret == 0:
+            self.set_container(name, EXITED, "Exited")
+        return ret
+
+    async def wait_container(self, name: str):
+        """Wait for a container to exit. Returns (ret, exit code)."""
+        ret, result = await self._docker.wait_container(name)
+        if ret == 0 and self._containers is not None and name in self._containers:
+            if self._containers[name]["AutoRemove"] is True:
+                self.forget_container(name)
+            else:
+                self.set_container(name, EXITED, "Exited (" + str(result) + ")")
+        return ret, result
+
+    async def remove_image(self, ref: str, force: bool = False):
+        """Remove an image. Returns (ret, message)."""
+        ret, result = await self._docker.remove_image(ref, force)
+        if ret == 0 and self._images is not None:
+            image_id = self.find_image(ref)
+            by_id = image_id != "" and image_ref(ref) not in self._images[image_id]
+            self.set_tag(ref, "")
+            # The image itself is deleted with its last tag (or when it is removed by ID),
+            # a forced untag keeps the image of the containers.
+            in_use = force is True and any(container["ImageID"] == image_id
+                                           for container in (self._containers or {}).values())
+            if image_id != "" and (by_id or len(self._images[image_id]) == 0) \
+                    and in_use is False:
+                self._images.pop(image_id, None)
+        return ret, result
+
+    async def tag_image(self, ref: str, repo: str, tag: str):
+        """Add a tag to an image. Returns (ret, message)."""
+        ret, result = await self._docker.tag_image(ref, repo, tag)
+        if ret == 0 and self._images is not None:
+            self.set_tag(repo + ":" + tag, self.find_image(ref))
+        return ret, result
+
+    async def build_image(self, context_dir: str, dockerfile: str, tag: str,
+                          buildargs: dict = None, nocache: bool = False):
+        """Build an image and record the ID of its tag."""
+        ret, result = await self._docker.build_image(context_dir, dockerfile, tag,
+                                                     buildargs, nocache=nocache)
+        if ret == 0 and self._images is not None:
+            image_id = result
+            if str(image_id).startswith("sha256:") is False:
+                # The build output did not tell the ID.
+                ret_id, image_id = await self._docker.image_id(tag)
+                if ret_id != 0:
+                    # Read the images again on the next query.
+                    self._images = None
+                    return ret, result
+            self.set_tag(tag, image_id)
+        return ret, result
+
+    # =========================================================
+    # Passed to the daemon
+    async def logs(self, name: str):
+        """Get the logs of a container. Returns (ret, text)."""
+        return await self._docker.logs(name)
+
+    async def stream_logs(self, name: str, on_line, since: str = "", follow: bool = False):
+        """Pass the timestamped log lines to on_line. Returns (ret, message)."""
+        return await self._docker.stream_logs(name, on_line, since, follow)
+
+    async def started_at(self, name: str):
+        """Get the start time of a running container. Returns (ret, RFC 3339 time or "")."""
+        return await self._docker.started_at(name)
+
+    async def memory_usage(self, name: str):
+        """Get the memory usage of a running container. Returns (ret, bytes)."""
+        return await self._docker.memory_usage(name)
+
+    # =========================================================
+    # Events of the daemon
+    def apply_event(self, event: dict):
+        """Apply a container or image event (docker events) to the state."""
+        self._stats["events"] += 1
+        actor = event.get("Actor") or {}
+        attributes = actor.get("Attributes") or {}
+        action = str(event.get("Action") or event.get("status") or "").split(":")[0]
+        if event.get("Type") == "container" and self._containers is not None:
+            name = attributes.get("name", "")
+            if name == "":
+                return
+            if action == "destroy":
+                self._containers.pop(name, None)
+            elif action in ("create", "start", "restart", "unpause"):
+                item = self._containers.setdefault(name, {
+                    "Id": actor.get("ID", ""), "Name": name,
+                    "Image": attributes.get("image", ""), "ImageID": "",
+                    "State": CREATED, "Status": "Created", "Ports": "", "AutoRemove": False})
+                if action != "create":
+                    item["State"] = RUNNING
+                    item["Status"] = "Up"
+            elif action in ("die", "stop"):
+                self.set_container(name, EXITED,
+                                   "Exited (" + str(attributes.get("exitCode", 0)) + ")")
+            elif action == "pause":
+                self.set_container(name, PAUSED, "Up (Paused)")
+            elif action == "rename":
+                old_name = attributes.get("oldName", "").lstrip("/")
+                if old_name in self._containers:
+                    self._containers[name] = self._containers.pop(old_name)
+                    self._containers[name]["Name"] = name
+        elif event.get("Type") == "image" and self._images is not None:
+            image_id = actor.get("ID", "")
+            if action == "tag" and attributes.get("name", "") != "":
+                self.set_tag(attributes["name"], image_id)
+            elif action == "untag":
+                tags = self._images.get(image_id, [])
+                if attributes.get("name", "") != "" and image_ref(attributes["name"]) in tags:
+                    tags.remove(image_ref(attributes["name"]))
+            elif action == "delete":
+                self._images.pop(image_id, None)
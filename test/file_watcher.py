@@ -0,0 +1,179 @@
+"""This is a module to watch the changes of the docs tree."""
+# SYSTEM: Python 3.11.1
+#
+# これは、docsフォルダの変更を監視するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * Linuxではinotifyで変更を監視
+# * inotifyが使えない場合は、一定間隔でファイルの更新日時を比較(ポーリング)
+# * 短時間に連続した変更はまとめて通知
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def load_inotify():
+    """Load the inotify functions of libc. Returns None if not available."""
+    if not hasattr(os, "uname") or os.uname().sysname != "Linux":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class FileWatcher:
+    """Watch a directory tree for changes."""
+    _root = "."
+    _interval = 0.1
+    _debounce = 0.03
+    _libc = None
+    _fd = -1
+    _watches = {}
+    _snapshot = {}
+
+    def __init__(self, root: str, interval: float = 0.1, use_inotify: bool = True):
+        """Initialize the class."""
+        self._root = os.path.abspath(root)
+        self._interval = interval
+        self._watches = {}
+        self._snapshot = {}
+        self._libc = load_inotify() if use_inotify is True else None
+        if self._libc is not None:
+            self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if self._fd < 0:
+                self._libc = None
+        if self._libc is not None:
+            for dir_path, _dir_names, _file_names in os.walk(self._root):
+                self._add_watch(dir_path)
+        else:
+            self._snapshot = self._scan()
+
+    @property
+    def mode(self):
+        """Get the watch mode."""
+        return "inotify" if self._libc is not None else "polling"
+
+    def close(self):
+        """Stop watching."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def wait(self, timeout: float = None):
+        """Wait for changes. Returns the changed paths relative to the root."""
+        if self._libc is not None:
+            return self._wait_inotify(timeout)
+        return self._wait_polling(timeout)
+
+    # =========================================================
+    # inotify
+    def _add_watch(self, dir_path: str):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd >= 0:
+            self._watches[wd] = dir_path
+
+    def _wait_inotify(self, timeout: float):
+        changed = set()
+        ready, _w, _x = select.select([self._fd], [], [], timeout)
+        if len(ready) == 0:
+            return []
+        while True:
+            self._read_events(changed)
+            # Collect the burst of events of a single save.
+            ready, _w, _x = select.select([self._fd], [], [], self._debounce)
+            if len(ready) == 0:
+                break
+        return sorted(changed)
+
+    def _read_events(self, changed: set):
+        try:
+            data = os.read(self._fd, 65536)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                changed.update(self._scan().keys())
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            dir_path = self._watches.get(wd)
+            if dir_path is None or name == "":
+                continue
+            path = os.path.join(dir_path, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    for sub_path, _dir_names, file_names in os.walk(path):
+                        self._add_watch(sub_path)
+                        for file_name in file_names:
+                            changed.add(self._relpath(os.path.join(sub_path, file_name)))
+                continue
+            changed.add(self._relpath(path))
+
+    # =========================================================
+    # Polling
+    def _scan(self):
+        snapshot = {}
+        for dir_path, _dir_names, file_names in os.walk(self._root):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[self._relpath(path)] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _wait_polling(self, timeout: float):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = set()
+            for rel_path, stat in snapshot.items():
+                if self._snapshot.get(rel_path) != stat:
+                    changed.add(rel_path)
+            for rel_path in self._snapshot.keys():
+                if rel_path not in snapshot:
+                    changed.add(rel_path)
+            self._snapshot = snapshot
+            if len(changed) > 0:
+                return sorted(changed)
+            if deadline is not None and time.monotonic() >= deadline:
+                return []
+            time.sleep(self._interval)
+
+    def _relpath(self, path: str):
+        return os.path.relpath(path, self._root).replace(os.sep, "/")
@@ -0,0 +1,290 @@
+"""This is a module to make responsive variants of the images of the built pages."""
+# SYSTEM: Python 3.11.1
+#
+# これは、ビルドしたページの画像をレスポンシブ画像に変換するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * ページの<img>が参照するPNG/JPEGを、docsフォルダまたはリポジトリ直下から探して_siteにコピー
+# * 画像を数種類の幅に縮小し、WebPと最適化したPNG(JPEG)を作成(Pillowが必要)
+# * 作成した画像は元画像のハッシュをキーにして_site.cache/imagesにキャッシュ
+# * 画像の変換はCPUコア数のプロセスで並列に実行
+# * <img>を<picture>(WebP)とsrcset付きの<img>に書き換える
+
+import os
+import re
+import json
+import html
+import shutil
+import posixpath
+import concurrent.futures
+
+import build_cache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+WIDTHS = (160, 320, 640, 1280)
+WEBP_QUALITY = 80
+WEBP_METHOD = 4
+JPEG_QUALITY = 85
+PAGE_WIDTH = 800
+EM_PIXELS = 16
+IMG_TAG = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+TAG_ATTRIBUTE = re.compile(r'([\w:-]+)\s*=\s*("[^"]*"|\'[^\']*\'|[^\s"\'=<>`]+)')
+MAX_WIDTH_STYLE = re.compile(r'(?:^|;)\s*(?:max-)?width\s*:\s*([\d.]+)\s*(px|em|rem)',
+                             re.IGNORECASE)
+CACHE_VERSION = 1
+
+
+def tag_attributes(tag: str):
+    """Get the attributes of an HTML tag."""
+    attributes = {}
+    for name, value in TAG_ATTRIBUTE.findall(tag):
+        if value[:1] in ('"', "'"):
+            value = value[1:-1]
+        attributes[name.lower()] = html.unescape(value)
+    return attributes
+
+
+def site_path(url: str, page_dir: str, baseurl: str = ""):
+    """Get the site path of an image URL. Returns "" for other URLs."""
+    if re.match(r'^[a-z][\w+.-]*:', url, re.IGNORECASE) or url.startswith("//"):
+        return ""
+    url = url.split("#")[0].split("?")[0]
+    if os.path.splitext(url)[1].lower() not in IMAGE_EXTENSIONS:
+        return ""
+    if url.startswith("/"):
+        if baseurl != "" and url.startswith(baseurl + "/"):
+            url = url[len(baseurl):]
+        path = posixpath.normpath(url.lstrip("/"))
+    else:
+        path = posixpath.normpath(posixpath.join(page_dir, url))
+    if path.startswith("..") or path == ".":
+        return ""
+    return path
+
+
+def display_width(attributes: dict):
+    """Guess the displayed width (px) of an image from its attributes."""
+    width = attributes.get("width", "").strip()
+    match = re.match(r'^([\d.]+)\s*(px|%)?$', width)
+    if match is not None:
+        value = float(match.group(1))
+        return round(value * PAGE_WIDTH / 100) if match.group(2) == "%" else round(value)
+    match = MAX_WIDTH_STYLE.search(attributes.get("style", ""))
+    if match is not None:
+        value = float(match.group(1))
+        return round(value) if match.group(2).lower() == "px" else round(value * EM_PIXELS)
+    return PAGE_WIDTH
+
+
+def variant_name(path: str, width: int, ext: str):
+    """Get the site path of a variant."""
+    return os.path.splitext(path)[0] + "-" + str(width) + "w" + ext
+
+
+def make_variants(task: tuple):
+    """Make the variants of an image. Runs in a worker process.
+
+    Returns (source, {"width", "height", "variants": [[width, ext], ...]}, error).
+    """
+    source, out_dir, widths = task
+    try:
+        with Image.open(source) as image:
+            image.load()
+            width, height = image.size
+            ext = ".jpg" if image.format == "JPEG" else ".png"
+            os.makedirs(out_dir, exist_ok=True)
+            variants = []
+            for target in sorted(set([w for w in widths if w < width] + [width])):
+                resized = image
+                if target < width:
+                    resized = image.resize((target, max(1, round(height * target / width))),
+                                           Image.LANCZOS)
+                name = os.path.join(out_dir, str(target))
+                resized.save(name + ".webp", "WEBP", quality=WEBP_QUALITY,
+                             method=WEBP_METHOD)
+                variants.append([target, ".webp"])
+                if target < width:
+                    if ext == ".jpg":
+                        resized.convert("RGB").save(name + ext, "JPEG", quality=JPEG_QUALITY,
+                                                    optimize=True, progressive=True)
+                    else:
+                        resized.save(name + ext, "PNG", optimize=True)
+                    variants.append([target, ext])
+        return source, {"width": width, "height": height, "variants": variants}, ""
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return source, None, str(e)
+
+
+class ImagePipeline:
+    """Make responsive variants of images through a cache keyed by the image hash."""
+    _roots = []
+    _dst = "_site"
+    _cache_dir = ""
+    _jobs = 1
+    _widths = WIDTHS
+    _images = {}
+    _errors = []
+    _stats = {}
+
+    def __init__(self, roots: list, dst: str, cache_dir: str, jobs: int = 0):
+        """Initialize the class. Images are searched in roots in order."""
+        self._roots = [os.path.abspath(root) for root in roots]
+        self._dst = os.path.abspath(dst)
+        self._cache_dir = os.path.abspath(cache_dir)
+        self._jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
+        self._images = {}
+        self._errors = []
+        self._stats = {"processed": 0, "cached": 0, "copied": 0}
+
+    @staticmethod
+    def available():
+        """Check whether Pillow is installed."""
+        return Image is not None
+
+    @property
+    def errors(self):
+        """Get the (site path, message) list of the failed images."""
+        return self._errors
+
+    @property
+    def stats(self):
+        """Get the number of processed, cached and copied images."""
+        return self._stats
+
+    def find_source(self, path: str):
+        """Find the source file of a site path. Returns "" if not found."""
+        for root in self._roots:
+            source = os.path.join(root, path)
+            if os.path.isfile(source):
+                return source
+        return ""
+
+    def cache_key(self, source: str):
+        """Get the cache key of an image."""
+        settings = json.dumps([CACHE_VERSION, list(self._widths), WEBP_QUALITY, WEBP_METHOD,
+                               JPEG_QUALITY])
+        return build_cache.hash_text(build_cache.hash_file(source) + settings)[:24]
+
+    def load_cached(self, key: str):
+        """Load the variant list of a cached image. Returns None if not cached."""
+        try:
+            with open(os.path.join(self._cache_dir, key, "variants.json"), "r",
+                      encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def process(self, paths: list):
+        """Copy the images into the site and make their variants."""
+        self._errors = []
+        self._stats = {"processed": 0, "cached": 0, "copied": 0}
+        pending = {}
+        for path in sorted(set(paths)):
+            self._images.pop(path, None)
+            source = self.find_source(path)
+            if source == "":
+                continue
+            self.copy_original(source, path)
+            if self.available() is False:
+                continue
+            key = self.cache_key(source)
+            info = self.load_cached(key)
+            if info is None:
+                pending.setdefault(source, (key, []))[1].append(path)
+                continue
+            self._stats["cached"] += 1
+            self._images[path] = (key, info)
+        tasks = [(source, os.path.join(self._cache_dir, key), self._widths)
+                 for source, (key, _) in pending.items()]
+        for source, info, error in self.run_tasks(tasks):
+            key, site_paths = pending[source]
+            if info is None:
+                self._errors.append((site_paths[0], error))
+                continue
+            # The cache may be shared by several builds (preview_farm.py).
+            info_path = os.path.join(self._cache_dir, key, "variants.json")
+            tmp_path = info_path + "." + str(os.getpid()) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(info, f)
+            os.replace(tmp_path, info_path)
+            self._stats["processed"] += 1
+            for path in site_paths:
+                self._images[path] = (key, info)
+        for path in sorted(set(paths)):
+            if path in self._images:
+                self.copy_variants(path)
+
+    def run_tasks(self, tasks: list):
+        """Make the variants, spreading the images over a process pool."""
+        jobs = min(self._jobs, len(tasks))
+        if jobs <= 1:
+            return [make_variants(task) for task in tasks]
+        print("  --> Resize images with " + str(jobs) + " processes")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(make_variants, tasks))
+
+    def copy_original(self, source: str, path: str):
+        """Copy an image into the site if it is not there."""
+        dst_path = os.path.join(self._dst, path)
+        if os.path.isfile(dst_path) and os.path.getmtime(dst_path) >= os.path.getmtime(source):
+            return
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        shutil.copyfile(source, dst_path)
+        self._stats["copied"] += 1
+
+    def copy_variants(self, path: str):
+        """Copy the cached variants of an image into the site, replacing those of another key."""
+        key, info = self._images[path]
+        for width, ext in info["variants"]:
+            cache_path = os.path.join(self._cache_dir, key, str(width) + ext)
+            dst_path = os.path.join(self._dst, variant_name(path, width, ext))
+            # The copies keep the time of the cached file, so a variant of the old image differs.
+            try:
+                cached, copied = os.stat(cache_path), os.stat(dst_path)
+                if cached.st_mtime_ns == copied.st_mtime_ns and cached.st_size == copied.st_size:
+                    continue
+            except FileNotFoundError:
+                pass
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            shutil.copy2(cache_path, dst_path)
+
+    def rewrite(self, text: str, page_dir: str, baseurl: str = ""):
+        """Rewrite the <img> tags of a page to use the variants."""
+        def replace(match):
+            tag = match.group(0)
+            attributes = tag_attributes(tag)
+            if "srcset" in attributes:
+                return tag
+            path = site_path(attributes.get("src", ""), page_dir, baseurl)
+            if path not in self._images:
+                return tag
+            info = self._images[path][1]
+            url = attributes["src"].split("#")[0].split("?")[0]
+            srcsets = {}
+            for width, ext in info["variants"]:
+                srcsets.setdefault(ext, []).append(
+                    variant_name(url, width, ext) + " " + str(width) + "w")
+            srcsets.setdefault(os.path.splitext(path)[1].lower(), []).append(
+                attributes["src"] + " " + str(info["width"]) + "w")
+            sizes = str(min(display_width(attributes), PAGE_WIDTH)) + "px"
+            fallback = [ext for ext in srcsets if ext != ".webp"][0]
+            img = (tag[:4] + ' srcset="' + html.escape(", ".join(srcsets[fallback]))
+                   + '" sizes="' + sizes + '"' + tag[4:])
+            return ('<picture><source type="image/webp" srcset="'
+                    + html.escape(", ".join(srcsets[".webp"])) + '" sizes="' + sizes + '">'
+                    + img + "</picture>")
+        return IMG_TAG.sub(replace, text)
+
+    def images_of(self, text: str, page_dir: str, baseurl: str = ""):
+        """List the site paths of the images of a page."""
+        paths = []
+        for tag in IMG_TAG.findall(text):
+            path = site_path(tag_attributes(tag).get("src", ""), page_dir, baseurl)
+            if path != "":
+                paths.append(path)
+        return paths
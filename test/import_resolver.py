@@ -0,0 +1,420 @@
+"""This is a module to expand the @import directives of the docs tree."""
+# SYSTEM: Python 3.11.1
+#
+# これは、docsフォルダの@import(Markdown Preview Enhanced)を展開するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * 各ファイルの@importを一度だけ解析し、ファイル→読み込み先のグラフを保存
+# * 展開した断片を内容のハッシュ(読み込み先のハッシュを含む)でキャッシュ
+# * 変更したファイルと、それを読み込んでいるファイルの断片だけを再展開
+# * 循環参照と存在しない読み込み先を報告
+# * "/"で始まるパスはプロジェクトのルート(docsの親フォルダ)からのパス
+# * ページが表示する画像もグラフに含め、docsの外のファイルを含めて変更の影響を受けるページを抽出
+
+import os
+import re
+import json
+import hashlib
+import posixpath
+
+GRAPH_VERSION = 2
+IMPORT_LINE = re.compile(r'^\s*@import\s+"([^"]+)"\s*(\{[^}]*\})?\s*$')
+FENCE_LINE = re.compile(r'^\s*(```|~~~)')
+FRONT_MATTER = re.compile(r'\A---\s*\n.*?\n---\s*\n', re.DOTALL)
+MD_LINK = re.compile(r'(!?\[[^\]]*\]\()([^)\s]+)((?:\s+"[^"]*")?\))')
+HTML_LINK = re.compile(r'(\b(?:src|href)=")([^"]+)(")')
+IMG_SRC = re.compile(r'<img\b[^>]*?\bsrc="([^"]+)"', re.IGNORECASE)
+URL_SCHEME = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:')
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".bmp")
+STYLE_EXTENSIONS = (".css", ".less")
+DIAGRAM_EXTENSIONS = (".puml", ".plantuml", ".pu")
+
+
+def import_kind(path: str):
+    """Get how an imported file is expanded."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in MARKDOWN_EXTENSIONS:
+        return "markdown"
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext in STYLE_EXTENSIONS:
+        return "style"
+    if ext in DIAGRAM_EXTENSIONS:
+        return "diagram"
+    if ext in (".html", ".htm"):
+        return "html"
+    return "code"
+
+
+def strip_front_matter(text: str):
+    """Remove the front matter of an imported page."""
+    return FRONT_MATTER.sub("", text, count=1)
+
+
+def is_relative_url(target: str):
+    """Check whether a link target is relative to the page."""
+    return not (target.startswith(("/", "#")) or URL_SCHEME.match(target))
+
+
+def rebase_links(text: str, from_dir: str, to_dir: str):
+    """Make the relative links of a fragment relative to another directory."""
+    if from_dir == to_dir:
+        return text
+
+    def rebase(match):
+        target = match.group(2)
+        if is_relative_url(target) is False:
+            return match.group(0)
+        path, anchor = target, ""
+        index = min([i for i in (target.find("#"), target.find("?")) if i >= 0], default=-1)
+        if index >= 0:
+            path, anchor = target[:index], target[index:]
+        if path == "":
+            return match.group(0)
+        moved = posixpath.relpath(posixpath.normpath(posixpath.join(from_dir, path)),
+                                  to_dir or ".")
+        return match.group(1) + moved + anchor + match.group(3)
+
+    lines = []
+    in_fence = False
+    for line in text.split("\n"):
+        if FENCE_LINE.match(line):
+            in_fence = not in_fence
+        elif in_fence is False:
+            line = HTML_LINK.sub(rebase, MD_LINK.sub(rebase, line))
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class ImportResolver:
+    """Expand @import directives with a persistent dependency graph and fragment cache."""
+    _src = "docs"
+    _root = "."
+    _prefix = ""
+    _cache_dir = ""
+    _nodes = {}
+    _fragments = {}
+    _keys = {}
+    _errors = []
+    _reported = set()
+    _expanded = 0
+    _reused = 0
+
+    def __init__(self, src: str, cache_dir: str = "", root_dir: str = ""):
+        """Initialize the class. root_dir is used for paths starting with "/"."""
+        self._src = os.path.abspath(src)
+        self._root = os.path.abspath(root_dir) if root_dir != "" else os.path.dirname(self._src)
+        self._prefix = os.path.relpath(self._src, self._root).replace(os.sep, "/")
+        if self._prefix == ".":
+            self._prefix = ""
+        self._cache_dir = os.path.abspath(cache_dir) if cache_dir != "" else ""
+        self._nodes = {}
+        self._fragments = {}
+        self._keys = {}
+        self._errors = []
+        self._reported = set()
+        self._expanded = 0
+        self._reused = 0
+        self.load()
+
+    def reset(self):
+        """Forget the keys and errors of the previous build (the graph is kept)."""
+        self._keys = {}
+        self._errors = []
+        self._reported = set()
+        self._expanded = 0
+        self._reused = 0
+
+    @property
+    def errors(self):
+        """Get the cycles and missing targets found so far: (kind, page, target)."""
+        return self._errors
+
+    @property
+    def stats(self):
+        """Get the number of expanded and reused fragments."""
+        return {"expanded": self._expanded, "reused": self._reused}
+
+    # =========================================================
+    # Paths
+    def to_node(self, rel_path: str):
+        """Get the node name (relative to the root) of a source-relative path."""
+        if self._prefix == "":
+            return posixpath.normpath(rel_path)
+        return posixpath.normpath(posixpath.join(self._prefix, rel_path))
+
+    def to_source(self, node: str):
+        """Get the source-relative path of a node. Returns None if outside the source."""
+        if self._prefix == "":
+            return node
+        if node.startswith(self._prefix + "/"):
+            return node[len(self._prefix) + 1:]
+        return None
+
+    def source_path(self, node: str):
+        """Get the path of a node relative to the source ("../" for the files outside)."""
+        return posixpath.relpath(node, self._prefix) if self._prefix != "" else node
+
+    def target_node(self, node: str, target: str):
+        """Get the node name of an import target."""
+        if target.startswith("/"):
+            path = target.lstrip("/")
+        else:
+            path = posixpath.join(posixpath.dirname(node), target)
+        return posixpath.normpath(path)
+
+    def asset_node(self, node: str, url: str):
+        """Get the node name of an image shown by a page. Returns "" for other URLs."""
+        if URL_SCHEME.match(url) or url.startswith("//"):
+            return ""
+        url = url.split("#")[0].split("?")[0]
+        if import_kind(url) != "image":
+            return ""
+        if url.startswith("/") is False:
+            return posixpath.normpath(posixpath.join(posixpath.dirname(node), url))
+        # Like the site, the source folder is searched before the root.
+        path = posixpath.normpath(url.lstrip("/"))
+        name = self.to_node(path)
+        if os.path.isfile(os.path.join(self._root, *name.split("/"))) is False \
+                and os.path.isfile(os.path.join(self._root, *path.split("/"))):
+            return path
+        return name
+
+    def children(self, name: str, node: dict):
+        """Get the node names imported or shown by a file."""
+        return [self.target_node(name, target) for target in node["imports"]] + node["assets"]
+
+    # =========================================================
+    # Graph
+    def load(self):
+        """Load the graph saved by the previous build."""
+        if self._cache_dir == "":
+            return
+        try:
+            with open(os.path.join(self._cache_dir, "graph.json"), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == GRAPH_VERSION:
+                self._nodes = data["nodes"]
+        except (OSError, ValueError, KeyError):
+            self._nodes = {}
+
+    def save(self, prune: bool = False):
+        """Save the graph. prune removes the fragments not used by this build."""
+        if self._cache_dir == "":
+            return
+        os.makedirs(os.path.join(self._cache_dir, "fragments"), exist_ok=True)
+        path = os.path.join(self._cache_dir, "graph.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": GRAPH_VERSION, "nodes": self._nodes}, f,
+                      indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+        if prune is True:
+            used = set(key + ".md" for key in self._keys.values())
+            fragment_dir = os.path.join(self._cache_dir, "fragments")
+            for name in os.listdir(fragment_dir):
+                if name not in used:
+                    os.remove(os.path.join(fragment_dir, name))
+
+    def node(self, name: str):
+        """Get the hash and imports of a file, parsing it only if it has changed."""
+        path = os.path.join(self._root, *name.split("/"))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._nodes.pop(name, None)
+            return None
+        if os.path.isfile(path) is False:
+            return None
+        node = self._nodes.get(name)
+        if node is not None and node["mtime_ns"] == stat.st_mtime_ns \
+                and node["size"] == stat.st_size:
+            return node
+        kind = import_kind(name)
+        imports = []
+        urls = []
+        if kind == "image" or kind == "style":
+            digest = ""
+        else:
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            text = data.decode("utf-8", errors="replace")
+            if kind == "markdown":
+                in_fence = False
+                for line in text.splitlines():
+                    if FENCE_LINE.match(line):
+                        in_fence = not in_fence
+                        continue
+                    if in_fence is True:
+                        continue
+                    match = IMPORT_LINE.match(line)
+                    if match is not None:
+                        imports.append(match.group(1))
+                        continue
+                    urls += [match.group(2) for match in MD_LINK.finditer(line)
+                             if match.group(1).startswith("!")]
+                    urls += IMG_SRC.findall(line)
+            elif kind == "html":
+                urls = IMG_SRC.findall(text)
+        assets = set(self.asset_node(name, url) for url in urls)
+        assets.discard("")
+        node = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": digest,
+                "imports": imports, "assets": sorted(assets)}
+        self._nodes[name] = node
+        return node
+
+    def scan(self, rel_paths: list):
+        """Parse the source files and all files they import or show.
+
+        Returns the paths of the files found outside the source ("../...").
+        """
+        pending = [self.to_node(rel_path) for rel_path in rel_paths]
+        found = set()
+        outside = set()
+        while len(pending) > 0:
+            name = pending.pop()
+            if name in found:
+                continue
+            found.add(name)
+            node = self.node(name)
+            if node is None:
+                continue
+            if self.to_source(name) is None:
+                outside.add(self.source_path(name))
+            pending.extend(self.children(name, node))
+        return sorted(outside)
+
+    def dependents(self, rel_paths: list):
+        """Get the source files that import or show the given files, directly or not.
+
+        The paths of the files outside the source start with "../" (see scan).
+        """
+        table = {}
+        for name, node in self._nodes.items():
+            for child in self.children(name, node):
+                table.setdefault(child, set()).add(name)
+        pending = [self.to_node(rel_path) for rel_path in rel_paths]
+        found = set()
+        while len(pending) > 0:
+            name = pending.pop()
+            if name in found:
+                continue
+            found.add(name)
+            pending.extend(table.get(name, set()))
+        return sorted(rel_path for rel_path in map(self.to_source, found)
+                      if rel_path is not None)
+
+    # =========================================================
+    # Fragments
+    def report(self, kind: str, page: str, target: str):
+        """Record a cycle or a missing target once."""
+        if (kind, page, target) not in self._reported:
+            self._reported.add((kind, page, target))
+            self._errors.append((kind, page, target))
+
+    def key(self, name: str, stack: tuple = ()):
+        """Get the cache key of the expanded fragment of a file."""
+        if name in self._keys:
+            return self._keys[name]
+        node = self.node(name)
+        if node is None:
+            return None
+        parts = [import_kind(name), name if node["hash"] == "" else node["hash"]]
+        cyclic = False
+        for target in node["imports"]:
+            child = self.target_node(name, target)
+            if child in stack or child == name:
+                self.report("cycle", name, " -> ".join(list(stack) + [name, child]))
+                parts.append("cycle:" + child)
+                cyclic = True
+                continue
+            child_key = self.key(child, stack + (name,))
+            if child_key is None:
+                self.report("missing", name, target)
+            parts.append(target + "=" + str(child_key))
+        key = hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+        if cyclic is False:
+            self._keys[name] = key
+        return key
+
+    def fragment(self, name: str, stack: tuple = ()):
+        """Get the expanded text of a file."""
+        key = self.key(name, stack)
+        if key is None:
+            return None
+        text = self._fragments.get(key)
+        if text is None and self._cache_dir != "":
+            try:
+                with open(os.path.join(self._cache_dir, "fragments", key + ".md"), "r",
+                          encoding="utf-8") as f:
+                    text = f.read()
+            except OSError:
+                text = None
+        if text is not None:
+            self._reused += 1
+            self._fragments[key] = text
+            return text
+        text = self.render_fragment(name, stack)
+        self._expanded += 1
+        self._fragments[key] = text
+        if self._cache_dir != "" and name in self._keys:
+            fragment_dir = os.path.join(self._cache_dir, "fragments")
+            os.makedirs(fragment_dir, exist_ok=True)
+            with open(os.path.join(fragment_dir, key + ".md"), "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+    def render_fragment(self, name: str, stack: tuple):
+        """Expand the imports of a Markdown file."""
+        with open(os.path.join(self._root, *name.split("/")), "r", encoding="utf-8") as f:
+            text = f.read()
+        if import_kind(name) != "markdown":
+            return text
+        lines = []
+        in_fence = False
+        for line in text.split("\n"):
+            if FENCE_LINE.match(line):
+                in_fence = not in_fence
+                lines.append(line)
+                continue
+            match = IMPORT_LINE.match(line) if in_fence is False else None
+            if match is None:
+                lines.append(line)
+                continue
+            lines.append(self.render_import(name, match.group(1), match.group(2) or "",
+                                            stack + (name,)))
+        return "\n".join(lines)
+
+    def render_import(self, name: str, target: str, attrs: str, stack: tuple):
+        """Get the Markdown that replaces an @import line."""
+        child = self.target_node(name, target)
+        kind = import_kind(child)
+        if child in stack:
+            return "<!-- @import cycle: " + target + " -->"
+        if self.node(child) is None:
+            return "<!-- @import not found: " + target + " -->"
+        if kind == "image":
+            return "![](" + target + ")" + attrs
+        if kind == "style":
+            return '<link rel="stylesheet" href="' + target + '">'
+        text = self.fragment(child, stack)
+        if kind == "markdown":
+            return rebase_links(strip_front_matter(text), posixpath.dirname(child),
+                                posixpath.dirname(name)).rstrip("\n")
+        if kind == "html":
+            return text.rstrip("\n")
+        language = "puml" if kind == "diagram" else os.path.splitext(child)[1][1:]
+        info = language + (" " + attrs if attrs != "" else "")
+        return "```" + info + "\n" + text.rstrip("\n") + "\n```"
+
+    def expand(self, rel_path: str):
+        """Get the text of a source page with all imports expanded.
+
+        Returns None if the page does not import anything.
+        """
+        name = self.to_node(rel_path)
+        node = self.node(name)
+        if node is None or len(node["imports"]) == 0:
+            return None
+        return self.fragment(name)
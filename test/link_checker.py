@@ -0,0 +1,430 @@
+"""This is a script to check the links and assets of the built site."""
+# SYSTEM: Python 3.11.1
+#
+# これは、ビルドしたサイトのリンクと画像などの参照先を確認するスクリプトです。
+#
+# このスクリプトは、以下の内容を実行します。
+# * _siteのページから<a>, <img>, <link>, <script>などの参照先を集める(並列に解析)
+# * サイト内のリンクは、ファイルの有無とページ内のアンカー(id)を確認
+# * docsフォルダの@importの参照先とインポートの循環を確認
+# * 外部URLは同時接続数を制限した非同期HTTPで確認(--proxyでテスト用のスタブサーバーに送信)
+# * 結果は_site.cache/links.jsonにキャッシュし、変更のないページと期限内の外部URLは再確認しない
+
+import sys
+import os
+import re
+import ssl
+import json
+import time
+import asyncio
+import argparse
+import posixpath
+import urllib.parse
+import concurrent.futures
+
+import build_cache
+import image_pipeline
+import import_resolver
+import native_engine
+
+__version__ = "0.0.1"
+CACHE_VERSION = 1
+USER_AGENT = "link_checker/" + __version__
+LINK_ATTRIBUTES = {
+    "a": ("href",),
+    "area": ("href",),
+    "link": ("href",),
+    "img": ("src", "srcset"),
+    "source": ("src", "srcset"),
+    "script": ("src",),
+    "iframe": ("src",),
+    "video": ("src", "poster"),
+    "audio": ("src",),
+}
+LINK_TAG_PATTERN = re.compile(
+    r'<(' + "|".join(LINK_ATTRIBUTES) + r')\b[^>]*>', re.IGNORECASE)
+ANCHOR_PATTERN = re.compile(r'\b(?:id|name)\s*=\s*"([^"]*)"')
+SKIP_SCHEMES = ("mailto:", "tel:", "javascript:", "data:", "about:")
+MAX_REDIRECTS = 5
+MIN_PAGES_PER_JOB = 8
+parser = argparse.ArgumentParser(
+    description="Check the links and assets of the built site"
+)
+parser.add_argument("-v", "--version", action="version",
+                    version="%(prog)s ver." + __version__)
+parser.add_argument("--root_dir", type=str,
+                    default=os.path.abspath(os.path.join(
+                        os.path.dirname(__file__), "./..")),
+                    help="Root directory")
+parser.add_argument("--volume_site", type=str, default="_site",
+                    help="Directory of the built site")
+parser.add_argument("--src", type=str, default="docs",
+                    help="Source directory to check the @import targets ('': do not check)")
+parser.add_argument("--baseurl", type=str, default="", help="baseurl of the site")
+parser.add_argument("--jobs", type=int, default=0,
+                    help="Number of processes to parse the pages (0: CPU cores)")
+# options : External
+parser.add_argument("--offline", action='store_true', help="Do not check external URLs")
+parser.add_argument("--concurrency", type=int, default=8,
+                    help="Number of concurrent requests to external sites")
+parser.add_argument("--timeout", type=float, default=10.0,
+                    help="Timeout of a request to an external site (seconds)")
+parser.add_argument("--proxy", type=str, default="",
+                    help="Send every external request to this HTTP server (e.g. a local stub)")
+parser.add_argument("--ttl", type=float, default=24.0,
+                    help="Hours before a working external URL is checked again")
+parser.add_argument("--error_ttl", type=float, default=1.0,
+                    help="Hours before a broken external URL is checked again")
+parser.add_argument("--no_cache", action='store_true', help="Ignore the previous results")
+
+
+def parse_page(task: tuple):
+    """Collect the links and anchors of a page. Runs in a worker process."""
+    site, out_path = task
+    with open(os.path.join(site, out_path), "rb") as f:
+        text = f.read().decode("utf-8", errors="replace")
+    links = []
+    for match in LINK_TAG_PATTERN.finditer(text):
+        attributes = image_pipeline.tag_attributes(match.group(0))
+        for name in LINK_ATTRIBUTES[match.group(1).lower()]:
+            value = attributes.get(name, "").strip()
+            if value == "":
+                continue
+            if name == "srcset":
+                for candidate in value.split(","):
+                    if candidate.strip() != "":
+                        links.append(candidate.split()[0])
+            else:
+                links.append(value)
+    anchors = [urllib.parse.unquote(anchor) for anchor in ANCHOR_PATTERN.findall(text)]
+    return out_path, sorted(set(links)), sorted(set(anchors))
+
+
+def is_external(url: str):
+    """Check whether a URL points outside of the site."""
+    return url.startswith(("http://", "https://", "//"))
+
+
+def resolve_internal(url: str, page: str, baseurl: str = ""):
+    """Get (site path, fragment) of an internal link. Returns None for other URLs."""
+    if url.lower().startswith(SKIP_SCHEMES) or is_external(url):
+        return None
+    url, _, fragment = url.partition("#")
+    path = urllib.parse.unquote(url.split("?")[0])
+    if path == "":
+        return page, urllib.parse.unquote(fragment)
+    if path.startswith("/"):
+        if baseurl != "" and (path == baseurl or path.startswith(baseurl + "/")):
+            path = path[len(baseurl):]
+        path = path.lstrip("/")
+    else:
+        path = posixpath.join(posixpath.dirname(page), path)
+    directory = path == "" or path.endswith("/")
+    path = posixpath.normpath(path) if path != "" else "."
+    if path == ".." or path.startswith("../"):
+        return "..", ""
+    if path == ".":
+        path = ""
+    elif directory:
+        path += "/"
+    return path, urllib.parse.unquote(fragment)
+
+
+class HttpChecker:
+    """Check external URLs with a bounded number of concurrent requests."""
+    _concurrency = 8
+    _timeout = 10.0
+    _proxy = None
+    _ssl = None
+
+    def __init__(self, concurrency: int, timeout: float, proxy: str = ""):
+        """Initialize the class."""
+        self._concurrency = max(1, concurrency)
+        self._timeout = timeout
+        self._proxy = urllib.parse.urlsplit(proxy) if proxy != "" else None
+        self._ssl = None
+
+    async def request(self, method: str, url: str):
+        """Send a request and read the response head. Returns (status, headers)."""
+        parts = urllib.parse.urlsplit(url)
+        target = (parts.path or "/") + ("?" + parts.query if parts.query != "" else "")
+        if self._proxy is not None:
+            host, port, use_ssl = self._proxy.hostname, self._proxy.port or 80, False
+            target = urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path or "/",
+                                              parts.query, ""))
+        else:
+            use_ssl = parts.scheme == "https"
+            host, port = parts.hostname, parts.port or (443 if use_ssl else 80)
+            if use_ssl and self._ssl is None:
+                self._ssl = ssl.create_default_context()
+        reader, writer = await asyncio.open_connection(
+            host, port, ssl=self._ssl if use_ssl else None,
+            server_hostname=parts.hostname if use_ssl else None)
+        try:
+            writer.write((method + " " + target + " HTTP/1.1\r\nHost: " + parts.netloc
+                          + "\r\nUser-Agent: " + USER_AGENT + "\r\nAccept: */*"
+                          + "\r\nConnection: close\r\n\r\n").encode("latin-1"))
+            head = await reader.readuntil(b"\r\n\r\n")
+        finally:
+            writer.close()
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ")[1])
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep != "":
+                headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    async def check(self, url: str):
+        """Check a URL, following redirects. Returns (status, error)."""
+        if url.startswith("//"):
+            url = "https:" + url
+        method = "HEAD"
+        for _ in range(MAX_REDIRECTS + 1):
+            try:
+                status, headers = await asyncio.wait_for(self.request(method, url),
+                                                         self._timeout)
+            except asyncio.TimeoutError:
+                return 0, "timeout"
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError,
+                    asyncio.LimitOverrunError) as e:
+                return 0, str(e) or type(e).__name__
+            if status in (405, 501) and method == "HEAD":
+                # Some servers do not support HEAD.
+                method = "GET"
+                continue
+            if status in (301, 302, 303, 307, 308) and "location" in headers:
+                url = urllib.parse.urljoin(url, headers["location"])
+                continue
+            return status, ""
+        return 0, "too many redirects"
+
+    async def check_all(self, urls: list):
+        """Check URLs concurrently. Returns {url: (status, error)}."""
+        semaphore = asyncio.Semaphore(self._concurrency)
+        results = {}
+
+        async def run(url: str):
+            async with semaphore:
+                results[url] = await self.check(url)
+
+        await asyncio.gather(*[run(url) for url in urls])
+        return results
+
+
+class LinkChecker:
+    """Check the links of the built site through a result cache."""
+    _site = "_site"
+    _src = ""
+    _baseurl = ""
+    _jobs = 1
+    _cache_path = ""
+    _cache = {}
+    _pages = {}
+    _broken = []
+    _stats = {}
+
+    def __init__(self, site: str, src: str = "", baseurl: str = "", jobs: int = 0):
+        """Initialize the class."""
+        self._site = os.path.abspath(site)
+        self._src = os.path.abspath(src) if src != "" else ""
+        self._baseurl = baseurl.rstrip("/")
+        self._jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
+        self._cache_path = os.path.join(native_engine.cache_dir(self._site), "links.json")
+        self._cache = {"pages": {}, "external": {}}
+        self._pages = {}
+        self._broken = []
+        self._stats = {}
+
+    @property
+    def broken(self):
+        """Get the (page, url, reason) list of the broken links."""
+        return self._broken
+
+    @property
+    def stats(self):
+        """Get the numbers of the checked items."""
+        return self._stats
+
+    def load_cache(self):
+        """Load the previous results."""
+        try:
+            with open(self._cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self._cache = {"pages": data["pages"], "external": data["external"]}
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save_cache(self):
+        """Save the results."""
+        os.makedirs(os.path.dirname(self._cache_path), exist_ok=True)
+        with open(self._cache_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "pages": self._pages,
+                       "external": self._cache["external"]}, f, ensure_ascii=False)
+        os.replace(self._cache_path + ".tmp", self._cache_path)
+
+    def site_files(self):
+        """List the files of the site."""
+        files = set()
+        for dir_path, dir_names, file_names in os.walk(self._site):
+            for file_name in file_names:
+                rel_path = os.path.relpath(os.path.join(dir_path, file_name), self._site)
+                files.add(rel_path.replace(os.sep, "/"))
+        return files
+
+    def parse_pages(self, files: set):
+        """Collect the links of the pages. Unchanged pages are taken from the cache."""
+        pending = []
+        for out_path in sorted(files):
+            if out_path.endswith((".html", ".htm")) is False:
+                continue
+            stat = os.stat(os.path.join(self._site, out_path))
+            signature = [stat.st_size, stat.st_mtime_ns]
+            cached = self._cache["pages"].get(out_path)
+            if cached is not None and cached["signature"] == signature:
+                self._pages[out_path] = cached
+            else:
+                self._pages[out_path] = {"signature": signature}
+                pending.append((self._site, out_path))
+        jobs = min(self._jobs, len(pending) // MIN_PAGES_PER_JOB)
+        if jobs <= 1:
+            results = [parse_page(task) for task in pending]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(parse_page, pending))
+        for out_path, links, anchors in results:
+            self._pages[out_path].update({"links": links, "anchors": anchors})
+        self._stats["pages"] = len(self._pages)
+        self._stats["parsed"] = len(pending)
+
+    def check_internal(self, files: set):
+        """Check the internal links and anchors."""
+        count = 0
+        for page in sorted(self._pages):
+            for url in self._pages[page]["links"]:
+                target = resolve_internal(url, page, self._baseurl)
+                if target is None:
+                    continue
+                count += 1
+                path, fragment = target
+                if path == "" or path.endswith("/"):
+                    path += "index.html"
+                if path not in files:
+                    if path + ".html" in files:
+                        path += ".html"
+                    elif path + "/index.html" in files:
+                        path += "/index.html"
+                    else:
+                        self._broken.append((page, url, "not found"))
+                        continue
+                if fragment not in ("", "top") and path in self._pages \
+                        and fragment not in self._pages[path]["anchors"]:
+                    self._broken.append((page, url, "anchor not found"))
+        self._stats["internal"] = count
+
+    def check_imports(self):
+        """Check the @import targets of the source pages."""
+        if self._src == "":
+            return
+        resolver = import_resolver.ImportResolver(
+            self._src, os.path.join(native_engine.cache_dir(self._site), "imports"))
+        for rel_path in build_cache.list_files(self._src):
+            if rel_path.endswith(".md"):
+                resolver.key(resolver.to_node(rel_path))
+        for kind, page, target in resolver.errors:
+            self._broken.append((page, target, "import cycle" if kind == "cycle"
+                                 else "import not found"))
+
+    def check_external(self, checker: HttpChecker, ttl: float, error_ttl: float):
+        """Check the external URLs that are not in the cache."""
+        now = time.time()
+        cache = self._cache["external"]
+        urls = sorted(set(url.split("#")[0] for page in self._pages.values()
+                          for url in page["links"] if is_external(url)))
+        pending = []
+        for url in urls:
+            entry = cache.get(url)
+            if entry is not None:
+                age = now - entry["checked"]
+                if age < (ttl if entry["error"] == "" and entry["status"] < 400
+                          else error_ttl) * 3600:
+                    continue
+            pending.append(url)
+        if len(pending) > 0:
+            for url, (status, error) in asyncio.run(checker.check_all(pending)).items():
+                cache[url] = {"status": status, "error": error, "checked": now}
+        for url in list(cache):
+            if url not in urls:
+                del cache[url]
+        for page in sorted(self._pages):
+            for url in self._pages[page]["links"]:
+                entry = cache.get(url.split("#")[0])
+                if entry is None:
+                    continue
+                if entry["error"] != "":
+                    self._broken.append((page, url, entry["error"]))
+                elif entry["status"] >= 400 and entry["status"] != 429:
+                    self._broken.append((page, url, "HTTP " + str(entry["status"])))
+        self._stats["external"] = len(urls)
+        self._stats["requested"] = len(pending)
+
+    def run(self, checker: HttpChecker = None, ttl: float = 24.0, error_ttl: float = 1.0,
+            use_cache: bool = True):
+        """Check the site. Returns the number of broken links."""
+        self._broken = []
+        self._pages = {}
+        self._stats = {}
+        if use_cache is True:
+            self.load_cache()
+        files = self.site_files()
+        self.parse_pages(files)
+        self.check_internal(files)
+        self.check_imports()
+        if checker is not None:
+            self.check_external(checker, ttl, error_ttl)
+        try:
+            self.save_cache()
+        except OSError as e:
+            print("  [ERROR] " + str(e))
+        return len(self._broken)
+
+
+def main(ap):
+    """Check the links and print the broken ones."""
+    print("[## Check links]")
+    site = os.path.join(ap.root_dir, ap.volume_site)
+    if os.path.isdir(site) is False:
+        print("  [ERROR] Not found: " + site)
+        return 1
+    start = time.perf_counter()
+    src = os.path.join(ap.root_dir, ap.src) if ap.src != "" else ""
+    baseurl = ap.baseurl
+    if baseurl == "" and src != "":
+        baseurl = str(native_engine.load_config(src).get("baseurl") or "")
+    checker = None
+    if ap.offline is False:
+        checker = HttpChecker(ap.concurrency, ap.timeout, ap.proxy)
+    link_checker = LinkChecker(site, src, baseurl, ap.jobs)
+    broken = link_checker.run(checker, ap.ttl, ap.error_ttl, not ap.no_cache)
+    stats = link_checker.stats
+    print("  --> Pages: " + str(stats["pages"]) + " (" + str(stats["parsed"]) + " parsed)")
+    print("  --> Internal links: " + str(stats["internal"]))
+    if checker is not None:
+        print("  --> External URLs: " + str(stats["external"]) + " ("
+              + str(stats["requested"]) + " requested)")
+    for page, url, reason in link_checker.broken:
+        print("  [ERROR] " + page + " -> " + url + " (" + reason + ")")
+    print("  --> Broken: " + str(broken) + " in "
+          + str(round((time.perf_counter() - start) * 1000)) + " ms")
+    return 1 if broken > 0 else 0
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    try:
+        sys.exit(main(args))
+    except Exception as e:
+        print("[ERROR] " + str(e))
+        sys.exit(1)
@@ -0,0 +1,167 @@
+"""This is a module to serve the build results with live reload."""
+# SYSTEM: Python 3.11.1
+#
+# これは、ビルド結果を配信し、変更時にブラウザを自動で再読み込みさせるためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * _siteフォルダをHTTPで配信
+# * HTMLにServer-Sent Events(/__livereload)を受信するスクリプトを挿入
+# * 再ビルドしたページを開いているブラウザに再読み込みを通知
+# * 内容のハッシュを含むファイル(style.<hash>.css)はブラウザで長期間キャッシュ可能として配信
+
+import os
+import json
+import threading
+import functools
+import http.server
+import urllib.parse
+
+import stylesheet_pipeline
+
+RELOAD_PATH = "/__livereload"
+RELOAD_SCRIPT = """<script>
+(function () {
+  var source = new EventSource("%s");
+  source.onmessage = function (event) {
+    var paths = JSON.parse(event.data);
+    var here = location.pathname.replace(/\\/$/, "/index.html");
+    for (var i = 0; i < paths.length; i++) {
+      if (paths[i] === here || !/\\.html$/.test(paths[i])) {
+        location.reload();
+        return;
+      }
+    }
+  };
+})();
+</script>
+""" % RELOAD_PATH
+HEARTBEAT_SECONDS = 15.0
+
+
+class ReloadChannel:
+    """Broadcast the reloaded paths to the connected browsers."""
+    _condition = None
+    _version = 0
+    _paths = []
+
+    def __init__(self):
+        """Initialize the class."""
+        self._condition = threading.Condition()
+        self._version = 0
+        self._paths = []
+
+    @property
+    def version(self):
+        """Get the number of notifications."""
+        return self._version
+
+    def notify(self, paths: list):
+        """Notify the changed URL paths."""
+        with self._condition:
+            self._version += 1
+            self._paths = list(paths)
+            self._condition.notify_all()
+
+    def wait(self, version: int, timeout: float):
+        """Wait for a notification newer than version."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._version != version, timeout)
+            return self._version, self._paths
+
+
+class LiveReloadHandler(http.server.SimpleHTTPRequestHandler):
+    """Serve the site and the live reload event stream."""
+
+    def __init__(self, *args, channel: ReloadChannel = None, **kwargs):
+        """Initialize the class."""
+        self.channel = channel
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        """Handle a GET request."""
+        url_path = urllib.parse.urlsplit(self.path).path
+        if url_path == RELOAD_PATH:
+            self.send_event_stream()
+            return
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, "index.html")
+        if path.endswith(".html") and os.path.isfile(path):
+            self.send_html(path)
+            return
+        super().do_GET()
+
+    def end_headers(self):
+        """Let the browser keep the content-hashed files."""
+        if stylesheet_pipeline.is_hashed(urllib.parse.urlsplit(self.path).path):
+            self.send_header("Cache-Control", stylesheet_pipeline.IMMUTABLE_CACHE_CONTROL)
+        super().end_headers()
+
+    def send_html(self, path: str):
+        """Send a page with the live reload script."""
+        with open(path, "rb") as f:
+            body = f.read()
+        script = RELOAD_SCRIPT.encode("utf-8")
+        index = body.rfind(b"</body>")
+        body = body + script if index < 0 else body[:index] + script + body[index:]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_event_stream(self):
+        """Keep the connection open and send the reload events."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        version = self.channel.version
+        try:
+            self.wfile.write(b"retry: 500\n\n")
+            self.wfile.flush()
+            while True:
+                new_version, paths = self.channel.wait(version, HEARTBEAT_SECONDS)
+                if new_version == version:
+                    self.wfile.write(b": ping\n\n")
+                else:
+                    version = new_version
+                    self.wfile.write(b"data: " + json.dumps(paths).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        """Do not log the event stream."""
+        if RELOAD_PATH not in self.path:
+            super().log_message(format, *args)
+
+
+class LiveReloadServer:
+    """HTTP server that pushes reloads to the open browsers."""
+    _httpd = None
+    _thread = None
+    _channel = None
+
+    def __init__(self, directory: str, host: str, port: int):
+        """Initialize the class."""
+        self._channel = ReloadChannel()
+        handler = functools.partial(LiveReloadHandler, directory=directory,
+                                    channel=self._channel)
+        self._httpd = http.server.ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+
+    def start(self):
+        """Start the server in a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the server."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reload(self, out_paths: list):
+        """Reload the browsers showing the given output files."""
+        self._channel.notify(["/" + out_path for out_path in out_paths])
@@ -0,0 +1,389 @@
+"""This is a script to follow the logs of the Jekyll container."""
+# SYSTEM: Python 3.11.1
+#
+# これは、Jekyllサーバのコンテナのログを逐次読み込むスクリプトです。
+#
+# このスクリプトは、以下の内容を実行します。
+# * 前回読み込んだ位置(タイムスタンプ)からのログだけを取得し、位置を保存
+#   (~/.cache/github_pages/logs/<コンテナ名>.json)
+# * メモリには直近の行(--lines)だけを保持し、--follow でなければ最後にその行を表示
+# * Jekyllの"Regenerating"と"done in X seconds"の行からビルド時間のイベントを作成
+# * --wait_ready の場合は、サーバが待ち受けを開始した時点で終了
+#   (コンテナの起動時刻より前の待ち受け開始の行は、前回の起動のものとして無視)
+#   (--timeout 秒以内に開始しなければ終了コード1)
+# * --grep で表示する行を絞り込み、--events でイベントだけを表示
+
+import sys
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+import datetime
+import collections
+
+import docker_api
+import repo_cache
+
+KEEP_EVENTS = 100
+TIMESTAMP = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d{1,9}))?(Z|[+-]\d\d:\d\d) ?")
+DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+STARTING = re.compile(r"^Jekyll Server$|Configuration file:")
+GENERATING = re.compile(r"Generating\.\.\.")
+REGENERATING = re.compile(r"Regenerating: (\d+) file\(s\) changed")
+DONE = re.compile(r"done in ([0-9.]+) seconds")
+ADDRESS = re.compile(r"Server address: (\S+)")
+READY = re.compile(r"Server running")
+ERROR = re.compile(r"Liquid Exception|Conversion error|\bError:|\bERROR\b")
+
+__version__ = "0.0.1"
+parser = argparse.ArgumentParser(
+    description="Follow the logs of the Jekyll container"
+)
+parser.add_argument("-v", "--version", action="version",
+                    version="%(prog)s ver." + __version__)
+parser.add_argument("--container_name", type=str, default="server_jekyll",
+                    help="Container name")
+parser.add_argument("--follow", action='store_true', help="Keep reading the new lines")
+parser.add_argument("--wait_ready", action='store_true',
+                    help="Return as soon as the server is listening")
+parser.add_argument("--timeout", type=float, default=0,
+                    help="Seconds to follow or to wait (0: no limit)")
+parser.add_argument("--since", type=str, default="",
+                    help="Start from 'all', a duration (e.g. 10m), a timestamp or "
+                    "unix seconds (default: the saved position)")
+parser.add_argument("--lines", type=int, default=200,
+                    help="Number of the latest lines kept in memory")
+parser.add_argument("--grep", type=str, default="",
+                    help="Print only the lines matching this regular expression")
+parser.add_argument("--events", action='store_true',
+                    help="Print only the build and server events")
+parser.add_argument("--state_dir", type=str, default="",
+                    help="Folder of the saved positions (default: ~/.cache/github_pages/logs)")
+parser.add_argument("--docker_client", type=str, default="auto",
+                    choices=["auto", "api", "cli"],
+                    help="Docker Engine API (Unix socket) or the docker command")
+parser.add_argument("--docker_socket", type=str, default="",
+                    help="Docker socket path (default: DOCKER_HOST or /var/run/docker.sock)")
+
+
+def default_state_dir():
+    """Get the default folder of the saved positions."""
+    return os.path.join(repo_cache.default_cache_dir(), "logs")
+
+
+def parse_timestamp(line: str):
+    """Split a line of docker logs --timestamps. Returns (nanoseconds or None, text)."""
+    match = TIMESTAMP.match(line)
+    if match is None:
+        return None, line
+    moment = datetime.datetime.fromisoformat(match.group(1) + match.group(3))
+    nanoseconds = int(moment.timestamp()) * 1000000000
+    nanoseconds += int((match.group(2) or "").ljust(9, "0"))
+    return nanoseconds, line[match.end():]
+
+
+def format_since(nanoseconds: int):
+    """Format a position as the since parameter of docker logs."""
+    return str(nanoseconds // 1000000000) + "." + str(nanoseconds % 1000000000).rjust(9, "0")
+
+
+def format_time(nanoseconds: int):
+    """Format a position as the local time."""
+    return datetime.datetime.fromtimestamp(nanoseconds / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def parse_since(text: str, saved: int):
+    """Convert --since to a position in nanoseconds (0: from the beginning)."""
+    if text == "":
+        return saved
+    if text == "all":
+        return 0
+    match = DURATION.match(text)
+    if match is not None:
+        unit = {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return int((time.time() - float(match.group(1)) * unit) * 1e9)
+    nanoseconds, rest = parse_timestamp(text + " ")
+    if nanoseconds is not None and rest == "":
+        return nanoseconds
+    return int(float(text) * 1e9)
+
+
+class LogFollower:
+    """Read the new log lines of a container and find the build events."""
+    _docker = None
+    _container = ""
+    _state_path = ""
+    _lines = None
+    _events = None
+    _offset = 0
+    _started = 0
+    _ready = False
+    _address = ""
+    _regenerating = None
+    _on_line = None
+    _on_event = None
+    _ready_event = None
+
+    def __init__(self, docker, container: str, state_dir: str = "", lines: int = 200,
+                 on_line=None, on_event=None):
+        """Initialize the class."""
+        self._docker = docker
+        self._container = container
+        self._state_path = os.path.join(state_dir or default_state_dir(), container + ".json")
+        self._lines = collections.deque(maxlen=max(1, lines))
+        self._events = collections.deque(maxlen=KEEP_EVENTS)
+        self._offset = 0
+        self._started = 0
+        self._ready = False
+        self._address = ""
+        self._regenerating = None
+        self._on_line = on_line
+        self._on_event = on_event
+        self._ready_event = None
+        self.load()
+
+    @property
+    def lines(self):
+        """Get the latest lines."""
+        return list(self._lines)
+
+    @property
+    def events(self):
+        """Get the latest events ({time, type, seconds, files, address, text})."""
+        return list(self._events)
+
+    @property
+    def offset(self):
+        """Get the position of the last read line (nanoseconds)."""
+        return self._offset
+
+    @property
+    def ready(self):
+        """Check whether the server has reported that it is listening."""
+        return self._ready
+
+    @property
+    def address(self):
+        """Get the address reported by the server."""
+        return self._address
+
+    def load(self):
+        """Load the saved position and events."""
+        try:
+            with open(self._state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self._offset = int(state.get("offset", 0))
+            self._started = int(state.get("started", 0))
+            self._events.extend(state.get("events", []))
+            self._ready = state.get("ready", False) is True
+            self._address = state.get("address", "")
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        """Save the position and events."""
+        os.makedirs(os.path.dirname(self._state_path), exist_ok=True)
+        with open(self._state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"container": self._container, "offset": self._offset,
+                       "started": self._started, "ready": self._ready, "address": self._address,
+                       "events": list(self._events)}, f, indent=1)
+        os.replace(self._state_path + ".tmp", self._state_path)
+
+    def add_event(self, nanoseconds: int, event_type: str, **values):
+        """Record an event."""
+        event = {"time": nanoseconds / 1e9, "type": event_type}
+        event.update(values)
+        self._events.append(event)
+        if self._on_event is not None:
+            self._on_event(event)
+
+    def feed(self, line: str):
+        """Handle a line of docker logs --timestamps."""
+        nanoseconds, text = parse_timestamp(line)
+        if nanoseconds is not None:
+            # since is inclusive, so the last line of the previous read comes again.
+            if nanoseconds <= self._offset:
+                return
+            self._offset = nanoseconds
+        else:
+            nanoseconds = self._offset
+        self._lines.append(text)
+        if STARTING.search(text) is not None:
+            # The container (re)started, so the server is not listening yet.
+            self._ready = False
+            self._regenerating = None
+        match = REGENERATING.search(text)
+        if match is not None:
+            self._regenerating = int(match.group(1))
+        elif GENERATING.search(text) is not None:
+            self._regenerating = None
+        match = DONE.search(text)
+        if match is not None:
+            if self._regenerating is None:
+                self.add_event(nanoseconds, "build", seconds=float(match.group(1)))
+            else:
+                self.add_event(nanoseconds, "regenerate", seconds=float(match.group(1)),
+                               files=self._regenerating)
+            self._regenerating = None
+        match = ADDRESS.search(text)
+        if match is not None:
+            self._address = match.group(1)
+        if READY.search(text) is not None and nanoseconds >= self._started:
+            self._ready = True
+            self.add_event(nanoseconds, "ready", address=self._address)
+            if self._ready_event is not None:
+                self._ready_event.set()
+        if ERROR.search(text) is not None:
+            self.add_event(nanoseconds, "error", text=text.strip())
+        if self._on_line is not None:
+            self._on_line(text)
+
+    async def started(self):
+        """Get the start time (nanoseconds) of the container, 0 if it is not running."""
+        ret, result = await self._docker.started_at(self._container)
+        if ret != 0 or result == "":
+            return 0
+        nanoseconds, _text = parse_timestamp(result)
+        return nanoseconds or 0
+
+    async def running(self):
+        """Check whether the container is running since the start seen by read()."""
+        started = await self.started()
+        return started != 0 and started == self._started
+
+    async def read(self, since: int = None, follow: bool = False, timeout: float = 0,
+                   wait_ready: bool = False):
+        """Read the new lines (and follow them). Returns (ret, message)."""
+        if since is not None:
+            self._offset = since
+        started = await self.started()
+        if started != self._started:
+            # The container was (re)started or stopped after the saved state, so its
+            # ready line belongs to the previous run.
+            self._ready = False
+            self._started = started
+        if wait_ready is True:
+            # Catch up first: the server may already be listening. Only the latest
+            # lines of the history are passed to on_line.
+            on_line = self._on_line
+            self._on_line = None
+            try:
+                ret, message = await self._docker.stream_logs(
+                    self._container, self.feed,
+                    format_since(self._offset) if self._offset else "")
+            finally:
+                self._on_line = on_line
+            if on_line is not None:
+                for text in self._lines:
+                    on_line(text)
+            self.save()
+            if ret != 0:
+                return ret, message
+            if self._ready is True:
+                if await self.running() is True:
+                    return 0, ""
+                # The server stopped after the saved ready line.
+                self._ready = False
+            follow = True
+        self._ready_event = asyncio.Event()
+        stream = asyncio.ensure_future(self._docker.stream_logs(
+            self._container, self.feed, format_since(self._offset) if self._offset else "",
+            follow))
+        waiters = {stream}
+        ready = None
+        if wait_ready is True:
+            ready = asyncio.ensure_future(self._ready_event.wait())
+            waiters.add(ready)
+        try:
+            done, _pending = await asyncio.wait(waiters, timeout=timeout or None,
+                                                return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in waiters:
+                task.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+            self._ready_event = None
+            self.save()
+        if wait_ready is True and self._ready is True:
+            return 0, ""
+        if stream in done:
+            ret, message = stream.result()
+            if ret == 0 and wait_ready is True:
+                return 1, "The container stopped before the server was ready"
+            return ret, message
+        if wait_ready is True:
+            return 1, "The server was not ready in " + str(timeout) + " seconds"
+        return 0, ""
+
+
+def print_event(event: dict):
+    """Print an event."""
+    stamp = datetime.datetime.fromtimestamp(event["time"]).strftime("%H:%M:%S")
+    if event["type"] == "build":
+        print("  --> " + stamp + " Build in " + str(event["seconds"]) + " s")
+    elif event["type"] == "regenerate":
+        print("  --> " + stamp + " Regenerate " + str(event["files"]) + " file(s) in "
+              + str(event["seconds"]) + " s")
+    elif event["type"] == "ready":
+        print("  --> " + stamp + " Ready: " + (event.get("address") or "(unknown address)"))
+    elif event["type"] == "error":
+        print("  [ERROR] " + stamp + " " + event.get("text", ""))
+
+
+async def follow_logs(ap):
+    """Read the logs of the container."""
+    docker = docker_api.create_client(ap.docker_client, ap.docker_socket)
+    grep = re.compile(ap.grep) if ap.grep != "" else None
+    live = ap.follow is True or ap.wait_ready is True
+
+    def on_line(text: str):
+        if live is True and ap.events is False and (grep is None or grep.search(text)):
+            print(text, flush=True)
+
+    def on_event(event: dict):
+        if live is True and ap.events is True:
+            print_event(event)
+            sys.stdout.flush()
+
+    follower = LogFollower(docker, ap.container_name, ap.state_dir, ap.lines,
+                           on_line, on_event)
+    print("[## docker logs] " + ap.container_name + " (since "
+          + (format_time(follower.offset) if follower.offset > 0 and ap.since == ""
+             else ap.since or "the beginning") + ")", flush=True)
+    since = parse_since(ap.since, follower.offset)
+    try:
+        ret, message = await follower.read(since, ap.follow, ap.timeout, ap.wait_ready)
+    finally:
+        await docker.close()
+    if live is False:
+        # Only the latest lines are kept, so a long history is not printed in full.
+        if ap.events is True:
+            for event in follower.events:
+                if event["time"] * 1e9 > since:
+                    print_event(event)
+        else:
+            for text in follower.lines:
+                if grep is None or grep.search(text):
+                    print(text)
+    if ret != 0:
+        print("  [ERROR] " + message)
+    elif ap.wait_ready is True:
+        print("  --> Ready: " + (follower.address or ap.container_name))
+    return ret
+
+
+def main(ap):
+    """Run the command."""
+    return asyncio.run(follow_logs(ap))
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    try:
+        sys.exit(main(args))
+    except KeyboardInterrupt:
+        sys.exit(0)
+    except Exception as e:
+        print("[ERROR] " + str(e))
+        sys.exit(1)
@@ -0,0 +1,420 @@
+"""This is a module to convert the Markdown of the docs tree to HTML."""
+# SYSTEM: Python 3.11.1
+#
+# これは、docsフォルダのMarkdownをHTMLに変換するためのモジュールです。
+#
+# このモジュールは、以下の記法に対応します。
+# * 見出し, 段落, 箇条書き(入れ子), 番号付きリスト, 引用, 水平線
+# * コードブロック, 表(GFM), HTMLブロック
+# * Admonition(!!! todo), [TOC]
+# * 強調, リンク, 画像(属性{width="30%"}付き), インラインコード
+
+import re
+import html
+
+HEADING_PATTERN = re.compile(r'^(#{1,6})[ \t]+(.*?)[ \t]*#*[ \t]*$')
+FENCE_PATTERN = re.compile(r'^[ ]{0,3}(`{3,}|~{3,})[ \t]*([^`\s]*)')
+HR_PATTERN = re.compile(r'^[ ]{0,3}([-*_])([ \t]*\1){2,}[ \t]*$')
+LIST_PATTERN = re.compile(r'^([ ]*)([*+-]|\d{1,9}[.)])([ \t]+|$)(.*)$')
+ADMONITION_PATTERN = re.compile(r'^!!![ \t]+([\w-]+)(?:[ \t]+"?(.*?)"?)?[ \t]*$')
+TABLE_SEPARATOR_PATTERN = re.compile(
+    r'^[ \t]*\|?[ \t]*:?-+:?[ \t]*(\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$')
+HTML_BLOCK_PATTERN = re.compile(
+    r'^[ ]{0,3}<(/?)(address|article|aside|blockquote|body|details|dialog|div|dl'
+    r'|fieldset|figure|footer|form|h[1-6]|head|header|hr|html|iframe|link|main'
+    r'|nav|ol|p|pre|script|section|style|summary|table|tbody|td|tfoot|th|thead'
+    r'|tr|ul|!--)(?=[\s/>]|$)', re.IGNORECASE)
+TOC_PATTERN = re.compile(r'^[ \t]*\[TOC\][ \t]*$')
+TOC_MARKER = "<!--native-toc-->"
+
+CODE_SPAN_PATTERN = re.compile(r'(`+)(.+?)\1')
+INLINE_HTML_PATTERN = re.compile(
+    r'</?[A-Za-z][\w-]*(?:\s+[\w:-]+(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'=<>`]+))?)*\s*/?>'
+    r'|<!--.*?-->')
+AUTOLINK_PATTERN = re.compile(r'<((?:https?|ftp|mailto):[^\s<>]+)>')
+IMAGE_PATTERN = re.compile(
+    r'!\[([^\]]*)\]\(\s*(\S+?)(?:\s+"([^"]*)")?\s*\)(\{[^}]*\})?')
+LINK_PATTERN = re.compile(r'\[([^\]]+)\]\(\s*(\S+?)(?:\s+"([^"]*)")?\s*\)')
+ATTRIBUTE_PATTERN = re.compile(r'([\w-]+)\s*=\s*"([^"]*)"')
+PLACEHOLDER = "\x00{}\x00"
+
+
+def slugify(text: str):
+    """Get a heading anchor from the heading text."""
+    text = re.sub(r'<[^>]+>', '', text)
+    text = html.unescape(text).strip().lower()
+    text = re.sub(r'[^\w\- ]', '', text)
+    return re.sub(r'\s+', '-', text).strip('-') or "section"
+
+
+def relative_link(url: str):
+    """Convert a relative link to a Markdown page into its HTML page."""
+    if re.match(r'^[a-z][\w+.-]*:', url, re.IGNORECASE) or url.startswith("#"):
+        return url
+    path, sep, fragment = url.partition("#")
+    if path.endswith(".md"):
+        path = path[:-len(".md")] + ".html"
+    return path + sep + fragment
+
+
+def expand_tabs(line: str):
+    """Expand tabs to four spaces."""
+    return line.expandtabs(4)
+
+
+def indent_width(line: str):
+    """Get the number of leading spaces."""
+    return len(line) - len(line.lstrip(" "))
+
+
+def dedent(lines: list, width: int):
+    """Remove up to width leading spaces from each line."""
+    result = []
+    for line in lines:
+        result.append(line[min(width, indent_width(line)):])
+    return result
+
+
+def render_toc(headings: list, depth_from: int = 1, depth_to: int = 6):
+    """Render the table of contents of (level, id, text) headings."""
+    items = []
+    for level, anchor, text in headings:
+        if depth_from <= level <= depth_to:
+            items.append((level, anchor, text))
+    if len(items) == 0:
+        return ""
+    out = []
+    base = min(level for level, _anchor, _text in items)
+    depth = base - 1
+    for level, anchor, text in items:
+        while depth < level:
+            out.append('<ul class="toc">' if depth == base - 1 else "<ul>")
+            depth += 1
+        while depth > level:
+            out.append("</ul>")
+            depth -= 1
+        out.append('<li><a href="#' + anchor + '">' + text + '</a></li>')
+    while depth >= base:
+        out.append("</ul>")
+        depth -= 1
+    return "\n".join(out)
+
+
+class MarkdownRenderer:
+    """Convert Markdown to HTML."""
+    _headings = []
+    _ids = {}
+
+    def __init__(self):
+        """Initialize the class."""
+        self._headings = []
+        self._ids = {}
+
+    @property
+    def headings(self):
+        """Get the (level, id, text) list of the rendered headings."""
+        return self._headings
+
+    def render(self, text: str, toc: bool = True):
+        """Render a Markdown document. toc=False keeps the [TOC] marker (TOC_MARKER)."""
+        self._headings = []
+        self._ids = {}
+        lines = [expand_tabs(line) for line in text.replace("\r\n", "\n").split("\n")]
+        body = self.render_blocks(lines)
+        if toc is True and TOC_MARKER in body:
+            body = body.replace(TOC_MARKER, self.render_toc())
+        return body
+
+    def render_toc(self, depth_from: int = 1, depth_to: int = 6):
+        """Render the table of contents of the rendered headings."""
+        return render_toc(self._headings, depth_from, depth_to)
+
+    # =========================================================
+    # Blocks
+    def render_blocks(self, lines: list, tight: bool = False):
+        """Render a list of lines as block elements."""
+        out = []
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            if line.strip() == "":
+                i += 1
+                continue
+            for block in (self._fence, self._heading, self._hr, self._admonition,
+                          self._html_block, self._table, self._blockquote,
+                          self._list, self._toc, self._indented_code):
+                result = block(lines, i)
+                if result is not None:
+                    html_text, i = result
+                    out.append(html_text)
+                    break
+            else:
+                html_text, i = self._paragraph(lines, i, tight)
+                out.append(html_text)
+        return "\n".join(out)
+
+    def _starts_block(self, line: str):
+        """Check whether a line interrupts a paragraph."""
+        return (FENCE_PATTERN.match(line) is not None
+                or HEADING_PATTERN.match(line) is not None
+                or HR_PATTERN.match(line) is not None
+                or ADMONITION_PATTERN.match(line) is not None
+                or HTML_BLOCK_PATTERN.match(line) is not None
+                or line.lstrip().startswith(">"))
+
+    def _fence(self, lines: list, i: int):
+        match = FENCE_PATTERN.match(lines[i])
+        if match is None:
+            return None
+        fence = match.group(1)
+        language = match.group(2)
+        width = indent_width(lines[i])
+        code = []
+        i += 1
+        while i < len(lines):
+            if lines[i].strip().startswith(fence[0] * len(fence)) \
+                    and lines[i].strip().strip(fence[0]) == "":
+                i += 1
+                break
+            code.append(lines[i][min(width, indent_width(lines[i])):])
+            i += 1
+        attr = ""
+        if language != "":
+            attr = ' class="language-' + html.escape(language) + '"'
+        text = html.escape("\n".join(code) + "\n" if len(code) > 0 else "")
+        return "<pre><code" + attr + ">" + text + "</code></pre>", i
+
+    def _heading(self, lines: list, i: int):
+        match = HEADING_PATTERN.match(lines[i])
+        if match is None:
+            return None
+        level = len(match.group(1))
+        text = self.render_inline(match.group(2))
+        anchor = slugify(text)
+        count = self._ids.get(anchor, 0)
+        self._ids[anchor] = count + 1
+        if count > 0:
+            anchor = anchor + "-" + str(count)
+        self._headings.append((level, anchor, text))
+        tag = "h" + str(level)
+        return "<" + tag + ' id="' + anchor + '">' + text + "</" + tag + ">", i + 1
+
+    def _hr(self, lines: list, i: int):
+        if HR_PATTERN.match(lines[i]) is None:
+            return None
+        return "<hr />", i + 1
+
+    def _admonition(self, lines: list, i: int):
+        match = ADMONITION_PATTERN.match(lines[i])
+        if match is None:
+            return None
+        kind = match.group(1).lower()
+        title = match.group(2)
+        if title is None or title == "":
+            title = kind.capitalize()
+        body = []
+        i += 1
+        while i < len(lines):
+            if lines[i].strip() != "" and indent_width(lines[i]) < 4:
+                break
+            body.append(lines[i])
+            i += 1
+        while len(body) > 0 and body[-1].strip() == "":
+            body.pop()
+            i -= 1
+        inner = self.render_blocks(dedent(body, 4))
+        return ('<div class="admonition ' + html.escape(kind) + '">\n'
+                + '<p class="admonition-title">' + self.render_inline(title) + "</p>\n"
+                + inner + "\n</div>"), i
+
+    def _html_block(self, lines: list, i: int):
+        if HTML_BLOCK_PATTERN.match(lines[i]) is None:
+            return None
+        block = []
+        while i < len(lines) and lines[i].strip() != "":
+            block.append(lines[i])
+            i += 1
+        return "\n".join(block), i
+
+    def _table(self, lines: list, i: int):
+        if "|" not in lines[i] or i + 1 >= len(lines):
+            return None
+        if TABLE_SEPARATOR_PATTERN.match(lines[i + 1]) is None:
+            return None
+        header = self._table_cells(lines[i])
+        aligns = []
+        for cell in self._table_cells(lines[i + 1]):
+            if cell.startswith(":") and cell.endswith(":"):
+                aligns.append(' style="text-align: center"')
+            elif cell.endswith(":"):
+                aligns.append(' style="text-align: right"')
+            elif cell.startswith(":"):
+                aligns.append(' style="text-align: left"')
+            else:
+                aligns.append("")
+        out = ["<table>", "<thead>", "<tr>"]
+        for n, cell in enumerate(header):
+            align = aligns[n] if n < len(aligns) else ""
+            out.append("<th" + align + ">" + self.render_inline(cell) + "</th>")
+        out.extend(["</tr>", "</thead>", "<tbody>"])
+        i += 2
+        while i < len(lines) and lines[i].strip() != "" and "|" in lines[i]:
+            out.append("<tr>")
+            cells = self._table_cells(lines[i])
+            for n in range(len(header)):
+                align = aligns[n] if n < len(aligns) else ""
+                cell = cells[n] if n < len(cells) else ""
+                out.append("<td" + align + ">" + self.render_inline(cell) + "</td>")
+            out.append("</tr>")
+            i += 1
+        out.extend(["</tbody>", "</table>"])
+        return "\n".join(out), i
+
+    def _table_cells(self, line: str):
+        line = line.strip()
+        if line.startswith("|"):
+            line = line[1:]
+        if line.endswith("|") and not line.endswith("\\|"):
+            line = line[:-1]
+        return [cell.strip() for cell in re.split(r'(?<!\\)\|', line)]
+
+    def _blockquote(self, lines: list, i: int):
+        if lines[i].lstrip().startswith(">") is False or indent_width(lines[i]) > 3:
+            return None
+        quote = []
+        while i < len(lines) and lines[i].strip() != "":
+            line = lines[i].lstrip()
+            if line.startswith(">"):
+                line = line[1:]
+                if line.startswith(" "):
+                    line = line[1:]
+            quote.append(line)
+            i += 1
+        return "<blockquote>\n" + self.render_blocks(quote) + "\n</blockquote>", i
+
+    def _list(self, lines: list, i: int):
+        match = LIST_PATTERN.match(lines[i])
+        if match is None or len(match.group(1)) > 3:
+            return None
+        if match.group(4).strip() == "" and match.group(3) == "":
+            return None
+        ordered = match.group(2)[0].isdigit()
+        base = len(match.group(1))
+        items = []
+        loose = False
+        while i < len(lines):
+            match = LIST_PATTERN.match(lines[i])
+            if match is None or len(match.group(1)) != base \
+                    or match.group(2)[0].isdigit() is not ordered:
+                break
+            width = len(match.group(1)) + len(match.group(2)) + max(1, len(match.group(3)))
+            item = [match.group(4)]
+            i += 1
+            while i < len(lines):
+                line = lines[i]
+                if line.strip() == "":
+                    if i + 1 < len(lines) and lines[i + 1].strip() != "" \
+                            and indent_width(lines[i + 1]) >= width:
+                        item.append("")
+                        i += 1
+                        continue
+                    if i + 1 < len(lines) and LIST_PATTERN.match(lines[i + 1]) \
+                            and indent_width(lines[i + 1]) == base:
+                        loose = True
+                    break
+                if indent_width(line) >= width:
+                    item.append(line[width:])
+                elif LIST_PATTERN.match(line) is not None and indent_width(line) > base:
+                    item.append(line.lstrip(" "))
+                elif LIST_PATTERN.match(line) is None and self._starts_block(line) is False \
+                        and item[-1].strip() != "":
+                    item.append(line.strip())
+                else:
+                    break
+                i += 1
+            items.append(item)
+            if i < len(lines) and lines[i].strip() == "":
+                i += 1
+        tag = "ol" if ordered else "ul"
+        out = ["<" + tag + ">"]
+        for item in items:
+            out.append("<li>" + self.render_blocks(item, tight=not loose) + "</li>")
+        out.append("</" + tag + ">")
+        return "\n".join(out), i
+
+    def _toc(self, lines: list, i: int):
+        if TOC_PATTERN.match(lines[i]) is None:
+            return None
+        return TOC_MARKER, i + 1
+
+    def _indented_code(self, lines: list, i: int):
+        if indent_width(lines[i]) < 4:
+            return None
+        code = []
+        while i < len(lines) and (lines[i].strip() == "" or indent_width(lines[i]) >= 4):
+            code.append(lines[i][4:])
+            i += 1
+        while len(code) > 0 and code[-1].strip() == "":
+            code.pop()
+        return "<pre><code>" + html.escape("\n".join(code) + "\n") + "</code></pre>", i
+
+    def _paragraph(self, lines: list, i: int, tight: bool):
+        text = [lines[i].strip()]
+        i += 1
+        while i < len(lines) and lines[i].strip() != "" \
+                and self._starts_block(lines[i]) is False \
+                and LIST_PATTERN.match(lines[i]) is None:
+            text.append(lines[i].strip())
+            i += 1
+        content = self.render_inline("\n".join(text))
+        if tight is True:
+            return content, i
+        return "<p>" + content + "</p>", i
+
+    # =========================================================
+    # Inlines
+    def render_inline(self, text: str):
+        """Render inline elements."""
+        stash = []
+
+        def keep(value: str):
+            stash.append(value)
+            return PLACEHOLDER.format(len(stash) - 1)
+
+        text = CODE_SPAN_PATTERN.sub(
+            lambda m: keep("<code>" + html.escape(m.group(2).strip()) + "</code>"), text)
+        text = re.sub(r'\\([\\`*_{}\[\]()#+\-.!|<>~])',
+                      lambda m: keep(html.escape(m.group(1))), text)
+        text = AUTOLINK_PATTERN.sub(
+            lambda m: keep('<a href="' + html.escape(m.group(1)) + '">'
+                           + html.escape(m.group(1)) + "</a>"), text)
+        text = INLINE_HTML_PATTERN.sub(lambda m: keep(m.group(0)), text)
+        text = IMAGE_PATTERN.sub(lambda m: keep(self._image(m)), text)
+        text = LINK_PATTERN.sub(lambda m: keep(self._link(m)), text)
+        text = re.sub(r'&(?!#?\w+;)', '&amp;', text)
+        text = text.replace("<", "&lt;").replace(">", "&gt;")
+        text = re.sub(r'\*\*(?=\S)(.+?)(?<=\S)\*\*', r'<strong>\1</strong>', text)
+        text = re.sub(r'(?<!\w)__(?=\S)(.+?)(?<=\S)__(?!\w)', r'<strong>\1</strong>', text)
+        text = re.sub(r'\*(?=\S)(.+?)(?<=\S)\*', r'<em>\1</em>', text)
+        text = re.sub(r'(?<![\w\\])_(?=\S)(.+?)(?<=\S)_(?!\w)', r'<em>\1</em>', text)
+        text = re.sub(r'~~(?=\S)(.+?)(?<=\S)~~', r'<del>\1</del>', text)
+        text = re.sub(r' {2,}\n', '<br />\n', text)
+        while "\x00" in text:
+            text = re.sub(r'\x00(\d+)\x00', lambda m: stash[int(m.group(1))], text)
+        return text
+
+    def _image(self, match):
+        attrs = ' src="' + html.escape(relative_link(match.group(2))) + '"'
+        attrs += ' alt="' + html.escape(match.group(1)) + '"'
+        if match.group(3) is not None:
+            attrs += ' title="' + html.escape(match.group(3)) + '"'
+        if match.group(4) is not None:
+            for name, value in ATTRIBUTE_PATTERN.findall(match.group(4)):
+                attrs += " " + name + '="' + html.escape(value) + '"'
+        return "<img" + attrs + " />"
+
+    def _link(self, match):
+        attrs = ' href="' + html.escape(relative_link(match.group(2))) + '"'
+        if match.group(3) is not None:
+            attrs += ' title="' + html.escape(match.group(3)) + '"'
+        return "<a" + attrs + ">" + self.render_inline(match.group(1)) + "</a>"
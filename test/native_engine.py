@@ -0,0 +1,687 @@
+"""This is a module to build the docs tree without Docker and Jekyll."""
+# SYSTEM: Python 3.11.1
+#
+# これは、DockerやJekyllを使わずにdocsフォルダをビルドするためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * docs/_config.ymlの読み込み
+# * Markdown(00_overview.md, 01_specification.md など)をHTMLに変換
+# * minima風のレイアウトでページを出力
+# * docs/assets/css/style.scssとLESSをCSSに変換(stylesheet_pipeline.py, 変換結果はキャッシュし、
+#   内容のハッシュを含むファイル名で出力)
+# * その他のファイルを_siteにコピー
+# * ページの変換はCPUコア数のプロセスで並列に実行し、決まった順序で_siteに書き込む
+# * @importは展開してから変換(展開した断片は_site.cacheにキャッシュ)
+# * PlantUMLの図はSVGに変換(diagram_renderer.py, 変換結果は_site.cacheにキャッシュ)
+# * ページの画像は縮小したWebP/PNGを作成してsrcsetで参照(image_pipeline.py)
+# * 全文検索インデックスを出力(search_index.py, 変更したページだけを再解析)
+# * 図と画像のキャッシュは、複数のサイトで共有することも可能(preview_farm.py)
+
+import os
+import re
+import html
+import time
+import shutil
+import posixpath
+import concurrent.futures
+
+import import_resolver
+import diagram_renderer
+import image_pipeline
+import search_index
+import stylesheet_pipeline
+from markdown_renderer import MarkdownRenderer
+from scss_compiler import ScssCompiler
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown", ".mkdown", ".mkdn", ".mkd")
+DEFAULT_EXCLUDE = ["Gemfile", "Gemfile.lock", "node_modules", "vendor"]
+FRONT_MATTER_PATTERN = re.compile(r'^---[ \t]*\r?\n(.*?)^---[ \t]*\r?\n',
+                                  re.MULTILINE | re.DOTALL)
+STYLESHEET_URL = "/assets/css/style.css"
+MIN_PAGES_PER_JOB = 4
+
+LAYOUT = """<!DOCTYPE html>
+<html lang="{lang}">
+<head>
+<meta charset="utf-8">
+<meta http-equiv="X-UA-Compatible" content="IE=edge">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<meta name="description" content="{description}">
+<link rel="stylesheet" href="{stylesheet}">
+<style>
+body {{ margin: 0; font: 400 16px/1.5 -apple-system, "Segoe UI", Roboto, "Noto Sans JP", sans-serif; color: #111; }}
+.wrapper {{ max-width: 800px; margin: 0 auto; padding: 0 30px; }}
+.site-header {{ border-top: 5px solid #424242; border-bottom: 1px solid #e8e8e8; min-height: 56px; }}
+.site-title {{ font-size: 26px; font-weight: 300; line-height: 54px; color: #424242; text-decoration: none; }}
+.page-content {{ padding: 30px 0; }}
+.site-footer {{ border-top: 1px solid #e8e8e8; padding: 30px 0; color: #828282; font-size: 15px; }}
+table {{ border-collapse: collapse; margin-bottom: 15px; }}
+th, td {{ border: 1px solid #e8e8e8; padding: 8px 10px; }}
+pre {{ background: #eef; border: 1px solid #e8e8e8; padding: 8px 12px; overflow-x: auto; }}
+.admonition {{ border-left: 4px solid #fc0; background: #fffbe6; padding: 4px 12px; margin: 15px 0; }}
+.admonition-title {{ font-weight: bold; margin: 4px 0; }}
+.site-search {{ float: right; line-height: 54px; }}
+#site-search-results {{ position: absolute; right: 30px; max-width: 500px; max-height: 70vh; overflow-y: auto; background: #fff; border: 1px solid #e8e8e8; padding: 0 12px; z-index: 1; }}
+#site-search-results ul {{ list-style: none; padding: 0; }}
+#site-search-results p {{ margin: 0 0 8px; color: #828282; font-size: 14px; }}
+</style>
+</head>
+<body>
+<header class="site-header">
+<div class="wrapper"><a class="site-title" rel="author" href="{baseurl}/">{site_title}</a>
+<form class="site-search" role="search" onsubmit="return false"><input type="search" id="site-search" placeholder="検索" autocomplete="off" aria-label="検索"></form>
+<div id="site-search-results" hidden></div></div>
+</header>
+<main class="page-content" aria-label="Content">
+<div class="wrapper">
+<article class="post">
+{content}
+</article>
+</div>
+</main>
+<footer class="site-footer">
+<div class="wrapper"><p>{description}</p></div>
+</footer>
+<script src="{baseurl}/search/search.js" data-index="{baseurl}/search/index.bin" defer></script>
+</body>
+</html>
+"""
+
+
+# =========================================================
+# YAML
+def parse_scalar(value: str):
+    """Parse a YAML scalar."""
+    value = value.strip()
+    if value == "" or value in ("~", "null", "Null", "NULL"):
+        return None
+    if value[0] in "\"'" and value[-1] == value[0] and len(value) >= 2:
+        text = value[1:-1]
+        if value[0] == '"':
+            escapes = {"n": "\n", "t": "\t", '"': '"', "\\": "\\"}
+            text = re.sub(r'\\(.)', lambda m: escapes.get(m.group(1), m.group(0)), text)
+        else:
+            text = text.replace("''", "'")
+        return text
+    if value.startswith("[") and value.endswith("]"):
+        inner = value[1:-1].strip()
+        if inner == "":
+            return []
+        return [parse_scalar(item) for item in split_flow(inner)]
+    if value in ("true", "True", "TRUE", "yes", "on"):
+        return True
+    if value in ("false", "False", "FALSE", "no", "off"):
+        return False
+    if re.fullmatch(r'[-+]?\d+', value):
+        return int(value)
+    if re.fullmatch(r'[-+]?(\d+\.\d*|\.\d+)([eE][-+]?\d+)?', value):
+        return float(value)
+    return value
+
+
+def split_flow(text: str):
+    """Split the items of a YAML flow sequence."""
+    items = []
+    buffer = ""
+    quote = ""
+    for c in text:
+        if quote != "":
+            buffer += c
+            if c == quote:
+                quote = ""
+        elif c in "\"'":
+            quote = c
+            buffer += c
+        elif c == ",":
+            items.append(buffer)
+            buffer = ""
+        else:
+            buffer += c
+    items.append(buffer)
+    return items
+
+
+def strip_yaml_comment(line: str):
+    """Remove a YAML comment outside of quotes."""
+    quote = ""
+    for n, c in enumerate(line):
+        if quote != "":
+            if c == quote:
+                quote = ""
+        elif c in "\"'":
+            quote = c
+        elif c == "#" and (n == 0 or line[n - 1] in " \t"):
+            return line[:n].rstrip()
+    return line.rstrip()
+
+
+def load_yaml(text: str):
+    """Load the YAML subset used by _config.yml and the front matter."""
+    lines = []
+    for raw in text.replace("\r\n", "\n").split("\n"):
+        lines.append(raw.expandtabs(2))
+    value, _pos = _yaml_node(lines, 0, 0)
+    return value if value is not None else {}
+
+
+def _yaml_next(lines: list, pos: int):
+    while pos < len(lines):
+        line = strip_yaml_comment(lines[pos])
+        if line.strip() != "" and line.strip() != "---":
+            return pos, line
+        pos += 1
+    return pos, None
+
+
+def _yaml_node(lines: list, pos: int, indent: int):
+    pos, line = _yaml_next(lines, pos)
+    if line is None:
+        return None, pos
+    width = len(line) - len(line.lstrip(" "))
+    if width < indent:
+        return None, pos
+    if line.lstrip().startswith("- ") or line.strip() == "-":
+        return _yaml_sequence(lines, pos, width)
+    return _yaml_mapping(lines, pos, width)
+
+
+def _yaml_sequence(lines: list, pos: int, indent: int):
+    result = []
+    while True:
+        pos, line = _yaml_next(lines, pos)
+        if line is None:
+            break
+        width = len(line) - len(line.lstrip(" "))
+        if width != indent or not (line.lstrip().startswith("- ") or line.strip() == "-"):
+            break
+        item = line.lstrip()[1:].strip()
+        if item == "":
+            value, pos = _yaml_node(lines, pos + 1, indent + 1)
+            result.append(value)
+        elif re.match(r'^[^"\'\[{][^:]*:(\s|$)', item):
+            lines = lines[:pos] + [" " * (indent + 2) + item] + lines[pos + 1:]
+            value, pos = _yaml_mapping(lines, pos, indent + 2)
+            result.append(value)
+        else:
+            result.append(parse_scalar(item))
+            pos += 1
+    return result, pos
+
+
+def _yaml_mapping(lines: list, pos: int, indent: int):
+    result = {}
+    while True:
+        pos, line = _yaml_next(lines, pos)
+        if line is None:
+            break
+        width = len(line) - len(line.lstrip(" "))
+        if width != indent:
+            break
+        match = re.match(r'^\s*("[^"]*"|\'[^\']*\'|[^:]+?)\s*:(?:\s+(.*)|\s*)$', line)
+        if match is None:
+            break
+        key = parse_scalar(match.group(1))
+        value = (match.group(2) or "").strip()
+        pos += 1
+        if value in ("|", "|-", "|+", ">", ">-", ">+"):
+            block = []
+            while pos < len(lines):
+                raw = lines[pos].rstrip()
+                if raw.strip() != "" and len(raw) - len(raw.lstrip(" ")) <= indent:
+                    break
+                block.append(raw.strip())
+                pos += 1
+            while len(block) > 0 and block[-1] == "":
+                block.pop()
+            text = "\n".join(block) if value[0] == "|" else " ".join(block)
+            if value.endswith("-") is False:
+                text += "\n"
+            result[key] = text
+        elif value == "":
+            child, pos = _yaml_node(lines, pos, indent + 1)
+            result[key] = child
+        else:
+            result[key] = parse_scalar(value)
+    return result, pos
+
+
+def split_page(text: str):
+    """Split a page into the front matter and the body."""
+    match = FRONT_MATTER_PATTERN.match(text)
+    if match is None:
+        return {}, text
+    front = load_yaml(match.group(1))
+    if isinstance(front, dict) is False:
+        front = {}
+    return front, text[match.end():]
+
+
+def load_config(src: str):
+    """Load docs/_config.yml."""
+    path = os.path.join(src, "_config.yml")
+    if os.path.isfile(path) is False:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        config = load_yaml(f.read())
+    return config if isinstance(config, dict) else {}
+
+
+# =========================================================
+# Pages
+def output_path(rel_path: str):
+    """Get the output path of a source file."""
+    root, ext = os.path.splitext(rel_path)
+    if ext.lower() in MARKDOWN_EXTENSIONS:
+        return root + ".html"
+    if ext.lower() == ".scss":
+        return root + ".css"
+    return rel_path
+
+
+def is_excluded(rel_path: str, exclude: list):
+    """Check whether Jekyll would skip a source file."""
+    parts = rel_path.split("/")
+    for part in parts:
+        if part.startswith((".", "_", "#")) or part.endswith("~"):
+            return True
+    for pattern in exclude:
+        pattern = pattern.strip("/")
+        if rel_path == pattern or rel_path.startswith(pattern + "/") or parts[0] == pattern:
+            return True
+    return False
+
+
+def page_title(front: dict, renderer: MarkdownRenderer, rel_path: str):
+    """Get the page title from the front matter or the first heading."""
+    if front.get("title"):
+        return str(front["title"])
+    if len(renderer.headings) > 0:
+        return re.sub(r'<[^>]+>', '', renderer.headings[0][2])
+    return os.path.splitext(os.path.basename(rel_path))[0]
+
+
+def render_page(src: str, rel_path: str, config: dict, text: str = None):
+    """Render a Markdown page to a complete HTML document."""
+    if text is None:
+        with open(os.path.join(src, rel_path), "r", encoding="utf-8") as f:
+            text = f.read()
+    front, body = split_page(text)
+    renderer = MarkdownRenderer()
+    content = renderer.render(body)
+    site_title = str(config.get("title") or "")
+    title = page_title(front, renderer, rel_path)
+    if site_title != "" and title != site_title:
+        title = title + " | " + site_title
+    description = " ".join(str(front.get("description") or config.get("description") or "").split())
+    baseurl = str(config.get("baseurl") or "").rstrip("/")
+    return LAYOUT.format(lang=html.escape(str(config.get("lang") or "ja")),
+                         title=html.escape(title),
+                         description=html.escape(description),
+                         stylesheet=baseurl + STYLESHEET_URL,
+                         baseurl=baseurl,
+                         site_title=html.escape(site_title),
+                         content=content)
+
+
+def render_stylesheet(src: str, rel_path: str):
+    """Compile a SCSS stylesheet."""
+    path = os.path.join(src, rel_path)
+    compiler = ScssCompiler([os.path.join(src, "_sass")])
+    css = compiler.compile_file(path)
+    for warning in compiler.warnings:
+        css = "/* " + warning + " */\n" + css
+    return css
+
+
+def render_file(src: str, rel_path: str, config: dict, text: str = None):
+    """Render a source file. Returns (output path, bytes or None to copy)."""
+    out_path = output_path(rel_path)
+    ext = os.path.splitext(rel_path)[1].lower()
+    if ext in MARKDOWN_EXTENSIONS:
+        return out_path, render_page(src, rel_path, config, text).encode("utf-8")
+    if ext == ".scss":
+        return out_path, render_stylesheet(src, rel_path).encode("utf-8")
+    return out_path, None
+
+
+def is_rendered(rel_path: str):
+    """Check whether a source file is converted instead of copied."""
+    ext = os.path.splitext(rel_path)[1].lower()
+    return ext in MARKDOWN_EXTENSIONS or ext == ".scss"
+
+
+def render_task(task: tuple):
+    """Render a source file in a worker process."""
+    src, rel_path, config, text = task
+    start = time.perf_counter()
+    try:
+        out_path, data = render_file(src, rel_path, config, text)
+        return rel_path, out_path, data, "", time.perf_counter() - start
+    except (OSError, UnicodeDecodeError) as e:
+        return rel_path, output_path(rel_path), None, str(e), time.perf_counter() - start
+
+
+def cache_dir(dst: str):
+    """Get the cache folder stored next to the build results."""
+    dst = os.path.abspath(dst)
+    return os.path.join(os.path.dirname(dst), os.path.basename(dst) + ".cache")
+
+
+class NativeEngine:
+    """Build the docs tree in-process."""
+    _src = "docs"
+    _dst = "_site"
+    _config = {}
+    _jobs = 1
+    _resolver = None
+    _diagrams = None
+    _images = None
+    _search = None
+    _styles = None
+    _page_timings = {}
+
+    def __init__(self, src: str, dst: str, jobs: int = 0, plantuml: str = "",
+                 shared_cache: str = ""):
+        """Initialize the class. jobs=0 uses all CPU cores, shared_cache is shared by sites."""
+        self._src = os.path.abspath(src)
+        self._dst = os.path.abspath(dst)
+        self._config = load_config(self._src)
+        self._jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
+        asset_cache = cache_dir(self._dst) if shared_cache == "" else shared_cache
+        self._resolver = import_resolver.ImportResolver(
+            self._src, os.path.join(cache_dir(self._dst), "imports"))
+        self._diagrams = diagram_renderer.DiagramRenderer(
+            os.path.join(asset_cache, "plantuml"), plantuml,
+            min(self._jobs, diagram_renderer.MAX_PROCESSES))
+        self._images = image_pipeline.ImagePipeline(
+            [self._src, os.path.dirname(self._src)], self._dst,
+            os.path.join(asset_cache, "images"), self._jobs)
+        self._search = search_index.SearchIndex(os.path.join(cache_dir(self._dst), "search"))
+        self._styles = stylesheet_pipeline.StylesheetPipeline(
+            self._src, self._dst, os.path.join(cache_dir(self._dst), "styles"))
+
+    @property
+    def config(self):
+        """Get the site configuration."""
+        return self._config
+
+    @property
+    def page_timings(self):
+        """Get the render time (seconds) of each page of the last build."""
+        return self._page_timings
+
+    def source_files(self):
+        """List the source files to build."""
+        exclude = DEFAULT_EXCLUDE + list(self._config.get("exclude") or [])
+        files = []
+        for dir_path, dir_names, file_names in os.walk(self._src):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                rel_path = os.path.relpath(os.path.join(dir_path, file_name), self._src)
+                rel_path = rel_path.replace(os.sep, "/")
+                if is_excluded(rel_path, exclude) is False:
+                    files.append(rel_path)
+        return files
+
+    def dependents(self, changed: list):
+        """Get the changed files and the pages that import or show them."""
+        self._resolver.scan([rel_path for rel_path in self.source_files()
+                             if os.path.splitext(rel_path)[1].lower()
+                             in MARKDOWN_EXTENSIONS + (".html",)])
+        return self._resolver.dependents(changed)
+
+    def build(self, changed: list = None):
+        """Build the site. If changed is given, only those files are rebuilt."""
+        print("[## Build with native engine]")
+        ret = 0
+        files = self.source_files()
+        if changed is None or os.path.isdir(self._dst) is False:
+            if os.path.isdir(self._dst):
+                self.clean()
+            targets = files
+        else:
+            # The pages that import or show a changed file are rendered again with it.
+            changed = self.dependents(changed)
+            targets = [rel_path for rel_path in files if rel_path in set(changed)]
+            for rel_path in changed:
+                if rel_path not in files:
+                    self.remove_output(rel_path)
+        # The stylesheets are checked on every build, the pages link their current names.
+        if self.build_stylesheets([rel_path for rel_path in files
+                                   if stylesheet_pipeline.is_stylesheet(rel_path)]) != 0:
+            ret = 1
+        texts = self.expand_imports(targets)
+        texts = self.render_diagrams(targets, texts)
+        # Merge the results in the order of the source tree, so the output
+        # does not depend on which worker finished first.
+        results = self.render_all([rel_path for rel_path in targets
+                                   if os.path.splitext(rel_path)[1].lower() != ".scss"], texts)
+        results = self.link_stylesheets(self.responsive_images(results), files, targets)
+        self._page_timings = {}
+        for rel_path, out_path, data, error, seconds in results:
+            if data is not None:
+                self._page_timings[rel_path] = seconds
+            try:
+                if error == "":
+                    self.write_output(rel_path, out_path, data)
+            except OSError as e:
+                error = str(e)
+            if error != "":
+                print("  [ERROR] " + rel_path + " : " + error)
+                ret = 1
+        try:
+            self._resolver.save(prune=changed is None)
+            self.update_search_index(files, results)
+        except OSError as e:
+            print("  [ERROR] " + str(e))
+        print("  --> Build pages: " + str(len(targets)) + "/" + str(len(files)))
+        print("        src : " + self._src)
+        print("        dst : " + self._dst)
+        return ret
+
+    def build_stylesheets(self, rel_paths: list):
+        """Compile the changed stylesheets and publish them with content-hashed names."""
+        if len(rel_paths) == 0:
+            return 0
+        try:
+            failures = self._styles.build_all(rel_paths)
+        except OSError as e:
+            print("  [ERROR] " + str(e))
+            return 1
+        for rel_path, message in self._styles.warnings:
+            print("  [WARNING] Stylesheet " + rel_path + ": " + message)
+        for rel_path, message in failures:
+            print("  [ERROR] " + rel_path + " : " + message)
+        stats = self._styles.stats
+        print("  --> Stylesheets: " + str(stats["compiled"]) + " compiled, "
+              + str(stats["cached"]) + " cached")
+        return 1 if len(failures) > 0 else 0
+
+    def link_stylesheets(self, results: list, files: list, targets: list):
+        """Point the pages to the content-hashed stylesheets."""
+        baseurl = str(self._config.get("baseurl") or "").rstrip("/")
+        results = list(results)
+        for index, (rel_path, out_path, data, error, seconds) in enumerate(results):
+            if error == "" and data is not None and out_path.endswith(".html"):
+                text = self._styles.rewrite(data.decode("utf-8"), posixpath.dirname(out_path),
+                                            baseurl)
+                results[index] = (rel_path, out_path, text.encode("utf-8"), error, seconds)
+        if len(self._styles.changed) == 0:
+            return results
+        # A stylesheet-only change rewrites the links of the other pages, without rendering them.
+        rendered = set(targets)
+        pages = [output_path(rel_path) for rel_path in files if rel_path not in rendered
+                 and os.path.splitext(rel_path)[1].lower() in MARKDOWN_EXTENSIONS]
+        if len(pages) > 0:
+            try:
+                count = self._styles.relink(pages, baseurl)
+                print("  --> Relink stylesheets: " + str(count) + " pages")
+            except OSError as e:
+                print("  [ERROR] " + str(e))
+        return results
+
+    def expand_imports(self, targets: list):
+        """Expand the @import directives of the pages. Returns {page: text}."""
+        self._resolver.reset()
+        texts = {}
+        for rel_path in targets:
+            if os.path.splitext(rel_path)[1].lower() not in MARKDOWN_EXTENSIONS:
+                continue
+            try:
+                text = self._resolver.expand(rel_path)
+            except (OSError, UnicodeDecodeError) as e:
+                print("  [ERROR] " + rel_path + " : " + str(e))
+                continue
+            if text is not None:
+                texts[rel_path] = text
+        for kind, page, target in self._resolver.errors:
+            if kind == "cycle":
+                print("  [WARNING] Import cycle: " + target)
+            else:
+                print("  [WARNING] Import not found: " + page + " -> " + target)
+        if len(texts) > 0:
+            stats = self._resolver.stats
+            print("  --> Expand imports: " + str(stats["expanded"]) + " fragments ("
+                  + str(stats["reused"]) + " reused)")
+        return texts
+
+    def render_diagrams(self, targets: list, texts: dict):
+        """Replace the diagram code blocks of the pages with rendered images."""
+        pages = {}
+        for rel_path in targets:
+            if os.path.splitext(rel_path)[1].lower() not in MARKDOWN_EXTENSIONS:
+                continue
+            text = texts.get(rel_path)
+            if text is None:
+                try:
+                    with open(os.path.join(self._src, rel_path), "r", encoding="utf-8") as f:
+                        text = f.read()
+                except (OSError, UnicodeDecodeError):
+                    continue
+            if len(diagram_renderer.find_diagrams(text)) > 0:
+                pages[rel_path] = text
+        if len(pages) == 0:
+            return texts
+        sources = [source for text in pages.values()
+                   for _, source, _ in diagram_renderer.find_diagrams(text)]
+        rendered = self._diagrams.render_all(sources)
+        for key, message in self._diagrams.errors:
+            print("  [WARNING] Diagram" + (" " + key if key != "" else "") + ": " + message)
+        try:
+            self._diagrams.copy_to(rendered, self._dst)
+        except OSError as e:
+            print("  [ERROR] " + str(e))
+            return texts
+        baseurl = str(self._config.get("baseurl") or "").rstrip("/")
+        for rel_path, text in pages.items():
+            texts[rel_path] = diagram_renderer.replace_diagrams(text, rendered, baseurl)
+        stats = self._diagrams.stats
+        print("  --> Diagrams: " + str(stats["rendered"]) + " rendered, "
+              + str(stats["cached"]) + " cached")
+        return texts
+
+    def responsive_images(self, results: list):
+        """Make the image variants of the rendered pages and rewrite their <img> tags."""
+        baseurl = str(self._config.get("baseurl") or "").rstrip("/")
+        pages = {}
+        for index, (rel_path, out_path, data, error, _seconds) in enumerate(results):
+            if error == "" and data is not None and out_path.endswith(".html"):
+                text = data.decode("utf-8")
+                if len(self._images.images_of(text, posixpath.dirname(out_path), baseurl)) > 0:
+                    pages[index] = text
+        if len(pages) == 0:
+            return results
+        paths = []
+        for index, text in pages.items():
+            paths += self._images.images_of(text, posixpath.dirname(results[index][1]), baseurl)
+        try:
+            self._images.process(paths)
+        except OSError as e:
+            print("  [ERROR] " + str(e))
+            return results
+        for path, message in self._images.errors:
+            print("  [WARNING] Image " + path + ": " + message)
+        if self._images.available() is False:
+            print("  [WARNING] Pillow is not installed, the images are not resized")
+            return results
+        results = list(results)
+        for index, text in pages.items():
+            rel_path, out_path, data, error, seconds = results[index]
+            text = self._images.rewrite(text, posixpath.dirname(out_path), baseurl)
+            results[index] = (rel_path, out_path, text.encode("utf-8"), error, seconds)
+        stats = self._images.stats
+        print("  --> Images: " + str(stats["processed"]) + " resized, "
+              + str(stats["cached"]) + " cached, " + str(stats["copied"]) + " copied")
+        return results
+
+    def update_search_index(self, files: list, results: list):
+        """Index the rendered pages and write the search index into the site."""
+        baseurl = str(self._config.get("baseurl") or "").rstrip("/")
+        self._search.load()
+        self._search.prune([output_path(rel_path) for rel_path in files
+                            if os.path.splitext(rel_path)[1].lower() in MARKDOWN_EXTENSIONS])
+        for rel_path, out_path, data, error, _seconds in results:
+            if error == "" and data is not None and out_path.endswith(".html"):
+                self._search.update(out_path, search_index.page_url(out_path, baseurl),
+                                    data.decode("utf-8"))
+        self._search.save()
+        size = self._search.write(self._dst)
+        print("  --> Search index: " + str(len(self._search.pages)) + " pages ("
+              + str(self._search.updated) + " updated, " + str(size // 1024) + " KB)")
+
+    def render_all(self, targets: list, texts: dict = None):
+        """Render the files, spreading the pages over a process pool."""
+        texts = texts or {}
+        tasks = [(self._src, rel_path, self._config, texts.get(rel_path))
+                 for rel_path in targets]
+        pages = [task for task in tasks if is_rendered(task[1])]
+        jobs = min(self._jobs, len(pages) // MIN_PAGES_PER_JOB)
+        if jobs <= 1:
+            return [render_task(task) for task in tasks]
+        print("  --> Render pages with " + str(jobs) + " processes")
+        chunksize = max(1, len(pages) // (jobs * 4))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            rendered = {}
+            for result in executor.map(render_task, pages, chunksize=chunksize):
+                rendered[result[0]] = result
+        results = []
+        for task in tasks:
+            if task[1] in rendered:
+                results.append(rendered[task[1]])
+            else:
+                results.append(render_task(task))
+        return results
+
+    def write_output(self, rel_path: str, out_path: str, data: bytes):
+        """Write a rendered file or copy a static file."""
+        dst_path = os.path.join(self._dst, out_path)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        if data is None:
+            shutil.copyfile(os.path.join(self._src, rel_path), dst_path)
+        else:
+            with open(dst_path, "wb") as f:
+                f.write(data)
+
+    def remove_output(self, rel_path: str):
+        """Remove the output of a deleted source file."""
+        dst_path = os.path.join(self._dst, output_path(rel_path))
+        if os.path.isfile(dst_path):
+            os.remove(dst_path)
+            print("  --> Remove: " + output_path(rel_path))
+        # The precompressed files of static_server.py would still serve the page.
+        for side_path in (dst_path + ".gz", dst_path + ".br"):
+            if os.path.isfile(side_path):
+                os.remove(side_path)
+
+    def clean(self):
+        """Remove the previous build results but keep the folder itself."""
+        keep = list(self._config.get("keep_files") or [".git", ".svn"])
+        for name in os.listdir(self._dst):
+            if name in keep:
+                continue
+            path = os.path.join(self._dst, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
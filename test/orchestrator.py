@@ -0,0 +1,122 @@
+"""This is a module to run the setup steps concurrently with asyncio."""
+# SYSTEM: Python 3.11.1
+#
+# これは、セットアップの各手順をasyncioで並列に実行するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * 外部コマンドをシェルを介さずに非同期で実行(asyncio.create_subprocess_exec)
+# * コマンドの出力を溜め込まずに逐次表示
+# * 手順の依存関係をグラフで表し、依存していない手順は同時に実行
+# * 失敗した手順に依存する手順はスキップ
+# * 各手順の実行時間を記録
+# * 手順と外部コマンドはtracing.pyのスパンとして記録(時間、終了コード、出力のバイト数)
+
+import time
+import asyncio
+
+import tracing
+
+SKIPPED = -1
+
+
+async def run_process(cmd: list, cwd: str = None, stream: bool = False,
+                      prefix: str = "    | "):
+    """Run a command. Returns (exit status, stdout without quotes)."""
+    with tracing.span(" ".join(cmd[:2]), tracing.PROCESS, command=" ".join(cmd)) as span:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, cwd=cwd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT if stream else None)
+        except OSError as e:
+            span.status = 1
+            return 1, str(e)
+        lines = []
+        while True:
+            line = await proc.stdout.readline()
+            if line == b"":
+                break
+            span.add_output(len(line))
+            text = line.decode("utf-8", errors="replace")
+            lines.append(text)
+            if stream is True:
+                print(prefix + text.rstrip("\r\n"), flush=True)
+        ret = await proc.wait()
+        span.status = ret
+    return ret, "".join(lines).replace('"', '')
+
+
+class Step:
+    """A step of the task graph."""
+    name = ""
+    func = None
+    depends = []
+
+    def __init__(self, name: str, func, depends: list):
+        """Initialize the class."""
+        self.name = name
+        self.func = func
+        self.depends = list(depends)
+
+
+class TaskGraph:
+    """Run coroutine steps as soon as their dependencies have succeeded."""
+    _steps = {}
+    _results = {}
+    _timings = {}
+
+    def __init__(self):
+        """Initialize the class."""
+        self._steps = {}
+        self._results = {}
+        self._timings = {}
+
+    @property
+    def results(self):
+        """Get the exit status of each step (SKIPPED if not run)."""
+        return self._results
+
+    @property
+    def timings(self):
+        """Get the wall time of each step that was run (seconds)."""
+        return self._timings
+
+    def add(self, name: str, func, depends: list = ()):
+        """Add a step. func is called without arguments and returns a coroutine."""
+        for dep in depends:
+            if dep not in self._steps:
+                raise ValueError("Unknown dependency: " + dep + " (" + name + ")")
+        self._steps[name] = Step(name, func, depends)
+
+    async def run(self):
+        """Run all steps. Returns the first non-zero exit status or 0."""
+        tasks = {}
+
+        async def run_step(step: Step):
+            for dep in step.depends:
+                if await tasks[dep] != 0:
+                    self._results[step.name] = SKIPPED
+                    return SKIPPED
+            start = time.monotonic()
+            with tracing.span(step.name, tracing.STEP) as span:
+                try:
+                    ret = await step.func()
+                except Exception as e:
+                    print("  [ERROR] " + step.name + " : " + str(e))
+                    ret = 1
+                span.status = ret
+            self._timings[step.name] = time.monotonic() - start
+            self._results[step.name] = ret
+            return ret
+
+        for step in self._steps.values():
+            tasks[step.name] = asyncio.ensure_future(run_step(step))
+        await asyncio.gather(*tasks.values())
+        for name in self._steps.keys():
+            if self._results[name] not in (0, SKIPPED):
+                return self._results[name]
+        return 0
+
+    def run_sync(self):
+        """Run all steps from synchronous code."""
+        return asyncio.run(self.run())
@@ -0,0 +1,553 @@
+"""This is a script to serve previews of several revisions at the same time."""
+# SYSTEM: Python 3.11.1
+#
+# これは、複数のブランチ/タグ/コミットのプレビューを同時に立てるスクリプトです。
+#
+# このスクリプトは、以下の内容を実行します。
+# * リビジョンごとにミラーキャッシュ(repo_cache.py)からファイルを取り出す
+# * リビジョンごとに別のプロセス(server.py --engine native)またはDockerコンテナで
+#   ビルドして配信し、空いているポートを自動で割り当てる
+# * 複数のリビジョンのビルドは並列に実行
+# * 図と画像のキャッシュ、gitのミラー、Dockerイメージとgemのボリュームは共有
+# * プレビューの数(--max_previews)とメモリ(--memory_mb)の上限を超える場合は、
+#   最も長く使われていないプレビューから停止して削除
+# * 状態は_previews/farm.jsonに保存(--addで指定したプレビューと、reverse_proxy.pyを
+#   経由してアクセスしたプレビューは使用中として扱う)
+
+import sys
+import os
+import re
+import json
+import time
+import shutil
+import signal
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import docker_api
+import orchestrator
+import repo_cache
+
+__version__ = "0.0.1"
+STATE_VERSION = 1
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+STOP_TIMEOUT = 10.0
+parser = argparse.ArgumentParser(
+    description="Serve previews of several revisions at the same time"
+)
+parser.add_argument("-v", "--version", action="version",
+                    version="%(prog)s ver." + __version__)
+# options : Commands
+parser.add_argument("--add", type=str, nargs="+", default=[],
+                    help="Build and serve these branches, tags or commits")
+parser.add_argument("--remove", type=str, nargs="+", default=[],
+                    help="Stop and delete the previews of these revisions")
+parser.add_argument("--list", action='store_true', help="List the previews")
+parser.add_argument("--stop_all", action='store_true', help="Stop and delete all previews")
+# options : Farm
+parser.add_argument("--root_dir", type=str,
+                    default=os.path.abspath(os.path.join(
+                        os.path.dirname(__file__), "./..")),
+                    help="Root directory")
+parser.add_argument("--repository", type=str, default="",
+                    help="Git repository of the revisions (default: root_dir)")
+parser.add_argument("--farm_dir", type=str, default="_previews",
+                    help="Folder of the previews and their shared caches")
+parser.add_argument("--cache_dir", type=str, default="",
+                    help="Mirror cache directory (default: ~/.cache/github_pages)")
+parser.add_argument("--offline", action='store_true',
+                    help="Use only the revisions in the mirror cache")
+parser.add_argument("--max_previews", type=int, default=4,
+                    help="Number of previews served at the same time")
+parser.add_argument("--memory_mb", type=int, default=2048,
+                    help="Memory used by all previews (MB, 0: no limit)")
+parser.add_argument("--base_port", type=int, default=8100,
+                    help="First port assigned to the previews")
+parser.add_argument("--host", type=str, default="127.0.0.1",
+                    help="Host address of the previews")
+parser.add_argument("--start_timeout", type=float, default=600.0,
+                    help="Seconds to wait for a preview to be served")
+parser.add_argument("--engine", type=str, default="native", choices=["docker", "native"],
+                    help="Serve each preview with Jekyll in Docker or with the built-in renderer")
+# options : Native
+parser.add_argument("--src_dir", type=str, default="docs", help="Build directory")
+parser.add_argument("--jobs", type=int, default=0,
+                    help="Number of render processes of a preview (0: CPU cores)")
+parser.add_argument("--plantuml", type=str, default="",
+                    help="PlantUML command of the native engine (default: PLANTUML or plantuml)")
+parser.add_argument("--cache_mb", type=int, default=16,
+                    help="Memory cache size of a preview server (MB)")
+# options : Docker
+parser.add_argument("--image_name", type=str, default="github_pages_server_image",
+                    help="Docker image name (made by server.py --setup)")
+parser.add_argument("--image_version", type=str, default="latest",
+                    help="Docker image version")
+parser.add_argument("--container_name", type=str, default="server_jekyll",
+                    help="Prefix of the container names")
+parser.add_argument("--gem_volume", type=str, default="github_pages_gems",
+                    help="Docker volume that keeps the gems ('': not used)")
+parser.add_argument("--server_env_dir", type=str, default="test/src/node",
+                    help="Server setting directory")
+parser.add_argument("--entrypoint_path", type=str, default="test/src/jekyll/entrypoint.sh",
+                    help="Entrypoint path")
+parser.add_argument("--docker_client", type=str, default="auto",
+                    choices=["auto", "api", "cli"],
+                    help="Control Docker through the Engine API socket or the docker command")
+parser.add_argument("--docker_socket", type=str, default="",
+                    help="Docker Engine API socket (default: DOCKER_HOST or /var/run/docker.sock)")
+
+
+def preview_name(revision: str):
+    """Get the folder (and container suffix) name of a revision."""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", revision).strip("._") or "preview"
+
+
+def port_available(host: str, port: int):
+    """Check whether a port can be listened on."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        # Like the servers, ignore the connections closed a moment ago (TIME_WAIT).
+        if os.name == "posix":
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+def free_port(host: str, start: int, used: set):
+    """Find the first free port from start."""
+    port = start
+    while port in used or port_available(host, port) is False:
+        port += 1
+    return port
+
+
+def process_alive(pid: int):
+    """Check whether a process is running."""
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    # A finished child of this process stays as a zombie until it is reaped.
+    try:
+        with open("/proc/" + str(pid) + "/stat", "r", encoding="utf-8") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return True
+
+
+def process_memory(pid: int):
+    """Get the resident memory (bytes) of a process group. Returns 0 if unknown."""
+    total = 0
+    if pid <= 0:
+        return 0
+    try:
+        names = os.listdir("/proc")
+    except OSError:
+        return 0
+    for name in names:
+        if name.isdigit() is False:
+            continue
+        try:
+            with open("/proc/" + name + "/stat", "r", encoding="utf-8") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # fields[2] is the process group, fields[21] is the resident pages.
+            if int(fields[2]) == pid:
+                total += int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+def stop_process(pid: int):
+    """Stop a process and the processes it started."""
+    kill = os.killpg if hasattr(os, "killpg") else os.kill
+    try:
+        kill(pid, signal.SIGTERM)
+    except OSError:
+        return
+    deadline = time.monotonic() + STOP_TIMEOUT
+    while process_alive(pid) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if process_alive(pid):
+        try:
+            kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        except OSError:
+            pass
+
+
+async def http_ready(host: str, port: int):
+    """Check whether an HTTP server answers on a port."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 2.0)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        writer.write(b"HEAD / HTTP/1.0\r\nHost: " + host.encode("ascii") + b"\r\n\r\n")
+        await writer.drain()
+        # The Docker port proxy accepts connections before the server is up,
+        # so wait for a status line.
+        line = await asyncio.wait_for(reader.readline(), 5.0)
+        return line.startswith(b"HTTP/")
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+class PreviewFarm:
+    """Previews of several revisions served at the same time and evicted in LRU order."""
+    _farm_dir = "_previews"
+    _repository = "."
+    _engine = "native"
+    _host = "127.0.0.1"
+    _ap = None
+    _cache = None
+    _docker = None
+    _previews = {}
+
+    def __init__(self, ap):
+        """Initialize the class."""
+        self._ap = ap
+        root_dir = os.path.abspath(ap.root_dir)
+        self._farm_dir = os.path.abspath(os.path.join(root_dir, ap.farm_dir))
+        self._repository = ap.repository or root_dir
+        if os.path.isdir(self._repository):
+            self._repository = os.path.abspath(self._repository)
+        self._engine = ap.engine
+        self._host = ap.host
+        self._cache = repo_cache.RepoCache(ap.cache_dir)
+        self._previews = {}
+        self.load()
+        self._docker = None
+        if ap.engine == "docker" or any("container" in p for p in self._previews.values()):
+            self._docker = docker_api.create_client(ap.docker_client, ap.docker_socket,
+                                                    root_dir)
+
+    @property
+    def state_path(self):
+        """Get the path of the state file."""
+        return os.path.join(self._farm_dir, "farm.json")
+
+    @property
+    def shared_cache(self):
+        """Get the cache folder shared by the previews."""
+        return os.path.join(self._farm_dir, "shared")
+
+    def preview_dir(self, name: str):
+        """Get the folder of a preview."""
+        return os.path.join(self._farm_dir, name)
+
+    def load(self):
+        """Load the state of the previews."""
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == STATE_VERSION:
+                self._previews = data.get("previews", {})
+        except (OSError, ValueError):
+            self._previews = {}
+        # Requests through reverse_proxy.py also count as uses.
+        try:
+            with open(os.path.join(self._farm_dir, "access.json"), "r",
+                      encoding="utf-8") as f:
+                access = json.load(f)
+            for name, preview in self._previews.items():
+                preview["last_used"] = max(preview["last_used"], float(access.get(name, 0)))
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def save(self):
+        """Save the state of the previews."""
+        os.makedirs(self._farm_dir, exist_ok=True)
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": STATE_VERSION, "previews": self._previews}, f,
+                      indent=1, sort_keys=True)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    async def close(self):
+        """Close the Docker connection."""
+        if self._docker is not None:
+            await self._docker.close()
+
+    # =========================================================
+    # Preview processes and containers
+    async def alive(self, preview: dict):
+        """Check whether a preview is being served."""
+        if "container" in preview:
+            ret, containers = await self._docker.list_containers(name=preview["container"])
+            return ret == 0 and any(c["Name"] == preview["container"]
+                                    and c["State"] == "running" for c in containers)
+        return process_alive(int(preview.get("pid", 0)))
+
+    async def memory(self, preview: dict):
+        """Get the memory used by a preview (bytes)."""
+        if "container" in preview:
+            ret, usage = await self._docker.memory_usage(preview["container"])
+            return usage if ret == 0 else 0
+        return process_memory(int(preview.get("pid", 0)))
+
+    async def start(self, name: str, preview: dict):
+        """Start the process or container of a preview."""
+        path = self.preview_dir(name)
+        src = os.path.join(path, "repo", self._ap.src_dir)
+        site = os.path.join(path, "_site")
+        os.makedirs(site, exist_ok=True)
+        if self._engine == "docker":
+            root_dir = os.path.abspath(self._ap.root_dir)
+            container = self._ap.container_name + "_" + name
+            binds = [os.path.join(root_dir, self._ap.server_env_dir) + ":/root/node",
+                     os.path.join(root_dir, self._ap.entrypoint_path) + ":/root/entrypoint.sh",
+                     src + ":/root/src",
+                     site + ":/root/_site"]
+            if self._ap.gem_volume != "":
+                binds.append(self._ap.gem_volume + ":/root/gems")
+            await self._docker.remove_container(container)
+            ret, result = await self._docker.run_container(
+                self._ap.image_name + ":" + self._ap.image_version, container, ["/bin/bash"],
+                binds=binds, workdir="/root", ports={preview["port"]: 8000})
+            if ret != 0:
+                return ret, result
+            preview["container"] = container
+            return 0, container
+        args = [sys.executable, SERVER_SCRIPT, "--engine", "native",
+                "--root_dir", os.path.join(path, "repo"), "--src_dir", self._ap.src_dir,
+                "--output_dir", site, "--host", self._host, "--port", str(preview["port"]),
+                "--jobs", str(self._ap.jobs), "--cache_mb", str(self._ap.cache_mb),
+                "--shared_cache", self.shared_cache]
+        if self._ap.plantuml != "":
+            args += ["--plantuml", self._ap.plantuml]
+        try:
+            with open(os.path.join(path, "server.log"), "ab") as log:
+                proc = subprocess.Popen(args, cwd=os.path.dirname(SERVER_SCRIPT),
+                                        stdin=subprocess.DEVNULL, stdout=log,
+                                        stderr=subprocess.STDOUT, start_new_session=True)
+        except OSError as e:
+            return 1, str(e)
+        preview["pid"] = proc.pid
+        return 0, str(proc.pid)
+
+    async def stop(self, preview: dict):
+        """Stop the process or container of a preview."""
+        if "container" in preview:
+            await self._docker.remove_container(preview["container"])
+        elif int(preview.get("pid", 0)) > 0:
+            await asyncio.to_thread(stop_process, int(preview["pid"]))
+
+    async def wait_ready(self, name: str, preview: dict):
+        """Wait for a preview to be served."""
+        deadline = time.monotonic() + self._ap.start_timeout
+        while time.monotonic() < deadline:
+            if await http_ready(self._host, preview["port"]):
+                return 0
+            if await self.alive(preview) is False:
+                log = os.path.join(self.preview_dir(name), "server.log")
+                if "container" in preview:
+                    log = "docker logs " + preview["container"]
+                print("  [ERROR] The preview stopped: " + preview["revision"]
+                      + " (see " + log + ")")
+                return 1
+            await asyncio.sleep(0.5)
+        print("  [ERROR] Timeout: " + preview["revision"])
+        return 1
+
+    async def remove(self, name: str, reason: str = "Remove"):
+        """Stop a preview and delete its folder."""
+        preview = self._previews.pop(name)
+        await self.stop(preview)
+        shutil.rmtree(self.preview_dir(name), ignore_errors=True)
+        print("  --> " + reason + ": " + preview["revision"] + " (port "
+              + str(preview["port"]) + ")")
+
+    async def prune(self):
+        """Forget the previews that are no longer served."""
+        for name, preview in list(self._previews.items()):
+            if await self.alive(preview) is False:
+                await self.remove(name, "Stopped")
+
+    # =========================================================
+    # Commands
+    async def checkout(self, revision: str, dest: str):
+        """Put the files of a revision in a folder. Returns (ret, commit)."""
+        commit = ""
+        if os.path.isdir(self._repository) and re.fullmatch(r"[0-9a-fA-F]{4,39}", revision):
+            # Only a full SHA can be fetched, the local repository expands an abbreviated one.
+            ret, result = await orchestrator.run_process(
+                ["git", "-C", self._repository, "rev-parse", "--verify", "--quiet",
+                 revision + "^{commit}"])
+            if ret == 0:
+                revision = result.strip()
+        if self._ap.offline is False:
+            ret, result = await self._cache.fetch(self._repository, revision)
+            commit = result if ret == 0 else ""
+        if commit == "":
+            commit = await self._cache.resolve(self._repository, revision)
+            if commit == "":
+                return 1, "Not found: " + self._repository + "(" + revision + ")"
+        record = repo_cache.load_record(dest)
+        if os.path.isdir(dest) and record.get("commit") == commit:
+            return 0, commit
+        self._cache.clear(dest)
+        ret, result = await self._cache.export(self._repository, commit, dest)
+        if ret != 0:
+            return ret, result.strip()
+        repo_cache.save_record(dest, {"url": self._repository, "ref": revision,
+                                      "commit": commit})
+        return 0, commit
+
+    async def evict(self, keep: set, needed: int = 0):
+        """Remove the least recently used previews until they fit. Returns the memory used."""
+        budget = self._ap.memory_mb * 1024 * 1024
+        usage = {name: await self.memory(preview) for name, preview in self._previews.items()}
+        for name in sorted(self._previews, key=lambda n: self._previews[n]["last_used"]):
+            if name in keep:
+                continue
+            over_count = len(self._previews) > self._ap.max_previews
+            over_memory = budget > 0 and sum(usage.values()) + needed > budget
+            if over_count is False and over_memory is False:
+                break
+            usage.pop(name)
+            await self.remove(name, "Evict")
+        return sum(usage.values())
+
+    async def add(self, revisions: list):
+        """Build and serve revisions, evicting the least recently used previews."""
+        print("[## Add previews]")
+        if len(revisions) > self._ap.max_previews:
+            print("  [ERROR] More revisions than --max_previews: " + str(len(revisions)))
+            return 1
+        if self._engine == "docker":
+            image = self._ap.image_name + ":" + self._ap.image_version
+            ret, image_id = await self._docker.image_id(image)
+            if ret != 0 or image_id == "":
+                print("  [ERROR] Not found: " + image + " (run server.py --setup)")
+                return 1
+        await self.prune()
+        names = {}
+        for revision in revisions:
+            names[preview_name(revision)] = revision
+        starting = []
+        for name, revision in names.items():
+            preview = self._previews.get(name)
+            ret, commit = await self.checkout(revision,
+                                              os.path.join(self.preview_dir(name), "repo"))
+            if ret != 0:
+                print("  [ERROR] " + commit)
+                return ret
+            if preview is not None and preview["commit"] == commit:
+                print("  --> Up to date: " + revision + " (" + commit[:12] + ")")
+                preview["last_used"] = time.time()
+                continue
+            if preview is not None:
+                await self.stop(preview)
+            port = free_port(self._host, self._ap.base_port,
+                             set(p["port"] for n, p in self._previews.items() if n != name))
+            if preview is not None and port_available(self._host, preview["port"]):
+                port = preview["port"]
+            self._previews[name] = {"revision": revision, "commit": commit, "port": port,
+                                    "host": self._host, "engine": self._engine,
+                                    "last_used": time.time()}
+            starting.append(name)
+        # Make room before starting. A new preview is expected to use as much memory
+        # as the previews already running.
+        running = [await self.memory(preview) for name, preview in self._previews.items()
+                   if name not in starting]
+        running = [size for size in running if size > 0]
+        needed = len(starting) * (sum(running) // len(running) if running else 0)
+        await self.evict(set(names), needed)
+        ret = 0
+        for name in starting:
+            result_ret, result = await self.start(name, self._previews[name])
+            if result_ret != 0:
+                print("  [ERROR] " + str(result).strip())
+                self._previews.pop(name)
+                ret = result_ret
+        started = [name for name in starting if name in self._previews]
+        self.save()
+        print("  --> Build " + str(len(started)) + " previews")
+        results = await asyncio.gather(*[self.wait_ready(name, self._previews[name])
+                                         for name in started])
+        for name, result in zip(started, results):
+            if result != 0:
+                ret = result
+        # Check the budget again with the real memory of the new previews.
+        used = await self.evict(set(names))
+        if 0 < self._ap.memory_mb * 1024 * 1024 < used:
+            print("  [WARNING] The previews use " + str(used // 1024 // 1024)
+                  + " MB (--memory_mb " + str(self._ap.memory_mb) + ")")
+        self.save()
+        await self.print_previews()
+        return ret
+
+    async def remove_revisions(self, revisions: list):
+        """Stop and delete the previews of revisions."""
+        print("[## Remove previews]")
+        ret = 0
+        for revision in revisions:
+            name = preview_name(revision)
+            if name not in self._previews:
+                print("  [WARNING] Not found: " + revision)
+                ret = 1
+                continue
+            await self.remove(name)
+        self.save()
+        return ret
+
+    async def stop_all(self):
+        """Stop and delete all previews."""
+        print("[## Stop all previews]")
+        for name in list(self._previews):
+            await self.remove(name)
+        self.save()
+        return 0
+
+    async def print_previews(self):
+        """Print the previews from the most recently used."""
+        print("[## Previews]")
+        now = time.time()
+        for name in sorted(self._previews, key=lambda n: -self._previews[n]["last_used"]):
+            preview = self._previews[name]
+            state = "running" if await self.alive(preview) else "stopped"
+            print("  --> http://" + self._host + ":" + str(preview["port"]) + "/ : "
+                  + preview["revision"] + " (" + preview["commit"][:12] + ", " + state + ", "
+                  + str(await self.memory(preview) // 1024 // 1024) + " MB, used "
+                  + str(round((now - preview["last_used"]) / 60)) + " min ago)")
+        return 0
+
+
+async def run(ap):
+    """Run the commands."""
+    farm = PreviewFarm(ap)
+    try:
+        ret = 0
+        if ap.stop_all is True:
+            ret = await farm.stop_all()
+        if ap.remove:
+            ret = await farm.remove_revisions(ap.remove) or ret
+        if ap.add:
+            ret = await farm.add(ap.add) or ret
+        if ap.list is True or (ap.add == [] and ap.remove == [] and ap.stop_all is False):
+            await farm.prune()
+            farm.save()
+            await farm.print_previews()
+        return ret
+    finally:
+        await farm.close()
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    try:
+        sys.exit(asyncio.run(run(args)))
+    except Exception as e:
+        print("[ERROR] " + str(e))
+        sys.exit(1)
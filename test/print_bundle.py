@@ -0,0 +1,518 @@
+"""This is a script to make a single-file print bundle of the specification."""
+# SYSTEM: Python 3.11.1
+#
+# これは、仕様書(docs/index.md)を印刷・PDF用の1つのHTMLファイルにまとめるスクリプトです。
+#
+# このスクリプトは、以下の内容を実行します。
+# * @importを展開した文書を、読み込み先のファイルごとの断片(セグメント)に分けて変換
+#   (変換結果は_site.cache/print/segmentsにキャッシュし、変更したファイルの断片だけを再変換)
+# * ページの区切り(page-break-before)はそのまま残し、文書全体の目次を[TOC]の位置に作成
+# * CSS(サイトのstyle.scss、<link>で読み込んだcustom.lessなど)と画像・PlantUMLの図を埋め込み
+#   (SCSSとLESSの変換結果はstylesheet_pipeline.pyのキャッシュをサイトのビルドと共有)
+#   (同じ画像は1回だけ読み込んで変換)
+# * 用紙の大きさと向きはフロントマターのpuppeteer(format, landscape)から@pageに設定
+# * 読み込み完了(画像のデコードとフォント)の時点でdata-print-ready属性とwindow.printReadyを設定
+# * --pdf の場合は、PrinceまたはChrome(headless)でPDFに変換(固定の待ち時間なし)
+
+import sys
+import os
+import re
+import html
+import json
+import time
+import base64
+import shutil
+import asyncio
+import argparse
+import mimetypes
+import posixpath
+
+import build_cache
+import diagram_renderer
+import import_resolver
+import markdown_renderer
+import native_engine
+import orchestrator
+import stylesheet_pipeline
+
+BUNDLE_VERSION = 1
+IMAGE_TAG = re.compile(r'(<img\b[^>]*?\bsrc=")([^"]+)(")')
+STYLESHEET_TAG = re.compile(r'<link\b[^>]*?\brel="stylesheet"[^>]*?\bhref="([^"]+)"[^>]*>')
+URL_SCHEME = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:')
+CHROME_COMMANDS = ("chromium", "chromium-browser", "google-chrome", "google-chrome-stable",
+                   "chrome")
+PRINT_STYLE = """
+body { margin: 0; font: 400 11pt/1.5 -apple-system, "Segoe UI", Roboto, "Noto Sans JP", sans-serif; color: #111; }
+table { border-collapse: collapse; margin-bottom: 12px; page-break-inside: auto; }
+tr { page-break-inside: avoid; }
+th, td { border: 1px solid #ccc; padding: 4px 8px; }
+pre { background: #eef; border: 1px solid #ddd; padding: 6px 10px; white-space: pre-wrap; }
+img { max-width: 100%; }
+h1, h2, h3, h4 { page-break-after: avoid; }
+.admonition { border-left: 4px solid #fc0; background: #fffbe6; padding: 4px 12px; margin: 12px 0; }
+.admonition-title { font-weight: bold; margin: 4px 0; }
+ul.toc, ul.toc ul { list-style: none; padding-left: 1.2em; }
+"""
+READY_SCRIPT = """<script>
+(function () {
+  var waits = Array.prototype.map.call(document.images, function (image) {
+    return image.decode ? image.decode().catch(function () {}) : null;
+  });
+  if (document.fonts) {
+    waits.push(document.fonts.ready);
+  }
+  Promise.all(waits).then(function () {
+    document.documentElement.setAttribute("data-print-ready", "true");
+    window.printReady = true;
+  });
+})();
+</script>"""
+
+__version__ = "0.0.1"
+parser = argparse.ArgumentParser(
+    description="Make a single-file print bundle of the specification"
+)
+parser.add_argument("-v", "--version", action="version",
+                    version="%(prog)s ver." + __version__)
+parser.add_argument("--root_dir", type=str,
+                    default=os.path.abspath(os.path.join(
+                        os.path.dirname(__file__), "./..")),
+                    help="Root directory")
+parser.add_argument("--src", type=str, default="docs", help="Source directory")
+parser.add_argument("--page", type=str, default="index.md",
+                    help="Page that imports the whole specification")
+parser.add_argument("--volume_site", type=str, default="_site",
+                    help="Build results (the cache is <volume_site>.cache/print)")
+parser.add_argument("--output", type=str, default="_print.html", help="Bundle file")
+parser.add_argument("--plantuml", type=str, default="",
+                    help="PlantUML command (default: PLANTUML or plantuml)")
+parser.add_argument("--force", action='store_true',
+                    help="Write the bundle even if nothing has changed")
+parser.add_argument("--pdf", type=str, default="", help="Convert the bundle to this PDF file")
+parser.add_argument("--pdf_engine", type=str, default="auto",
+                    choices=["auto", "prince", "chrome"],
+                    help="PDF renderer (auto: prince if installed, else chrome)")
+parser.add_argument("--pdf_timeout", type=float, default=300,
+                    help="Upper limit of the PDF conversion (seconds)")
+
+
+def split_segments(text: str):
+    """Split a Markdown file at its Markdown @import lines. Returns (texts, imports)."""
+    texts = []
+    imports = []
+    lines = []
+    in_fence = False
+    for line in text.split("\n"):
+        if import_resolver.FENCE_LINE.match(line):
+            in_fence = not in_fence
+        match = import_resolver.IMPORT_LINE.match(line) if in_fence is False else None
+        if match is not None and import_resolver.import_kind(match.group(1)) == "markdown":
+            texts.append("\n".join(lines))
+            imports.append(match.group(1))
+            lines = []
+            continue
+        lines.append(line)
+    texts.append("\n".join(lines))
+    return texts, imports
+
+
+def page_format(front: dict):
+    """Get the CSS page size from the puppeteer options of the front matter."""
+    options = front.get("puppeteer") or {}
+    if isinstance(options, dict) is False:
+        return ""
+    size = str(options.get("format") or "")
+    if options.get("landscape") is True:
+        size = (size + " landscape").strip()
+    return size
+
+
+def inline_headings(html_text: str, renames: dict):
+    """Rename the heading anchors of a segment that are already used by others."""
+    for old, new in renames.items():
+        html_text = html_text.replace(' id="' + old + '"', ' id="' + new + '"')
+        html_text = html_text.replace(' href="#' + old + '"', ' href="#' + new + '"')
+    return html_text
+
+
+class PrintBundle:
+    """Assemble the expanded specification from cached per-file segments."""
+    _src = "docs"
+    _root = "."
+    _page = "index.md"
+    _cache_dir = ""
+    _resolver = None
+    _diagrams = None
+    _styles = None
+    _texts = {}
+    _data_urls = {}
+    _assets = {}
+    _missing = []
+    _stats = {}
+
+    def __init__(self, src: str, page: str, cache_root: str, plantuml: str = ""):
+        """Initialize the class. cache_root is the cache of the site (<volume_site>.cache)."""
+        self._src = os.path.abspath(src)
+        self._root = os.path.dirname(self._src)
+        self._page = page
+        self._cache_dir = os.path.join(os.path.abspath(cache_root), "print")
+        self._resolver = import_resolver.ImportResolver(
+            self._src, os.path.join(self._cache_dir, "imports"))
+        # The diagrams rendered by the native engine are reused.
+        self._diagrams = diagram_renderer.DiagramRenderer(
+            os.path.join(os.path.abspath(cache_root), "plantuml"), plantuml)
+        # So are the compiled stylesheets.
+        self._styles = stylesheet_pipeline.StylesheetPipeline(
+            self._src, "", os.path.join(os.path.abspath(cache_root), "styles"))
+        self._texts = {}
+        self._data_urls = {}
+        self._assets = {}
+        self._missing = []
+        self._stats = {"segments": 0, "rendered": 0, "images": 0, "bytes": 0}
+
+    @property
+    def missing(self):
+        """Get the URLs of the images and stylesheets that were not found."""
+        return self._missing
+
+    @property
+    def stats(self):
+        """Get the number of segments, rendered segments, inlined images and written bytes."""
+        return self._stats
+
+    # =========================================================
+    # Segments
+    def plan(self, name: str, page_dir: str, stack: tuple = ()):
+        """List the segments of a file and its Markdown imports in document order."""
+        node = self._resolver.node(name)
+        if node is None:
+            return []
+        segments = []
+        parts = []
+        index = 0
+        for target in node["imports"]:
+            child = self._resolver.target_node(name, target)
+            if import_resolver.import_kind(child) == "markdown":
+                # A missing or cyclic page ends the segment but adds nothing.
+                segments.append(self.segment(name, index, page_dir, stack, node, parts))
+                if child not in stack and child != name:
+                    segments += self.plan(child, page_dir, stack + (name,))
+                index += 1
+                parts = []
+            else:
+                # Other imports (images, code, diagrams) are expanded into the segment.
+                parts.append(target + "=" + str(self._resolver.key(child, stack + (name,))))
+        segments.append(self.segment(name, index, page_dir, stack, node, parts))
+        return segments
+
+    def segment(self, name: str, index: int, page_dir: str, stack: tuple, node: dict,
+                parts: list):
+        """Get the cache key of a segment."""
+        key = build_cache.hash_text("\n".join(
+            [str(BUNDLE_VERSION), node["hash"], str(index), page_dir,
+             str(self._diagrams.available())] + parts))
+        return {"name": name, "index": index, "page_dir": page_dir, "stack": stack,
+                "key": key, "root": len(stack) == 0}
+
+    def segment_text(self, segment: dict):
+        """Get the Markdown of a segment with its other imports expanded."""
+        name = segment["name"]
+        if name not in self._texts:
+            with open(os.path.join(self._root, *name.split("/")), "r", encoding="utf-8") as f:
+                text = f.read()
+            self._texts[name] = split_segments(import_resolver.strip_front_matter(text))[0]
+        lines = []
+        in_fence = False
+        for line in self._texts[name][segment["index"]].split("\n"):
+            if import_resolver.FENCE_LINE.match(line):
+                in_fence = not in_fence
+            match = import_resolver.IMPORT_LINE.match(line) if in_fence is False else None
+            if match is None:
+                lines.append(line)
+                continue
+            lines.append(self._resolver.render_import(name, match.group(1), match.group(2) or "",
+                                                      segment["stack"] + (name,)))
+        return import_resolver.rebase_links("\n".join(lines), posixpath.dirname(name),
+                                            segment["page_dir"])
+
+    def render_segment(self, segment: dict):
+        """Render a segment, reusing the cached result. Returns {html, headings}."""
+        path = os.path.join(self._cache_dir, "segments", segment["key"] + ".json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        text = self.segment_text(segment)
+        sources = [source for _, source, _ in diagram_renderer.find_diagrams(text)]
+        if len(sources) > 0:
+            rendered = self._diagrams.render_all(sources)
+            for key, message in self._diagrams.errors:
+                print("  [WARNING] Diagram" + (" " + key if key != "" else "") + ": " + message)
+            text = diagram_renderer.replace_diagrams(text, rendered)
+        renderer = markdown_renderer.MarkdownRenderer()
+        entry = {"html": renderer.render(text, toc=False),
+                 "headings": [list(heading) for heading in renderer.headings]}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + "." + str(os.getpid()) + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(path + "." + str(os.getpid()) + ".tmp", path)
+        self._stats["rendered"] += 1
+        return entry
+
+    # =========================================================
+    # Assets
+    def asset_path(self, url: str, page_dir: str):
+        """Get the file of an image or stylesheet URL. Returns None for external URLs."""
+        if URL_SCHEME.match(url) or url.startswith("#") or url.startswith("//"):
+            return None
+        url = url.split("#")[0].split("?")[0]
+        if url.startswith("/" + diagram_renderer.DIAGRAM_DIR + "/"):
+            return self._diagrams.cache_path(posixpath.splitext(posixpath.basename(url))[0])
+        if url.startswith("/"):
+            candidates = [os.path.join(self._src, *url.lstrip("/").split("/")),
+                          os.path.join(self._root, *url.lstrip("/").split("/"))]
+        else:
+            rel_path = posixpath.normpath(posixpath.join(page_dir, url))
+            candidates = [os.path.join(self._root, *rel_path.split("/"))]
+        for path in candidates:
+            if os.path.isfile(path):
+                return path
+        # Rebuild when a missing file is added.
+        for path in candidates:
+            self._assets[path] = None
+        self._missing.append(url)
+        return None
+
+    def use_asset(self, path: str):
+        """Record an embedded file for the up-to-date check of the next run."""
+        stat = os.stat(path)
+        self._assets[path] = [stat.st_mtime_ns, stat.st_size]
+
+    def data_url(self, path: str):
+        """Get the data URL of an image (each file is encoded once)."""
+        if path not in self._data_urls:
+            self.use_asset(path)
+            mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            with open(path, "rb") as f:
+                data = base64.b64encode(f.read()).decode("ascii")
+            self._data_urls[path] = "data:" + mime + ";base64," + data
+            self._stats["images"] += 1
+        return self._data_urls[path]
+
+    def stylesheet(self, path: str):
+        """Get the CSS of a stylesheet file (SCSS and LESS are compiled and cached)."""
+        self.use_asset(path)
+        if stylesheet_pipeline.is_stylesheet(path):
+            return self._styles.css(path)[0]
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def inline_assets(self, html_text: str, page_dir: str):
+        """Embed the images and stylesheets of a rendered segment."""
+        def image(match):
+            path = self.asset_path(html.unescape(match.group(2)), page_dir)
+            if path is None:
+                return match.group(0)
+            return match.group(1) + self.data_url(path) + match.group(3)
+
+        def style(match):
+            path = self.asset_path(html.unescape(match.group(1)), page_dir)
+            if path is None:
+                return match.group(0)
+            return "<style>\n" + self.stylesheet(path) + "\n</style>"
+        return STYLESHEET_TAG.sub(style, IMAGE_TAG.sub(image, html_text))
+
+    # =========================================================
+    # Bundle
+    def inputs_digest(self, segments: list):
+        """Get the digest of everything the bundle is made of."""
+        parts = [str(BUNDLE_VERSION)] + [segment["key"] for segment in segments]
+        for folder in ("assets/css", "_sass"):
+            path = os.path.join(self._src, folder)
+            if os.path.isdir(path):
+                for rel_path in build_cache.list_files(path):
+                    stat = os.stat(os.path.join(path, rel_path))
+                    parts.append(folder + "/" + rel_path + ":" + str(stat.st_mtime_ns)
+                                 + ":" + str(stat.st_size))
+        return build_cache.hash_text("\n".join(parts))
+
+    def write(self, output: str, force: bool = False):
+        """Write the bundle. Returns (ret, message)."""
+        name = self._resolver.to_node(self._page)
+        if self._resolver.node(name) is None:
+            return 1, "Not found: " + os.path.join(self._src, self._page)
+        with open(os.path.join(self._src, self._page), "r", encoding="utf-8") as f:
+            front, _body = native_engine.split_page(f.read())
+        segments = self.plan(name, posixpath.dirname(name))
+        self._stats["segments"] = len(segments)
+        digest = self.inputs_digest(segments)
+        state_path = os.path.join(self._cache_dir, "bundle.json")
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if (force is False and state.get("digest") == digest
+                and state.get("output") == os.path.abspath(output) and os.path.isfile(output)
+                and self.assets_unchanged(state.get("assets", {}))):
+            self._resolver.save()
+            self._stats["bytes"] = os.path.getsize(output)
+            return 0, "Up to date: " + output
+
+        entries = [self.render_segment(segment) for segment in segments]
+        # The anchors must be unique in the whole document, and the TOC lists all of them.
+        headings = []
+        renames = []
+        used = {}
+        for entry in entries:
+            rename = {}
+            for level, anchor, text in entry["headings"]:
+                count = used.get(anchor, 0)
+                used[anchor] = count + 1
+                if count > 0:
+                    rename[anchor] = anchor + "-" + str(count)
+                    anchor = rename[anchor]
+                    used[anchor] = used.get(anchor, 0) + 1
+                headings.append((level, anchor, text))
+            renames.append(rename)
+        options = front.get("toc") if isinstance(front.get("toc"), dict) else {}
+        toc = markdown_renderer.render_toc(headings, int(options.get("depth_from", 1)),
+                                           int(options.get("depth_to", 6)))
+        if not any(markdown_renderer.TOC_MARKER in entry["html"] for entry in entries):
+            toc_head = toc
+        else:
+            toc_head = ""
+
+        config = native_engine.load_config(self._src)
+        title = str(front.get("title") or config.get("title") or "")
+        size = page_format(front)
+        site_css = os.path.join(self._src, "assets", "css", "style.scss")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        tmp_path = output + "." + str(os.getpid()) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write('<!DOCTYPE html>\n<html lang="' + html.escape(str(config.get("lang") or "ja"))
+                    + '">\n<head>\n<meta charset="utf-8">\n<title>' + html.escape(title)
+                    + "</title>\n<style>" + PRINT_STYLE)
+            if size != "":
+                f.write("@page { size: " + size + "; }\n")
+            f.write("</style>\n")
+            if os.path.isfile(site_css):
+                f.write("<style>\n" + self.stylesheet(site_css) + "\n</style>\n")
+            f.write("</head>\n<body>\n<main>\n" + toc_head + "\n")
+            # Each segment is written as soon as its assets are embedded.
+            for segment, entry, rename in zip(segments, entries, renames):
+                text = inline_headings(entry["html"], rename) if len(rename) > 0 \
+                    else entry["html"]
+                text = text.replace(markdown_renderer.TOC_MARKER, toc)
+                f.write(self.inline_assets(text, segment["page_dir"]) + "\n")
+            f.write("</main>\n" + READY_SCRIPT + "\n</body>\n</html>\n")
+        os.replace(tmp_path, output)
+        self._stats["bytes"] = os.path.getsize(output)
+        self._resolver.save()
+        self._styles.save()
+        os.makedirs(self._cache_dir, exist_ok=True)
+        with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"digest": digest, "output": os.path.abspath(output),
+                       "assets": self._assets}, f, indent=1)
+        os.replace(state_path + ".tmp", state_path)
+        self.prune(segments)
+        return 0, "Bundle: " + output
+
+    def assets_unchanged(self, assets: dict):
+        """Check whether the files embedded by the previous run are unchanged."""
+        for path, item in assets.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                if item is None:
+                    continue
+                return False
+            if item is None or stat.st_mtime_ns != item[0] or stat.st_size != item[1]:
+                return False
+        return True
+
+    def prune(self, segments: list):
+        """Remove the cached segments that the bundle no longer uses."""
+        used = set(segment["key"] + ".json" for segment in segments)
+        folder = os.path.join(self._cache_dir, "segments")
+        for name in os.listdir(folder) if os.path.isdir(folder) else []:
+            if name not in used:
+                os.remove(os.path.join(folder, name))
+
+
+def pdf_command(engine: str, bundle: str, pdf: str):
+    """Get the command that converts the bundle to PDF. Returns [] if none is installed."""
+    if engine in ("auto", "prince") and shutil.which("prince") is not None:
+        return ["prince", bundle, "-o", pdf]
+    if engine in ("auto", "chrome"):
+        for name in CHROME_COMMANDS:
+            if shutil.which(name) is not None:
+                # Everything is embedded, so the page is ready at its load event.
+                return [name, "--headless=new", "--disable-gpu", "--no-pdf-header-footer",
+                        "--print-to-pdf=" + pdf, "file://" + bundle]
+    return []
+
+
+async def write_pdf(engine: str, bundle: str, pdf: str, timeout: float):
+    """Convert the bundle to PDF."""
+    print("[## Convert to PDF]")
+    cmd = pdf_command(engine, os.path.abspath(bundle), os.path.abspath(pdf))
+    if len(cmd) == 0:
+        print("  [ERROR] No PDF renderer found (install prince or chromium)")
+        return 1
+    try:
+        ret, result = await asyncio.wait_for(
+            orchestrator.run_process(cmd, os.path.dirname(os.path.abspath(bundle))),
+            timeout or None)
+    except asyncio.TimeoutError:
+        print("  [ERROR] The PDF renderer did not finish in " + str(timeout) + " seconds")
+        return 1
+    if ret != 0 or os.path.isfile(pdf) is False:
+        print("  [ERROR] " + cmd[0] + " : " + result.strip())
+        return ret or 1
+    print("  --> PDF (" + cmd[0] + "): " + pdf)
+    return 0
+
+
+def make_bundle(src: str, page: str, volume_site: str, output: str, plantuml: str = "",
+                force: bool = False):
+    """Write the print bundle and print the result."""
+    print("[## Print bundle]")
+    start = time.perf_counter()
+    bundle = PrintBundle(src, page, native_engine.cache_dir(volume_site), plantuml)
+    try:
+        ret, message = bundle.write(output, force)
+    except (OSError, UnicodeDecodeError) as e:
+        ret, message = 1, str(e)
+    if ret != 0:
+        print("  [ERROR] " + message)
+        return ret
+    for url in sorted(set(bundle.missing)):
+        print("  [WARNING] Not found: " + url)
+    stats = bundle.stats
+    print("  --> " + message + " (" + str(stats["segments"]) + " segments, "
+          + str(stats["rendered"]) + " rendered, " + str(stats["images"]) + " images, "
+          + str(stats["bytes"] // 1024) + " KiB) in "
+          + str(round((time.perf_counter() - start) * 1000)) + " ms")
+    return 0
+
+
+def main(ap):
+    """Run the command."""
+    output = os.path.abspath(os.path.join(ap.root_dir, ap.output))
+    ret = make_bundle(os.path.join(ap.root_dir, ap.src), ap.page,
+                      os.path.join(ap.root_dir, ap.volume_site), output, ap.plantuml, ap.force)
+    if ret == 0 and ap.pdf != "":
+        ret = asyncio.run(write_pdf(ap.pdf_engine, output, os.path.abspath(ap.pdf),
+                                    ap.pdf_timeout))
+    return ret
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    try:
+        sys.exit(main(args))
+    except Exception as e:
+        print("[ERROR] " + str(e))
+        sys.exit(1)
@@ -0,0 +1,252 @@
+"""This is a module to fetch git repositories through a local mirror cache."""
+# SYSTEM: Python 3.11.1
+#
+# これは、gitリポジトリをローカルのミラーキャッシュを介して取得するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * URLごとのbareリポジトリ(ミラー)に、指定したブランチ/タグだけを浅く(depth 1)取得
+# * 取得済みのブランチ/タグはミラーからコピーし、ネットワークを使わない
+# * オフラインの場合は、事前に用意したミラーまたはtarballから展開
+# * git configはミラーごとに設定し、グローバル設定は変更しない
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import tarfile
+
+import build_cache
+import orchestrator
+
+RECORD_VERSION = 1
+CACHE_REF_PREFIX = "refs/cache/"
+MIRROR_CONFIG = [
+    # Keep the LF line endings (Docker reads the scripts as is).
+    ("core.autocrlf", "input"),
+]
+
+
+def default_cache_dir():
+    """Get the default cache directory."""
+    cache_home = os.environ.get("XDG_CACHE_HOME", "")
+    if cache_home == "":
+        cache_home = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "github_pages")
+
+
+def mirror_name(url: str):
+    """Get the mirror directory name of a URL."""
+    name = url.rstrip("/").split("/")[-1]
+    if name.endswith(".git"):
+        name = name[:-4]
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", name) or "repo"
+    return name + "-" + hashlib.sha1(url.encode("utf-8")).hexdigest()[:12] + ".git"
+
+
+def record_path(dest: str):
+    """Get the path of the record stored next to the checkout."""
+    dest = os.path.abspath(dest)
+    return os.path.join(os.path.dirname(dest), os.path.basename(dest) + ".fetch.json")
+
+
+def load_record(dest: str):
+    """Load the record of a checkout. Returns {} if there is none."""
+    try:
+        with open(record_path(dest), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == RECORD_VERSION:
+            return data
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def save_record(dest: str, record: dict):
+    """Save the record of a checkout."""
+    data = dict(record)
+    data["version"] = RECORD_VERSION
+    path = record_path(dest)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def extract_tar(archive_path: str, dest: str, strip_top: bool = False):
+    """Extract a tar archive. strip_top removes a single top-level directory."""
+    with tarfile.open(archive_path, "r:*") as tar:
+        members = tar.getmembers()
+        names = set(member.name.split("/")[0] for member in members if member.name != "")
+        prefix = ""
+        if strip_top is True and len(names) == 1 and any(
+                member.isdir() and member.name == list(names)[0] for member in members):
+            prefix = list(names)[0] + "/"
+        selected = []
+        for member in members:
+            if prefix != "":
+                if member.name.startswith(prefix) is False:
+                    continue
+                member.name = member.name[len(prefix):]
+            name = os.path.normpath(member.name)
+            if member.name == "" or name.startswith("..") or os.path.isabs(name):
+                continue
+            selected.append(member)
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(dest, selected, filter="data")
+        else:
+            tar.extractall(dest, selected)
+
+
+class RepoCache:
+    """Bare mirror cache of git repositories keyed by URL."""
+    _cache_dir = ""
+
+    def __init__(self, cache_dir: str = ""):
+        """Initialize the class."""
+        if cache_dir == "":
+            cache_dir = default_cache_dir()
+        self._cache_dir = os.path.abspath(cache_dir)
+
+    @property
+    def cache_dir(self):
+        """Get the cache directory."""
+        return self._cache_dir
+
+    def mirror_path(self, url: str):
+        """Get the mirror path of a URL."""
+        return os.path.join(self._cache_dir, "git", mirror_name(url))
+
+    async def git(self, mirror: str, args: list):
+        """Run a git command on a mirror."""
+        return await orchestrator.run_process(["git", "--git-dir=" + mirror] + args)
+
+    async def init_mirror(self, url: str):
+        """Create the mirror of a URL if it does not exist."""
+        mirror = self.mirror_path(url)
+        if os.path.isfile(os.path.join(mirror, "HEAD")) is False:
+            os.makedirs(os.path.dirname(mirror), exist_ok=True)
+            ret, result = await orchestrator.run_process(
+                ["git", "init", "--quiet", "--bare", mirror])
+            if ret != 0:
+                return ret, result
+            print("  --> Create mirror: " + mirror)
+        for key, value in MIRROR_CONFIG + [("cache.url", url)]:
+            ret, result = await self.git(mirror, ["config", key, value])
+            if ret != 0:
+                return ret, result
+        return 0, mirror
+
+    async def resolve(self, url: str, ref: str):
+        """Get the cached commit of a branch or tag. Returns "" if not cached."""
+        mirror = self.mirror_path(url)
+        if os.path.isfile(os.path.join(mirror, "HEAD")) is False:
+            return ""
+        ret, result = await self.git(mirror, ["rev-parse", "--verify", "--quiet",
+                                              CACHE_REF_PREFIX + ref + "^{commit}"])
+        return result.strip() if ret == 0 else ""
+
+    async def fetch(self, url: str, ref: str):
+        """Fetch only the tip of a branch or tag into the mirror. Returns (ret, commit)."""
+        ret, result = await self.init_mirror(url)
+        if ret != 0:
+            return ret, result
+        ret, result = await self.git(
+            self.mirror_path(url),
+            ["fetch", "--quiet", "--no-progress", "--depth", "1", "--no-tags", "--force",
+             url, "+" + ref + ":" + CACHE_REF_PREFIX + ref])
+        if ret != 0:
+            return ret, result
+        commit = await self.resolve(url, ref)
+        if commit == "":
+            return 1, "Not found: " + ref
+        print("  --> Fetch " + url + "(" + ref + ") " + commit[:12])
+        return 0, commit
+
+    async def export(self, url: str, commit: str, dest: str):
+        """Copy the files of a cached commit into a directory."""
+        tmp_path = os.path.join(self._cache_dir, "export-" + commit + ".tar")
+        ret, result = await self.git(self.mirror_path(url),
+                                     ["archive", "--format=tar", "-o", tmp_path, commit])
+        if ret == 0:
+            try:
+                extract_tar(tmp_path, dest)
+            except (OSError, tarfile.TarError) as e:
+                ret, result = 1, str(e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return ret, result
+
+    async def checkout(self, url: str, ref: str, dest: str, refresh: bool = False,
+                       offline: bool = False, archive: str = ""):
+        """Put a branch or tag of a repository in a directory."""
+        record = load_record(dest)
+        try:
+            if archive != "":
+                return self.checkout_archive(archive, dest, record, refresh)
+            if (refresh is False and os.path.isdir(dest) and record.get("url") == url
+                    and record.get("ref") == ref):
+                print("  --> exists directory: " + dest + "(" + record["commit"][:12] + ")")
+                return 0
+            commit = ""
+            if refresh is False or offline is True:
+                commit = await self.resolve(url, ref)
+            if commit == "" and offline is True:
+                if os.path.isdir(dest) and refresh is False:
+                    print("  --> Not in the mirror cache, use the directory as is: " + dest)
+                    return 0
+                print("  [ERROR] Not in the mirror cache: " + url + "(" + ref + ")")
+                return 1
+            if commit == "":
+                ret, result = await self.fetch(url, ref)
+                if ret != 0:
+                    # Fall back on the cached commit when the network is not available.
+                    commit = await self.resolve(url, ref)
+                    if commit == "":
+                        print("  [ERROR] Failed to fetch " + url + "(" + ref + ") "
+                              + result.strip())
+                        return ret
+                    print("  --> Fetch failed, use the cached commit: " + commit[:12])
+                else:
+                    commit = result
+            else:
+                print("  --> Use the mirror cache: " + url + "(" + ref + ") " + commit[:12])
+            if (refresh is False and os.path.isdir(dest) and record.get("url") == url
+                    and record.get("commit") == commit):
+                print("  --> Up to date: " + dest)
+                return 0
+            self.clear(dest)
+            ret, result = await self.export(url, commit, dest)
+            if ret != 0:
+                print("  [ERROR] " + result.strip())
+                return ret
+            save_record(dest, {"url": url, "ref": ref, "commit": commit})
+            print("  --> Copy " + commit[:12] + " to " + dest)
+        except OSError as e:
+            print("  [ERROR] " + str(e))
+            return 1
+        return 0
+
+    def checkout_archive(self, archive: str, dest: str, record: dict, refresh: bool):
+        """Put the files of a tarball in a directory."""
+        digest = build_cache.hash_file(archive)
+        if refresh is False and os.path.isdir(dest) and record.get("archive") == digest:
+            print("  --> Up to date: " + dest)
+            return 0
+        self.clear(dest)
+        try:
+            extract_tar(archive, dest, strip_top=True)
+        except tarfile.TarError as e:
+            print("  [ERROR] " + str(e))
+            return 1
+        save_record(dest, {"archive": digest, "path": os.path.abspath(archive)})
+        print("  --> Extract " + archive + " to " + dest)
+        return 0
+
+    def clear(self, dest: str):
+        """Remove a checkout and its record."""
+        if os.path.exists(dest):
+            print("  --> Remove directory: " + dest)
+            shutil.rmtree(dest)
+        if os.path.exists(record_path(dest)):
+            os.remove(record_path(dest))
+        os.makedirs(dest)
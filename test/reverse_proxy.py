@@ -0,0 +1,667 @@
+"""This is a script to front the preview servers with one reverse proxy."""
+# SYSTEM: Python 3.11.1
+#
+# これは、複数のプレビューサーバーを1つのポートで中継するリバースプロキシです。
+# (src/node/proxy.js の置き換え)
+#
+# このスクリプトは、以下の内容を実行します。
+# * Hostヘッダー(test.local など)またはパスの先頭(/docs/ など)で中継先を選ぶ
+# * 中継先は --route, ルートファイル(JSON), preview_farm.pyのプレビュー
+#   (<名前>.localhost)から作成し、ファイルが変わると読み直す
+# * 中継先とのコネクションはKeep-Aliveでプールして使い回す
+# * リクエストとレスポンスの本文はバッファリングせずに転送(chunked, Upgradeにも対応)
+# * --cache_mb の場合は、静的なレスポンスを短時間(--cache_ttl)メモリにキャッシュ
+# * プレビューへのアクセス時刻を記録し、preview_farm.pyの削除の順序(LRU)に反映
+
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+import collections
+import http
+
+import static_server
+
+__version__ = "0.0.1"
+ROUTE_CHECK_SECONDS = 1.0
+ACCESS_SAVE_SECONDS = 5.0
+CONNECT_TIMEOUT = 5.0
+IDLE_SECONDS = 30.0
+MAX_IDLE_CONNECTIONS = 8
+CHUNK_SIZE = 64 * 1024
+HOP_HEADERS = ("connection", "keep-alive", "proxy-connection", "proxy-authenticate",
+               "proxy-authorization", "te", "trailer", "upgrade")
+parser = argparse.ArgumentParser(
+    description="Reverse proxy in front of the preview servers"
+)
+parser.add_argument("-v", "--version", action="version",
+                    version="%(prog)s ver." + __version__)
+parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on")
+parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+parser.add_argument("--route", type=str, action="append", default=[],
+                    help="Route like test.local=127.0.0.1:4000 or /docs/=127.0.0.1:8100")
+parser.add_argument("--routes", type=str, default="",
+                    help='JSON file of the routes ({"test.local": "127.0.0.1:4000", ...})')
+parser.add_argument("--root_dir", type=str,
+                    default=os.path.abspath(os.path.join(
+                        os.path.dirname(__file__), "./..")),
+                    help="Root directory")
+parser.add_argument("--farm_dir", type=str, default="_previews",
+                    help="Route <name>.<domain> to the previews of preview_farm.py ('': none)")
+parser.add_argument("--domain", type=str, default="localhost",
+                    help="Domain of the preview host names")
+parser.add_argument("--timeout", type=float, default=60.0,
+                    help="Seconds to wait for the response of a backend")
+parser.add_argument("--cache_mb", type=int, default=0,
+                    help="Memory cache size of the static responses (MB, 0: no cache)")
+parser.add_argument("--cache_ttl", type=float, default=2.0,
+                    help="Seconds a cached response is used without asking the backend")
+
+
+def parse_backend(text: str):
+    """Parse a backend like 127.0.0.1:4000, http://host:port or 4000. Returns (host, port)."""
+    text = text.strip()
+    if text.startswith("http://"):
+        text = text[len("http://"):]
+    text = text.split("/")[0]
+    host, sep, port = text.rpartition(":")
+    if sep == "":
+        host, port = "", text
+    if port.isdigit() is False:
+        raise ValueError("Invalid backend: " + text)
+    return host.strip("[]") or "127.0.0.1", int(port)
+
+
+def parse_head(head: bytes):
+    """Split an HTTP head into the first line and the (name, value) list."""
+    lines = head.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep != "" and name.strip() != "":
+            headers.append((name.strip(), value.strip()))
+    return lines[0].split(" ", 2), headers
+
+
+def header_value(headers: list, name: str, default: str = ""):
+    """Get the (comma joined) value of a header."""
+    values = [value for key, value in headers if key.lower() == name]
+    return ", ".join(values) if len(values) > 0 else default
+
+
+def end_to_end(headers: list):
+    """Remove the hop-by-hop headers (and the ones named in Connection)."""
+    named = set(token.strip().lower()
+                for token in header_value(headers, "connection").split(","))
+    return [(name, value) for name, value in headers
+            if name.lower() not in HOP_HEADERS and name.lower() not in named]
+
+
+def format_head(first_line: str, headers: list):
+    """Format an HTTP head."""
+    return (first_line + "\r\n" + "".join(name + ": " + value + "\r\n"
+                                          for name, value in headers) + "\r\n").encode("latin-1")
+
+
+async def copy_exact(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     length: int, sink: list = None):
+    """Copy a body of a known length."""
+    while length > 0:
+        chunk = await reader.read(min(CHUNK_SIZE, length))
+        if chunk == b"":
+            raise asyncio.IncompleteReadError(b"", length)
+        writer.write(chunk)
+        if sink is not None:
+            sink.append(chunk)
+        await writer.drain()
+        length -= len(chunk)
+
+
+async def copy_chunked(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Copy a chunked body as it is (with the chunk sizes and the trailers)."""
+    while True:
+        line = await reader.readuntil(b"\r\n")
+        writer.write(line)
+        size = int(line.split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                writer.write(line)
+                if line == b"\r\n":
+                    break
+            await writer.drain()
+            return
+        await copy_exact(reader, writer, size + 2)
+
+
+async def copy_until_eof(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Copy until the connection is closed."""
+    while True:
+        chunk = await reader.read(CHUNK_SIZE)
+        if chunk == b"":
+            return
+        writer.write(chunk)
+        await writer.drain()
+
+
+class RouteTable:
+    """Routes by host name and path prefix, reloaded when their files change."""
+    _static = {}
+    _routes_path = ""
+    _farm_dir = ""
+    _domain = "localhost"
+    _hosts = {}
+    _prefixes = []
+    _previews = {}
+    _signature = None
+    _checked = 0.0
+
+    def __init__(self, routes: list = (), routes_path: str = "", farm_dir: str = "",
+                 domain: str = "localhost"):
+        """Initialize the class. routes are "key=backend" strings."""
+        self._static = {}
+        for route in routes:
+            key, sep, backend = route.partition("=")
+            if sep == "":
+                raise ValueError("Invalid route: " + route)
+            self._static[key.strip()] = parse_backend(backend)
+        self._routes_path = os.path.abspath(routes_path) if routes_path != "" else ""
+        self._farm_dir = os.path.abspath(farm_dir) if farm_dir != "" else ""
+        self._domain = domain.strip(".").lower()
+        self._hosts = {}
+        self._prefixes = []
+        self._previews = {}
+        self._signature = None
+        self._checked = 0.0
+        self.reload()
+
+    @property
+    def farm_dir(self):
+        """Get the folder of the previews ("" if not used)."""
+        return self._farm_dir
+
+    def routes(self):
+        """List the (route, backend) pairs."""
+        items = [(host, backend) for host, backend in sorted(self._hosts.items())]
+        return items + [(prefix, backend) for prefix, backend in self._prefixes]
+
+    def signature(self):
+        """Get the modification times of the route files."""
+        paths = [self._routes_path]
+        if self._farm_dir != "":
+            paths.append(os.path.join(self._farm_dir, "farm.json"))
+        result = []
+        for path in paths:
+            try:
+                result.append(os.stat(path).st_mtime_ns if path != "" else 0)
+            except OSError:
+                result.append(None)
+        return result
+
+    def reload(self):
+        """Read the route files again if they changed."""
+        now = time.monotonic()
+        if self._signature is not None and now - self._checked < ROUTE_CHECK_SECONDS:
+            return False
+        self._checked = now
+        signature = self.signature()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        routes = {}
+        self._previews = {}
+        if self._farm_dir != "":
+            for name, preview in self.load_json(
+                    os.path.join(self._farm_dir, "farm.json")).get("previews", {}).items():
+                host = (name + "." + self._domain).lower()
+                routes[host] = (preview.get("host", "127.0.0.1"), int(preview["port"]))
+                self._previews[host] = name
+        if self._routes_path != "":
+            for key, backend in self.load_json(self._routes_path).items():
+                routes[key] = parse_backend(str(backend))
+        routes.update(self._static)
+        self._hosts = {key.lower(): backend for key, backend in routes.items()
+                       if key.startswith("/") is False}
+        # The longest prefix is matched first.
+        self._prefixes = sorted([(key, backend) for key, backend in routes.items()
+                                 if key.startswith("/")], key=lambda item: -len(item[0]))
+        return True
+
+    def load_json(self, path: str):
+        """Load a JSON file. Returns {} if it cannot be read."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def match(self, host: str, path: str):
+        """Find the backend of a request. Returns (backend, preview name) or (None, "")."""
+        self.reload()
+        host = host.lower()
+        if host.startswith("[") is False:
+            host = host.rsplit(":", 1)[0]
+        if host in self._hosts:
+            return self._hosts[host], self._previews.get(host, "")
+        for prefix, backend in self._prefixes:
+            if path == prefix.rstrip("/") or path.startswith(prefix):
+                return backend, ""
+        return None, ""
+
+
+class UpstreamPool:
+    """Idle keep-alive connections to the backends."""
+    _idle = {}
+
+    def __init__(self):
+        """Initialize the class."""
+        self._idle = {}
+
+    async def acquire(self, backend: tuple):
+        """Get a connection to a backend. Returns (reader, writer, reused)."""
+        idle = self._idle.get(backend)
+        while idle:
+            reader, writer, since = idle.pop()
+            if (time.monotonic() - since < IDLE_SECONDS and writer.is_closing() is False
+                    and reader.at_eof() is False):
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*backend),
+                                                CONNECT_TIMEOUT)
+        return reader, writer, False
+
+    def release(self, backend: tuple, reader: asyncio.StreamReader,
+                writer: asyncio.StreamWriter):
+        """Keep a connection for the next request."""
+        idle = self._idle.setdefault(backend, [])
+        if len(idle) >= MAX_IDLE_CONNECTIONS or writer.is_closing():
+            writer.close()
+            return
+        idle.append((reader, writer, time.monotonic()))
+
+    def close(self):
+        """Close the idle connections."""
+        for idle in self._idle.values():
+            for _reader, writer, _since in idle:
+                writer.close()
+        self._idle = {}
+
+
+class ResponseCache:
+    """Short-lived LRU memory cache of static responses."""
+    _entries = None
+    _max_bytes = 0
+    _ttl = 2.0
+    _bytes = 0
+    _stats = {}
+
+    def __init__(self, max_bytes: int, ttl: float):
+        """Initialize the class."""
+        self._entries = collections.OrderedDict()
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0}
+
+    @property
+    def stats(self):
+        """Get the number of hits and misses."""
+        return self._stats
+
+    @property
+    def max_entry(self):
+        """Get the largest response that is cached."""
+        return self._max_bytes // 8
+
+    def get(self, key: tuple):
+        """Get a fresh response. Returns (status, headers, body) or None."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return entry[1:]
+
+    def put(self, key: tuple, status: int, headers: list, body: bytes):
+        """Store a response."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[3])
+        self._entries[key] = (time.monotonic() + self._ttl, status, headers, body)
+        self._bytes += len(body)
+        while self._bytes > self._max_bytes and len(self._entries) > 0:
+            _key, entry = self._entries.popitem(last=False)
+            self._bytes -= len(entry[3])
+
+    @staticmethod
+    def cacheable(method: str, request_headers: list, status: int, headers: list):
+        """Check whether a response may be stored."""
+        if method != "GET" or status != 200:
+            return False
+        if header_value(request_headers, "authorization") or header_value(request_headers,
+                                                                          "range"):
+            return False
+        control = header_value(headers, "cache-control").lower()
+        vary = header_value(headers, "vary").lower()
+        return (header_value(headers, "set-cookie") == ""
+                and header_value(headers, "content-length").isdigit()
+                and all(word not in control for word in ("no-store", "private"))
+                and vary in ("", "accept-encoding"))
+
+
+class ReverseProxy:
+    """asyncio reverse proxy with pooled upstream connections."""
+    _routes = None
+    _host = "127.0.0.1"
+    _port = 8080
+    _timeout = 60.0
+    _pool = None
+    _cache = None
+    _server = None
+    _access = {}
+    _access_dirty = False
+
+    def __init__(self, routes: RouteTable, host: str, port: int, timeout: float = 60.0,
+                 cache_bytes: int = 0, cache_ttl: float = 2.0):
+        """Initialize the class. cache_bytes=0 disables the response cache."""
+        self._routes = routes
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._pool = UpstreamPool()
+        self._cache = ResponseCache(cache_bytes, cache_ttl) if cache_bytes > 0 else None
+        self._access = {}
+        self._access_dirty = False
+
+    @property
+    def cache(self):
+        """Get the response cache (None if not used)."""
+        return self._cache
+
+    async def start(self):
+        """Start listening."""
+        self._server = await asyncio.start_server(self.handle, self._host, self._port,
+                                                  limit=static_server.MAX_HEADER_SIZE)
+        return self._server
+
+    async def serve_forever(self):
+        """Serve until cancelled."""
+        if self._server is None:
+            await self.start()
+        saver = asyncio.ensure_future(self.save_access_loop())
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            saver.cancel()
+            self.save_access()
+
+    def close(self):
+        """Stop listening and close the upstream connections."""
+        if self._server is not None:
+            self._server.close()
+        self._pool.close()
+
+    # =========================================================
+    # Access times of the previews (read by preview_farm.py)
+    def save_access(self):
+        """Save the access times of the previews."""
+        if self._access_dirty is False or self._routes.farm_dir == "":
+            return
+        path = os.path.join(self._routes.farm_dir, "access.json")
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self._access, f, indent=1, sort_keys=True)
+            os.replace(path + ".tmp", path)
+            self._access_dirty = False
+        except OSError as e:
+            print("  [WARNING] " + str(e))
+
+    async def save_access_loop(self):
+        """Save the access times regularly."""
+        while True:
+            await asyncio.sleep(ACCESS_SAVE_SECONDS)
+            self.save_access()
+
+    # =========================================================
+    # Requests
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handle the requests of a client connection."""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"),
+                                                  static_server.KEEP_ALIVE_SECONDS)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        asyncio.TimeoutError):
+                    break
+                request_line, headers = parse_head(head)
+                if len(request_line) != 3 or request_line[2].startswith("HTTP/") is False:
+                    self.send(writer, 400, b"Bad Request\n", False)
+                    break
+                keep_alive = await self.forward(reader, writer, request_line, headers)
+                await writer.drain()
+                if keep_alive is False:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def send(self, writer: asyncio.StreamWriter, status: int, body: bytes,
+             keep_alive: bool):
+        """Write a response of the proxy itself."""
+        headers = [("Content-Type", "text/plain; charset=utf-8"),
+                   ("Content-Length", str(len(body))),
+                   ("Connection", "keep-alive" if keep_alive else "close")]
+        writer.write(format_head("HTTP/1.1 %d %s" % (status, http.HTTPStatus(status).phrase),
+                                 headers) + body)
+
+    async def forward(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                      request_line: list, headers: list):
+        """Forward a request to its backend. Returns False to close the connection."""
+        method, target, version = request_line
+        connection = header_value(headers, "connection").lower()
+        keep_alive = ("close" not in connection if version == "HTTP/1.1"
+                      else "keep-alive" in connection)
+        host = header_value(headers, "host")
+        backend, preview = self._routes.match(host, target.split("?")[0])
+        has_body = (header_value(headers, "content-length", "0") not in ("", "0")
+                    or "chunked" in header_value(headers, "transfer-encoding").lower())
+        if backend is None:
+            routes = "".join("  " + key + " -> " + backend[0] + ":" + str(backend[1]) + "\n"
+                             for key, backend in self._routes.routes())
+            if has_body:
+                keep_alive = False
+            self.send(writer, 404, ("No route: " + host + target + "\n" + routes)
+                      .encode("utf-8"), keep_alive)
+            return keep_alive
+        if preview != "":
+            self._access[preview] = time.time()
+            self._access_dirty = True
+
+        # Responses from the cache
+        cache_key = None
+        if self._cache is not None and method == "GET" and has_body is False:
+            cache_key = (backend, target, header_value(headers, "accept-encoding"))
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self.send_cached(writer, cached, headers, keep_alive)
+                return keep_alive
+
+        upgrade = header_value(headers, "upgrade")
+        forwarded = end_to_end(headers)
+        client = writer.get_extra_info("peername")
+        forwarded_for = header_value(headers, "x-forwarded-for")
+        if client:
+            forwarded_for = (forwarded_for + ", " if forwarded_for else "") + str(client[0])
+        forwarded = [(name, value) for name, value in forwarded
+                     if name.lower() not in ("x-forwarded-for", "x-forwarded-host",
+                                             "x-forwarded-proto")]
+        forwarded += [("X-Forwarded-For", forwarded_for), ("X-Forwarded-Host", host),
+                      ("X-Forwarded-Proto", "http")]
+        if upgrade != "":
+            forwarded += [("Connection", "Upgrade"), ("Upgrade", upgrade)]
+        else:
+            forwarded.append(("Connection", "keep-alive"))
+        upstream_head = format_head(method + " " + target + " HTTP/1.1", forwarded)
+
+        # A pooled connection may have been closed by the backend in the meantime.
+        # Then the request is sent again on a new connection (if it has no body).
+        for attempt in range(2):
+            try:
+                up_reader, up_writer, reused = await self._pool.acquire(backend)
+            except (OSError, asyncio.TimeoutError) as e:
+                if has_body:
+                    keep_alive = False
+                self.send(writer, 502, ("Bad Gateway: " + backend[0] + ":" + str(backend[1])
+                                        + " (" + (str(e) or "timeout") + ")\n")
+                          .encode("utf-8"), keep_alive)
+                return keep_alive
+            try:
+                up_writer.write(upstream_head)
+                if has_body:
+                    await self.copy_request_body(reader, up_writer, headers)
+                await up_writer.drain()
+                response_head = await asyncio.wait_for(up_reader.readuntil(b"\r\n\r\n"),
+                                                       self._timeout)
+                break
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                up_writer.close()
+                if reused and has_body is False and attempt == 0:
+                    continue
+                self.send(writer, 502, ("Bad Gateway: " + str(e) + "\n").encode("utf-8"),
+                          False)
+                return False
+            except asyncio.TimeoutError:
+                up_writer.close()
+                self.send(writer, 504, b"Gateway Timeout\n", False)
+                return False
+
+        status_line, response_headers = parse_head(response_head)
+        status = int(status_line[1])
+        if status == 101:
+            # Switch to a tunnel (WebSocket and so on).
+            writer.write(response_head)
+            await writer.drain()
+            await self.tunnel(reader, writer, up_reader, up_writer)
+            return False
+        return await self.relay_response(writer, method, headers, status_line,
+                                         response_headers, up_reader, up_writer, backend,
+                                         keep_alive, cache_key)
+
+    async def copy_request_body(self, reader: asyncio.StreamReader,
+                                up_writer: asyncio.StreamWriter, headers: list):
+        """Stream the body of a request to the backend."""
+        if "chunked" in header_value(headers, "transfer-encoding").lower():
+            await copy_chunked(reader, up_writer)
+        else:
+            await copy_exact(reader, up_writer, int(header_value(headers, "content-length")))
+
+    async def relay_response(self, writer: asyncio.StreamWriter, method: str,
+                             request_headers: list, status_line: list, headers: list,
+                             up_reader: asyncio.StreamReader, up_writer: asyncio.StreamWriter,
+                             backend: tuple, keep_alive: bool, cache_key: tuple):
+        """Stream the response of the backend to the client."""
+        status = int(status_line[1])
+        upstream_close = ("close" in header_value(headers, "connection").lower()
+                          or status_line[0] == "HTTP/1.0")
+        length = header_value(headers, "content-length")
+        chunked = "chunked" in header_value(headers, "transfer-encoding").lower()
+        no_body = method == "HEAD" or status in (204, 304) or 100 <= status < 200
+        until_eof = no_body is False and chunked is False and length.isdigit() is False
+        if until_eof:
+            # The end of the body is the end of the connection.
+            keep_alive = False
+            upstream_close = True
+        out_headers = end_to_end(headers)
+        out_headers.append(("Connection", "keep-alive" if keep_alive else "close"))
+        writer.write(format_head("HTTP/1.1 " + " ".join(status_line[1:]), out_headers))
+        sink = None
+        if (cache_key is not None and no_body is False
+                and ResponseCache.cacheable(method, request_headers, status, headers)
+                and int(length) <= self._cache.max_entry):
+            sink = []
+        try:
+            if no_body is False:
+                if chunked:
+                    await copy_chunked(up_reader, writer)
+                elif until_eof:
+                    await copy_until_eof(up_reader, writer)
+                else:
+                    await copy_exact(up_reader, writer, int(length), sink)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            up_writer.close()
+            return False
+        if upstream_close:
+            up_writer.close()
+        else:
+            self._pool.release(backend, up_reader, up_writer)
+        if sink is not None:
+            self._cache.put(cache_key, status, out_headers[:-1], b"".join(sink))
+        return keep_alive
+
+    def send_cached(self, writer: asyncio.StreamWriter, cached: tuple,
+                    request_headers: list, keep_alive: bool):
+        """Send a response from the cache."""
+        status, headers, body = cached
+        headers = headers + [("Connection", "keep-alive" if keep_alive else "close")]
+        etag = header_value(headers, "etag")
+        tags = [tag.strip() for tag in header_value(request_headers, "if-none-match").split(",")]
+        if etag != "" and etag in tags:
+            headers = [(name, value) for name, value in headers
+                       if name.lower() != "content-length"]
+            writer.write(format_head("HTTP/1.1 304 Not Modified", headers))
+            return
+        writer.write(format_head("HTTP/1.1 %d %s" % (status, http.HTTPStatus(status).phrase),
+                                 headers))
+        writer.write(body)
+
+    async def tunnel(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     up_reader: asyncio.StreamReader, up_writer: asyncio.StreamWriter):
+        """Copy both directions until one side closes."""
+        tasks = [asyncio.ensure_future(copy_until_eof(reader, up_writer)),
+                 asyncio.ensure_future(copy_until_eof(up_reader, writer))]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            up_writer.close()
+
+
+async def serve(ap):
+    """Start the reverse proxy."""
+    farm_dir = os.path.join(ap.root_dir, ap.farm_dir) if ap.farm_dir != "" else ""
+    routes = RouteTable(ap.route, ap.routes, farm_dir, ap.domain)
+    proxy = ReverseProxy(routes, ap.host, ap.port, ap.timeout, ap.cache_mb * 1024 * 1024,
+                         ap.cache_ttl)
+    await proxy.start()
+    print("[## Reverse proxy] http://" + ap.host + ":" + str(ap.port) + "/")
+    for key, backend in routes.routes():
+        print("  --> " + key + " -> " + backend[0] + ":" + str(backend[1]))
+    if farm_dir != "":
+        print("  --> Previews: http://<name>." + ap.domain + ":" + str(ap.port) + "/ ("
+              + os.path.abspath(farm_dir) + ")")
+    try:
+        await proxy.serve_forever()
+    finally:
+        proxy.close()
+    return 0
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    try:
+        sys.exit(asyncio.run(serve(args)))
+    except KeyboardInterrupt:
+        print("  --> Stop server")
+        sys.exit(0)
+    except Exception as e:
+        print("[ERROR] " + str(e))
+        sys.exit(1)
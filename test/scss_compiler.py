@@ -0,0 +1,249 @@
+"""This is a module to compile the stylesheets of the docs tree."""
+# SYSTEM: Python 3.11.1
+#
+# これは、docsフォルダのスタイルシート(SCSS, LESS)をCSSに変換するためのモジュールです。
+#
+# このモジュールは、以下の記法に対応します。
+# * ネストしたルール, 親セレクタ(&)
+# * 変数($name: value; LESSの場合は@name: value;)
+# * @import(同じフォルダのパーシャル)
+# * @media, @page などのアットルール
+
+import os
+import re
+
+VARIABLE_PATTERN = re.compile(r'\$([\w-]+)')
+LESS_VARIABLE_PATTERN = re.compile(r'@([\w-]+)')
+LESS_DEFINITION = re.compile(r'^@([\w-]+)\s*:(.*)$', re.DOTALL)
+NESTED_AT_RULES = ("@media", "@supports")
+
+
+def strip_front_matter(text: str):
+    """Remove the Jekyll front matter."""
+    match = re.match(r'^---[ \t]*\r?\n.*?^---[ \t]*\r?\n', text, re.MULTILINE | re.DOTALL)
+    if match is not None:
+        return text[match.end():]
+    return text
+
+
+def strip_comments(text: str):
+    """Remove the block and line comments outside of strings."""
+    out = []
+    i = 0
+    quote = ""
+    while i < len(text):
+        c = text[i]
+        if quote != "":
+            out.append(c)
+            if c == "\\" and i + 1 < len(text):
+                out.append(text[i + 1])
+                i += 1
+            elif c == quote:
+                quote = ""
+        elif c in "\"'":
+            quote = c
+            out.append(c)
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = len(text) if end < 0 else end + 2
+            continue
+        elif text.startswith("//", i) and (i == 0 or text[i - 1] != ":"):
+            end = text.find("\n", i)
+            i = len(text) if end < 0 else end
+            continue
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def combine_selectors(parent: str, child: str):
+    """Combine a parent selector and a nested selector."""
+    if parent == "":
+        return ", ".join(s.strip() for s in child.split(","))
+    result = []
+    for p in [s.strip() for s in parent.split(",")]:
+        for c in [s.strip() for s in child.split(",")]:
+            if "&" in c:
+                result.append(c.replace("&", p))
+            else:
+                result.append(p + " " + c)
+    return ", ".join(result)
+
+
+class ScssCompiler:
+    """Compile SCSS (or the same subset of LESS) to CSS."""
+    _load_paths = []
+    _syntax = "scss"
+    _variables = {}
+    _imported = []
+    _warnings = []
+
+    def __init__(self, load_paths: list = None, syntax: str = "scss"):
+        """Initialize the class. syntax is "scss" or "less"."""
+        self._load_paths = list(load_paths or [])
+        self._syntax = syntax
+        self._variables = {}
+        self._imported = []
+        self._warnings = []
+
+    @property
+    def imported(self):
+        """Get the files read by the last compilation."""
+        return self._imported
+
+    @property
+    def warnings(self):
+        """Get the warnings of the last compilation."""
+        return self._warnings
+
+    def compile_file(self, path: str):
+        """Compile a SCSS file."""
+        self._variables = {}
+        self._imported = [os.path.abspath(path)]
+        self._warnings = []
+        with open(path, "r", encoding="utf-8") as f:
+            text = strip_front_matter(f.read())
+        items = self._parse(text, os.path.dirname(os.path.abspath(path)))
+        return self._emit(items)
+
+    def compile_string(self, text: str, base_dir: str = "."):
+        """Compile a SCSS string."""
+        self._variables = {}
+        self._imported = []
+        self._warnings = []
+        items = self._parse(strip_front_matter(text), base_dir)
+        return self._emit(items)
+
+    # =========================================================
+    # Parse
+    def _parse(self, text: str, base_dir: str):
+        items, _pos = self._parse_block(strip_comments(text), 0, base_dir)
+        return items
+
+    def _parse_block(self, text: str, pos: int, base_dir: str):
+        items = []
+        buffer = ""
+        quote = ""
+        depth = 0
+        while pos < len(text):
+            c = text[pos]
+            pos += 1
+            if quote != "":
+                buffer += c
+                if c == quote:
+                    quote = ""
+                continue
+            if c in "\"'":
+                quote = c
+                buffer += c
+            elif c == "(":
+                depth += 1
+                buffer += c
+            elif c == ")":
+                depth -= 1
+                buffer += c
+            elif c == ";" and depth == 0:
+                items.extend(self._statement(buffer.strip(), base_dir))
+                buffer = ""
+            elif c == "{" and depth == 0:
+                children, pos = self._parse_block(text, pos, base_dir)
+                items.append(("block", " ".join(buffer.split()), children))
+                buffer = ""
+            elif c == "}" and depth == 0:
+                break
+            else:
+                buffer += c
+        if buffer.strip() != "":
+            items.extend(self._statement(buffer.strip(), base_dir))
+        return items, pos
+
+    def _statement(self, statement: str, base_dir: str):
+        if statement == "":
+            return []
+        if statement.startswith("$"):
+            name, _sep, value = statement[1:].partition(":")
+            value = value.replace("!default", "").strip()
+            self._variables[name.strip()] = self._substitute(value)
+            return []
+        definition = LESS_DEFINITION.match(statement) if self._syntax == "less" else None
+        if definition is not None:
+            self._variables[definition.group(1)] = self._substitute(definition.group(2).strip())
+            return []
+        if statement.startswith("@import"):
+            return self._import(statement, base_dir)
+        return [("decl", self._substitute(" ".join(statement.split())))]
+
+    def _import(self, statement: str, base_dir: str):
+        items = []
+        for name in re.findall(r'["\']([^"\']+)["\']', statement):
+            if name.endswith(".css") or name.startswith(("http:", "https:", "//")):
+                items.append(("decl", '@import "' + name + '"'))
+                continue
+            path = self._find_import(name, base_dir)
+            if path is None:
+                self._warnings.append("Not found @import: " + name)
+                continue
+            self._imported.append(path)
+            with open(path, "r", encoding="utf-8") as f:
+                text = strip_front_matter(f.read())
+            items.extend(self._parse(text, os.path.dirname(path)))
+        return items
+
+    def _find_import(self, name: str, base_dir: str):
+        head, tail = os.path.split(name)
+        ext = "." + self._syntax
+        candidates = []
+        for directory in [base_dir] + self._load_paths:
+            for file_name in (tail, tail + ext, "_" + tail, "_" + tail + ext,
+                              tail + ".css"):
+                candidates.append(os.path.join(directory, head, file_name))
+        for path in candidates:
+            if os.path.isfile(path):
+                return os.path.abspath(path)
+        return None
+
+    def _substitute(self, value: str):
+        pattern = LESS_VARIABLE_PATTERN if self._syntax == "less" else VARIABLE_PATTERN
+        return pattern.sub(lambda m: self._variables.get(m.group(1), m.group(0)), value)
+
+    # =========================================================
+    # Emit
+    def _emit(self, items: list):
+        out = []
+        self._emit_rules(items, "", out)
+        return "\n\n".join(out) + ("\n" if len(out) > 0 else "")
+
+    def _emit_rules(self, items: list, selector: str, out: list):
+        declarations = []
+        nested = []
+        for item in items:
+            if item[0] == "decl":
+                if item[1].startswith("@") and selector == "":
+                    out.append(item[1] + ";")
+                else:
+                    declarations.append(item[1])
+            else:
+                nested.append(item)
+        if len(declarations) > 0 and selector != "":
+            out.append(self._format(selector, declarations))
+        for _kind, child_selector, children in nested:
+            if child_selector.startswith(NESTED_AT_RULES):
+                inner = []
+                self._emit_rules(children, selector, inner)
+                if len(inner) > 0:
+                    out.append(child_selector + " {\n"
+                               + "\n".join("  " + line if line != "" else line
+                                           for block in inner
+                                           for line in block.split("\n"))
+                               + "\n}")
+            elif child_selector.startswith("@"):
+                inner_decls = [c[1] for c in children if c[0] == "decl"]
+                out.append(self._format(child_selector, inner_decls))
+            else:
+                self._emit_rules(children, combine_selectors(selector, child_selector), out)
+
+    def _format(self, selector: str, declarations: list):
+        return (selector + " {\n"
+                + "".join("  " + d + ";\n" for d in declarations)
+                + "}")
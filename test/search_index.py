@@ -0,0 +1,424 @@
+"""This is a module to make the full-text search index of the built pages."""
+# SYSTEM: Python 3.11.1
+#
+# これは、ビルドしたページの全文検索インデックスを作成するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * ページを見出しごとのセクション(ページ, 見出しのアンカー, 本文)に分割
+# * 日本語は空白で区切れないため、文字のbi-gramで索引を作成(NFKCで正規化)
+# * 索引はbi-gramごとに(セクション番号の差分, 出現位置)をvarintで格納したバイナリ
+# * ページごとの解析結果は_site.cache/searchにキャッシュし、変更したページだけを再解析
+# * ブラウザ用の検索スクリプト(search.js)を出力(サーバーへの問い合わせは不要)
+
+import os
+import re
+import json
+import html
+import unicodedata
+
+import build_cache
+
+SEARCH_DIR = "search"
+INDEX_NAME = "index.bin"
+SCRIPT_NAME = "search.js"
+INDEX_MAGIC = b"HCSI"
+INDEX_VERSION = 1
+CACHE_VERSION = 1
+GRAM_SIZE = 2
+ARTICLE_PATTERN = re.compile(r'<article\b[^>]*>(.*)</article>', re.DOTALL | re.IGNORECASE)
+TITLE_PATTERN = re.compile(r'<title>(.*?)</title>', re.DOTALL | re.IGNORECASE)
+HEADING_PATTERN = re.compile(r'<h([1-6])\b([^>]*)>(.*?)</h\1\s*>', re.DOTALL | re.IGNORECASE)
+ID_PATTERN = re.compile(r'\bid\s*=\s*"([^"]*)"')
+SKIP_PATTERN = re.compile(r'<(script|style)\b.*?</\1\s*>', re.DOTALL | re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]*>')
+
+SEARCH_SCRIPT = """(function () {
+  "use strict";
+  var script = document.currentScript;
+  var indexUrl = script.getAttribute("data-index");
+  var input = document.getElementById("site-search");
+  var output = document.getElementById("site-search-results");
+  var MAX_RESULTS = 20;
+  var SNIPPET = 40;
+  var loading = null;
+  var timer = null;
+  if (input === null || output === null) {
+    return;
+  }
+
+  function normalize(text) {
+    return text.normalize("NFKC").toLowerCase().replace(/\\s+/g, " ").trim();
+  }
+
+  function decode(bytes) {
+    var pos = 0;
+    var decoder = new TextDecoder();
+    function varint() {
+      var value = 0, scale = 1, b;
+      do {
+        b = bytes[pos++];
+        value += (b & 0x7f) * scale;
+        scale *= 128;
+      } while (b & 0x80);
+      return value;
+    }
+    function text(length) {
+      var value = decoder.decode(bytes.subarray(pos, pos + length));
+      pos += length;
+      return value;
+    }
+    if (text(4) !== "HCSI" || bytes[pos++] !== 1) {
+      throw new Error("Unknown search index format");
+    }
+    var meta = JSON.parse(text(varint()));
+    var grams = new Map();
+    var count = varint();
+    for (var i = 0; i < count; i++) {
+      var key = text(varint());
+      var n = varint();
+      var postings = new Uint32Array(n * 2);
+      var section = 0;
+      for (var j = 0; j < n; j++) {
+        section += varint();
+        postings[j * 2] = section;
+        postings[j * 2 + 1] = varint();
+      }
+      grams.set(key, postings);
+    }
+    var lower = meta.sections.map(function (s) { return s[3].toLowerCase(); });
+    return {pages: meta.pages, sections: meta.sections, lower: lower, grams: grams};
+  }
+
+  function load() {
+    if (loading === null) {
+      loading = fetch(indexUrl).then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.status + " " + indexUrl);
+        }
+        return response.arrayBuffer();
+      }).then(function (buffer) {
+        return decode(new Uint8Array(buffer));
+      });
+    }
+    return loading;
+  }
+
+  function sectionsOf(index, term) {
+    // Returns Map(section -> offset of the first gram).
+    var chars = Array.from(term);
+    var hits = new Map();
+    if (chars.length < 2) {
+      index.grams.forEach(function (postings, key) {
+        if (key.indexOf(term) < 0) {
+          return;
+        }
+        for (var i = 0; i < postings.length; i += 2) {
+          if (!hits.has(postings[i])) {
+            hits.set(postings[i], postings[i + 1]);
+          }
+        }
+      });
+      return hits;
+    }
+    for (var g = 0; g + 1 < chars.length; g++) {
+      var postings = index.grams.get(chars[g] + chars[g + 1]);
+      if (postings === undefined) {
+        return new Map();
+      }
+      var next = new Map();
+      for (var i = 0; i < postings.length; i += 2) {
+        if (g === 0) {
+          next.set(postings[i], postings[i + 1]);
+        } else if (hits.has(postings[i])) {
+          next.set(postings[i], hits.get(postings[i]));
+        }
+      }
+      hits = next;
+      if (hits.size === 0) {
+        break;
+      }
+    }
+    return hits;
+  }
+
+  function search(index, query) {
+    var terms = normalize(query).split(" ").filter(function (t) { return t !== ""; });
+    if (terms.length === 0) {
+      return [];
+    }
+    var hits = null;
+    terms.forEach(function (term) {
+      var found = sectionsOf(index, term);
+      if (hits === null) {
+        hits = found;
+        return;
+      }
+      var both = new Map();
+      hits.forEach(function (offset, section) {
+        if (found.has(section)) {
+          both.set(section, offset);
+        }
+      });
+      hits = both;
+    });
+    var results = [];
+    hits.forEach(function (offset, section) {
+      // The grams only narrow the candidates, so check the whole terms.
+      // A term cannot start before the first occurrence of its first gram.
+      var text = index.lower[section];
+      var heading = index.sections[section][2].toLowerCase();
+      var at = text.indexOf(terms[0], offset);
+      var inHeading = heading.indexOf(terms[0]) >= 0;
+      if (at < 0 && !inHeading) {
+        return;
+      }
+      for (var t = 1; t < terms.length; t++) {
+        if (text.indexOf(terms[t]) < 0 && heading.indexOf(terms[t]) < 0) {
+          return;
+        }
+      }
+      at = Math.max(at, 0);
+      results.push({section: section, at: at, score: (inHeading ? 0 : 1e6) + at});
+    });
+    results.sort(function (a, b) { return a.score - b.score || a.section - b.section; });
+    return results.slice(0, MAX_RESULTS);
+  }
+
+  function show(index, results, query) {
+    output.textContent = "";
+    if (query.trim() === "") {
+      output.hidden = true;
+      return;
+    }
+    output.hidden = false;
+    if (results.length === 0) {
+      var empty = document.createElement("p");
+      empty.textContent = "見つかりませんでした";
+      output.appendChild(empty);
+      return;
+    }
+    var list = document.createElement("ul");
+    results.forEach(function (result) {
+      var section = index.sections[result.section];
+      var page = index.pages[section[0]];
+      var item = document.createElement("li");
+      var link = document.createElement("a");
+      link.href = page[0] + (section[1] !== "" ? "#" + section[1] : "");
+      link.textContent = page[1] + (section[2] !== "" ? " › " + section[2] : "");
+      var snippet = document.createElement("p");
+      var start = Math.max(0, result.at - SNIPPET);
+      snippet.textContent = (start > 0 ? "…" : "") + section[3].substr(start, SNIPPET * 3) +
+        (start + SNIPPET * 3 < section[3].length ? "…" : "");
+      item.appendChild(link);
+      item.appendChild(snippet);
+      list.appendChild(item);
+    });
+    output.appendChild(list);
+  }
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      var query = input.value;
+      load().then(function (index) {
+        if (query === input.value) {
+          show(index, search(index, query), query);
+        }
+      }).catch(function (error) {
+        output.hidden = false;
+        output.textContent = String(error);
+      });
+    }, 100);
+  });
+  input.addEventListener("focus", load, {once: true});
+  window.siteSearch = function (query) {
+    return load().then(function (index) { return search(index, query); });
+  };
+})();
+"""
+
+
+def normalize(text: str):
+    """Normalize text for indexing (NFKC, collapsed whitespace)."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def html_text(fragment: str):
+    """Get the plain text of an HTML fragment."""
+    return normalize(html.unescape(TAG_PATTERN.sub(" ", SKIP_PATTERN.sub(" ", fragment))))
+
+
+def page_url(out_path: str, baseurl: str = ""):
+    """Get the URL of a page."""
+    url = "/" + out_path
+    if url.endswith("/index.html"):
+        url = url[:-len("index.html")]
+    return baseurl + url
+
+
+def extract_sections(page: str):
+    """Split a rendered page into sections. Returns (title, [[anchor, heading, text]])."""
+    match = TITLE_PATTERN.search(page)
+    title = html_text(match.group(1)) if match is not None else ""
+    match = ARTICLE_PATTERN.search(page)
+    content = match.group(1) if match is not None else page
+    sections = []
+    anchor, heading, start = "", "", 0
+    for match in HEADING_PATTERN.finditer(content):
+        text = html_text(content[start:match.start()])
+        if text != "" or heading != "":
+            sections.append([anchor, heading, text])
+        id_match = ID_PATTERN.search(match.group(2))
+        anchor = html.unescape(id_match.group(1)) if id_match is not None else ""
+        heading = html_text(match.group(3))
+        start = match.end()
+    text = html_text(content[start:])
+    if text != "" or heading != "":
+        sections.append([anchor, heading, text])
+    return title, sections
+
+
+def ngrams(text: str):
+    """Get the character n-grams of a text. Returns {gram: first offset}."""
+    text = text.lower()
+    grams = {}
+    for i in range(len(text) - GRAM_SIZE + 1):
+        gram = text[i:i + GRAM_SIZE]
+        if " " not in gram and gram not in grams:
+            grams[gram] = i
+    return grams
+
+
+def encode_varint(value: int):
+    """Encode an unsigned integer as a LEB128 varint."""
+    data = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value == 0:
+            data.append(byte)
+            return bytes(data)
+        data.append(byte | 0x80)
+
+
+def encode_text(text: str):
+    """Encode a length-prefixed UTF-8 string."""
+    data = text.encode("utf-8")
+    return encode_varint(len(data)) + data
+
+
+def encode_index(pages: list, sections: list, postings: dict):
+    """Encode the search index.
+
+    pages: [[url, title]], sections: [[page, anchor, heading, text]],
+    postings: {gram: [(section, offset), ...]} sorted by section.
+    """
+    data = bytearray(INDEX_MAGIC)
+    data.append(INDEX_VERSION)
+    data += encode_text(json.dumps({"pages": pages, "sections": sections},
+                                   ensure_ascii=False, separators=(",", ":")))
+    data += encode_varint(len(postings))
+    for gram in sorted(postings):
+        data += encode_text(gram)
+        data += encode_varint(len(postings[gram]))
+        previous = 0
+        for section, offset in postings[gram]:
+            data += encode_varint(section - previous)
+            data += encode_varint(offset)
+            previous = section
+    return bytes(data)
+
+
+class SearchIndex:
+    """Search index updated page by page."""
+    _cache_path = ""
+    _pages = {}
+    _updated = 0
+
+    def __init__(self, cache_dir: str):
+        """Initialize the class."""
+        self._cache_path = os.path.join(os.path.abspath(cache_dir), "pages.json")
+        self._pages = {}
+        self._updated = 0
+
+    @property
+    def pages(self):
+        """Get the indexed pages."""
+        return self._pages
+
+    @property
+    def updated(self):
+        """Get the number of pages indexed since the cache was loaded."""
+        return self._updated
+
+    def load(self):
+        """Load the cached pages."""
+        self._pages = {}
+        self._updated = 0
+        try:
+            with open(self._cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self._pages = data["pages"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        """Save the pages to the cache."""
+        os.makedirs(os.path.dirname(self._cache_path), exist_ok=True)
+        with open(self._cache_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "pages": self._pages}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(self._cache_path + ".tmp", self._cache_path)
+
+    def update(self, out_path: str, url: str, page: str):
+        """Index a rendered page unless it is unchanged."""
+        digest = build_cache.hash_text(url + "\n" + page)
+        entry = self._pages.get(out_path)
+        if entry is not None and entry["hash"] == digest:
+            return False
+        title, sections = extract_sections(page)
+        grams = {}
+        for index, (anchor, heading, text) in enumerate(sections):
+            # Offsets point into the text; heading-only grams point at its start.
+            offsets = ngrams(text)
+            for gram in ngrams(heading):
+                offsets.setdefault(gram, 0)
+            for gram, offset in offsets.items():
+                grams.setdefault(gram, []).append([index, offset])
+        self._pages[out_path] = {"hash": digest, "url": url, "title": title,
+                                 "sections": sections, "grams": grams}
+        self._updated += 1
+        return True
+
+    def prune(self, out_paths: list):
+        """Remove the pages that are not in out_paths."""
+        keep = set(out_paths)
+        for out_path in list(self._pages):
+            if out_path not in keep:
+                del self._pages[out_path]
+
+    def encode(self):
+        """Merge the pages into the binary index."""
+        pages, sections, postings = [], [], {}
+        for out_path in sorted(self._pages):
+            entry = self._pages[out_path]
+            base = len(sections)
+            for anchor, heading, text in entry["sections"]:
+                sections.append([len(pages), anchor, heading, text])
+            pages.append([entry["url"], entry["title"]])
+            for gram, hits in entry["grams"].items():
+                postings.setdefault(gram, []).extend(
+                    (base + index, offset) for index, offset in hits)
+        return encode_index(pages, sections, postings)
+
+    def write(self, dst: str):
+        """Write the index and the search script into the site."""
+        out_dir = os.path.join(dst, SEARCH_DIR)
+        os.makedirs(out_dir, exist_ok=True)
+        data = self.encode()
+        with open(os.path.join(out_dir, INDEX_NAME), "wb") as f:
+            f.write(data)
+        with open(os.path.join(out_dir, SCRIPT_NAME), "w", encoding="utf-8") as f:
+            f.write(SEARCH_SCRIPT)
+        return len(data)
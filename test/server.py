@@ -7,11 +7,38 @@
 # * jekyll-build-pagesのDockerイメージを作成
 # * jekyll-build-pagesのDockerコンテナを作成
 #   * デーモンで起動する
+# * --engine native の場合は、Dockerを使わずにビルドしてサーバを起動
+#   (ファイルはメモリにキャッシュし、圧縮済みのファイル・304応答・Rangeに対応)
+# * --serve_only の場合は、ビルド済みの_siteフォルダを配信
+# * --watch の場合は、docsフォルダの変更を監視し、変更したページだけを再ビルドして
+#   ブラウザを自動で再読み込み
+# * 依存関係のない手順は並列に実行
+# * DockerはEngine API(Unixソケット)で操作し、使えない場合はdockerコマンドを使用
+#   (コンテナとイメージの一覧は最初に1回だけ取得し、以降の確認はメモリの状態から回答)
+# * --image_cache の場合は、Dockerfile, Gemfile, entrypoint.sh, Rubyのバージョンの
+#   ハッシュをイメージのタグにし、同じタグのイメージがあれば再利用
+#   (ない場合はレイヤーキャッシュを使用してビルドし、gemはボリュームに保存)
+# * 各手順と外部コマンドの時間・終了コード・出力のバイト数を表示し、--trace でトレース
+#   (JSON Lines / Chromeのトレース)、--metrics でPrometheusのテキスト形式に出力
+# * コンテナのログは前回表示した位置からの直近の行だけを表示(log_follower.py)
+#   * --wait_ready の場合は、Jekyllが待ち受けを開始するまで待つ
 
 import sys
 import os
+import time
+import asyncio
 import argparse
-import subprocess
+
+import build_cache
+import docker_api
+import docker_state
+import file_watcher
+import live_reload
+import log_follower
+import native_engine
+import orchestrator
+import static_server
+import tracing
 
 __version__ = "0.0.1"
 parser = argparse.ArgumentParser(
@@ -29,8 +56,33 @@ parser.add_argument("--container_name", type=str, default="server_jekyll",
                     help="Docker container name")
 parser.add_argument("--image_args_ruby_version", type=str, default="",
                     help="Ruby version")
+parser.add_argument("--docker_client", type=str, default="auto",
+                    choices=["auto", "api", "cli"],
+                    help="Control Docker through the Engine API socket or the docker command")
+parser.add_argument("--docker_socket", type=str, default="",
+                    help="Docker Engine API socket (default: DOCKER_HOST or /var/run/docker.sock)")
+parser.add_argument("--docker_events", action='store_true',
+                    help="Keep the Docker state up to date with the daemon's event stream")
 # options : Jekyll
 parser.add_argument("--port", type=int, default=8000, help="publish port")
+parser.add_argument("--host", type=str, default="127.0.0.1",
+                    help="Host address of the native server")
+parser.add_argument("--engine", type=str, default="docker", choices=["docker", "native"],
+                    help="Serve with Jekyll in Docker or with the built-in renderer")
+parser.add_argument("--jobs", type=int, default=0,
+                    help="Number of render processes of the native engine (0: CPU cores)")
+parser.add_argument("--plantuml", type=str, default="",
+                    help="PlantUML command of the native engine (default: PLANTUML or plantuml)")
+parser.add_argument("--shared_cache", type=str, default="",
+                    help="Diagram and image cache shared by several sites (native engine)")
+parser.add_argument("--serve_only", action='store_true',
+                    help="Serve the output directory as it is, without building")
+parser.add_argument("--cache_mb", type=int, default=64,
+                    help="Memory cache size of the built-in server (MB)")
+parser.add_argument("--watch", action='store_true',
+                    help="Rebuild changed pages and reload the browser (native engine)")
+parser.add_argument("--poll", action='store_true',
+                    help="Watch by polling instead of inotify")
 parser.add_argument("--src_dir", type=str, default="docs",
                     help="Build directory")
 parser.add_argument("--output_dir", type=str, default="_site",
@@ -53,6 +105,23 @@ parser.add_argument("--setup", action='store_true',
                     help="Restart the container")
 parser.add_argument("--remake_container_only", action='store_true',
                     help="Remake from container")
+parser.add_argument("--image_cache", action='store_true',
+                    help="Tag the image with a hash of its inputs and build with the layer cache")
+parser.add_argument("--gem_volume", type=str, default="github_pages_gems",
+                    help="Docker volume that keeps the gems with --image_cache ('': not used)")
+parser.add_argument("--wait_ready", action='store_true',
+                    help="Wait until the Jekyll server in the container is listening")
+parser.add_argument("--ready_timeout", type=float, default=300,
+                    help="Seconds to wait with --wait_ready")
+parser.add_argument("--log_lines", type=int, default=200,
+                    help="Number of the latest container log lines to print")
+parser.add_argument("--trace", type=str, default="",
+                    help="Write the spans of the phases and commands to this file")
+parser.add_argument("--trace_format", type=str, default="auto",
+                    choices=["auto", "jsonl", "chrome"],
+                    help="Format of --trace (auto: jsonl for *.jsonl, else chrome)")
+parser.add_argument("--metrics", type=str, default="",
+                    help="Write the phase metrics in the Prometheus text format to this file")
 
 
 class SetupGithubPages:
@@ -63,6 +132,12 @@ class SetupGithubPages:
     _dockerfile_path = "test/src/Dockerfile"
     _server_env_dir = "test/src/node"
     _remake_container_only = False
+    _image_exists = None
+    _image_hash = ""
+    _gem_volume = ""
+    _plantuml = ""
+    _shared_cache = ""
+    _docker = None
 
     def __init__(self, ap):
         """Initialize the class."""
@@ -81,102 +156,259 @@ class SetupGithubPages:
         self._entrypoint_path = os.path.abspath(
             os.path.join(ap.root_dir, ap.entrypoint_path))
         self._remake_container_only = ap.remake_container_only
+        self._plantuml = ap.plantuml
+        if ap.shared_cache != "":
+            self._shared_cache = os.path.abspath(ap.shared_cache)
+        if ap.image_cache is True:
+            self._gem_volume = ap.gem_volume
+        # The existence checks of the steps are answered from one snapshot of the daemon.
+        self._docker = docker_state.DockerState(
+            docker_api.create_client(ap.docker_client, ap.docker_socket, self._root_dir),
+            ap.docker_events)
+        tracing.start("server")
+        try:
+            with tracing.span("server", engine=ap.engine) as span:
+                span.status = self.run(ap)
+        finally:
+            tracing.finish(ap.trace, ap.trace_format, ap.metrics)
 
-        if ap.setup is True:
+    def run(self, ap):
+        """Run the phases of the setup."""
+        if ap.watch is True:
             # =========================================================
-            # If there are any containers using the image, delete them.
-            ret = self.remove_container(ap.image_name, ap.image_version)
+            # Build, serve and rebuild on changes without Docker.
+            return self.watch_site(ap.host, ap.port, ap.jobs, ap.poll)
 
+        if ap.serve_only is True:
             # =========================================================
-            # If there is an image with the same name, delete it.
-            if self._remake_container_only is False and ret == 0:
-                ret = self.remove_image(ap.image_name, ap.image_version)
-            if ret == 0:
-                ret = self.build_docker_image(self._root_dir, self._gemfile_dir,
-                                              self._dockerfile_path,
-                                              ap.image_name, ap.image_version,
-                                              ap.image_args_ruby_version)
+            # Serve the build results (e.g. of build.py) without Docker.
+            return self.serve_site(self._output_dir, ap.host, ap.port, ap.cache_mb)
 
+        if ap.engine == "native":
             # =========================================================
+            # Build and serve without Docker.
+            with tracing.span("native_build") as span:
+                ret = native_engine.NativeEngine(self._src, self._output_dir, ap.jobs,
+                                                 self._plantuml, self._shared_cache).build()
+                span.status = ret
             if ret == 0:
-                ret = self.create_docker_container(ap.image_name, ap.image_version,
-                                                   ap.container_name,
-                                                   ap.port, self._src,
-                                                   self._output_dir,
-                                                   self._server_env_dir,
-                                                   self._entrypoint_path)
+                ret = self.serve_site(self._output_dir, ap.host, ap.port, ap.cache_mb)
+            return ret
+
+        # =========================================================
+        # Run the Docker steps. Steps that do not depend on each other
+        # run concurrently.
+        graph = orchestrator.TaskGraph()
+        if ap.setup is True:
+            # Delete the container of the server (not the previews of preview_farm.py).
+            graph.add("remove_container",
+                      lambda: self.remove_container(ap.container_name))
+            if ap.image_cache is True:
+                self.add_cached_image_steps(graph, ap)
+            else:
+                image_depends = []
+                if self._remake_container_only is False:
+                    # If there is an image with the same name, delete it.
+                    graph.add("remove_image",
+                              lambda: self.remove_image(ap.image_name, ap.image_version),
+                              ["remove_container"])
+                    image_depends = ["remove_image"]
+                graph.add("check_image",
+                          lambda: self.check_docker_image(ap.image_name, ap.image_version),
+                          image_depends)
+                graph.add("build_image",
+                          lambda: self.build_docker_image(self._root_dir, self._gemfile_dir,
+                                                          self._dockerfile_path,
+                                                          ap.image_name, ap.image_version,
+                                                          ap.image_args_ruby_version),
+                          ["check_image"])
+            graph.add("create_container",
+                      lambda: self.create_docker_container(ap.image_name, ap.image_version,
+                                                           ap.container_name,
+                                                           ap.port, self._src,
+                                                           self._output_dir,
+                                                           self._server_env_dir,
+                                                           self._entrypoint_path,
+                                                           self._gem_volume),
+                      ["remove_container", "build_image"])
         else:
-            ret = self.stop_container(ap.container_name)
+            graph.add("stop_container", lambda: self.stop_container(ap.container_name))
+            graph.add("start_container", lambda: self.start_container(ap.container_name),
+                      ["stop_container"])
+        with tracing.span("docker_steps", client=self._docker.name) as span:
+            ret = asyncio.run(self.run_graph(graph, ap.container_name, ap))
+            span.status = ret
+        return ret
+
+    def add_cached_image_steps(self, graph: orchestrator.TaskGraph, ap):
+        """Add the steps that reuse or build the image tagged with its input hash."""
+        graph.add("image_hash",
+                  lambda: self.hash_image_inputs(self._gemfile_dir, self._dockerfile_path,
+                                                 self._entrypoint_path,
+                                                 ap.image_args_ruby_version))
+        graph.add("check_image",
+                  lambda: self.check_docker_image(ap.image_name, self._image_hash),
+                  ["image_hash"])
+        graph.add("build_hashed_image",
+                  lambda: self.build_docker_image(self._root_dir, self._gemfile_dir,
+                                                  self._dockerfile_path,
+                                                  ap.image_name, self._image_hash,
+                                                  ap.image_args_ruby_version, False),
+                  ["check_image"])
+        # The container and the other steps use image_name:image_version.
+        graph.add("build_image",
+                  lambda: self.tag_docker_image(ap.image_name, self._image_hash,
+                                                ap.image_version),
+                  ["build_hashed_image"])
+
+    async def run_graph(self, graph: orchestrator.TaskGraph, container_name: str, ap):
+        """Run the task graph, print the containers and close the Docker connection."""
+        try:
+            ret = await graph.run()
+            # =========================================================
+            await self.print_container_list()
             if ret == 0:
-                ret = self.start_container(ap.container_name)
+                ret = await self.print_docker_logs(container_name, ap.log_lines, ap.wait_ready,
+                                                   ap.ready_timeout)
+            # =========================================================
+        finally:
+            self._docker.print_stats()
+            await self._docker.close()
+        return ret
 
-        # =========================================================
-        self.print_container_list()
-        if ret == 0:
-            self.print_docker_logs(ap.container_name)
-        # =========================================================
+    def serve_site(self, output_dir: str, host: str, port: int, cache_mb: int = 64):
+        """Serve the build results with the built-in HTTP server."""
+        print("[## Serve the site]")
+        if os.path.isdir(output_dir) is False:
+            print("  [ERROR] Not found: " + output_dir)
+            return 1
+        try:
+            with tracing.span("prepare_site") as span:
+                count = static_server.precompress_site(output_dir)
+                print("  --> Precompress files: " + str(count))
+                server = static_server.StaticServer(output_dir, host, port,
+                                                    cache_mb * 1024 * 1024)
+                count = server.cache.preload()
+                span.status = 0
+            print("  --> Preload files: " + str(count) + " ("
+                  + str(server.cache.stats["bytes"] // 1024) + " KiB)")
+            print("  --> Open this link in your browser: http://"
+                  + host + ":" + str(port) + "/")
+            with tracing.span("serve"):
+                asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            print("  --> Stop server")
+        except OSError as e:
+            print("  [ERROR] " + str(e))
+            return 1
+        return 0
 
-    def stop_container(self, container_name: str):
+    def watch_site(self, host: str, port: int, jobs: int, poll: bool):
+        """Serve the site and rebuild the changed pages."""
+        engine = native_engine.NativeEngine(self._src, self._output_dir, jobs,
+                                            self._plantuml, self._shared_cache)
+        with tracing.span("native_build") as span:
+            ret = engine.build()
+            span.status = ret
+        if ret != 0:
+            return ret
+        print("[## Watch the source directory]")
+        try:
+            server = live_reload.LiveReloadServer(self._output_dir, host, port)
+        except OSError as e:
+            print("  [ERROR] " + str(e))
+            return 1
+        server.start()
+        watcher = file_watcher.FileWatcher(self._src, use_inotify=not poll)
+        print("  --> Watch (" + watcher.mode + "): " + self._src)
+        print("  --> Open this link in your browser: http://"
+              + host + ":" + str(port) + "/")
+        try:
+            while True:
+                changed = watcher.wait()
+                if len(changed) == 0:
+                    continue
+                start = time.monotonic()
+                with tracing.span("rebuild", changed=len(changed)) as span:
+                    if "_config.yml" in changed:
+                        engine = native_engine.NativeEngine(self._src, self._output_dir,
+                                                            jobs, self._plantuml,
+                                                            self._shared_cache)
+                        ret = engine.build()
+                        pages = engine.source_files()
+                    else:
+                        pages = engine.dependents(changed)
+                        ret = engine.build(pages)
+                    span.status = ret
+                server.reload([native_engine.output_path(page) for page in pages])
+                print("  --> Rebuild " + str(len(pages)) + " files in "
+                      + str(round((time.monotonic() - start) * 1000)) + " ms")
+        except KeyboardInterrupt:
+            print("  --> Stop server")
+        finally:
+            watcher.close()
+            server.stop()
+        return 0
+
+    async def stop_container(self, container_name: str):
         """Stop Docker container."""
-        ret, result = self.get_process(['docker', 'ps', '--format', '"{{.Names}}"',
-                                        '--filter', 'name=' + container_name])
+        # The name filter also matches the previews (<container_name>_<revision>).
+        ret, containers = await self._docker.list_containers(False, name=container_name)
         if ret == 0:
-            for item in result.splitlines():
-                if item == "":
+            for item in containers:
+                if item["Name"] != container_name:
                     continue
-                ret, _result2 = self.get_process(
-                    ['docker', 'stop', item])
+                ret = await self._docker.stop_container(item["Name"])
                 if ret == 0:
-                    print("  --> Stop container: " + item)
+                    print("  --> Stop container: " + item["Name"])
         if ret != 0:
             print("  [ERROR] Failed container stop")
         return ret
 
-    def start_container(self, container_name: str):
+    async def start_container(self, container_name: str):
         """Start Docker container."""
-        ret, result = self.get_process(['docker', 'ps', '-a', '--format', '"{{.Names}}"',
-                                        '--filter', 'name=' + container_name])
+        ret, containers = await self._docker.list_containers(True, name=container_name)
         if ret == 0:
-            for item in result.splitlines():
-                if item == "":
-                    continue
-                if item == container_name:
-                    ret, _result2 = self.get_process(
-                        ['docker', 'start', item])
+            for item in containers:
+                if item["Name"] == container_name:
+                    ret = await self._docker.start_container(item["Name"])
                     if ret == 0:
-                        print("  --> Start container: " + item)
+                        print("  --> Start container: " + item["Name"])
         if ret != 0:
             print("  [ERROR] Failed container Start :" + container_name)
         return ret
 
-    def remove_container(self, image_name: str, image_version: str):
+    async def remove_container(self, container_name: str):
         """Remove Docker container."""
         print("[## Remove a container]")
         # ================================
-        # If there are any containers using the image, delete them.
-        ret, result = self.get_process(['docker', 'ps', '-a', '--format', '"{{.Names}}"',
-                                        '--filter', 'ancestor=' + image_name + ':' + image_version])
+        # The previews of preview_farm.py (<container_name>_<revision>) use the same
+        # image, so only the container with this exact name is deleted.
+        ret, containers = await self._docker.list_containers(True, name=container_name)
         if ret == 0:
-            for container_name in result.splitlines():
-                if container_name == "":
-                    continue
-                ret2, _result2 = self.get_process(
-                    ['docker', 'rm', '-f', container_name])
+            names = [item["Name"] for item in containers if item["Name"] == container_name]
+            results = await asyncio.gather(
+                *[self._docker.remove_container(name) for name in names])
+            for container_name, ret2 in zip(names, results):
                 print(
                     "  --> Remove container: " + container_name + "(" + str(ret2) + ")")
         else:
             print("  [ERROR] Don't call docker ps")
         return ret
 
-    def remove_image(self, image_name: str, image_version: str):
+    async def remove_image(self, image_name: str, image_version: str):
         """Remove Docker image."""
         print("[## Remove a docker image]")
-        ret, result = self.get_process(
-            ['docker', 'images', '-q', image_name + ':' + image_version])
+        ret, image_id = await self._docker.image_id(image_name + ':' + image_version)
+        containers = []
+        if ret == 0 and image_id != "":
+            ret, containers = await self._docker.list_containers(
+                True, ancestor=image_name + ':' + image_version)
         if ret == 0:
-            if result != "":
-                ret, result_rmi = self.get_process(
-                    ['docker', 'rmi', image_name + ':' + image_version])
+            if image_id != "":
+                # The previews of preview_farm.py keep running on the untagged image.
+                ret, result_rmi = await self._docker.remove_image(
+                    image_name + ':' + image_version, force=len(containers) > 0)
                 if ret == 0:
                     print(result_rmi)
                     print(
@@ -185,23 +417,51 @@ class SetupGithubPages:
             print("  [ERROR] Don't remove a Docker image")
         return ret
 
-    def build_docker_image(self, root_dir: str, gemfile_dir: str, dockerfile_path: str,
-                           image_name: str, image_version: str, ruby_version: str):
+    async def check_docker_image(self, image_name: str, image_version: str):
+        """Check whether the Docker image exists."""
+        ret, image_id = await self._docker.image_id(image_name + ':' + image_version)
+        if ret == 0:
+            self._image_exists = image_id != ""
+        return ret
+
+    async def hash_image_inputs(self, gemfile_dir: str, dockerfile_path: str,
+                                entrypoint_path: str, ruby_version: str):
+        """Get the image tag from the hash of the image inputs."""
+        print("[## Hash the image inputs]")
+        self._image_hash = build_cache.content_tag(
+            {"Dockerfile": dockerfile_path,
+             "Gemfile": os.path.join(gemfile_dir, "Gemfile"),
+             "entrypoint.sh": entrypoint_path},
+            {"RUBY_VERSION": ruby_version})
+        print("  --> Image inputs hash: " + self._image_hash)
+        return 0
+
+    async def tag_docker_image(self, image_name: str, image_hash: str, image_version: str):
+        """Tag the hashed image with the image version."""
+        ret, result = await self._docker.tag_image(image_name + ':' + image_hash,
+                                                   image_name, image_version)
+        if ret == 0:
+            print("  --> Tag image: " + image_name + ':' + image_hash
+                  + " -> " + image_name + ':' + image_version)
+        else:
+            print("  [ERROR] Don't tag a Docker image: " + result)
+        return ret
+
+    async def build_docker_image(self, root_dir: str, gemfile_dir: str, dockerfile_path: str,
+                                 image_name: str, image_version: str, ruby_version: str,
+                                 nocache: bool = True):
         """Build Docker Image."""
         print("[## Create a Docker image]")
-        ret, result = self.get_process(
-            ['docker', 'images', '-q', image_name + ':' + image_version])
+        ret = 0
+        if self._image_exists is None:
+            ret = await self.check_docker_image(image_name, image_version)
         if ret == 0:
-            if result == "":
-                os.chdir(gemfile_dir)
-                ret = os.system('docker build'
-                                + ' --no-cache'
-                                + ' --build-arg RUBY_VERSION=' + ruby_version
-                                + ' -t ' + image_name + ':' + image_version
-                                + ' -f' + dockerfile_path
-                                + " " + gemfile_dir)
-                os.chdir(root_dir)
+            if self._image_exists is False:
+                ret, _result = await self._docker.build_image(
+                    gemfile_dir, dockerfile_path, image_name + ':' + image_version,
+                    {"RUBY_VERSION": ruby_version}, nocache=nocache)
                 if ret == 0:
+                    self._image_exists = True
                     print("  --> Create image: "
                           + image_name + ':' + image_version + "(" + str(ret) + ")")
             else:
@@ -211,25 +471,24 @@ class SetupGithubPages:
             print("  [ERROR] Not get Docker image")
         return ret
 
-    def create_docker_container(self, image_name: str, image_version: str,
-                                container_name: str, open_port: int,
-                                src: str, output_dir: str, server_env_dir: str,
-                                entrypoint_path: str):
+    async def create_docker_container(self, image_name: str, image_version: str,
+                                      container_name: str, open_port: int,
+                                      src: str, output_dir: str, server_env_dir: str,
+                                      entrypoint_path: str, gem_volume: str = ""):
         """Create Docker Container."""
         print("[## Create Docker Container]")
-        ret, _result = self.get_process(
-            ['docker', 'run', '-dit',
-             '--name', container_name,
-             '--hostname', container_name,
-             '--publish', str(open_port) + ":8000",
-             '-v', server_env_dir + ":/root/node",
-             '-v', entrypoint_path + ':/root/entrypoint.sh',
-             '-v', src + ":/root/src",
-             '-v', output_dir + ":/root/_site",
-             '--workdir', "/root",
-             image_name + ":" + image_version,
-             "/bin/bash"
-             ])
+        binds = [server_env_dir + ":/root/node",
+                 entrypoint_path + ':/root/entrypoint.sh',
+                 src + ":/root/src",
+                 output_dir + ":/root/_site"]
+        if gem_volume != "":
+            # The gems installed by "bundle install" are kept across image rebuilds.
+            binds.append(gem_volume + ":/root/gems")
+        ret, _result = await self._docker.run_container(
+            image_name + ":" + image_version, container_name, ["/bin/bash"],
+            binds=binds,
+            workdir="/root",
+            ports={open_port: 8000})
         if ret == 0:
             print("  --> Create Docker container: " + container_name)
             print("        src : " + src)
@@ -238,57 +497,40 @@ class SetupGithubPages:
             print("  [ERROR] Don't create a Docker container")
         return ret
 
-    def print_docker_logs(self, container_name: str):
-        """Print Docker Logs."""
+    async def print_docker_logs(self, container_name: str, lines: int = 200,
+                                wait_ready: bool = False, timeout: float = 0):
+        """Print the new lines of the Docker logs (and wait for the server)."""
         print("[## docker logs]")
-        ret = os.system('docker logs ' + container_name)
+        follower = log_follower.LogFollower(
+            self._docker, container_name, lines=lines,
+            on_line=(lambda text: print(text, flush=True)) if wait_ready is True else None)
+        start = follower.offset
+        with tracing.span("docker_logs", wait_ready=wait_ready) as span:
+            ret, message = await follower.read(wait_ready=wait_ready, timeout=timeout)
+            span.status = ret
+        if wait_ready is False:
+            for text in follower.lines:
+                print(text)
+        for event in follower.events:
+            if event["time"] * 1e9 > start and event["type"] in ("build", "regenerate"):
+                log_follower.print_event(event)
+        if ret != 0:
+            print("  [ERROR] " + message)
+        elif wait_ready is True:
+            print("  --> Ready: " + (follower.address or container_name))
         return ret
 
-    def print_container_list(self):
+    async def print_container_list(self):
         """Print Docker Container"""
         print("[## Container list] ")
-        ret, result = self.get_process(
-            ['docker', 'ps', '-a', '--format', '"{{.Names}}\tState[{{.Status}}]\tProt:{{.Ports}}"'])
-        if ret == 0 and result == "":
+        ret, containers = await self._docker.list_containers(True)
+        if ret == 0 and len(containers) > 0:
             print("--------------------------------------------------")
-            print(result)
+            for item in containers:
+                print(item["Name"] + "\tState[" + item["Status"] + "]\tProt:" + item["Ports"])
             print("--------------------------------------------------")
         return ret
 
-    def process_run(self, cmd: str, work_dir: str = ""):
-        """Run the process."""
-        try:
-            if work_dir == "":
-                work_dir = self._root_dir
-            proc = subprocess.run(
-                cmd, check=True, shell=True, cwd=work_dir, stdout=subprocess.PIPE)
-            stdout = proc.stdout
-            str_type = type(stdout)
-            if str_type is bytes:
-                stdout = stdout.decode('utf-8').replace('"', '')
-            else:
-                stdout = str(stdout).replace('"', '')
-            return proc.returncode, stdout
-        except Exception as e:
-            return 1, str(e)
-
-    def get_process(self, cmd: str, work_dir: str = ""):
-        """Get the process."""
-        try:
-            if work_dir == "":
-                work_dir = self._root_dir
-            proc = subprocess.run(
-                cmd, check=True, shell=True, cwd=work_dir, stdout=subprocess.PIPE)
-            stdout = proc.stdout
-            str_type = type(stdout)
-            if str_type is bytes:
-                stdout = stdout.decode('utf-8').replace('"', '')
-            else:
-                stdout = str(stdout).replace('"', '')
-            return proc.returncode, stdout
-        except Exception as e:
-            return 1, str(e)
-
 
 if __name__ == "__main__":
     args = parser.parse_args()
@@ -0,0 +1,348 @@
+"""This is a module to keep the build results in a content-addressed store."""
+# SYSTEM: Python 3.11.1
+#
+# これは、ビルド結果(_site)をハッシュで管理し、差分だけを配置するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * _siteの全ファイルのパス・ハッシュ・サイズ・更新時刻をマニフェストに記録
+#   (サイズと更新時刻が前回と同じファイルはハッシュを再計算しない)
+# * ファイルの内容はハッシュをキーにして_site.cache/artifactsに保存(同じ内容は1つだけ)
+# * 直近のビルド(KEEP_BUILDS)のマニフェストと、その参照する内容だけを残す
+# * 2つのマニフェストを比較し、変更・削除されたファイルを抽出
+# * 変更された内容だけを1つのtarストリーム(zstandardがあればzstd、なければgzip)にまとめる
+# * まとめたファイルやストアから、配置先のフォルダに変更されたファイルだけを反映
+#   (配置先の外を指すパス(絶対パス、"../")を含むファイルは反映しない)
+
+import os
+import io
+import json
+import time
+import shutil
+import tarfile
+import posixpath
+
+import build_cache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MANIFEST_VERSION = 1
+BUNDLE_VERSION = 1
+KEEP_BUILDS = 5
+ZSTD_LEVEL = 10
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+BUNDLE_INDEX = "deploy.json"
+
+
+def store_dir(volume_site: str):
+    """Get the default artifact store of a site."""
+    volume_site = os.path.abspath(volume_site)
+    return os.path.join(os.path.dirname(volume_site),
+                        os.path.basename(volume_site) + ".cache", "artifacts")
+
+
+def deploy_manifest_path(target: str):
+    """Get the path of the manifest stored next to a deploy target."""
+    target = os.path.abspath(target)
+    return os.path.join(os.path.dirname(target), os.path.basename(target) + ".deploy.json")
+
+
+def scan_site(site: str, previous: dict = None):
+    """Get {path: [hash, size, mtime_ns]} of a site, reusing the unchanged hashes of previous."""
+    previous = previous or {}
+    files = {}
+    for rel_path in build_cache.list_files(site):
+        stat = os.stat(os.path.join(site, rel_path))
+        old = previous.get(rel_path)
+        if old is not None and old[1] == stat.st_size and old[2] == stat.st_mtime_ns:
+            files[rel_path] = old
+            continue
+        files[rel_path] = [build_cache.hash_file(os.path.join(site, rel_path)),
+                           stat.st_size, stat.st_mtime_ns]
+    return files
+
+
+def manifest_digest(files: dict):
+    """Get the digest of the contents of a manifest (ignoring mtimes)."""
+    return build_cache.hash_text(json.dumps(
+        {path: item[0] for path, item in files.items()}, sort_keys=True))
+
+
+def diff_manifests(old: dict, new: dict):
+    """Get the changed (added or modified) and removed paths."""
+    changed = [path for path, item in sorted(new.items())
+               if path not in old or old[path][0] != item[0]]
+    removed = sorted(path for path in old if path not in new)
+    return changed, removed
+
+
+def load_manifest(path: str):
+    """Load a manifest file. Returns None if there is no valid manifest."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return data
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(path: str, data: dict):
+    """Save a manifest file."""
+    data = dict(data)
+    data["version"] = MANIFEST_VERSION
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def default_compression():
+    """Get the best available compression of the bundles."""
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def is_inside(rel_path: str):
+    """Check whether a manifest path stays in the folder it is joined to."""
+    if isinstance(rel_path, str) is False or rel_path == "" or "\\" in rel_path \
+            or "\0" in rel_path or posixpath.isabs(rel_path) or os.path.isabs(rel_path) \
+            or os.path.splitdrive(rel_path)[0] != "":
+        return False
+    path = posixpath.normpath(rel_path)
+    return path not in (".", "..") and path.startswith("../") is False
+
+
+def write_file(path: str, reader, length: int = -1):
+    """Write a file from a stream through a temporary file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".deploy.tmp"
+    with open(tmp_path, "wb") as f:
+        if length < 0:
+            shutil.copyfileobj(reader, f)
+        else:
+            while length > 0:
+                chunk = reader.read(min(1024 * 1024, length))
+                if chunk == b"":
+                    break
+                f.write(chunk)
+                length -= len(chunk)
+    os.replace(tmp_path, path)
+
+
+def remove_files(target: str, paths: list):
+    """Remove files and the folders they leave empty."""
+    for rel_path in paths:
+        path = os.path.join(target, rel_path)
+        if os.path.isfile(path):
+            os.remove(path)
+        folder = os.path.dirname(path)
+        while os.path.abspath(folder) != os.path.abspath(target):
+            try:
+                os.rmdir(folder)
+            except OSError:
+                break
+            folder = os.path.dirname(folder)
+
+
+class ArtifactStore:
+    """Content-addressed store of the build results."""
+    _root = ""
+
+    def __init__(self, root: str):
+        """Initialize the class."""
+        self._root = os.path.abspath(root)
+
+    @property
+    def root(self):
+        """Get the store folder."""
+        return self._root
+
+    def blob_path(self, digest: str):
+        """Get the path of a stored content."""
+        return os.path.join(self._root, "blobs", digest[:2], digest)
+
+    def build_path(self, build_id: str):
+        """Get the manifest path of a build."""
+        return os.path.join(self._root, "builds", build_id + ".json")
+
+    def builds(self):
+        """List the builds from the oldest. Returns [{id, time, files, bytes}]."""
+        try:
+            with open(os.path.join(self._root, "builds.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def load(self, build_id: str = ""):
+        """Load the manifest of a build (default: the latest). Returns None if not found."""
+        builds = self.builds()
+        if build_id == "" and len(builds) > 0:
+            build_id = builds[-1]["id"]
+        matches = [build["id"] for build in builds if build["id"].startswith(build_id)]
+        if build_id == "" or len(matches) != 1:
+            return None
+        return load_manifest(self.build_path(matches[0]))
+
+    def add_build(self, site: str, keep: int = KEEP_BUILDS):
+        """Record the current site. Returns (manifest, number of new contents, their bytes)."""
+        latest = self.load()
+        files = scan_site(site, latest["files"] if latest is not None else None)
+        build_id = manifest_digest(files)[:16]
+        added = 0
+        added_bytes = 0
+        for rel_path, (digest, size, _mtime) in files.items():
+            blob = self.blob_path(digest)
+            if os.path.isfile(blob):
+                continue
+            with open(os.path.join(site, rel_path), "rb") as f:
+                write_file(blob, f)
+            added += 1
+            added_bytes += size
+        manifest = {"id": build_id, "time": time.time(), "files": files}
+        save_manifest(self.build_path(build_id), manifest)
+        builds = [build for build in self.builds() if build["id"] != build_id]
+        builds.append({"id": build_id, "time": manifest["time"], "files": len(files),
+                       "bytes": sum(item[1] for item in files.values())})
+        self.save_builds(builds[-keep:])
+        for build in builds[:-keep]:
+            os.remove(self.build_path(build["id"]))
+        if len(builds) > keep:
+            self.prune()
+        return manifest, added, added_bytes
+
+    def save_builds(self, builds: list):
+        """Save the build list."""
+        path = os.path.join(self._root, "builds.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(builds, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def prune(self):
+        """Remove the contents that no kept build refers to."""
+        used = set()
+        for build in self.builds():
+            manifest = load_manifest(self.build_path(build["id"]))
+            if manifest is not None:
+                used.update(item[0] for item in manifest["files"].values())
+        removed = 0
+        blobs = os.path.join(self._root, "blobs")
+        for rel_path in build_cache.list_files(blobs) if os.path.isdir(blobs) else []:
+            if os.path.basename(rel_path) not in used:
+                os.remove(os.path.join(blobs, rel_path))
+                removed += 1
+        return removed
+
+    # =========================================================
+    # Deploy
+    def sync(self, manifest: dict, target: str, base: dict = None):
+        """Copy the changed files of a build to a folder. Returns (changed, removed, bytes)."""
+        files = manifest["files"]
+        if base is None:
+            base = scan_site(target) if os.path.isdir(target) else {}
+        changed, removed = diff_manifests(base, files)
+        copied = 0
+        for rel_path in changed:
+            with open(self.blob_path(files[rel_path][0]), "rb") as f:
+                write_file(os.path.join(target, rel_path), f)
+            copied += files[rel_path][1]
+        remove_files(target, removed)
+        return changed, removed, copied
+
+    def write_bundle(self, path: str, manifest: dict, base: dict = None,
+                     compression: str = ""):
+        """Write the changes from base as one tar stream. Returns (changed, removed, bytes)."""
+        files = manifest["files"]
+        base = base or {}
+        changed, removed = diff_manifests(base, files)
+        index = {"version": BUNDLE_VERSION, "id": manifest["id"], "files": files,
+                 "base": manifest_digest(base) if len(base) > 0 else "",
+                 "changed": changed, "removed": removed}
+        digests = sorted(set(files[rel_path][0] for rel_path in changed))
+        compression = compression or default_compression()
+        total = 0
+        with open(path + ".tmp", "wb") as raw:
+            stream = raw
+            if compression == "zstd":
+                stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(
+                    raw, closefd=False)
+            mode = "w|gz" if compression == "gzip" else "w|"
+            with tarfile.open(fileobj=stream, mode=mode) as tar:
+                data = json.dumps(index).encode("utf-8")
+                info = tarfile.TarInfo(BUNDLE_INDEX)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+                for digest in digests:
+                    blob = self.blob_path(digest)
+                    info = tarfile.TarInfo("blobs/" + digest)
+                    info.size = os.path.getsize(blob)
+                    info.mtime = int(time.time())
+                    with open(blob, "rb") as f:
+                        tar.addfile(info, f)
+                    total += info.size
+            if stream is not raw:
+                stream.close()
+        os.replace(path + ".tmp", path)
+        return changed, removed, total
+
+
+def open_bundle(path: str):
+    """Open a bundle as a tar stream (zstd, gzip or plain)."""
+    f = open(path, "rb")
+    if f.read(4) == ZSTD_MAGIC:
+        f.seek(0)
+        if zstandard is None:
+            f.close()
+            raise ValueError("zstandard is not installed: " + path)
+        return tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(f),
+                            mode="r|"), f
+    f.seek(0)
+    return tarfile.open(fileobj=f, mode="r|*"), f
+
+
+def apply_bundle(path: str, target: str, force: bool = False):
+    """Apply a bundle to a folder. Returns (ret, message)."""
+    current = load_manifest(deploy_manifest_path(target))
+    current_files = current["files"] if current is not None else {}
+    tar, f = open_bundle(path)
+    try:
+        member = tar.next()
+        if member is None or member.name != BUNDLE_INDEX:
+            return 1, "Not a bundle: " + path
+        index = json.loads(tar.extractfile(member).read().decode("utf-8"))
+        if index.get("version") != BUNDLE_VERSION:
+            return 1, "Unsupported bundle version: " + str(index.get("version"))
+        # The paths are joined to the target, so none of them may leave it.
+        for rel_path in list(index["files"]) + index["changed"] + index["removed"]:
+            if is_inside(rel_path) is False:
+                return 1, "Invalid path in the bundle: " + repr(rel_path)
+        if (force is False and index["base"] != ""
+                and index["base"] != manifest_digest(current_files)):
+            return 1, "The target is not the base of the bundle (use --force)"
+        targets = {}
+        for rel_path in index["changed"]:
+            targets.setdefault(index["files"][rel_path][0], []).append(rel_path)
+        # The contents are written as they are read, without a temporary store.
+        written = 0
+        for member in tar:
+            digest = member.name[len("blobs/"):]
+            paths = targets.pop(digest, [])
+            if member.name.startswith("blobs/") is False or len(paths) == 0:
+                continue
+            write_file(os.path.join(target, paths[0]), tar.extractfile(member), member.size)
+            for rel_path in paths[1:]:
+                with open(os.path.join(target, paths[0]), "rb") as copy:
+                    write_file(os.path.join(target, rel_path), copy)
+            written += member.size
+        if len(targets) > 0:
+            return 1, "Missing contents in the bundle: " + str(len(targets))
+    finally:
+        tar.close()
+        f.close()
+    remove_files(target, index["removed"])
+    save_manifest(deploy_manifest_path(target), {"id": index["id"], "files": index["files"]})
+    return 0, (str(len(index["changed"])) + " changed, " + str(len(index["removed"]))
+               + " removed, " + str(written // 1024) + " KiB")
@@ -0,0 +1,110 @@
+# SYSTEM: Ruby 3.3
+#
+# これは、Jekyllを読み込んだまま常駐し、ビルドの依頼を受け付けるワーカーです。
+#
+# このスクリプトは、以下の内容を実行します。
+# * JekyllとGitHub Pagesのプラグインは起動時に一度だけ読み込む
+# * TCPで1行のJSON(ping, build, stop)を受け取り、1行のJSONで結果を返す
+# * ping以外のコマンドはトークン(BUILD_WORKER_TOKEN)を確認し、/root/src -> /root/_site 以外のビルドは拒否
+# * github-pagesが読み込めない場合は、通常のビルドと異なるサイトになるため起動しない
+# * 同じsrc/dst/_config.ymlのビルドでは、Jekyll::Siteを再利用
+# * ページごとの変換時間を返す
+
+require "json"
+require "socket"
+require "openssl"
+begin
+  require "github-pages"
+rescue LoadError => e
+  # Plain Jekyll would build a different site from the action image.
+  abort "Build worker: github-pages is not installed (#{e.message})"
+end
+require "jekyll"
+
+PORT = Integer(ENV.fetch("BUILD_WORKER_PORT", ARGV[0] || "4010"))
+TOKEN = ENV.fetch("BUILD_WORKER_TOKEN", "")
+SOURCE = "/root/src"
+DESTINATION = "/root/_site"
+abort "Build worker: BUILD_WORKER_TOKEN is not set" if TOKEN.empty?
+
+$started = {}
+$timings = {}
+$sites = {}
+
+def monotonic
+  Process.clock_gettime(Process::CLOCK_MONOTONIC)
+end
+
+[:pages, :documents].each do |owner|
+  Jekyll::Hooks.register owner, :pre_render do |item, _payload|
+    $started[item.object_id] = monotonic
+  end
+  Jekyll::Hooks.register owner, :post_render do |item|
+    start = $started.delete(item.object_id)
+    $timings[item.relative_path] = monotonic - start unless start.nil?
+  end
+end
+
+def site_for(request)
+  options = {
+    "source" => request.fetch("src"),
+    "destination" => request.fetch("dst"),
+    "future" => true,
+    "incremental" => request.fetch("incremental", false),
+    "quiet" => true
+  }
+  config_path = File.join(options["source"], "_config.yml")
+  mtime = File.exist?(config_path) ? File.mtime(config_path).to_f : 0
+  key = JSON.generate([options, mtime])
+  $sites[key] ||= Jekyll::Site.new(Jekyll.configuration(options))
+end
+
+def check(request)
+  token = request.fetch("token", "").to_s
+  return "Invalid token" unless OpenSSL.secure_compare(token, TOKEN)
+  if request["command"] == "build" &&
+     (request["src"] != SOURCE || request["dst"] != DESTINATION)
+    return "The worker builds only #{SOURCE} into #{DESTINATION}"
+  end
+  ""
+end
+
+def build(request)
+  $timings = {}
+  start = monotonic
+  site_for(request).process
+  { "status" => 0, "seconds" => monotonic - start,
+    "pages" => $timings.sort.to_a, "log" => "" }
+rescue StandardError => e
+  { "status" => 1, "seconds" => monotonic - start, "pages" => [],
+    "log" => "#{e.class}: #{e.message}\n" }
+end
+
+server = TCPServer.new("0.0.0.0", PORT)
+$stdout.puts "Build worker: #{PORT}"
+$stdout.flush
+loop do
+  client = server.accept
+  begin
+    request = JSON.parse(client.gets || "{}")
+    error = request["command"] == "ping" ? "" : check(request)
+    case error.empty? ? request["command"] : :rejected
+    when :rejected
+      client.puts JSON.generate({ "status" => 1, "log" => "  [ERROR] #{error}\n" })
+    when "ping"
+      client.puts JSON.generate({ "status" => 0, "worker" => "jekyll", "version" => Jekyll::VERSION })
+    when "build"
+      client.puts JSON.generate(build(request))
+    when "stop"
+      client.puts JSON.generate({ "status" => 0 })
+      client.close
+      break
+    else
+      client.puts JSON.generate({ "status" => 1, "log" => "Unknown command\n" })
+    end
+  rescue JSON::ParserError, IOError, SystemCallError => e
+    $stderr.puts e.message
+  ensure
+    client.close unless client.closed?
+  end
+end
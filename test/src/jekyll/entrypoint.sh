@@ -12,6 +12,8 @@ if [ "$PRINT_SCRIPT" = "false" ]; then
     echo "SERVER_PORT:$SERVER_PORT"
     echo "=============================="
     pushd /root/jekyll > /dev/null
+        # Install only the missing gems into the gem volume.
+        bundle check > /dev/null || NOKOGIRI_USE_SYSTEM_LIBRARIES=true bundle install
         bundle exec jekyll serve --no-watch --config \
             /root/node/_config.yml,/root/src/_config.yml \
             --host ${SERVER_IP} --port ${SERVER_PORT}
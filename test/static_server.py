@@ -0,0 +1,572 @@
+"""This is a module to serve the build results from memory."""
+# SYSTEM: Python 3.11.1
+#
+# これは、ビルド結果(_site)をメモリにキャッシュして配信するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * テキストファイルをビルド時に一度だけ圧縮(.gz, brotliがある場合は.br)
+#   (削除されたファイルの.gz/.brも削除)
+# * ファイルをLRUのメモリキャッシュに読み込み、リクエストごとにディスクを読まない
+# * ETag / Last-Modified による304応答、Rangeリクエスト、Accept-Encodingに対応
+# * 内容のハッシュを含むファイル(style.<hash>.css)はブラウザで長期間キャッシュ可能として配信
+# * asyncioで複数のリクエストを同時に処理(HTTP/1.1 keep-alive)
+
+import os
+import gzip
+import time
+import asyncio
+import hashlib
+import threading
+import collections
+import email.utils
+import http
+import urllib.parse
+
+import build_cache
+import stylesheet_pipeline
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIME_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".htm": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".mjs": "text/javascript; charset=utf-8",
+    ".json": "application/json",
+    ".map": "application/json",
+    ".webmanifest": "application/manifest+json",
+    ".xml": "application/xml",
+    ".rss": "application/rss+xml",
+    ".atom": "application/atom+xml",
+    ".txt": "text/plain; charset=utf-8",
+    ".md": "text/markdown; charset=utf-8",
+    ".csv": "text/csv; charset=utf-8",
+    ".yml": "text/yaml; charset=utf-8",
+    ".yaml": "text/yaml; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+    ".ico": "image/x-icon",
+    ".bmp": "image/bmp",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+    ".eot": "application/vnd.ms-fontobject",
+    ".pdf": "application/pdf",
+    ".wasm": "application/wasm",
+    ".zip": "application/zip",
+    ".gz": "application/gzip",
+    ".mp4": "video/mp4",
+    ".webm": "video/webm",
+    ".mp3": "audio/mpeg",
+    ".ogg": "audio/ogg",
+    ".wav": "audio/wav",
+}
+DEFAULT_MIME_TYPE = "application/octet-stream"
+COMPRESSIBLE_EXTENSIONS = (".html", ".htm", ".css", ".js", ".mjs", ".json", ".map",
+                           ".webmanifest", ".xml", ".rss", ".atom", ".txt", ".md",
+                           ".csv", ".yml", ".yaml", ".svg", ".ico", ".ttf", ".otf", ".eot",
+                           ".bin")
+MIN_COMPRESS_SIZE = 512
+MAX_FILE_SIZE = 8 * 1024 * 1024
+STREAM_CHUNK_SIZE = 256 * 1024
+KEEP_ALIVE_SECONDS = 15.0
+MAX_HEADER_SIZE = 64 * 1024
+
+
+def mime_type(path: str):
+    """Get the Content-Type of a file."""
+    return MIME_TYPES.get(os.path.splitext(path)[1].lower(), DEFAULT_MIME_TYPE)
+
+
+def is_compressible(path: str):
+    """Check whether a file is worth compressing."""
+    return path.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+
+
+def compress(data: bytes, encoding: str, level: int = 9):
+    """Compress data with gzip or brotli."""
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if level >= 9 else 5)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def precompress_site(root: str, files: list = None, min_size: int = MIN_COMPRESS_SIZE):
+    """Write .gz (and .br) files next to the text files. Returns the number of written files."""
+    encodings = ["gz"] + (["br"] if brotli is not None else [])
+    if files is None:
+        files = build_cache.list_files(root)
+        remove_orphan_sidecars(root, files)
+    count = 0
+    for rel_path in files:
+        path = os.path.join(root, rel_path)
+        if is_compressible(rel_path) is False or os.path.isfile(path) is False:
+            continue
+        stat = os.stat(path)
+        if stat.st_size < min_size:
+            remove_sidecars(path)
+            continue
+        data = None
+        for encoding in encodings:
+            side_path = path + "." + encoding
+            if os.path.isfile(side_path) and os.stat(side_path).st_mtime_ns >= stat.st_mtime_ns:
+                continue
+            if data is None:
+                with open(path, "rb") as f:
+                    data = f.read()
+            packed = compress(data, "br" if encoding == "br" else "gzip")
+            if len(packed) >= len(data):
+                # An older compressed file would be served instead of the new content.
+                remove_sidecars(path, [encoding])
+                continue
+            with open(side_path + ".tmp", "wb") as f:
+                f.write(packed)
+            os.replace(side_path + ".tmp", side_path)
+            count += 1
+    return count
+
+
+def remove_sidecars(path: str, encodings: list = ("gz", "br")):
+    """Remove the compressed files of a file."""
+    for encoding in encodings:
+        if os.path.isfile(path + "." + encoding):
+            os.remove(path + "." + encoding)
+
+
+def remove_orphan_sidecars(root: str, files: list):
+    """Remove the compressed files whose source file was deleted."""
+    names = set(files)
+    for rel_path in files:
+        source = rel_path[:-3]
+        if rel_path.endswith((".gz", ".br")) and is_compressible(source) \
+                and source not in names:
+            os.remove(os.path.join(root, rel_path))
+
+
+def http_date(timestamp: float):
+    """Format a timestamp for the HTTP headers."""
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value: str):
+    """Parse an HTTP date. Returns None if it is not valid."""
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def parse_range(value: str, size: int):
+    """Parse a single byte range. Returns (start, end), None (ignore) or False (416)."""
+    if value.startswith("bytes=") is False or "," in value:
+        return None
+    start, _sep, end = value[6:].strip().partition("-")
+    try:
+        if start == "":
+            length = int(end)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end != "" else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def accepted_encodings(value: str):
+    """Get the content codings accepted by the client."""
+    encodings = set()
+    for item in value.split(","):
+        name, _sep, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q=") and params[2:] in ("0", "0.0", "0.00", "0.000"):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+class CacheEntry:
+    """A file kept in memory."""
+    data = None
+    variants = {}
+    size = 0
+    mtime_ns = 0
+    etag = ""
+    last_modified = ""
+    mime = DEFAULT_MIME_TYPE
+
+    def __init__(self, data: bytes, variants: dict, size: int, mtime_ns: int,
+                 etag: str, mime: str):
+        """Initialize the class."""
+        self.data = data
+        self.variants = variants
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.etag = etag
+        self.last_modified = http_date(mtime_ns / 1e9)
+        self.mime = mime
+
+    @property
+    def memory(self):
+        """Get the bytes held in memory."""
+        return len(self.data or b"") + sum(len(data) for data in self.variants.values())
+
+
+class FileCache:
+    """LRU memory cache of the files under a directory."""
+    _root = "."
+    _max_bytes = 0
+    _entries = None
+    _lock = None
+    _bytes = 0
+    _hits = 0
+    _misses = 0
+
+    def __init__(self, root: str, max_bytes: int = 64 * 1024 * 1024):
+        """Initialize the class."""
+        self._root = os.path.abspath(root)
+        self._max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def root(self):
+        """Get the root directory."""
+        return self._root
+
+    @property
+    def stats(self):
+        """Get the cache statistics."""
+        return {"files": len(self._entries), "bytes": self._bytes,
+                "hits": self._hits, "misses": self._misses}
+
+    def lookup(self, rel_path: str):
+        """Get a cached entry that is still fresh. Returns None on a miss."""
+        with self._lock:
+            entry = self._entries.get(rel_path)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(os.path.join(self._root, rel_path))
+        except OSError:
+            self.invalidate([rel_path])
+            return None
+        if stat.st_mtime_ns != entry.mtime_ns or stat.st_size != entry.size:
+            return None
+        with self._lock:
+            if rel_path in self._entries:
+                self._entries.move_to_end(rel_path)
+            self._hits += 1
+        return entry
+
+    def load(self, rel_path: str):
+        """Read a file into the cache. Returns None if it does not exist."""
+        path = os.path.join(self._root, rel_path)
+        try:
+            stat = os.stat(path)
+            if os.path.isfile(path) is False:
+                return None
+            if stat.st_size > min(MAX_FILE_SIZE, self._max_bytes):
+                # Too large to keep in memory, it is streamed from the disk.
+                etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+                return CacheEntry(None, {}, stat.st_size, stat.st_mtime_ns, etag,
+                                  mime_type(rel_path))
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        variants = {}
+        if is_compressible(rel_path) and len(data) >= MIN_COMPRESS_SIZE:
+            for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                side_path = path + suffix
+                try:
+                    if os.stat(side_path).st_mtime_ns >= stat.st_mtime_ns:
+                        with open(side_path, "rb") as f:
+                            variants[encoding] = f.read()
+                except OSError:
+                    pass
+            if "gzip" not in variants:
+                # Not precompressed: compress once and keep the result.
+                packed = compress(data, "gzip", 6)
+                if len(packed) < len(data):
+                    variants["gzip"] = packed
+        etag = '"' + hashlib.sha256(data).hexdigest()[:20] + '"'
+        entry = CacheEntry(data, variants, stat.st_size, stat.st_mtime_ns, etag,
+                           mime_type(rel_path))
+        with self._lock:
+            self._misses += 1
+            old = self._entries.pop(rel_path, None)
+            if old is not None:
+                self._bytes -= old.memory
+            self._entries[rel_path] = entry
+            self._bytes += entry.memory
+            while self._bytes > self._max_bytes and len(self._entries) > 1:
+                _name, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.memory
+        return entry
+
+    def preload(self):
+        """Read the files into the cache until it is full. Returns the number of files."""
+        count = 0
+        for rel_path in build_cache.list_files(self._root):
+            if self._bytes >= self._max_bytes:
+                break
+            if rel_path.endswith((".gz", ".br")) and os.path.isfile(
+                    os.path.join(self._root, rel_path[:-3])):
+                continue
+            if self.load(rel_path) is not None:
+                count += 1
+        return count
+
+    def invalidate(self, rel_paths: list = None):
+        """Drop the given files (or all files) from the cache."""
+        with self._lock:
+            if rel_paths is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for rel_path in rel_paths:
+                entry = self._entries.pop(rel_path, None)
+                if entry is not None:
+                    self._bytes -= entry.memory
+
+
+class StaticServer:
+    """asyncio HTTP server for a static site."""
+    _cache = None
+    _host = "127.0.0.1"
+    _port = 8000
+    _server = None
+
+    def __init__(self, root: str, host: str, port: int,
+                 max_bytes: int = 64 * 1024 * 1024):
+        """Initialize the class."""
+        self._cache = FileCache(root, max_bytes)
+        self._host = host
+        self._port = port
+
+    @property
+    def cache(self):
+        """Get the file cache."""
+        return self._cache
+
+    async def start(self):
+        """Start listening."""
+        self._server = await asyncio.start_server(self.handle, self._host, self._port,
+                                                  limit=MAX_HEADER_SIZE)
+        return self._server
+
+    async def serve_forever(self):
+        """Serve until cancelled."""
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        """Stop listening."""
+        if self._server is not None:
+            self._server.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handle the requests of a connection."""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"),
+                                                  KEEP_ALIVE_SECONDS)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        asyncio.TimeoutError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                request_line = lines[0].split(" ")
+                if len(request_line) != 3 or request_line[2].startswith("HTTP/") is False:
+                    self.send(writer, 400, [], b"Bad Request\n")
+                    break
+                method, target, version = request_line
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(":")
+                    if sep != "":
+                        headers[name.strip().lower()] = value.strip()
+                length = headers.get("content-length", "0")
+                if length.isdigit() and int(length) > 0:
+                    await reader.readexactly(int(length))
+                connection = headers.get("connection", "").lower()
+                keep_alive = (connection != "close" if version == "HTTP/1.1"
+                              else connection == "keep-alive")
+                keep_alive = await self.respond(writer, method, target, headers) and keep_alive
+                await writer.drain()
+                if keep_alive is False:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def send(self, writer: asyncio.StreamWriter, status: int, headers: list,
+             body: bytes = b"", head_only: bool = False, length: int = None):
+        """Write a response."""
+        lines = ["HTTP/1.1 %d %s" % (status, http.HTTPStatus(status).phrase),
+                 "Date: " + http_date(time.time()),
+                 "Server: github-pages-preview"]
+        lines += [name + ": " + value for name, value in headers]
+        if status != 304:
+            lines.append("Content-Length: " + str(len(body) if length is None else length))
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if head_only is False and len(body) > 0:
+            writer.write(body)
+
+    def resolve(self, url_path: str):
+        """Map a URL path to a relative file path. Returns (rel_path, redirect)."""
+        parts = [part for part in url_path.split("/") if part not in ("", ".")]
+        if ".." in parts or any("\0" in part or "\\" in part for part in parts):
+            return None, None
+        rel_path = "/".join(parts)
+        path = os.path.join(self._cache.root, *parts)
+        if os.path.isdir(path):
+            if url_path.endswith("/") is False:
+                return None, url_path + "/"
+            return (rel_path + "/index.html").lstrip("/"), None
+        if os.path.isfile(path) is False and os.path.isfile(path + ".html"):
+            # Jekyll permalinks without the extension.
+            return rel_path + ".html", None
+        return rel_path, None
+
+    async def respond(self, writer: asyncio.StreamWriter, method: str, target: str,
+                      headers: dict):
+        """Send the response of a request. Returns False to close the connection."""
+        if method not in ("GET", "HEAD"):
+            self.send(writer, 405, [("Allow", "GET, HEAD")], b"Method Not Allowed\n")
+            return True
+        head_only = method == "HEAD"
+        url = urllib.parse.urlsplit(target)
+        rel_path, redirect = self.resolve(urllib.parse.unquote(url.path))
+        if redirect is not None:
+            location = urllib.parse.quote(redirect) + ("?" + url.query if url.query else "")
+            self.send(writer, 301, [("Location", location)], b"", head_only)
+            return True
+        entry = None
+        if rel_path is not None:
+            entry = self._cache.lookup(rel_path)
+            if entry is None:
+                loop = asyncio.get_running_loop()
+                entry = await loop.run_in_executor(None, self._cache.load, rel_path)
+        if entry is None:
+            return await self.respond_not_found(writer, head_only)
+
+        # Conditional requests
+        etag = entry.etag
+        encoding = ""
+        if len(entry.variants) > 0:
+            accepted = accepted_encodings(headers.get("accept-encoding", ""))
+            for name in ("br", "gzip"):
+                if name in accepted and name in entry.variants:
+                    encoding = name
+                    etag = entry.etag[:-1] + "-" + name + '"'
+                    break
+        # A content-hashed file never changes, so the browser does not ask again.
+        cache_control = (stylesheet_pipeline.IMMUTABLE_CACHE_CONTROL
+                         if stylesheet_pipeline.is_hashed(rel_path) else "no-cache")
+        common = [("ETag", etag), ("Last-Modified", entry.last_modified),
+                  ("Cache-Control", cache_control)]
+        if len(entry.variants) > 0:
+            common.append(("Vary", "Accept-Encoding"))
+        if self.not_modified(headers, etag, entry):
+            self.send(writer, 304, common)
+            return True
+
+        # Range requests are answered from the uncompressed file.
+        byte_range = None
+        if "range" in headers and self.range_applies(headers, entry):
+            byte_range = parse_range(headers["range"], entry.size)
+            if byte_range is False:
+                self.send(writer, 416, [("Content-Range", "bytes */%d" % entry.size)])
+                return True
+        headers_out = [("Content-Type", entry.mime), ("Accept-Ranges", "bytes")] + common
+        if byte_range is not None:
+            start, end = byte_range
+            headers_out = [(name, value) for name, value in headers_out
+                           if name != "ETag"] + [("ETag", entry.etag)]
+            headers_out.append(("Content-Range", "bytes %d-%d/%d" % (start, end, entry.size)))
+            return await self.send_body(writer, 206, headers_out, entry, start, end + 1,
+                                        head_only, rel_path)
+        if encoding != "":
+            headers_out.append(("Content-Encoding", encoding))
+            self.send(writer, 200, headers_out, entry.variants[encoding], head_only)
+            return True
+        return await self.send_body(writer, 200, headers_out, entry, 0, entry.size,
+                                    head_only, rel_path)
+
+    async def send_body(self, writer: asyncio.StreamWriter, status: int, headers: list,
+                        entry: CacheEntry, start: int, end: int, head_only: bool,
+                        rel_path: str):
+        """Send the whole file or a part of it."""
+        if entry.data is not None:
+            self.send(writer, status, headers, entry.data[start:end], head_only)
+            return True
+        self.send(writer, status, headers, b"", True, end - start)
+        if head_only is True:
+            return True
+        loop = asyncio.get_running_loop()
+        try:
+            with open(os.path.join(self._cache.root, rel_path), "rb") as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = await loop.run_in_executor(
+                        None, f.read, min(STREAM_CHUNK_SIZE, remaining))
+                    if chunk == b"":
+                        return False
+                    writer.write(chunk)
+                    await writer.drain()
+                    remaining -= len(chunk)
+        except OSError:
+            return False
+        return True
+
+    async def respond_not_found(self, writer: asyncio.StreamWriter, head_only: bool):
+        """Send the 404 page of the site."""
+        entry = self._cache.lookup("404.html")
+        if entry is None:
+            loop = asyncio.get_running_loop()
+            entry = await loop.run_in_executor(None, self._cache.load, "404.html")
+        if entry is not None and entry.data is not None:
+            self.send(writer, 404, [("Content-Type", entry.mime)], entry.data, head_only)
+        else:
+            self.send(writer, 404, [("Content-Type", "text/plain; charset=utf-8")],
+                      b"Not Found\n", head_only)
+        return True
+
+    def not_modified(self, headers: dict, etag: str, entry: CacheEntry):
+        """Check the If-None-Match and If-Modified-Since headers."""
+        if "if-none-match" in headers:
+            tags = [tag.strip() for tag in headers["if-none-match"].split(",")]
+            tags = [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+            return "*" in tags or etag in tags or entry.etag in tags
+        if "if-modified-since" in headers:
+            since = parse_http_date(headers["if-modified-since"])
+            return since is not None and int(entry.mtime_ns / 1e9) <= since
+        return False
+
+    def range_applies(self, headers: dict, entry: CacheEntry):
+        """Check the If-Range header."""
+        if "if-range" not in headers:
+            return True
+        value = headers["if-range"]
+        return value == entry.etag or value == entry.last_modified
@@ -0,0 +1,339 @@
+"""This is a module to compile and cache the stylesheets of the site."""
+# SYSTEM: Python 3.11.1
+#
+# これは、サイトのスタイルシート(SCSS, LESS)を変換してキャッシュするためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * docs/assets/css/style.scss、docsフォルダのLESS(custom.less)をCSSに変換して圧縮
+# * 変換結果は、元のファイルと@importしたファイルのハッシュをキーに_site.cache/stylesに保存
+#   (ファイルの時刻とサイズが変わっていなければファイルを読まない、元に戻した場合も再変換しない)
+# * 内容のハッシュを含むファイル名(style.<hash>.css)で出力し、ページの<link>を書き換え
+#   (Jekyllと同じstyle.cssも出力、LESSのファイルはJekyllと同じくそのままコピー)
+# * スタイルシートだけを変更した場合は、変換済みのページの<link>だけを書き換え
+# * ハッシュ付きのファイルは、static_server.pyとlive_reload.pyで長期間キャッシュ可能として配信
+
+import os
+import re
+import json
+import html
+import posixpath
+
+import build_cache
+from scss_compiler import ScssCompiler
+
+PIPELINE_VERSION = 1
+HASH_LENGTH = 12
+STYLE_EXTENSIONS = (".scss", ".less")
+STYLESHEET_TAG = re.compile(r'(<link\b[^>]*?\brel="stylesheet"[^>]*?\bhref=")([^"]+)(")')
+HASHED_NAME = re.compile(r'\.[0-9a-f]{%d}\.css$' % HASH_LENGTH)
+URL_SCHEME = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:')
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MAX_COMPILED = 32
+
+
+def is_stylesheet(rel_path: str):
+    """Check whether a source file is compiled by the pipeline."""
+    return os.path.splitext(rel_path)[1].lower() in STYLE_EXTENSIONS
+
+
+def is_hashed(path: str):
+    """Check whether a file name has a content hash (the file never changes)."""
+    return HASHED_NAME.search(path) is not None
+
+
+def plain_path(rel_path: str):
+    """Get the CSS path of a stylesheet without the content hash."""
+    return posixpath.splitext(HASHED_NAME.sub(".css", rel_path))[0] + ".css"
+
+
+def hashed_path(rel_path: str, digest: str):
+    """Get the content-hashed CSS path of a stylesheet."""
+    return posixpath.splitext(plain_path(rel_path))[0] + "." + digest[:HASH_LENGTH] + ".css"
+
+
+def minify(css: str):
+    """Remove the comments and the whitespace that CSS does not need."""
+    out = []
+    i = 0
+    quote = ""
+    space = False
+    while i < len(css):
+        c = css[i]
+        if quote != "":
+            out.append(c)
+            if c == "\\" and i + 1 < len(css):
+                out.append(css[i + 1])
+                i += 1
+            elif c == quote:
+                quote = ""
+        elif css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            i = len(css) if end < 0 else end + 2
+            continue
+        elif c.isspace():
+            space = True
+        else:
+            # A space is kept only where it separates two tokens ("a b", "1px solid").
+            if space and len(out) > 0 and out[-1] not in "{};,>:(" and c not in "{};,>)":
+                out.append(" ")
+            space = False
+            if c == "}" and len(out) > 0 and out[-1] == ";":
+                out.pop()
+            if c in "\"'":
+                quote = c
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+class StylesheetPipeline:
+    """Compile, cache and publish the stylesheets of a site."""
+    _src = "docs"
+    _dst = ""
+    _cache_dir = ""
+    _manifest = None
+    _urls = {}
+    _changed = []
+    _warnings = []
+    _stats = {}
+
+    def __init__(self, src: str, dst: str, cache_dir: str):
+        """Initialize the class. dst="" only compiles (e.g. for the print bundle)."""
+        self._src = os.path.abspath(src)
+        self._dst = os.path.abspath(dst) if dst != "" else ""
+        self._cache_dir = cache_dir
+        self._manifest = None
+        self._urls = {}
+        self._changed = []
+        self._warnings = []
+        self._stats = {"compiled": 0, "cached": 0}
+
+    @property
+    def changed(self):
+        """Get the stylesheets whose file name changed in the last build."""
+        return self._changed
+
+    @property
+    def warnings(self):
+        """Get the (stylesheet, message) warnings of the compilations."""
+        return self._warnings
+
+    @property
+    def stats(self):
+        """Get the numbers of compiled and cached stylesheets."""
+        return self._stats
+
+    @property
+    def urls(self):
+        """Get the content-hashed path of each stylesheet (by source and by CSS path)."""
+        return self._urls
+
+    # =========================================================
+    # Cache
+    def load(self):
+        """Load the manifest of the cache."""
+        try:
+            with open(os.path.join(self._cache_dir, "manifest.json"), "r",
+                      encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != PIPELINE_VERSION:
+                manifest = None
+        except (OSError, ValueError):
+            manifest = None
+        self._manifest = manifest or {"version": PIPELINE_VERSION, "sources": {},
+                                      "compiled": {}, "published": {}}
+        return self._manifest
+
+    def save(self):
+        """Save the manifest of the cache."""
+        if self._manifest is None:
+            return
+        os.makedirs(self._cache_dir, exist_ok=True)
+        path = os.path.join(self._cache_dir, "manifest.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def input_key(self, path: str, inputs: dict):
+        """Get the cache key of a stylesheet from the hashes of its files (None if one is gone)."""
+        parts = [str(PIPELINE_VERSION), path]
+        for input_path in sorted(inputs):
+            mtime_ns, size, digest = inputs[input_path]
+            try:
+                stat = os.stat(input_path)
+            except OSError:
+                return None
+            if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+                # Only a changed file is read again.
+                digest = build_cache.hash_file(input_path)
+                inputs[input_path] = [stat.st_mtime_ns, stat.st_size, digest]
+            parts.append(input_path + ":" + digest)
+        return build_cache.hash_text("\n".join(parts))
+
+    def compile(self, path: str):
+        """Compile a stylesheet. Returns (css, the files it was made of, warnings)."""
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in STYLE_EXTENSIONS:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read(), [path], []
+        compiler = ScssCompiler([os.path.join(self._src, "_sass")], ext[1:])
+        css = compiler.compile_file(path)
+        return css, compiler.imported, compiler.warnings
+
+    def css(self, path: str):
+        """Get the minified CSS of a stylesheet and its hash, compiling it only if needed."""
+        if self._manifest is None:
+            self.load()
+        path = os.path.abspath(path)
+        compiled = self._manifest["compiled"]
+        entry = self._manifest["sources"].get(path)
+        if entry is not None:
+            # The same files give the same imports, so an earlier result is still valid.
+            key = self.input_key(path, entry["inputs"])
+            if key is not None and key in compiled:
+                try:
+                    with open(os.path.join(self._cache_dir, key + ".css"), "r",
+                              encoding="utf-8") as f:
+                        css = f.read()
+                    compiled[key] = compiled.pop(key)
+                    self._stats["cached"] += 1
+                    return css, compiled[key]
+                except OSError:
+                    compiled.pop(key)
+        css, imported, warnings = self.compile(path)
+        css = minify(css)
+        digest = build_cache.hash_text(css)
+        for message in warnings:
+            self._warnings.append((os.path.relpath(path, self._src), message))
+        self._stats["compiled"] += 1
+        if len(warnings) > 0:
+            # A missing @import is not recorded, so it is compiled again next time.
+            self._manifest["sources"].pop(path, None)
+            return css, digest
+        inputs = {}
+        for input_path in imported:
+            stat = os.stat(input_path)
+            inputs[input_path] = [stat.st_mtime_ns, stat.st_size,
+                                  build_cache.hash_file(input_path)]
+        key = self.input_key(path, inputs)
+        os.makedirs(self._cache_dir, exist_ok=True)
+        cache_path = os.path.join(self._cache_dir, key + ".css")
+        with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(css)
+        os.replace(cache_path + ".tmp", cache_path)
+        self._manifest["sources"][path] = {"inputs": inputs}
+        compiled.pop(key, None)
+        compiled[key] = digest
+        return css, digest
+
+    def prune(self):
+        """Remove the oldest compilations beyond MAX_COMPILED."""
+        compiled = self._manifest["compiled"]
+        for key in list(compiled)[:max(0, len(compiled) - MAX_COMPILED)]:
+            compiled.pop(key)
+            path = os.path.join(self._cache_dir, key + ".css")
+            if os.path.isfile(path):
+                os.remove(path)
+
+    # =========================================================
+    # Site
+    def build_all(self, rel_paths: list):
+        """Publish the stylesheets of the site. Returns the (stylesheet, error) failures."""
+        self.load()
+        published = self._manifest["published"]
+        self._urls = {}
+        self._changed = []
+        self._warnings = []
+        self._stats = {"compiled": 0, "cached": 0}
+        failures = []
+        for rel_path in rel_paths:
+            try:
+                css, digest = self.css(os.path.join(self._src, rel_path))
+                url = hashed_path(rel_path, digest)
+                self.publish(rel_path, url, css)
+            except (OSError, UnicodeDecodeError) as e:
+                failures.append((rel_path, str(e)))
+                continue
+            self._urls[rel_path] = url
+            self._urls[plain_path(rel_path)] = url
+            if published.get(rel_path) != url:
+                self._changed.append(rel_path)
+            published[rel_path] = url
+        for rel_path in [rel_path for rel_path in published if rel_path not in rel_paths]:
+            path = os.path.join(self._dst, published.pop(rel_path))
+            if os.path.isfile(path):
+                os.remove(path)
+            self._changed.append(rel_path)
+        self.prune()
+        self.save()
+        return failures
+
+    def publish(self, rel_path: str, url: str, css: str):
+        """Write the content-hashed CSS (and style.css for a SCSS file) into the site."""
+        path = os.path.join(self._dst, url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.isfile(path) is False:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(css)
+        # Jekyll publishes style.scss as style.css, other sites may still link it.
+        if rel_path.endswith(".scss"):
+            plain = os.path.join(self._dst, plain_path(rel_path))
+            data = css.encode("utf-8")
+            try:
+                with open(plain, "rb") as f:
+                    same = f.read() == data
+            except OSError:
+                same = False
+            if same is False:
+                with open(plain, "wb") as f:
+                    f.write(data)
+        # The older versions are no longer linked by any page.
+        folder = os.path.dirname(path)
+        stem = posixpath.basename(posixpath.splitext(plain_path(rel_path))[0])
+        for name in os.listdir(folder):
+            if (name != os.path.basename(path) and is_hashed(name)
+                    and name.startswith(stem + ".") and len(name) == len(stem) + HASH_LENGTH + 5):
+                os.remove(os.path.join(folder, name))
+
+    def rewrite(self, text: str, page_dir: str, baseurl: str = ""):
+        """Point the <link rel="stylesheet"> tags of a page to the content-hashed files."""
+        def link(match):
+            url = html.unescape(match.group(2))
+            if URL_SCHEME.match(url) or url.startswith("//"):
+                return match.group(0)
+            path = url.split("#")[0].split("?")[0]
+            if path.startswith("/"):
+                if baseurl != "" and path.startswith(baseurl + "/"):
+                    path = path[len(baseurl):]
+                rel_path = posixpath.normpath(path.lstrip("/"))
+            else:
+                rel_path = posixpath.normpath(posixpath.join(page_dir, path))
+            target = self._urls.get(rel_path)
+            if target is None and is_hashed(rel_path):
+                # A page written with an older version of the stylesheet.
+                target = self._urls.get(plain_path(rel_path))
+            if target is None:
+                return match.group(0)
+            if url.startswith("/"):
+                new_url = baseurl + "/" + target
+            else:
+                new_url = posixpath.relpath(target, page_dir or ".")
+            return match.group(1) + html.escape(new_url) + match.group(3)
+        return STYLESHEET_TAG.sub(link, text)
+
+    def relink(self, pages: list, baseurl: str = ""):
+        """Rewrite the links of pages that were built before. Returns the number of pages."""
+        count = 0
+        for out_path in pages:
+            path = os.path.join(self._dst, out_path)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            new_text = self.rewrite(text, posixpath.dirname(out_path), baseurl)
+            if new_text != text:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(new_text)
+                count += 1
+        return count
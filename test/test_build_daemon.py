@@ -0,0 +1,136 @@
+"""This is a test of the native build worker running as a local process."""
+# SYSTEM: Python 3.11.1
+#
+# これは、build_daemon.pyのネイティブ版のワーカーをローカルで起動して確認するテストです。
+#
+# このテストは、以下の内容を確認します。
+# * トークンがない・違うコマンドは拒否(ビルドしない)
+# * 起動時に指定したsrc/dst以外のビルドは拒否
+# * 正しいビルドの依頼は指定したdstに出力し、2回目の依頼は変更したページだけを変換
+#
+# 実行方法: cd ./test && python -m unittest test_build_daemon
+
+import os
+import json
+import socket
+import asyncio
+import tempfile
+import unittest
+import warnings
+import unittest.mock
+
+import build_daemon
+
+HOST = build_daemon.DEFAULT_HOST
+
+
+def free_port():
+    """Get a port that nothing listens on."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+class TestNativeBuildWorker(unittest.IsolatedAsyncioTestCase):
+    """Test of the native build worker."""
+
+    async def asyncSetUp(self):
+        """Create the site and start the worker with its own token."""
+        self._folder = tempfile.TemporaryDirectory()
+        root = self._folder.name
+        self._src = os.path.join(root, "docs")
+        self._dst = os.path.join(root, "_site")
+        os.makedirs(self._src)
+        for name, text in (("_config.yml", "title: test\n"),
+                           ("index.md", "# Index\n\n[A](a.html) [B](b.html)\n"),
+                           ("a.md", "# A\n\nPage A\n"),
+                           ("b.md", "# B\n\nPage B\n")):
+            with open(os.path.join(self._src, name), "w", encoding="utf-8") as f:
+                f.write(text)
+        # The token file is written under XDG_CACHE_HOME by the worker and read by the tests.
+        patcher = unittest.mock.patch.dict(
+            os.environ, {"XDG_CACHE_HOME": os.path.join(root, "cache")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self._port = free_port()
+        self._log = os.path.join(root, "worker.log")
+        with warnings.catch_warnings():
+            # The worker keeps running after its Popen object is dropped.
+            warnings.simplefilter("ignore", ResourceWarning)
+            build_daemon.start_native_worker(HOST, self._port, self._src, self._dst,
+                                             self._log)
+        worker = await build_daemon.wait_ready(HOST, self._port, 30)
+        if worker != "native":
+            with open(self._log, "r", encoding="utf-8") as f:
+                self.fail("The worker did not start: " + f.read())
+
+    async def asyncTearDown(self):
+        """Stop the worker."""
+        await build_daemon.stop(HOST, self._port)
+        self._folder.cleanup()
+
+    async def send(self, message: dict):
+        """Send a command as it is (without the token of the user)."""
+        reader, writer = await asyncio.open_connection(HOST, self._port)
+        try:
+            writer.write((json.dumps(message) + "\n").encode("utf-8"))
+            await writer.drain()
+            return json.loads((await reader.readline()).decode("utf-8"))
+        finally:
+            writer.close()
+
+    def test_token_file(self):
+        """Only the user can read the token."""
+        path = build_daemon.token_path(self._port)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        self.assertEqual(len(build_daemon.load_token(self._port)), 64)
+
+    async def test_wrong_token(self):
+        """Commands without the token are rejected and nothing is built."""
+        message = {"command": "build", "src": self._src, "dst": self._dst, "pages": None}
+        for token in (None, "", "0" * 64):
+            if token is not None:
+                message["token"] = token
+            result = await self.send(message)
+            self.assertEqual(result["status"], 1)
+            self.assertIn("Invalid token", result["log"])
+        result = await self.send({"command": "stop", "token": "0" * 64})
+        self.assertEqual(result["status"], 1)
+        self.assertFalse(os.path.exists(self._dst))
+        # The worker is still running.
+        self.assertEqual(await build_daemon.ping(HOST, self._port), "native")
+
+    async def test_other_site(self):
+        """A build of another src or dst is rejected."""
+        other = os.path.join(self._folder.name, "other")
+        for src, dst in ((self._src, other), (other, self._dst)):
+            ret, result = await build_daemon.submit_build(HOST, self._port, src, dst)
+            self.assertEqual(ret, 0)
+            self.assertEqual(result["status"], 1)
+            self.assertIn("The worker builds only", result["log"])
+        self.assertFalse(os.path.exists(other))
+        self.assertFalse(os.path.exists(self._dst))
+
+    async def test_build(self):
+        """A build writes the bound dst, and a repeated build renders only the changes."""
+        ret, result = await build_daemon.submit_build(HOST, self._port, self._src, self._dst)
+        self.assertEqual((ret, result["status"]), (0, 0), result.get("log"))
+        self.assertEqual(sorted(path for path, _seconds in result["pages"]),
+                         ["a.md", "b.md", "index.md"])
+        for name in ("index.html", "a.html", "b.html"):
+            self.assertTrue(os.path.isfile(os.path.join(self._dst, name)))
+        a_mtime = os.stat(os.path.join(self._dst, "a.html")).st_mtime_ns
+
+        with open(os.path.join(self._src, "b.md"), "w", encoding="utf-8") as f:
+            f.write("# B\n\nPage B, changed\n")
+        ret, result = await build_daemon.submit_build(HOST, self._port, self._src, self._dst,
+                                                      ["b.md"])
+        self.assertEqual((ret, result["status"]), (0, 0), result.get("log"))
+        self.assertEqual([path for path, _seconds in result["pages"]], ["b.md"])
+        with open(os.path.join(self._dst, "b.html"), "r", encoding="utf-8") as f:
+            self.assertIn("Page B, changed", f.read())
+        self.assertEqual(os.stat(os.path.join(self._dst, "a.html")).st_mtime_ns, a_mtime)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+"""This is a test of the diagram renderer with a stand-in PlantUML command."""
+# SYSTEM: Python 3.11.1
+#
+# これは、diagram_renderer.pyをPlantUMLの代わりのスクリプトで確認するテストです。
+#
+# このテストは、以下の内容を確認します。
+# * 複数の図を1つの常駐プロセス(-pipe)で変換(プロセスの起動は1回)
+# * 再ビルドではキャッシュだけを使い、プロセスを起動しない
+# * 変換に失敗した図は、その図だけをエラーにしてコードブロックのまま残し、ほかの図は変換
+#
+# 実行方法: cd ./test && python -m unittest test_diagram_renderer
+
+import io
+import os
+import sys
+import shlex
+import tempfile
+import unittest
+import contextlib
+import unittest.mock
+
+import diagram_renderer
+
+# The stand-in of "plantuml -pipe". Each start is logged, and a diagram with "BROKEN"
+# is answered with an error message instead of an SVG.
+FAKE_PLANTUML = '''import os
+import sys
+
+with open(os.environ["FAKE_PLANTUML_LOG"], "a") as f:
+    f.write("start\\n")
+delimiter = sys.argv[sys.argv.index("-pipedelimitor") + 1]
+lines = []
+for line in sys.stdin:
+    lines.append(line)
+    if line.startswith("@end"):
+        source = "".join(lines)
+        lines = []
+        if "BROKEN" in source:
+            sys.stdout.write("ERROR\\n1\\nSyntax Error?\\n")
+        else:
+            sys.stdout.write("<svg><!-- " + source.splitlines()[1] + " --></svg>\\n")
+        sys.stdout.write(delimiter + "\\n")
+        sys.stdout.flush()
+'''
+
+PAGE = """# Diagrams
+
+```puml
+Alice -> Bob
+```
+
+```plantuml
+BROKEN ->
+```
+
+```puml
+Bob -> Carol
+```
+"""
+
+
+class TestDiagramRenderer(unittest.TestCase):
+    """Test of DiagramRenderer."""
+
+    def setUp(self):
+        """Create the stand-in command and the cache folder."""
+        self._folder = tempfile.TemporaryDirectory()
+        script = os.path.join(self._folder.name, "plantuml.py")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write(FAKE_PLANTUML)
+        self._command = shlex.join([sys.executable, script])
+        self._cache = os.path.join(self._folder.name, "cache")
+        self._log = os.path.join(self._folder.name, "starts.log")
+
+    def tearDown(self):
+        """Remove the folder."""
+        self._folder.cleanup()
+
+    def starts(self):
+        """Get the number of started renderer processes."""
+        if os.path.isfile(self._log) is False:
+            return 0
+        with open(self._log, "r", encoding="utf-8") as f:
+            return len(f.read().splitlines())
+
+    def render(self, sources: list):
+        """Render the sources on one process. Returns (renderer, rendered keys)."""
+        renderer = diagram_renderer.DiagramRenderer(self._cache, self._command, jobs=1)
+        with unittest.mock.patch.dict(os.environ, {"FAKE_PLANTUML_LOG": self._log}), \
+                contextlib.redirect_stdout(io.StringIO()):
+            rendered = renderer.render_all(sources)
+        return renderer, rendered
+
+    def test_one_process(self):
+        """Several diagrams are rendered by one process."""
+        sources = ["Alice -> Bob", "Bob -> Carol", "Carol -> Dave", "Alice -> Bob"]
+        renderer, rendered = self.render(sources)
+        self.assertEqual(renderer.errors, [])
+        self.assertEqual(renderer.stats, {"rendered": 3, "cached": 0})
+        self.assertEqual(rendered, set(diagram_renderer.diagram_key(s) for s in sources))
+        self.assertEqual(self.starts(), 1)
+        with open(renderer.cache_path(diagram_renderer.diagram_key("Bob -> Carol")), "r",
+                  encoding="utf-8") as f:
+            self.assertEqual(f.read(), "<svg><!-- Bob -> Carol --></svg>\n")
+
+    def test_cache(self):
+        """A rebuild uses the cache without starting the renderer."""
+        sources = ["Alice -> Bob", "Bob -> Carol"]
+        self.render(sources)
+        renderer, rendered = self.render(sources)
+        self.assertEqual(renderer.stats, {"rendered": 0, "cached": 2})
+        self.assertEqual(len(rendered), 2)
+        self.assertEqual(self.starts(), 1)
+
+    def test_error(self):
+        """A broken diagram is reported alone and stays a code block."""
+        sources = [source for _match, source, _attrs in diagram_renderer.find_diagrams(PAGE)]
+        renderer, rendered = self.render(sources)
+        broken = diagram_renderer.diagram_key("BROKEN ->\n")
+        self.assertEqual(renderer.errors, [(broken, "ERROR")])
+        self.assertEqual(renderer.stats, {"rendered": 2, "cached": 0})
+        self.assertNotIn(broken, rendered)
+        self.assertFalse(os.path.isfile(renderer.cache_path(broken)))
+        # The process is started again after the error.
+        self.assertEqual(self.starts(), 2)
+        text = diagram_renderer.replace_diagrams(PAGE, rendered)
+        self.assertIn("```plantuml\nBROKEN ->\n```", text)
+        for source in ("Alice -> Bob\n", "Bob -> Carol\n"):
+            path = diagram_renderer.diagram_path(diagram_renderer.diagram_key(source))
+            self.assertIn("![](/" + path + ")", text)
+
+    def test_missing_renderer(self):
+        """A missing command is one error, and the diagrams stay code blocks."""
+        renderer = diagram_renderer.DiagramRenderer(self._cache, "no-such-plantuml-xyz")
+        self.assertEqual(renderer.render_all(["Alice -> Bob"]), set())
+        self.assertEqual(renderer.errors, [("", "Renderer not found: no-such-plantuml-xyz")])
+
+
+if __name__ == "__main__":
+    unittest.main()
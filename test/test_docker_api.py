@@ -0,0 +1,250 @@
+"""This is a test of the Engine API client against a stub socket."""
+# SYSTEM: Python 3.11.1
+#
+# これは、docker_api.pyのEngine APIクライアントをスタブのソケットで確認するテストです。
+#
+# このテストは、以下の内容を確認します。
+# * chunkedの応答を読み込み、JSONとして返す
+# * 多重化されたログ(8バイトのヘッダー付きフレーム)を行に分割
+#   * フレームやヘッダーが受信の途中で分かれても、同じ行になる
+# * Keep-Aliveのコネクションがデーモンに閉じられていたら、新しいコネクションで1回だけ再送
+#   * 応答の途中で切れた場合は再送しない(POSTを2回実行しない、行を2回渡さない)
+#
+# 実行方法: cd ./test && python -m unittest test_docker_api
+
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+
+import docker_api
+
+
+def frame(stream: int, data: bytes):
+    """Create a frame of a multiplexed log stream."""
+    return bytes([stream, 0, 0, 0]) + len(data).to_bytes(4, "big") + data
+
+
+def chunked(parts: list, head: bytes = b"HTTP/1.1 200 OK\r\n"):
+    """Create a chunked response."""
+    body = b"".join(b"%x\r\n" % len(part) + part + b"\r\n" for part in parts)
+    return head + b"Transfer-Encoding: chunked\r\n\r\n" + body + b"0\r\n\r\n"
+
+
+class StubDaemon:
+    """A Unix socket server that answers each connection with canned responses."""
+    path = ""
+    requests = []
+    connections = 0
+    _responses = []
+    _server = None
+
+    def __init__(self, path: str, responses: list):
+        """Initialize the class. responses is a list (per connection) of lists of bytes."""
+        self.path = path
+        self.requests = []
+        self.connections = 0
+        self._responses = list(responses)
+        self._server = None
+
+    async def start(self):
+        """Start listening."""
+        self._server = await asyncio.start_unix_server(self._handle, self.path)
+
+    async def stop(self):
+        """Stop listening."""
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        responses = self._responses.pop(0) if self._responses else []
+        for response in responses:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            self.requests.append(head.split(b"\r\n")[0].decode("latin-1"))
+            # Send in small pieces so that the client has to join them.
+            for pos in range(0, len(response), 5):
+                writer.write(response[pos:pos + 5])
+                await writer.drain()
+        # The daemon closes an idle keep-alive connection.
+        writer.close()
+
+
+class TestDockerApiClient(unittest.IsolatedAsyncioTestCase):
+    """Test of DockerApiClient."""
+
+    async def asyncSetUp(self):
+        """Create a folder for the socket."""
+        self._folder = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._folder.name, "docker.sock")
+        self._daemon = None
+
+    async def asyncTearDown(self):
+        """Stop the stub daemon."""
+        if self._daemon is not None:
+            await self._daemon.stop()
+        self._folder.cleanup()
+
+    async def serve(self, responses: list):
+        """Start the stub daemon and return a client for it."""
+        self._daemon = StubDaemon(self._path, responses)
+        await self._daemon.start()
+        return docker_api.DockerApiClient(self._path)
+
+    async def test_chunked_json(self):
+        """A chunked body is joined and parsed as JSON."""
+        body = json.dumps([{"Id": "a" * 64, "RepoTags": ["busybox:latest"]}]).encode()
+        client = await self.serve([[chunked([body[:7], body[7:30], body[30:]])]])
+        ret, result = await client.call("GET", "/images/json")
+        await client.close()
+        self.assertEqual(ret, 0)
+        self.assertEqual(result, [{"Id": "a" * 64, "RepoTags": ["busybox:latest"]}])
+        self.assertEqual(self._daemon.requests, ["GET /images/json HTTP/1.1"])
+
+    async def test_chunked_error(self):
+        """An error status returns the message of the body."""
+        head = b"HTTP/1.1 404 Not Found\r\n"
+        client = await self.serve([[chunked([b'{"message": "No such image"}'], head)]])
+        ret, result = await client.call("GET", "/images/missing/json")
+        await client.close()
+        self.assertEqual((ret, result), (1, "No such image"))
+
+    async def test_no_content(self):
+        """A 204 response without Content-Length does not wait for a body."""
+        client = await self.serve([[b"HTTP/1.1 204 No Content\r\n\r\n",
+                                    b"HTTP/1.1 204 No Content\r\n\r\n"]])
+        self.assertEqual(await client.call("POST", "/containers/a/stop"), (0, None))
+        self.assertEqual(await client.call("POST", "/containers/b/stop"), (0, None))
+        await client.close()
+        self.assertEqual(self._daemon.connections, 1)
+
+    async def test_keep_alive(self):
+        """Requests share one connection."""
+        response = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}"
+        client = await self.serve([[response, response, response]])
+        for _i in range(3):
+            self.assertEqual(await client.call("GET", "/_ping"), (0, {}))
+        await client.close()
+        self.assertEqual(self._daemon.connections, 1)
+
+    async def test_keep_alive_retry(self):
+        """A request on a connection closed by the daemon is sent again once."""
+        response = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}"
+        client = await self.serve([[response], [response]])
+        self.assertEqual(await client.call("GET", "/_ping"), (0, {}))
+        # Wait until the daemon has closed the first connection.
+        await asyncio.sleep(0.1)
+        self.assertEqual(await client.call("GET", "/version"), (0, {}))
+        await client.close()
+        self.assertEqual(self._daemon.connections, 2)
+        self.assertEqual(self._daemon.requests,
+                         ["GET /_ping HTTP/1.1", "GET /version HTTP/1.1"])
+
+    async def test_keep_alive_retry_post(self):
+        """A POST that the daemon never received is sent again on a new connection."""
+        ping = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}"
+        created = b"HTTP/1.1 201 Created\r\nContent-Length: 12\r\n\r\n{\"Id\": \"c1\"}"
+        client = await self.serve([[ping], [created]])
+        self.assertEqual(await client.call("GET", "/_ping"), (0, {}))
+        await asyncio.sleep(0.1)
+        self.assertEqual(await client.call("POST", "/containers/create", body={}),
+                         (0, {"Id": "c1"}))
+        await client.close()
+        self.assertEqual(self._daemon.requests,
+                         ["GET /_ping HTTP/1.1", "POST /containers/create HTTP/1.1"])
+
+    async def test_no_retry_after_response(self):
+        """A response cut off after its headers is not sent again."""
+        ping = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}"
+        cut = b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n{\"stream\""
+        client = await self.serve([[ping, cut], [ping]])
+        self.assertEqual(await client.call("GET", "/_ping"), (0, {}))
+        ret, _message = await client.call("POST", "/containers/create", body={})
+        await client.close()
+        self.assertEqual(ret, 1)
+        self.assertEqual(self._daemon.connections, 1)
+        self.assertEqual(self._daemon.requests,
+                         ["GET /_ping HTTP/1.1", "POST /containers/create HTTP/1.1"])
+
+    async def test_no_retry_of_streamed_lines(self):
+        """Lines of a response cut off mid-stream are passed only once."""
+        ping = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}"
+        cut = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n" \
+            + b"14\r\n{\"stream\":\"Step 1\"}\n\r\n"
+        client = await self.serve([[ping, cut], [ping]])
+        self.assertEqual(await client.call("GET", "/_ping"), (0, {}))
+        lines = []
+        with self.assertRaises(asyncio.IncompleteReadError):
+            await client.request("POST", "/build", on_line=lines.append)
+        await client.close()
+        self.assertEqual(lines, [b'{"stream":"Step 1"}'])
+        self.assertEqual(self._daemon.connections, 1)
+
+    async def test_no_retry_on_new_connection(self):
+        """A new connection that is closed at once is not retried."""
+        client = await self.serve([[]])
+        ret, _message = await client.call("GET", "/_ping")
+        await client.close()
+        self.assertEqual(ret, 1)
+        self.assertEqual(self._daemon.connections, 1)
+
+    async def test_stream_logs(self):
+        """Multiplexed frames are split into lines, even across chunks."""
+        data = frame(1, b"2024-01-01T00:00:00.000000000Z first\n2024-01-01T00:00:01") \
+            + frame(2, b".000000000Z second\r\n") \
+            + frame(1, b"2024-01-01T00:00:02.000000000Z last")
+        client = await self.serve([[chunked([data[:3], data[3:20], data[20:61], data[61:]])]])
+        lines = []
+        ret, message = await client.stream_logs("server_jekyll", lines.append)
+        await client.close()
+        self.assertEqual((ret, message), (0, ""))
+        self.assertEqual(lines, ["2024-01-01T00:00:00.000000000Z first",
+                                 "2024-01-01T00:00:01.000000000Z second",
+                                 "2024-01-01T00:00:02.000000000Z last"])
+        self.assertTrue(self._daemon.requests[0].startswith(
+            "GET /containers/server_jekyll/logs?"))
+
+    async def test_logs(self):
+        """The whole log of a non-TTY container is demultiplexed."""
+        data = frame(1, b"out\n") + frame(2, b"err\n")
+        head = b"HTTP/1.1 200 OK\r\nContent-Length: " + str(len(data)).encode() + b"\r\n\r\n"
+        client = await self.serve([[head + data]])
+        self.assertEqual(await client.logs("server_jekyll"), (0, "out\nerr\n"))
+        await client.close()
+
+
+class TestLogStream(unittest.TestCase):
+    """Test of demux_logs and LogStream."""
+
+    def test_demux_logs(self):
+        """Frames are joined, and a plain (TTY) stream is kept as is."""
+        self.assertEqual(docker_api.demux_logs(frame(1, b"a\n") + frame(2, b"b")), b"a\nb")
+        self.assertEqual(docker_api.demux_logs(b"plain text\n"), b"plain text\n")
+
+    def test_plain(self):
+        """A plain stream is split into lines, and the last line is passed on close."""
+        lines = []
+        stream = docker_api.LogStream(lines.append)
+        for data in (b"ab", b"c\nd", b"e\r\nf"):
+            stream.feed(data)
+        self.assertEqual(lines, ["abc", "de"])
+        stream.close()
+        self.assertEqual(lines, ["abc", "de", "f"])
+
+    def test_multiplexed_byte_by_byte(self):
+        """Frames received one byte at a time give the same lines."""
+        data = frame(1, b"first\nsec") + frame(2, b"ond\n") + frame(1, b"third")
+        lines = []
+        stream = docker_api.LogStream(lines.append)
+        for pos in range(len(data)):
+            stream.feed(data[pos:pos + 1])
+        stream.close()
+        self.assertEqual(lines, ["first", "second", "third"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+"""This is a test of the link checker against a local stub server."""
+# SYSTEM: Python 3.11.1
+#
+# これは、link_checker.pyをローカルのスタブサーバー(http.server)で確認するテストです。
+#
+# このテストは、以下の内容を確認します。
+# * 外部URLのリクエストは--proxyで指定したサーバーに送信(URL全体をリクエストのパスにする)
+# * 確認済みの外部URLはキャッシュの期限内は再確認しない(2回目はリクエストなし)
+# * HEADに405を返すサーバーにはGETで再確認
+# * サイト内のリンク先のファイルとアンカー(id)がない場合はエラー
+#
+# 実行方法: cd ./test && python -m unittest test_link_checker
+
+import io
+import os
+import tempfile
+import threading
+import contextlib
+import http.server
+import unittest
+
+import link_checker
+
+PAGE = """<html><body>
+<h1 id="top-title">Index</h1>
+<a href="page.html#section">ok anchor</a>
+<a href="page.html#missing-section">broken anchor</a>
+<a href="missing.html">broken page</a>
+<a href="#top-title">same page</a>
+<a href="http://example.test/ok">ok</a>
+<a href="http://example.test/no-head">no HEAD</a>
+<a href="http://example.test/gone">gone</a>
+<a href="http://example.test/moved">moved</a>
+</body></html>
+"""
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Answer the requests of the link checker and record them."""
+    requests = []
+
+    def do_HEAD(self):
+        """Answer a HEAD request."""
+        self.answer("HEAD")
+
+    def do_GET(self):
+        """Answer a GET request."""
+        self.answer("GET")
+
+    def answer(self, method: str):
+        """Send the status of the requested path."""
+        self.requests.append((method, self.path, self.headers.get("Host", "")))
+        path = self.path.split("example.test", 1)[-1]
+        if path == "/no-head" and method == "HEAD":
+            self.send_response(405)
+        elif path == "/moved":
+            self.send_response(301)
+            self.send_header("Location", "/ok")
+        elif path in ("/ok", "/no-head"):
+            self.send_response(200)
+        else:
+            self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        """Do not print the requests."""
+
+
+class TestLinkChecker(unittest.TestCase):
+    """Test of link_checker.py."""
+
+    def setUp(self):
+        """Create the site and start the stub server."""
+        self._folder = tempfile.TemporaryDirectory()
+        site = os.path.join(self._folder.name, "_site")
+        os.makedirs(site)
+        with open(os.path.join(site, "index.html"), "w", encoding="utf-8") as f:
+            f.write(PAGE)
+        with open(os.path.join(site, "page.html"), "w", encoding="utf-8") as f:
+            f.write('<html><body><h2 id="section">Section</h2></body></html>\n')
+        StubHandler.requests = []
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        """Stop the stub server and remove the site."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._folder.cleanup()
+
+    def check(self):
+        """Run link_checker.py through the stub server. Returns (exit status, output)."""
+        args = link_checker.parser.parse_args(
+            ["--root_dir", self._folder.name, "--src", "", "--jobs", "1",
+             "--proxy", "http://127.0.0.1:" + str(self._server.server_address[1])])
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            ret = link_checker.main(args)
+        return ret, out.getvalue()
+
+    def test_broken_links(self):
+        """Broken files, anchors and external URLs are reported."""
+        ret, output = self.check()
+        self.assertEqual(ret, 1)
+        self.assertIn("index.html -> page.html#missing-section (anchor not found)", output)
+        self.assertIn("index.html -> missing.html (not found)", output)
+        self.assertIn("index.html -> http://example.test/gone (HTTP 404)", output)
+        # The redirected URL, the GET fallback and the existing anchors are not reported.
+        self.assertIn("--> Broken: 3 in", output)
+
+    def test_proxy(self):
+        """The requests go to the proxy with the whole URL and the original host."""
+        self.check()
+        self.assertIn(("HEAD", "http://example.test/ok", "example.test"), StubHandler.requests)
+        self.assertIn(("HEAD", "http://example.test/moved", "example.test"),
+                      StubHandler.requests)
+
+    def test_head_fallback(self):
+        """A URL whose server does not allow HEAD is checked again with GET."""
+        self.check()
+        self.assertEqual([method for method, path, _host in StubHandler.requests
+                          if path == "http://example.test/no-head"], ["HEAD", "GET"])
+
+    def test_cache(self):
+        """The second run answers the external URLs from the cache."""
+        self.check()
+        count = len(StubHandler.requests)
+        self.assertGreater(count, 0)
+        ret, output = self.check()
+        self.assertEqual(ret, 1)
+        self.assertEqual(len(StubHandler.requests), count)
+        self.assertIn("--> External URLs: 4 (0 requested)", output)
+        self.assertIn("--> Pages: 2 (0 parsed)", output)
+        self.assertIn("index.html -> http://example.test/gone (HTTP 404)", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+"""This is a test of the task graph of the setup steps."""
+# SYSTEM: Python 3.11.1
+#
+# これは、orchestrator.pyのTaskGraphとrun_processと、build.pyの手順を確認するテストです。
+#
+# このテストは、以下の内容を確認します。
+# * 手順は依存する手順が成功してから実行
+# * 依存していない手順は同時に実行
+# * 失敗した手順(例外を含む)に依存する手順はスキップし、最初の失敗の終了コードを返す
+# * 実行した手順の時間を記録
+# * build.pyのDockerの手順を、PATHに置いた偽のdockerコマンドで実行
+#   * コンテナの削除とイメージの作成は同時に実行し、コンテナの作成は両方の後に実行
+#   * イメージの作成に失敗すると、コンテナの手順は実行せずに終了コードを返す
+#
+# 実行方法: cd ./test && python -m unittest test_orchestrator
+
+import io
+import os
+import sys
+import asyncio
+import tarfile
+import tempfile
+import unittest
+import contextlib
+import unittest.mock
+
+import build
+import orchestrator
+
+# The docker command of the tests. Each call is logged as "start <args>" and "end <command>".
+FAKE_DOCKER = '''#!{python}
+import os
+import sys
+import time
+
+args = sys.argv[1:]
+
+
+def log(text):
+    with open(os.environ["FAKE_DOCKER_LOG"], "a") as f:
+        f.write(text + "\\n")
+
+
+log("start " + " ".join(args))
+ret = 0
+if args[0] == "ps":
+    print('{{"ID": "c1", "Names": "build_jekyll_old", "Image": "github_pages_build_image:latest",'
+          ' "State": "exited", "Status": "exited"}}')
+elif args[0] == "rm" or args[0] == "build":
+    # Slow enough that the steps overlap if they run at the same time.
+    time.sleep(0.3)
+    if args[0] == "build":
+        print("Step 1/1 : FROM ruby")
+        ret = int(os.environ.get("FAKE_DOCKER_BUILD_EXIT", "0"))
+elif args[0] == "run":
+    # The bound output folder is created by the container.
+    site = [arg.split(":")[0] for arg in args if arg.endswith(":/root/_site")][0]
+    os.makedirs(site, exist_ok=True)
+    with open(os.path.join(site, "index.html"), "w") as f:
+        f.write("<h1>Index</h1>")
+    print("c2")
+elif args[0] == "wait":
+    print("0")
+log("end " + args[0])
+sys.exit(ret)
+'''
+
+
+class TestTaskGraph(unittest.TestCase):
+    """Test of TaskGraph."""
+
+    def step(self, name: str, ret: int = 0, delay: float = 0.0):
+        """Create a step that records when it starts and ends."""
+        async def func():
+            self._events.append("start " + name)
+            await asyncio.sleep(delay)
+            self._events.append("end " + name)
+            return ret
+        return func
+
+    def setUp(self):
+        """Clear the recorded events."""
+        self._events = []
+
+    def test_dependency_order(self):
+        """A step starts after all of its dependencies have ended."""
+        graph = orchestrator.TaskGraph()
+        graph.add("image", self.step("image", delay=0.02))
+        graph.add("volume", self.step("volume"))
+        graph.add("container", self.step("container"), ["image", "volume"])
+        self.assertEqual(graph.run_sync(), 0)
+        self.assertLess(self._events.index("end image"), self._events.index("start container"))
+        self.assertLess(self._events.index("end volume"), self._events.index("start container"))
+        self.assertEqual(graph.results, {"image": 0, "volume": 0, "container": 0})
+
+    def test_concurrent(self):
+        """Independent steps run at the same time."""
+        graph = orchestrator.TaskGraph()
+        graph.add("a", self.step("a", delay=0.05))
+        graph.add("b", self.step("b", delay=0.05))
+        self.assertEqual(graph.run_sync(), 0)
+        self.assertEqual(self._events[:2], ["start a", "start b"])
+
+    def test_failure_skips_dependents(self):
+        """The dependents of a failed step are skipped, and the others still run."""
+        graph = orchestrator.TaskGraph()
+        graph.add("image", self.step("image", ret=3))
+        graph.add("volume", self.step("volume"))
+        graph.add("container", self.step("container"), ["image", "volume"])
+        graph.add("server", self.step("server"), ["container"])
+        self.assertEqual(graph.run_sync(), 3)
+        self.assertEqual(graph.results, {"image": 3, "volume": 0,
+                                         "container": orchestrator.SKIPPED,
+                                         "server": orchestrator.SKIPPED})
+        self.assertNotIn("start container", self._events)
+        self.assertEqual(sorted(graph.timings.keys()), ["image", "volume"])
+
+    def test_exception(self):
+        """An exception in a step counts as exit status 1."""
+        async def broken():
+            raise RuntimeError("broken")
+        graph = orchestrator.TaskGraph()
+        graph.add("broken", broken)
+        graph.add("after", self.step("after"), ["broken"])
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(graph.run_sync(), 1)
+        self.assertIn("[ERROR] broken : broken", out.getvalue())
+        self.assertEqual(graph.results, {"broken": 1, "after": orchestrator.SKIPPED})
+
+    def test_timings(self):
+        """The wall time of each step is recorded."""
+        graph = orchestrator.TaskGraph()
+        graph.add("slow", self.step("slow", delay=0.05))
+        graph.run_sync()
+        self.assertGreaterEqual(graph.timings["slow"], 0.04)
+
+    def test_unknown_dependency(self):
+        """A dependency must be added first."""
+        graph = orchestrator.TaskGraph()
+        with self.assertRaises(ValueError):
+            graph.add("container", self.step("container"), ["image"])
+
+
+class TestRunProcess(unittest.TestCase):
+    """Test of run_process."""
+
+    def test_output(self):
+        """The exit status and the output without quotes are returned."""
+        ret, output = asyncio.run(orchestrator.run_process(
+            [sys.executable, "-c", "print('\"id\"'); raise SystemExit(2)"]))
+        self.assertEqual((ret, output.strip()), (2, "id"))
+
+    def test_missing_command(self):
+        """A command that can't be started returns 1."""
+        ret, _message = asyncio.run(orchestrator.run_process(["no-such-command-xyz"]))
+        self.assertEqual(ret, 1)
+
+
+class TestBuildSteps(unittest.TestCase):
+    """Test of the Docker steps of build.py with a fake docker command."""
+
+    def setUp(self):
+        """Create the site, the jekyll-build-pages archive and the docker command."""
+        self._folder = tempfile.TemporaryDirectory()
+        root = self._folder.name
+        os.makedirs(os.path.join(root, "docs"))
+        with open(os.path.join(root, "docs", "index.md"), "w", encoding="utf-8") as f:
+            f.write("# Index\n")
+        with open(os.path.join(root, "docs", "_config.yml"), "w", encoding="utf-8") as f:
+            f.write("title: test\n")
+        self._archive = os.path.join(root, "jekyll-build-pages.tar.gz")
+        with tarfile.open(self._archive, "w:gz") as tar:
+            for name in ("Dockerfile", "Gemfile"):
+                data = ("# " + name + "\n").encode("utf-8")
+                info = tarfile.TarInfo("jekyll-build-pages/" + name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        bin_dir = os.path.join(root, "bin")
+        os.makedirs(bin_dir)
+        docker = os.path.join(bin_dir, "docker")
+        with open(docker, "w", encoding="utf-8") as f:
+            f.write(FAKE_DOCKER.format(python=sys.executable))
+        os.chmod(docker, 0o755)
+        self._log = os.path.join(root, "docker.log")
+        self._env = {"PATH": bin_dir + os.pathsep + os.environ.get("PATH", ""),
+                     "FAKE_DOCKER_LOG": self._log,
+                     "XDG_CACHE_HOME": os.path.join(root, "cache")}
+
+    def tearDown(self):
+        """Remove the folder."""
+        self._folder.cleanup()
+
+    def run_build(self, build_exit: int = 0):
+        """Run build.py with the docker command. Returns (setup, logged lines)."""
+        env = dict(self._env, FAKE_DOCKER_BUILD_EXIT=str(build_exit))
+        argv = ["--root_dir", self._folder.name, "--archive", self._archive,
+                "--docker_client", "cli"]
+        with unittest.mock.patch.dict(os.environ, env), \
+                contextlib.redirect_stdout(io.StringIO()):
+            setup = build.SetupGithubPages(build.parser.parse_args(argv))
+        with open(self._log, "r", encoding="utf-8") as f:
+            return setup, f.read().splitlines()
+
+    def test_steps(self):
+        """The old container is removed while the image is built, then the build runs."""
+        setup, lines = self.run_build()
+        self.assertEqual(setup.ret, 0)
+        commands = [line for line in lines if line.startswith("start ")]
+        self.assertIn("start rm -f build_jekyll_old", commands)
+        self.assertTrue(any(line.startswith("start build ") for line in commands))
+        # Neither step waits for the other.
+        first_end = min(lines.index("end rm"), lines.index("end build"))
+        self.assertLess(lines.index("start rm -f build_jekyll_old"), first_end)
+        self.assertLess(next(i for i, line in enumerate(lines)
+                             if line.startswith("start build ")), first_end)
+        # The container is created after both and removed after the build in it.
+        run = next(i for i, line in enumerate(lines) if line.startswith("start run "))
+        self.assertGreater(run, lines.index("end rm"))
+        self.assertGreater(run, lines.index("end build"))
+        self.assertEqual([line for line in commands[commands.index(lines[run]):]],
+                         [lines[run], "start wait build_jekyll", "start rm -f build_jekyll"])
+        for step in ("remove_container", "download", "build_image", "create_container",
+                     "wait_container", "save_manifest"):
+            self.assertIn(step, setup.timings)
+
+    def test_failed_image(self):
+        """A failed image build skips the container steps and returns its exit status."""
+        setup, lines = self.run_build(build_exit=2)
+        self.assertEqual(setup.ret, 2)
+        self.assertIn("end build", lines)
+        for command in ("run", "wait"):
+            self.assertFalse(any(line.startswith("start " + command + " ") for line in lines))
+        self.assertIn("remove_container", setup.timings)
+        for step in ("create_container", "wait_container", "save_manifest"):
+            self.assertNotIn(step, setup.timings)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,286 @@
+"""This is a module to trace the phases and commands of the setup scripts."""
+# SYSTEM: Python 3.11.1
+#
+# これは、セットアップスクリプトの各手順と外部コマンドの時間を記録するためのモジュールです。
+#
+# このモジュールは、以下の内容を実行します。
+# * 手順(phase)、タスクグラフの手順(step)、外部コマンド(process)、Docker APIの呼び出し
+#   (docker)を入れ子のスパンとして記録
+# * スパンごとに時間、終了コード、配下で実行したコマンドの数と標準出力のバイト数を集計
+# * JSON Lines(追記)、Chromeのトレースイベント(chrome://tracing, Perfetto)、
+#   Prometheusのテキスト形式で出力
+# * 実行の最後に手順ごとの時間と終了コードを表示
+
+import os
+import json
+import time
+import asyncio
+import contextvars
+
+PHASE = "phase"
+STEP = "step"
+PROCESS = "process"
+DOCKER = "docker"
+METRIC_PREFIX = "github_pages_"
+_current = contextvars.ContextVar("tracing_span", default=None)
+
+
+class Span:
+    """A timed part of a run."""
+    name = ""
+    kind = PHASE
+    parent = None
+    start = 0.0
+    end = None
+    status = None
+    processes = 0
+    stdout_bytes = 0
+    attrs = {}
+    lane = 0
+
+    def __init__(self, name: str, kind: str, parent, attrs: dict, lane: int):
+        """Initialize the class."""
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.end = None
+        self.status = None
+        self.processes = 0
+        self.stdout_bytes = 0
+        self.attrs = dict(attrs)
+        self.lane = lane
+
+    @property
+    def seconds(self):
+        """Get the wall time (until now if the span has not ended)."""
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    @property
+    def depth(self):
+        """Get the number of ancestors."""
+        depth = 0
+        parent = self.parent
+        while parent is not None:
+            depth += 1
+            parent = parent.parent
+        return depth
+
+    def add_output(self, size: int):
+        """Count the stdout bytes of a command in this span and its ancestors."""
+        span = self
+        while span is not None:
+            span.stdout_bytes += size
+            span = span.parent
+
+
+class Tracer:
+    """Spans of one run of a script."""
+    _script = ""
+    _spans = []
+    _lanes = {}
+    _started = 0.0
+
+    def __init__(self, script: str = ""):
+        """Initialize the class."""
+        self._script = script
+        self._spans = []
+        self._lanes = {}
+        self._started = time.time()
+
+    @property
+    def script(self):
+        """Get the script name."""
+        return self._script
+
+    @property
+    def spans(self):
+        """Get the spans in the order they were started."""
+        return self._spans
+
+    def lane(self):
+        """Get the lane (a track of the trace viewer) of the current asyncio task."""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return self._lanes.setdefault(id(task) if task is not None else 0, len(self._lanes))
+
+    def open(self, name: str, kind: str, attrs: dict):
+        """Start a span under the current one."""
+        span = Span(name, kind, _current.get(), attrs, self.lane())
+        self._spans.append(span)
+        if kind == PROCESS:
+            parent = span.parent
+            while parent is not None:
+                parent.processes += 1
+                parent = parent.parent
+        return span
+
+    def phases(self):
+        """Get the top-level spans, the phases right under them and the task graph steps."""
+        return [span for span in self._spans
+                if (span.kind == PHASE and span.depth <= 1) or span.kind == STEP]
+
+    # =========================================================
+    # Export
+    def to_records(self):
+        """Convert the spans to JSON-compatible records."""
+        ids = {id(span): index for index, span in enumerate(self._spans)}
+        origin = self._spans[0].start if len(self._spans) > 0 else 0.0
+        records = []
+        for span in self._spans:
+            records.append({
+                "script": self._script,
+                "run": self._started,
+                "id": ids[id(span)],
+                "parent": ids.get(id(span.parent)) if span.parent is not None else None,
+                "name": span.name,
+                "kind": span.kind,
+                "start": round(span.start - origin, 6),
+                "seconds": round(span.seconds, 6),
+                "status": span.status,
+                "processes": span.processes,
+                "stdout_bytes": span.stdout_bytes,
+                "attrs": span.attrs,
+            })
+        return records
+
+    def write_jsonl(self, path: str):
+        """Append the spans to a JSON Lines file (one run after another)."""
+        with open(path, "a", encoding="utf-8") as f:
+            for record in self.to_records():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def write_chrome(self, path: str):
+        """Write the spans as Chrome trace events."""
+        origin = self._spans[0].start if len(self._spans) > 0 else 0.0
+        events = [{"name": "process_name", "ph": "M", "pid": os.getpid(), "tid": 0,
+                   "args": {"name": self._script}}]
+        for span in self._spans:
+            args = dict(span.attrs)
+            args.update({"status": span.status, "processes": span.processes,
+                         "stdout_bytes": span.stdout_bytes})
+            events.append({"name": span.name, "cat": span.kind, "ph": "X",
+                           "ts": round((span.start - origin) * 1e6, 1),
+                           "dur": round(span.seconds * 1e6, 1),
+                           "pid": os.getpid(), "tid": span.lane, "args": args})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f,
+                      ensure_ascii=False)
+
+    def write_metrics(self, path: str):
+        """Write the phases as Prometheus text (e.g. for the node exporter textfile collector)."""
+        metrics = [("phase_seconds", "gauge", "Wall time of a phase", "seconds"),
+                   ("phase_processes", "gauge", "Commands run in a phase", "processes"),
+                   ("phase_stdout_bytes", "gauge", "Stdout bytes of the commands of a phase",
+                    "stdout_bytes"),
+                   ("phase_status", "gauge", "Exit status of a phase (-1: unknown)", "status")]
+        lines = []
+        for name, metric_type, description, field in metrics:
+            lines.append("# HELP " + METRIC_PREFIX + name + " " + description)
+            lines.append("# TYPE " + METRIC_PREFIX + name + " " + metric_type)
+            for span in self.phases():
+                value = getattr(span, field)
+                if field == "status":
+                    value = value if isinstance(value, int) else -1
+                lines.append(METRIC_PREFIX + name + '{script="' + self._script
+                             + '",phase="' + span.name.replace('"', "'") + '"} '
+                             + (str(round(value, 6)) if isinstance(value, float)
+                                else str(value)))
+        lines.append("# HELP " + METRIC_PREFIX + "last_run_timestamp_seconds "
+                     + "Start time of the last run")
+        lines.append("# TYPE " + METRIC_PREFIX + "last_run_timestamp_seconds gauge")
+        lines.append(METRIC_PREFIX + 'last_run_timestamp_seconds{script="' + self._script
+                     + '"} ' + str(round(self._started, 3)))
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+    def print_summary(self):
+        """Print the wall time, the commands and the exit status of each phase."""
+        phases = self.phases()
+        if len(phases) == 0:
+            return
+        print("[## Phases]")
+        for span in phases:
+            status = "" if span.status is None else ", exit " + str(span.status)
+            print("  --> " + "  " * span.depth + span.name + " : "
+                  + str(round(span.seconds * 1000)) + " ms (" + str(span.processes)
+                  + " commands, " + str(span.stdout_bytes) + " bytes" + status + ")")
+
+
+class _SpanContext:
+    """Context manager of a span."""
+    _tracer = None
+    _args = ()
+    _span = None
+    _token = None
+
+    def __init__(self, tracer: Tracer, name: str, kind: str, attrs: dict):
+        """Initialize the class."""
+        self._tracer = tracer
+        self._args = (name, kind, attrs)
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        """Start the span."""
+        self._span = self._tracer.open(*self._args)
+        self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, traceback):
+        """End the span."""
+        self._span.end = time.perf_counter()
+        if exc_type is not None and self._span.status is None:
+            self._span.status = "error" if exc_type is not KeyboardInterrupt else "interrupted"
+        _current.reset(self._token)
+        return False
+
+
+_tracer = Tracer()
+
+
+def start(script: str):
+    """Start recording a new run."""
+    global _tracer
+    _tracer = Tracer(script)
+    _current.set(None)
+    return _tracer
+
+
+def tracer():
+    """Get the tracer of the current run."""
+    return _tracer
+
+
+def span(name: str, kind: str = PHASE, **attrs):
+    """Record a span: with tracing.span("build_image") as span: ... span.status = ret."""
+    return _SpanContext(_tracer, name, kind, attrs)
+
+
+def current():
+    """Get the current span (None outside of any span)."""
+    return _current.get()
+
+
+def finish(trace_path: str = "", trace_format: str = "auto", metrics_path: str = ""):
+    """Print the summary and export the run."""
+    _tracer.print_summary()
+    try:
+        if trace_path != "":
+            if trace_format == "auto":
+                trace_format = "jsonl" if trace_path.endswith(".jsonl") else "chrome"
+            if trace_format == "jsonl":
+                _tracer.write_jsonl(trace_path)
+            else:
+                _tracer.write_chrome(trace_path)
+            print("  --> Trace (" + trace_format + "): " + trace_path)
+        if metrics_path != "":
+            _tracer.write_metrics(metrics_path)
+            print("  --> Metrics: " + metrics_path)
+    except OSError as e:
+        print("  [ERROR] " + str(e))
+        return 1
+    return 0